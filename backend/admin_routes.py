@@ -5,32 +5,27 @@ MISSION F: Quota Gemini - Process pending analyses with retry mechanism
 """
 
 from fastapi import APIRouter, HTTPException, Depends
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone, timedelta
 from typing import Optional, Dict, Any
-import os
 import logging
 
-router = APIRouter(prefix="/api/admin")
+import campaign_engine
+import database
+import email_outbox
+import llm_gateway
+import smtp_client
+import pdf_executor
+import pdf_store
+import pending_worker
+import quota_governor
+import render_cache
+import result_cache
+import similarity_index
+import telemetry
+import whitelist_validator
+from database import get_db, get_database
 
-# MongoDB connection
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
-
-mongo_client = None
-db = None
-
-def get_db():
-    """Lazy initialization of MongoDB connection"""
-    global mongo_client, db
-    if db is None and mongo_url:
-        mongo_client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        db = mongo_client[db_name]
-    return db
+router = APIRouter(prefix="/api/admin")
 
 
 @router.get("/stats/visits")
@@ -199,6 +194,9 @@ async def process_pending_analyses(limit: int = 10):
     MISSION: Process pending analyses (retry when quota available)
     Protected endpoint - should check admin auth in production
     
+    Runs the pending worker now (it also drains the queue on its own schedule),
+    even if the worker is paused after a quota error.
+    
     Usage: POST /api/admin/process-pending?limit=10
     """
     current_db = get_db()
@@ -207,154 +205,21 @@ async def process_pending_analyses(limit: int = 10):
         raise HTTPException(status_code=503, detail="Database not configured")
     
     try:
-        # Find pending analyses with retry_count < 5
-        pending = await current_db.pending_analyses.find({
-            "status": "queued",
-            "retry_count": {"$lt": 5}
-        }).sort("created_at", 1).limit(limit).to_list(limit)
+        summary = await pending_worker.drain_once(limit=limit, ignore_pause=True)
         
-        if not pending:
+        if not summary["results"]:
             return {
-                "message": "No pending analyses to process",
+                "message": summary.get("skipped") or "No pending analyses to process",
                 "processed": 0,
                 "failed": 0
             }
         
-        processed = 0
-        failed = 0
-        results = []
-        
-        for analysis in pending:
-            request_id = analysis.get("request_id", "unknown")
-            
-            try:
-                # Import dynamically to avoid circular imports
-                import mini_analysis_routes
-                
-                gemini_client = mini_analysis_routes.gemini_client
-                GEMINI_MODEL = mini_analysis_routes.GEMINI_MODEL
-                
-                if not gemini_client:
-                    logging.error(f"[{request_id}] QUEUE_RETRY: Gemini client not available")
-                    failed += 1
-                    continue
-                
-                # Reconstruct request from payload
-                form_payload = analysis.get("form_payload", {})
-                mini_request = mini_analysis_routes.MiniAnalysisRequest(**form_payload)
-                language = analysis.get("language", "fr")
-                
-                # Build prompt using the function
-                prompt = mini_analysis_routes.build_prompt(mini_request, language=language)
-                
-                # Call Gemini
-                logging.info(f"[{request_id}] QUEUE_RETRY: Attempting to generate analysis")
-                
-                response = gemini_client.models.generate_content(
-                    model=GEMINI_MODEL,
-                    contents=[prompt]
-                )
-                
-                analysis_text = response.text if hasattr(response, 'text') else str(response)
-                
-                if not analysis_text or "LANG_FAIL" in analysis_text:
-                    raise Exception("Invalid response from Gemini")
-                
-                # Save successful analysis
-                analysis_record = {
-                    "brand_slug": analysis.get("brand", "").lower(),
-                    "brand_name": analysis.get("brand"),
-                    "email": analysis.get("user_email"),
-                    "payload_form": form_payload,
-                    "created_at": datetime.now(timezone.utc),
-                    "provider": "gemini",
-                    "model": GEMINI_MODEL,
-                    "response_text": analysis_text,
-                    "from_pending": True,
-                    "original_request_id": request_id
-                }
-                
-                await current_db.mini_analyses.insert_one(analysis_record)
-                
-                # Update pending status
-                await current_db.pending_analyses.update_one(
-                    {"_id": analysis["_id"]},
-                    {
-                        "$set": {
-                            "status": "processed",
-                            "processed_at": datetime.now(timezone.utc)
-                        }
-                    }
-                )
-                
-                # Send email with analysis - import function if available
-                try:
-                    import extended_routes
-                    await extended_routes.send_analysis_email(
-                        analysis.get("user_email"),
-                        analysis.get("brand"),
-                        analysis_text,
-                        language,
-                        request_id
-                    )
-                    logging.info(f"[{request_id}] QUEUE_SENT: Analysis emailed successfully")
-                except Exception as email_error:
-                    logging.error(f"[{request_id}] EMAIL_SEND_FAIL: {str(email_error)}")
-                
-                processed += 1
-                results.append({
-                    "request_id": request_id,
-                    "status": "success",
-                    "brand": analysis.get("brand")
-                })
-                
-            except Exception as e:
-                error_str = str(e).lower()
-                
-                # Increment retry count
-                new_retry_count = analysis.get("retry_count", 0) + 1
-                
-                if "resource_exhausted" in error_str or "quota" in error_str:
-                    # Still quota issue - keep queued
-                    await current_db.pending_analyses.update_one(
-                        {"_id": analysis["_id"]},
-                        {
-                            "$set": {
-                                "retry_count": new_retry_count,
-                                "last_retry_at": datetime.now(timezone.utc),
-                                "last_error": "quota_exhausted"
-                            }
-                        }
-                    )
-                    logging.warning(f"[{request_id}] QUEUE_RETRY: Quota still exhausted")
-                    failed += 1
-                else:
-                    # Other error - mark as failed
-                    await current_db.pending_analyses.update_one(
-                        {"_id": analysis["_id"]},
-                        {
-                            "$set": {
-                                "status": "failed",
-                                "retry_count": new_retry_count,
-                                "failed_at": datetime.now(timezone.utc),
-                                "error": str(e)
-                            }
-                        }
-                    )
-                    logging.error(f"[{request_id}] QUEUE_FAILED: {str(e)}")
-                    failed += 1
-                
-                results.append({
-                    "request_id": request_id,
-                    "status": "failed",
-                    "error": str(e)[:100]
-                })
-        
         return {
-            "message": f"Processed {processed} analyses, {failed} failed",
-            "processed": processed,
-            "failed": failed,
-            "results": results
+            "message": f"Processed {summary['processed']} analyses, {summary['failed']} failed",
+            "processed": summary["processed"],
+            "failed": summary["failed"],
+            "results": summary["results"],
+            "worker": pending_worker.worker_status()
         }
         
     except Exception as e:
@@ -371,21 +236,209 @@ async def get_pending_stats():
         raise HTTPException(status_code=503, detail="Database not configured")
     
     try:
-        queued_count = await current_db.pending_analyses.count_documents({"status": "queued"})
+        # "queued" = legacy status, migrated to "pending" on the worker's first run
+        pending_count = await current_db.pending_analyses.count_documents({"status": {"$in": ["pending", "queued"]}})
+        processing_count = await current_db.pending_analyses.count_documents({"status": "processing"})
         processed_count = await current_db.pending_analyses.count_documents({"status": "processed"})
         failed_count = await current_db.pending_analyses.count_documents({"status": "failed"})
         
         return {
-            "queued": queued_count,
+            "queued": pending_count,
+            "processing": processing_count,
             "processed": processed_count,
             "failed": failed_count,
-            "total": queued_count + processed_count + failed_count
+            "total": pending_count + processing_count + processed_count + failed_count,
+            "worker": pending_worker.worker_status()
         }
     except Exception as e:
         logging.error(f"Error getting pending stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/pending-worker")
+async def get_pending_worker_status():
+    """Pending worker state: running, paused_until (quota), counters"""
+    return pending_worker.worker_status()
+
+
+@router.get("/gemini-quota")
+async def get_gemini_quota():
+    """Remaining Gemini budgets (per minute / per day), burn rate and projected exhaustion"""
+    return quota_governor.governor_status()
+
+
+@router.get("/llm-gateway")
+async def get_llm_gateway_status():
+    """LLM providers: circuit breaker state, fallback/hedge counters, latency histograms"""
+    return llm_gateway.gateway_status()
+
+
+@router.get("/pdf-executor")
+async def get_pdf_executor_status():
+    """PDF worker processes: pool size, queue depth, render / queue wait times, letterhead template, PDF engine caches"""
+    import letterhead
+    import pdf_engine
+    return {
+        **pdf_executor.executor_status(),
+        "letterhead": letterhead.letterhead_status(),
+        "engine": pdf_engine.engine_status(),
+    }
+
+
+@router.get("/similarity-index")
+async def get_similarity_index_status():
+    """Similar-analyses index: size, memory, load / backfill counters, last query time"""
+    return similarity_index.index_status()
+
+
+@router.get("/whitelist-validator")
+async def get_whitelist_validator_status():
+    """Whitelist compliance check: automaton size, allowed cities per whitelist, violation / regeneration counters"""
+    return whitelist_validator.validator_status()
+
+
+@router.get("/pdf-store")
+async def get_pdf_store_status():
+    """PDF artifact store: backend, stored / deduplicated PDFs, downloads, range and 304 responses"""
+    return pdf_store.store_status()
+
+
+@router.get("/render-cache")
+async def get_render_cache_status():
+    """PDF render cache: memory / disk tier sizes, hit rate, evictions, invalidations"""
+    return render_cache.cache_status()
+
+
+@router.delete("/render-cache")
+async def invalidate_render_cache(doc_type: str, ref: Optional[str] = None):
+    """
+    Drop cached PDF renders (this worker's memory tier + the shared disk tier)
+
+    Usage:
+      DELETE /api/admin/render-cache?doc_type=mini_analysis
+      DELETE /api/admin/render-cache?doc_type=invoice&ref=<invoice_id>
+    """
+    if doc_type not in ("mini_analysis", "analysis_report", "invoice", "ai_insight"):
+        raise HTTPException(status_code=400, detail="doc_type: mini_analysis, analysis_report, invoice or ai_insight")
+    return await render_cache.invalidate(doc_type, ref)
+
+
+@router.get("/email-outbox")
+async def get_email_outbox_status():
+    """Email outbox: messages per status, dispatcher state, sent / retried / failed counters, SMTP connection pools"""
+    current_db = get_db()
+    counts = {}
+    if current_db is not None:
+        for status in ("pending", "sending", "sent", "failed"):
+            counts[status] = await current_db.email_outbox.count_documents({"status": status})
+    return {"outbox": counts, "dispatcher": email_outbox.outbox_status(), "smtp": smtp_client.pool_status()}
+
+
+@router.post("/email-outbox/{outbox_id}/retry")
+async def retry_email(outbox_id: str, current_db=Depends(get_database)):
+    """Queue a failed email again (attempts reset)"""
+    from bson import ObjectId
+
+    if not ObjectId.is_valid(outbox_id):
+        raise HTTPException(status_code=400, detail="Invalid outbox ID")
+
+    result = await current_db.email_outbox.update_one(
+        {"_id": ObjectId(outbox_id), "status": "failed"},
+        {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": datetime.now(timezone.utc),
+                  "updated_at": datetime.now(timezone.utc)}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=404, detail="No failed email with this ID")
+    return {"success": True, "outbox_id": outbox_id, "status": "pending"}
+
+
+@router.get("/database")
+async def get_database_pool_status():
+    """Shared MongoDB client: pool settings, open / checked-out connections, checkout waits and failures"""
+    return database.pool_status()
+
+
+@router.get("/campaigns")
+async def get_campaign_engine_status():
+    """Campaign engine: campaigns per status, active runs, sent / failed / deferred counters, template cache"""
+    current_db = get_db()
+    counts = {}
+    if current_db is not None:
+        for status in ("draft", "running", "paused", "completed", "cancelled"):
+            counts[status] = await current_db.campaigns.count_documents({"status": status})
+    return {"campaigns": counts, "engine": campaign_engine.engine_status()}
+
+
+# =============================================================================
+# MINI-ANALYSIS RESULT CACHE
+# =============================================================================
+
+@router.get("/mini-analysis-cache")
+async def get_result_cache_stats():
+    """Result cache configuration + hit/miss counters (this worker)"""
+    current_db = get_db()
+    stats = result_cache.cache_status()
+    if current_db is not None:
+        try:
+            stats["mongo_entries"] = await current_db.mini_analysis_cache.count_documents({})
+        except Exception as e:
+            logging.warning(f"Result cache count failed: {str(e)}")
+    return stats
+
+
+@router.delete("/mini-analysis-cache")
+async def invalidate_result_cache(brand: Optional[str] = None, template: Optional[str] = None, all: bool = False):
+    """
+    Invalidate cached mini-analyses
+
+    Usage:
+      DELETE /api/admin/mini-analysis-cache?brand=Café Test
+      DELETE /api/admin/mini-analysis-cache?template=MASTER_PROMPT_RETAIL_NON_FOOD
+      DELETE /api/admin/mini-analysis-cache?all=true
+    """
+    if not brand and not template and not all:
+        raise HTTPException(status_code=400, detail="brand, template or all=true required")
+
+    import mini_analysis_routes
+    brand_slug = mini_analysis_routes.normalize_brand_slug(brand) if brand else None
+
+    try:
+        removed = await result_cache.invalidate(get_db(), brand_slug=brand_slug, template=template or None)
+    except Exception as e:
+        logging.error(f"Error invalidating result cache: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"status": "invalidated", "brand_slug": brand_slug, "template": template, **removed}
+
+
+# =============================================================================
+# MINI-ANALYSIS TELEMETRY
+# =============================================================================
+
+@router.get("/mini-analysis-telemetry")
+async def get_mini_analysis_telemetry(days: int = 7, group_by: str = "sector,language,day"):
+    """
+    Latency percentiles (generation / pdf / smtp / total), tokens and cost of mini-analyses
+
+    Usage:
+      GET /api/admin/mini-analysis-telemetry?days=7
+      GET /api/admin/mini-analysis-telemetry?days=30&group_by=language
+    """
+    current_db = get_db()
+    if current_db is None:
+        raise HTTPException(status_code=503, detail="Database not configured")
+
+    keys = [k.strip() for k in group_by.split(",") if k.strip()]
+    if not keys or any(k not in ("sector", "language", "day") for k in keys):
+        raise HTTPException(status_code=400, detail="group_by: comma-separated list of sector, language, day")
+
+    try:
+        return await telemetry.aggregate(current_db, days=max(1, min(days, 90)), group_by=keys)
+    except Exception as e:
+        logging.error(f"Error aggregating telemetry: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # =============================================================================
 # USER MANAGEMENT ROUTES
 # =============================================================================
@@ -5,7 +5,6 @@ Provides JWT verification, role-based access control, and MongoDB filtering
 
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime, timezone
 import os
@@ -13,28 +12,11 @@ import logging
 import jwt
 from functools import wraps
 
+from database import get_db
+
 # Security
 security = HTTPBearer()
 
-# MongoDB
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
-
-mongo_client = None
-db = None
-
-def get_db():
-    """Get MongoDB database instance"""
-    global mongo_client, db
-    if db is None and mongo_url:
-        mongo_client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        db = mongo_client[db_name]
-    return db
-
 # JWT Configuration
 JWT_SECRET = os.getenv('JWT_SECRET')
 JWT_ALGORITHM = 'HS256'
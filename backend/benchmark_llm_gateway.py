@@ -0,0 +1,80 @@
+"""
+Offline benchmark of the LLM gateway with the deterministic stub provider
+No API key, no network: measures gateway overhead, throughput and tail latency
+(with and without hedging) for a given concurrency.
+
+Usage:
+    python benchmark_llm_gateway.py --requests 200 --concurrency 8 --latency 0.2
+    python benchmark_llm_gateway.py --slow-every 25 --hedge     # tail latency + hedging
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="LLM gateway benchmark (stub provider)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub latency (seconds)")
+    parser.add_argument("--slow-every", type=int, default=0, help="every Nth stub call is 10x slower")
+    parser.add_argument("--hedge", action="store_true", help="enable hedging (stub -> stub)")
+    return parser.parse_args()
+
+
+async def run_benchmark(args):
+    # Import after the environment is set: the gateway reads its configuration at import
+    import llm_gateway
+
+    providers = ["stub", "stub"] if args.hedge else ["stub"]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await llm_gateway.generate(
+                "benchmark",
+                f"- **Brand Name:** Brand {i % 20}\nBenchmark prompt",
+                providers=providers,
+                request_id=f"bench_{i}"
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            return result
+
+    # Warm-up (hedging needs latency samples before it kicks in)
+    await asyncio.gather(*(one(i) for i in range(min(args.requests, 25))))
+    latencies.clear()
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))]
+
+    print("=" * 60)
+    print(f"[BENCHMARK] {args.requests} requests, concurrency {args.concurrency}, stub latency {args.latency}s"
+          f"{', slow every ' + str(args.slow_every) if args.slow_every else ''}{', hedging' if args.hedge else ''}")
+    print("=" * 60)
+    print(f"Throughput: {args.requests / elapsed:.1f} req/s ({elapsed:.2f}s total)")
+    print(f"Latency ms: p50={pct(50):.0f} p95={pct(95):.0f} p99={pct(99):.0f} max={latencies[-1]:.0f}")
+    print(f"Hedged responses: {len([r for r in results if r['hedged']])}")
+    stub = llm_gateway.gateway_status()["providers"]["stub"]
+    print(f"Stub counters: {stub['counters']}")
+    print(f"Stub histogram: {stub['latency_ms']['histogram']}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ["FAKE_LLM_LATENCY_SECONDS"] = str(args.latency)
+    os.environ["LLM_STUB_SLOW_EVERY"] = str(args.slow_every)
+    os.environ["LLM_HEDGE_ENABLED"] = "true" if args.hedge else "false"
+    os.environ["LLM_HEDGE_MIN_DELAY_SECONDS"] = str(args.latency)
+    os.environ.setdefault("LLM_MAX_WORKERS", str(max(args.concurrency * 2, 4)))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(run_benchmark(args))
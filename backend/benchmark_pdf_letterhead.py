@@ -0,0 +1,117 @@
+"""
+Benchmark of the mini-analysis PDF letterhead: single-pass template vs PyPDF2 merge
+- merge:    ReportLab content PDF, then PdfReader(letterhead) + PdfReader(content),
+            merge_page and PdfWriter serialization (previous implementation)
+- template: letterhead parsed once, drawn as a form XObject from the page callback
+
+Reports renders per second, mean / p95 latency and peak Python memory per render.
+
+Usage:
+    python benchmark_pdf_letterhead.py --renders 50 --language he
+    python benchmark_pdf_letterhead.py --paragraphs 80 --every-page
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from types import SimpleNamespace
+
+PARAGRAPHS = {
+    "fr": "Le concept de la marque présente un potentiel réel sur le marché israélien : Tel Aviv, "
+          "Jérusalem et Haïfa concentrent la clientèle cible et la concurrence reste limitée.",
+    "en": "The brand concept has real potential in the Israeli market: Tel Aviv, Jerusalem and "
+          "Haifa concentrate the target customers and competition remains limited.",
+    "he": "לקונספט של המותג יש פוטנציאל ממשי בשוק הישראלי: תל אביב, ירושלים וחיפה מרכזות את "
+          "קהל היעד והתחרות עדיין מוגבלת.",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="PDF letterhead benchmark (template vs merge)")
+    parser.add_argument("--renders", type=int, default=30)
+    parser.add_argument("--paragraphs", type=int, default=40, help="analysis length")
+    parser.add_argument("--language", default="fr", choices=sorted(PARAGRAPHS))
+    parser.add_argument("--every-page", action="store_true", help="letterhead on every page (/pdf/generate layout)")
+    return parser.parse_args()
+
+
+def merge_letterhead(content_bytes: bytes, path, every_page: bool) -> bytes:
+    """Previous implementation: re-parse both PDFs, merge_page, serialize again"""
+    from PyPDF2 import PdfReader, PdfWriter
+
+    header_page = PdfReader(str(path)).pages[0]
+    writer = PdfWriter()
+    for index, page in enumerate(PdfReader(BytesIO(content_bytes)).pages):
+        if index == 0 or every_page:
+            page.merge_page(header_page)
+        writer.add_page(page)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def measure(render, renders: int):
+    render()  # warm-up (imports, fonts, letterhead template)
+    latencies = []
+    peaks = []
+    sizes = set()
+    for _ in range(renders):
+        tracemalloc.start()
+        started = time.perf_counter()
+        sizes.add(len(render()))
+        latencies.append((time.perf_counter() - started) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    ordered = sorted(latencies)
+    return {
+        "per_second": round(1000 / statistics.mean(latencies), 1),
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 1),
+        "peak_mib": round(max(peaks) / 2 ** 20, 2),
+        "bytes": max(sizes),
+    }
+
+
+def main(args):
+    import letterhead
+    import pdf_engine
+
+    analysis = "\n\n".join(PARAGRAPHS[args.language] for _ in range(args.paragraphs))
+    no_letterhead = SimpleNamespace(draw_on_page=lambda canvas, doc=None: None, load=letterhead.load,
+                                    LETTERHEAD_PATH=letterhead.LETTERHEAD_PATH)
+
+    def template_render():
+        if args.every_page:
+            return pdf_engine.build_analysis_report_pdf("Benchmark", analysis, args.language)
+        return pdf_engine.build_mini_analysis_pdf("Benchmark", analysis, args.language)
+
+    def merge_render():
+        # Content rendered without the letterhead callback, merged afterwards
+        pdf_engine.letterhead = no_letterhead
+        try:
+            if args.every_page:
+                content = pdf_engine.build_analysis_report_pdf("Benchmark", analysis, args.language)
+            else:
+                content = pdf_engine.build_mini_analysis_pdf("Benchmark", analysis, args.language)
+        finally:
+            pdf_engine.letterhead = letterhead
+        return merge_letterhead(content, letterhead.LETTERHEAD_PATH, args.every_page)
+
+    results = {"merge": measure(merge_render, args.renders), "template": measure(template_render, args.renders)}
+
+    print("=" * 78)
+    print(f"[PDF LETTERHEAD] {args.renders} renders, {args.paragraphs} paragraphs, language={args.language}, "
+          f"{'every page' if args.every_page else 'first page'}")
+    print("=" * 78)
+    print(f"{'path':<10}{'renders/s':>11}{'mean ms':>10}{'p95 ms':>10}{'peak MiB':>10}{'PDF bytes':>12}")
+    for name, row in results.items():
+        print(f"{name:<10}{row['per_second']:>11}{row['mean_ms']:>10}{row['p95_ms']:>10}{row['peak_mib']:>10}{row['bytes']:>12}")
+    print(f"Speed-up: x{round(results['template']['per_second'] / results['merge']['per_second'], 2)}")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main(parse_args())
@@ -0,0 +1,161 @@
+"""
+Benchmark of SMTP delivery: one connection per message vs pooled sessions (smtp_client)
+- fresh:   aiosmtplib.send() per message - connect, EHLO, LOGIN, MAIL/RCPT/DATA, QUIT
+           (previous implementation of every sender)
+- pooled:  smtp_client.send() - authenticated sessions reused across messages
+- batch:   smtp_client.send_batch() - several messages over one session
+
+Runs against a local SMTP sink (no message leaves the machine). --rtt-ms delays every
+sink reply to emulate the network round trip to the provider (OVH / Gmail); TLS is not
+emulated, so real gains are larger (one handshake per session instead of per message).
+
+Reports messages per second and connections opened.
+
+Usage:
+    python benchmark_smtp_pool.py --messages 200 --concurrency 4
+    python benchmark_smtp_pool.py --messages 100 --rtt-ms 20
+"""
+import sys
+import os
+
+# Add parent directory to path to import server modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SMTP_PASSWORD', 'benchmark')
+
+import argparse
+import asyncio
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SMTP delivery benchmark (pooled sessions vs connection per message)")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4, help="sends in flight (EMAIL_OUTBOX_CONCURRENCY)")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="delay added to every sink reply")
+    return parser.parse_args()
+
+
+class SMTPSink:
+    """Minimal ESMTP server: accepts AUTH, counts sessions and messages"""
+
+    def __init__(self, rtt_ms: float):
+        self.rtt = rtt_ms / 1000
+        self.sessions = 0
+        self.messages = 0
+
+    async def reply(self, writer, line: str):
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        writer.write(f"{line}\r\n".encode())
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.sessions += 1
+        try:
+            await self.reply(writer, "220 sink ESMTP")
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                command = line.split(" ")[0].upper()
+                if command in ("EHLO", "HELO"):
+                    await self.reply(writer, "250-sink\r\n250-AUTH PLAIN LOGIN\r\n250 OK")
+                elif command == "AUTH":
+                    await self.reply(writer, "235 2.7.0 Authentication successful")
+                elif command == "DATA":
+                    await self.reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                    while await reader.readline() != b".\r\n":
+                        pass
+                    self.messages += 1
+                    await self.reply(writer, "250 2.0.0 Ok: queued")
+                elif command == "QUIT":
+                    await self.reply(writer, "221 Bye")
+                    break
+                else:
+                    await self.reply(writer, "250 OK")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def build_message(index: int):
+    message = MIMEMultipart()
+    message['From'] = "Israel Growth Venture <contact@israelgrowthventure.com>"
+    message['To'] = f"client{index}@example.com"
+    message['Subject'] = f"Benchmark {index}"
+    message.attach(MIMEText("Bonjour,\n\nVotre mini-analyse est prête.\n" * 20, 'plain', 'utf-8'))
+    return message
+
+
+async def run_concurrent(send, messages, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(message):
+        async with semaphore:
+            await send(message)
+
+    await asyncio.gather(*(one(message) for message in messages))
+
+
+async def measure(name: str, sink: SMTPSink, run):
+    sessions_before, messages_before = sink.sessions, sink.messages
+    started = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - started
+    sent = sink.messages - messages_before
+    return {
+        "mode": name,
+        "messages": sent,
+        "per_second": round(sent / elapsed, 1),
+        "connections": sink.sessions - sessions_before,
+    }
+
+
+async def main(args):
+    import aiosmtplib
+    import smtp_client
+
+    sink = SMTPSink(args.rtt_ms)
+    server = await asyncio.start_server(sink.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    # Plain connection to the local sink (production accounts get TLS from smtp_client.account())
+    settings = {**smtp_client.account("127.0.0.1", port, "bench@israelgrowthventure.com"), "use_tls": False, "start_tls": False}
+    smtp_client.SMTP_POOL_SIZE = args.concurrency
+
+    async def fresh_send(message):
+        await aiosmtplib.send(message, hostname="127.0.0.1", port=port, username=settings["username"],
+                              password=os.environ['SMTP_PASSWORD'], start_tls=False)
+
+    async def pooled_send(message):
+        await smtp_client.send(message, settings)
+
+    async def batches():
+        messages = [build_message(i) for i in range(args.messages)]
+        size = -(-len(messages) // args.concurrency)
+        await asyncio.gather(*(smtp_client.send_batch(messages[i:i + size], settings)
+                               for i in range(0, len(messages), size)))
+
+    results = [
+        await measure("fresh", sink, lambda: run_concurrent(fresh_send, [build_message(i) for i in range(args.messages)], args.concurrency)),
+        await measure("pooled", sink, lambda: run_concurrent(pooled_send, [build_message(i) for i in range(args.messages)], args.concurrency)),
+    ]
+    await smtp_client.close_all()
+    results.append(await measure("batch", sink, batches))
+    await smtp_client.close_all()
+
+    server.close()
+    await server.wait_closed()
+
+    print(f"{args.messages} messages, concurrency {args.concurrency}, sink RTT {args.rtt_ms} ms")
+    print(f"{'mode':<8} {'msg/s':>8} {'connections':>12}")
+    for result in results:
+        print(f"{result['mode']:<8} {result['per_second']:>8} {result['connections']:>12}")
+    print(f"speedup pooled/fresh: {results[1]['per_second'] / results[0]['per_second']:.1f}x")
+    print(f"pool stats: {smtp_client.pool_status()['stats']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
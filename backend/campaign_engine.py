@@ -0,0 +1,647 @@
+"""
+Campaign Engine for Israel Growth Venture
+Bulk email campaigns: an email template (crm email_templates) sent to an audience,
+- newsletter: newsletter_subscribers still active with marketing consent
+- leads: a lead filter (status, stage, sector, language...), minus the emails unsubscribed from the newsletter
+
+The audience is streamed from an indexed cursor sorted by _id, CAMPAIGN_BATCH_SIZE recipients at a time:
+- the template (snapshotted when the campaign is created) is compiled once per text ({{variable}}
+  placeholders split out) and rendered per recipient from the compiled cache
+- sends are throttled (CAMPAIGN_RATE_PER_SECOND) with CAMPAIGN_CONCURRENCY in flight,
+  over smtp_client's pooled sessions
+- each recipient is reserved in campaign_recipients (unique campaign_id + email) before it is sent:
+  an email listed twice in the audience, or a batch replayed after a crash, is never sent twice
+- the campaign checkpoint (last _id of the audience processed) and counters are saved after each batch:
+  a campaign still running when the app stops is leased again at startup and resumes after its checkpoint
+- transient SMTP failures are deferred and retried once the audience has been streamed, with an
+  exponential delay per recipient (CAMPAIGN_RETRY_DELAY_SECONDS, doubled after each attempt) - the
+  campaign is put aside until the next retry is due; a batch failing entirely (SMTP down) puts the
+  campaign aside for CAMPAIGN_SMTP_BACKOFF_SECONDS
+
+campaigns schema:
+    status: draft | running | paused | completed | cancelled
+    name, template {template_id, name, subject, body}, audience {type, filters}, language, variables,
+    checkpoint, counts {sent, failed, skipped, deferred, interrupted}, sending_seconds,
+    next_attempt_at, lease_owner, lease_expires_at, started_at, completed_at, last_error
+campaign_recipients schema:
+    campaign_id, email, recipient_id, language, variables,
+    status: reserved | sent | deferred | failed | interrupted, attempts, error, sent_at,
+    next_attempt_at (deferred)
+"""
+
+from datetime import datetime, timedelta, timezone
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import html
+import logging
+import os
+import re
+import socket
+import time
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import database
+import email_outbox
+import smtp_client
+
+CAMPAIGN_ENGINE_ENABLED = os.getenv('CAMPAIGN_ENGINE_ENABLED', 'true').lower() == 'true'
+CAMPAIGN_BATCH_SIZE = int(os.getenv('CAMPAIGN_BATCH_SIZE', '50'))
+CAMPAIGN_CONCURRENCY = int(os.getenv('CAMPAIGN_CONCURRENCY', '4'))
+CAMPAIGN_RATE_PER_SECOND = float(os.getenv('CAMPAIGN_RATE_PER_SECOND', '10'))
+CAMPAIGN_POLL_SECONDS = int(os.getenv('CAMPAIGN_POLL_SECONDS', '30'))
+CAMPAIGN_SMTP_BACKOFF_SECONDS = 300
+# Deferred recipients: retried 60s, then 120s after their failed attempt
+CAMPAIGN_RETRY_DELAY_SECONDS = 60
+CAMPAIGN_MAX_ATTEMPTS = 3
+CAMPAIGN_LEASE_SECONDS = 300
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+# Case-insensitive email comparison
+EMAIL_COLLATION = {"locale": "en", "strength": 2}
+
+AUDIENCE_TYPES = ("newsletter", "leads")
+# Lead fields a campaign can filter on (values are matched exactly, lists with $in)
+LEAD_FILTER_FIELDS = ("status", "stage", "priority", "sector", "language", "source",
+                      "owner_email", "target_city", "expansion_type", "tags")
+
+UNSUBSCRIBE_FOOTER = {
+    "fr": "Pour ne plus recevoir nos emails, répondez à ce message avec « unsubscribe ».",
+    "en": "To stop receiving our emails, reply to this message with \"unsubscribe\".",
+    "he": "כדי להפסיק לקבל מאיתנו מיילים, השיבו להודעה זו עם \"unsubscribe\".",
+}
+
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+_task: Optional[asyncio.Task] = None
+_wakeup: Optional[asyncio.Event] = None
+_indexes_ready = False
+_active: Dict[str, Dict[str, Any]] = {}
+
+_stats = {
+    "batches": 0,
+    "sent": 0,
+    "failed": 0,
+    "deferred": 0,
+    "skipped": 0,
+    "completed": 0,
+    "smtp_backoffs": 0,
+    "last_run_at": None,
+}
+
+
+async def _ensure_indexes(current_db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        await current_db.campaigns.create_index([("status", 1), ("next_attempt_at", 1)], background=True)
+        await current_db.campaign_recipients.create_index([("campaign_id", 1), ("email", 1)], unique=True, background=True)
+        await current_db.campaign_recipients.create_index([("campaign_id", 1), ("status", 1)], background=True)
+        # Unsubscribe lookup of the leads audience (emails are stored as entered)
+        await current_db.newsletter_subscribers.create_index(
+            [("email", 1)], collation=EMAIL_COLLATION, name="email_case_insensitive", background=True)
+        # Audience cursors: equality filters then the _id sort / checkpoint range
+        await current_db.newsletter_subscribers.create_index(
+            [("is_active", 1), ("consent_marketing", 1), ("_id", 1)], background=True)
+        await current_db.leads.create_index([("status", 1), ("_id", 1)], background=True)
+        await current_db.leads.create_index([("stage", 1), ("_id", 1)], background=True)
+    except Exception as e:
+        logging.warning(f"campaign index creation skipped: {e}")
+    _indexes_ready = True
+
+
+# ==========================================
+# TEMPLATES
+# ==========================================
+
+@lru_cache(maxsize=256)
+def compile_template(text: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """Split a {{variable}} template once: ((literal, variable_name or None), ...)"""
+    parts = []
+    position = 0
+    for match in PLACEHOLDER.finditer(text):
+        parts.append((text[position:match.start()], match.group(1)))
+        position = match.end()
+    parts.append((text[position:], None))
+    return tuple(parts)
+
+
+def render(text: str, variables: Dict[str, Any]) -> str:
+    """Render from the compiled cache - unknown variables render empty"""
+    return "".join(
+        literal + (str(variables.get(name) or "") if name else "")
+        for literal, name in compile_template(text)
+    )
+
+
+def template_text(field: Any, language: str, default_language: str) -> str:
+    """email_templates subject / body: a string (CRM templates) or a dict per language (seeded templates)"""
+    if isinstance(field, dict):
+        return field.get(language) or field.get(default_language) or next(iter(field.values()), "")
+    return field or ""
+
+
+def build_message(campaign: Dict[str, Any], recipient: Dict[str, Any]):
+    template = campaign["template"]
+    language = recipient.get("language") or campaign.get("language", "fr")
+    variables = {**(campaign.get("variables") or {}), **(recipient.get("variables") or {}), "email": recipient["email"]}
+    subject = render(template_text(template["subject"], language, campaign.get("language", "fr")), variables)
+    body = render(template_text(template["body"], language, campaign.get("language", "fr")), variables)
+    footer = UNSUBSCRIBE_FOOTER.get(language, UNSUBSCRIBE_FOOTER["en"])
+
+    message = MIMEMultipart('alternative')
+    message['Subject'] = subject
+    message['From'] = f"Israel Growth Venture <{smtp_client.SMTP_FROM}>"
+    message['Reply-To'] = smtp_client.SMTP_FROM
+    message['To'] = recipient["email"]
+    message['Message-ID'] = make_msgid(domain=smtp_client.SMTP_FROM.partition("@")[2] or None)
+    message['Date'] = formatdate(localtime=False)
+    message['List-Unsubscribe'] = f"<mailto:{smtp_client.SMTP_FROM}?subject=unsubscribe>"
+    message['Precedence'] = "bulk"
+    message['X-IGV-Campaign'] = str(campaign["_id"])
+
+    message.attach(MIMEText(f"{body}\n\n---\n{footer}", 'plain', 'utf-8'))
+    direction = "rtl" if language == "he" else "ltr"
+    html_body = f"""
+    <html>
+    <body dir="{direction}" style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+            {html.escape(body).replace(chr(10), '<br>')}
+            <hr style="margin-top: 30px; border: none; border-top: 1px solid #eee;">
+            <p style="font-size: 12px; color: #666;">{html.escape(footer)}</p>
+        </div>
+    </body>
+    </html>
+    """
+    message.attach(MIMEText(html_body, 'html', 'utf-8'))
+    return message
+
+
+# ==========================================
+# AUDIENCE
+# ==========================================
+
+def audience_query(audience: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """(collection name, query) of a campaign audience"""
+    filters = audience.get("filters") or {}
+    if audience.get("type") == "newsletter":
+        query: Dict[str, Any] = {"is_active": True, "consent_marketing": True}
+        if filters.get("language"):
+            query["language"] = filters["language"]
+        if filters.get("tags"):
+            query["tags"] = {"$in": filters["tags"]}
+        return "newsletter_subscribers", query
+
+    if audience.get("type") == "leads":
+        query = {"email": {"$nin": [None, ""]}}
+        for field in LEAD_FILTER_FIELDS:
+            value = filters.get(field)
+            if value in (None, "", []):
+                continue
+            query[field] = {"$in": value} if isinstance(value, list) else value
+        return "leads", query
+
+    raise ValueError(f"Unknown audience type: {audience.get('type')}")
+
+
+def _recipient_variables(audience_type: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+    if audience_type == "newsletter":
+        return {}
+    return {
+        "name": doc.get("name") or "",
+        "contact_name": doc.get("name") or "",
+        "brand": doc.get("brand_name") or "",
+        "sector": doc.get("sector") or "",
+        "city": doc.get("target_city") or "",
+    }
+
+
+async def count_audience(current_db, audience: Dict[str, Any]) -> int:
+    collection, query = audience_query(audience)
+    return await current_db[collection].count_documents(query)
+
+
+# ==========================================
+# CAMPAIGNS
+# ==========================================
+
+async def create_campaign(current_db, name: str, template: Dict[str, Any], audience: Dict[str, Any],
+                          language: str = "fr", variables: Optional[Dict[str, Any]] = None,
+                          created_by: Optional[str] = None) -> Dict[str, Any]:
+    """Draft campaign with a snapshot of the template (later template edits do not change it)"""
+    audience_query(audience)  # validates the audience type
+    await _ensure_indexes(current_db)
+    now = datetime.now(timezone.utc)
+    campaign = {
+        "name": name,
+        "status": "draft",
+        "template": {
+            "template_id": str(template.get("_id", "")),
+            "name": template.get("name"),
+            "subject": template.get("subject", ""),
+            "body": template.get("body", ""),
+        },
+        "audience": audience,
+        "language": language,
+        "variables": variables or {},
+        "checkpoint": None,
+        "counts": {"sent": 0, "failed": 0, "skipped": 0, "deferred": 0, "interrupted": 0},
+        "sending_seconds": 0.0,
+        "created_by": created_by,
+        "created_at": now,
+        "updated_at": now,
+    }
+    result = await current_db.campaigns.insert_one(campaign)
+    campaign["_id"] = result.inserted_id
+    return campaign
+
+
+async def set_status(current_db, campaign_id: str, status: str) -> Optional[Dict[str, Any]]:
+    """start / resume (running), pause, cancel - a running campaign notices at its next batch"""
+    allowed_from = {
+        "running": ["draft", "paused"],
+        "paused": ["running"],
+        "cancelled": ["draft", "running", "paused"],
+    }[status]
+    now = datetime.now(timezone.utc)
+    update: Dict[str, Any] = {"status": status, "updated_at": now}
+    if status == "running":
+        update.update({"next_attempt_at": now, "last_error": None})
+    campaign = await current_db.campaigns.find_one_and_update(
+        {"_id": ObjectId(campaign_id), "status": {"$in": allowed_from}},
+        {"$set": update},
+        return_document=ReturnDocument.AFTER
+    )
+    if campaign is not None and status == "running" and _wakeup is not None:
+        _wakeup.set()
+    return campaign
+
+
+def campaign_progress(campaign: Dict[str, Any]) -> Dict[str, Any]:
+    counts = campaign.get("counts") or {}
+    seconds = campaign.get("sending_seconds") or 0
+    return {
+        **counts,
+        "sending_seconds": round(seconds, 1),
+        "throughput_per_second": round(counts.get("sent", 0) / seconds, 2) if seconds else None,
+        "checkpoint": str(campaign["checkpoint"]) if campaign.get("checkpoint") else None,
+    }
+
+
+async def lease_next(current_db) -> Optional[Dict[str, Any]]:
+    """Atomically claim a running campaign that is due and not held by a live worker"""
+    now = datetime.now(timezone.utc)
+    return await current_db.campaigns.find_one_and_update(
+        {
+            "status": "running",
+            "next_attempt_at": {"$not": {"$gt": now}},
+            # Free, or the lease of a crashed / restarted worker
+            "lease_expires_at": {"$not": {"$gt": now}},
+        },
+        {"$set": {
+            "lease_owner": WORKER_ID,
+            "lease_expires_at": now + timedelta(seconds=CAMPAIGN_LEASE_SECONDS),
+            "updated_at": now
+        },
+         "$min": {"started_at": now}},
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+class RateLimiter:
+    """At most rate sends per second across the concurrent senders (0 = unlimited)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_slot = time.monotonic()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def _send_recipients(campaign: Dict[str, Any], recipients: List[Dict[str, Any]],
+                           limiter: RateLimiter) -> List[Optional[Exception]]:
+    """Send to each recipient (CAMPAIGN_CONCURRENCY in flight, throttled). Returns the error per recipient"""
+    settings = smtp_client.account()
+    semaphore = asyncio.Semaphore(CAMPAIGN_CONCURRENCY)
+
+    async def one(recipient):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                await smtp_client.send(build_message(campaign, recipient), settings)
+                return None
+            except Exception as e:
+                return e
+
+    return await asyncio.gather(*(one(recipient) for recipient in recipients))
+
+
+async def _deliver(current_db, campaign: Dict[str, Any], recipients: List[Dict[str, Any]],
+                   limiter: RateLimiter) -> Dict[str, Any]:
+    """Send reserved recipients and record each outcome. Returns {"sent", "failed", "deferred", "seconds", "smtp_down"}"""
+    started = time.monotonic()
+    errors = await _send_recipients(campaign, recipients, limiter)
+    now = datetime.now(timezone.utc)
+
+    outcome = {"sent": 0, "failed": 0, "deferred": 0}
+    updates = []
+    for recipient, error in zip(recipients, errors):
+        attempts = recipient.get("attempts", 0) + 1
+        if error is None:
+            status, error_text = "sent", None
+        else:
+            error_text = str(error)[:300]
+            permanent = email_outbox.is_permanent_error(error)
+            status = "failed" if permanent or attempts >= CAMPAIGN_MAX_ATTEMPTS else "deferred"
+        outcome[status] += 1
+        retry_at = now + timedelta(seconds=CAMPAIGN_RETRY_DELAY_SECONDS * 2 ** (attempts - 1)) if status == "deferred" else None
+        updates.append(UpdateOne(
+            {"_id": recipient["_id"]},
+            {"$set": {"status": status, "attempts": attempts, "error": error_text, "next_attempt_at": retry_at,
+                      "sent_at": now if error is None else None, "updated_at": now}}
+        ))
+    if updates:
+        await current_db.campaign_recipients.bulk_write(updates, ordered=False)
+
+    _stats["sent"] += outcome["sent"]
+    _stats["failed"] += outcome["failed"]
+    _stats["deferred"] += outcome["deferred"]
+    outcome["seconds"] = time.monotonic() - started
+    # Nothing went through and nothing was refused for good: the SMTP server is unreachable
+    outcome["smtp_down"] = bool(recipients) and outcome["deferred"] == len(recipients)
+    return outcome
+
+
+async def _reserve(current_db, campaign: Dict[str, Any], docs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """campaign_recipients records of a batch (status reserved). Returns (reserved, skipped)"""
+    audience_type = campaign["audience"]["type"]
+    candidates: Dict[str, Dict[str, Any]] = {}
+    for doc in docs:
+        email = (doc.get("email") or "").strip().lower()
+        if "@" in email and email not in candidates:
+            candidates[email] = doc
+
+    if audience_type == "leads" and candidates:
+        # Leads who withdrew their marketing consent through the newsletter unsubscribe
+        # (case-insensitive: subscriber emails are stored as entered)
+        async for subscriber in current_db.newsletter_subscribers.find(
+                {"email": {"$in": list(candidates)}, "is_active": False}, {"email": 1}, collation=EMAIL_COLLATION):
+            candidates.pop((subscriber.get("email") or "").lower(), None)
+
+    now = datetime.now(timezone.utc)
+    records = [
+        {
+            "_id": ObjectId(),
+            "campaign_id": campaign["_id"],
+            "email": email,
+            "recipient_id": str(doc["_id"]),
+            "language": doc.get("language") or campaign.get("language", "fr"),
+            "variables": _recipient_variables(audience_type, doc),
+            "status": "reserved",
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for email, doc in candidates.items()
+    ]
+
+    reserved = records
+    if records:
+        try:
+            await current_db.campaign_recipients.insert_many(records, ordered=False)
+        except BulkWriteError as e:
+            # Already reserved (duplicate email, or batch replayed after a restart): not sent again
+            duplicates = {error["index"] for error in e.details.get("writeErrors", []) if error.get("code") == 11000}
+            if len(duplicates) != len(e.details.get("writeErrors", [])):
+                raise
+            reserved = [record for index, record in enumerate(records) if index not in duplicates]
+    return reserved, len(docs) - len(reserved)
+
+
+async def _checkpoint(current_db, campaign: Dict[str, Any], set_fields: Dict[str, Any],
+                      counts: Dict[str, int], seconds: float) -> Optional[Dict[str, Any]]:
+    """Save progress and renew the lease. Returns the campaign, None when the lease was lost"""
+    now = datetime.now(timezone.utc)
+    return await current_db.campaigns.find_one_and_update(
+        {"_id": campaign["_id"], "lease_owner": WORKER_ID},
+        {"$set": {**set_fields, "lease_expires_at": now + timedelta(seconds=CAMPAIGN_LEASE_SECONDS), "updated_at": now},
+         "$inc": {**{f"counts.{key}": value for key, value in counts.items() if value}, "sending_seconds": seconds}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _release(current_db, campaign: Dict[str, Any], set_fields: Dict[str, Any]):
+    await current_db.campaigns.update_one(
+        {"_id": campaign["_id"], "lease_owner": WORKER_ID},
+        {"$set": {**set_fields, "lease_owner": None, "lease_expires_at": None,
+                  "updated_at": datetime.now(timezone.utc)}}
+    )
+
+
+async def _backoff(current_db, campaign: Dict[str, Any]):
+    """SMTP unreachable: put the campaign aside, another worker (or this one) resumes it later"""
+    _stats["smtp_backoffs"] += 1
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=CAMPAIGN_SMTP_BACKOFF_SECONDS)
+    await _release(current_db, campaign, {"next_attempt_at": retry_at, "last_error": "SMTP server unreachable"})
+    logging.warning(f"CAMPAIGN_SMTP_BACKOFF {campaign['_id']} until {retry_at.isoformat()}")
+
+
+async def run_campaign(current_db, campaign: Dict[str, Any]) -> str:
+    """Stream the audience after the checkpoint, then retry deferred recipients. Returns the outcome"""
+    campaign_id = str(campaign["_id"])
+    limiter = RateLimiter(CAMPAIGN_RATE_PER_SECOND)
+    _active[campaign_id] = {"name": campaign.get("name"), "started_at": datetime.now(timezone.utc)}
+
+    try:
+        # Reserved by a run that stopped mid-batch: outcome unknown, not sent again
+        interrupted = await current_db.campaign_recipients.update_many(
+            {"campaign_id": campaign["_id"], "status": "reserved"},
+            {"$set": {"status": "interrupted", "updated_at": datetime.now(timezone.utc)}}
+        )
+        if interrupted.modified_count:
+            await _checkpoint(current_db, campaign, {}, {"interrupted": interrupted.modified_count}, 0)
+
+        collection, query = audience_query(campaign["audience"])
+        if campaign.get("checkpoint") is not None:
+            query["_id"] = {"$gt": campaign["checkpoint"]}
+        projection = {"email": 1, "language": 1, "name": 1, "brand_name": 1, "sector": 1, "target_city": 1}
+        cursor = current_db[collection].find(query, projection).sort("_id", 1).batch_size(CAMPAIGN_BATCH_SIZE)
+
+        batch: List[Dict[str, Any]] = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) < CAMPAIGN_BATCH_SIZE:
+                continue
+            outcome = await _run_batch(current_db, campaign, batch, limiter)
+            batch = []
+            if outcome != "continue":
+                return outcome
+        if batch:
+            outcome = await _run_batch(current_db, campaign, batch, limiter)
+            if outcome != "continue":
+                return outcome
+
+        # Audience streamed: deferred recipients get their remaining attempts once their retry is due
+        while True:
+            deferred = await current_db.campaign_recipients.find(
+                {"campaign_id": campaign["_id"], "status": "deferred", "next_attempt_at": {"$not": {"$gt": datetime.now(timezone.utc)}}}
+            ).limit(CAMPAIGN_BATCH_SIZE).to_list(CAMPAIGN_BATCH_SIZE)
+            if not deferred:
+                waiting = await current_db.campaign_recipients.find_one(
+                    {"campaign_id": campaign["_id"], "status": "deferred"}, {"next_attempt_at": 1},
+                    sort=[("next_attempt_at", 1)]
+                )
+                if waiting is None:
+                    break
+                # Put the campaign aside (the worker runs the other campaigns meanwhile)
+                await _release(current_db, campaign, {"next_attempt_at": waiting["next_attempt_at"]})
+                logging.info(f"CAMPAIGN_RETRY_SCHEDULED {campaign_id} at {waiting['next_attempt_at'].isoformat()}")
+                return "retry_scheduled"
+            await current_db.campaign_recipients.update_many(
+                {"_id": {"$in": [recipient["_id"] for recipient in deferred]}},
+                {"$set": {"status": "reserved"}}
+            )
+            result = await _deliver(current_db, campaign, deferred, limiter)
+            if result["smtp_down"]:
+                await _checkpoint(current_db, campaign, {}, {}, result["seconds"])
+                await _backoff(current_db, campaign)
+                return "smtp_backoff"
+            counts = {"sent": result["sent"], "failed": result["failed"],
+                      "deferred": result["deferred"] - len(deferred)}
+            current = await _checkpoint(current_db, campaign, {}, counts, result["seconds"])
+            if current is None or current["status"] != "running":
+                return await _stopped(current_db, campaign, current)
+
+        now = datetime.now(timezone.utc)
+        await _release(current_db, campaign, {"status": "completed", "completed_at": now})
+        _stats["completed"] += 1
+        logging.info(f"✅ CAMPAIGN_COMPLETED {campaign_id} ({campaign.get('name')})")
+        return "completed"
+    finally:
+        _active.pop(campaign_id, None)
+
+
+async def _stopped(current_db, campaign: Dict[str, Any], current: Optional[Dict[str, Any]]) -> str:
+    """Paused or cancelled during the run (or the lease was taken over)"""
+    if current is None:
+        logging.warning(f"CAMPAIGN_LEASE_LOST {campaign['_id']}")
+        return "lease_lost"
+    await _release(current_db, campaign, {})
+    logging.info(f"CAMPAIGN_{current['status'].upper()} {campaign['_id']} ({campaign.get('name')})")
+    return current["status"]
+
+
+async def _run_batch(current_db, campaign: Dict[str, Any], docs: List[Dict[str, Any]], limiter: RateLimiter) -> str:
+    """Reserve, send and checkpoint one audience batch. Returns "continue" or why the run stops"""
+    _stats["batches"] += 1
+    reserved, skipped = await _reserve(current_db, campaign, docs)
+    _stats["skipped"] += skipped
+    result = await _deliver(current_db, campaign, reserved, limiter)
+
+    counts = {"sent": result["sent"], "failed": result["failed"], "deferred": result["deferred"], "skipped": skipped}
+    # Deferred recipients are retried after the audience: the checkpoint moves past them
+    current = await _checkpoint(current_db, campaign, {"checkpoint": docs[-1]["_id"]}, counts, result["seconds"])
+    if result["smtp_down"] and current is not None:
+        await _backoff(current_db, campaign)
+        return "smtp_backoff"
+    if current is None or current["status"] != "running":
+        return await _stopped(current_db, campaign, current)
+    return "continue"
+
+
+async def drain_once() -> Dict[str, Any]:
+    """Run the due campaigns, one after the other"""
+    current_db = database.get_db()
+    if current_db is None:
+        return {"campaigns": [], "skipped": "Database not configured"}
+
+    await _ensure_indexes(current_db)
+    _stats["last_run_at"] = datetime.now(timezone.utc)
+
+    results = []
+    while True:
+        campaign = await lease_next(current_db)
+        if campaign is None:
+            break
+        try:
+            outcome = await run_campaign(current_db, campaign)
+        except asyncio.CancelledError:
+            # App shutdown: hand the campaign back at once instead of waiting for the lease to expire
+            await asyncio.shield(_release(current_db, campaign, {}))
+            raise
+        except Exception as e:
+            # Database error: the lease expires and the campaign resumes from its checkpoint
+            logging.error(f"❌ CAMPAIGN_ERROR {campaign['_id']}: {str(e)}")
+            outcome = "error"
+        results.append({"campaign_id": str(campaign["_id"]), "outcome": outcome})
+    return {"campaigns": results}
+
+
+async def _run_loop():
+    while True:
+        _wakeup.clear()
+        try:
+            summary = await drain_once()
+            for result in summary.get("campaigns", []):
+                logging.info(f"CAMPAIGN_ENGINE run: {result['campaign_id']} {result['outcome']}")
+        except Exception as e:
+            logging.error(f"CAMPAIGN_ENGINE loop error: {str(e)}")
+
+        # set_status(running) wakes the loop up at once; the poll resumes campaigns put aside
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=CAMPAIGN_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start():
+    """Start the campaign loop (app startup) - campaigns left running by a previous process resume"""
+    global _task, _wakeup
+    if not CAMPAIGN_ENGINE_ENABLED or (_task is not None and not _task.done()):
+        return
+    _wakeup = asyncio.Event()
+    _task = asyncio.ensure_future(_run_loop())
+    logging.info(f"✅ Campaign engine started (batch={CAMPAIGN_BATCH_SIZE}, concurrency={CAMPAIGN_CONCURRENCY}, "
+                 f"rate={CAMPAIGN_RATE_PER_SECOND}/s)")
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
+
+
+def engine_status() -> Dict[str, Any]:
+    return {
+        "enabled": CAMPAIGN_ENGINE_ENABLED,
+        "running": _task is not None and not _task.done(),
+        "worker_id": WORKER_ID,
+        "batch_size": CAMPAIGN_BATCH_SIZE,
+        "concurrency": CAMPAIGN_CONCURRENCY,
+        "rate_per_second": CAMPAIGN_RATE_PER_SECOND,
+        "poll_seconds": CAMPAIGN_POLL_SECONDS,
+        "active": [{"campaign_id": key, "name": value["name"], "started_at": value["started_at"].isoformat()}
+                   for key, value in _active.items()],
+        "template_cache": compile_template.cache_info()._asdict(),
+        "stats": {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in _stats.items()}
+    }
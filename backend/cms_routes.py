@@ -11,7 +11,6 @@ import logging
 import uuid
 import hashlib
 import jwt
-from motor.motor_asyncio import AsyncIOMotorClient
 
 # Import auth middleware
 import sys
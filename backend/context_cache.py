@@ -0,0 +1,259 @@
+"""
+Provider-side Context Cache for Israel Growth Venture mini-analyses
+Registers each compiled template's static prefix (master prompt, plus the reference
+documents unless they are pruned per request) as a Gemini cachedContent, so requests
+only send the client form block.
+Falls back to the full prompt when the cache is disabled, cannot be created or expired.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from fastapi import Request
+from google.genai import types as genai_types
+
+import llm_executor
+import prompt_registry
+
+# Context caching configuration
+CONTEXT_CACHE_ENABLED = os.getenv('GEMINI_CONTEXT_CACHE_ENABLED', 'true').lower() == 'true'
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL_SECONDS', '3600'))
+# A cached context closer than this to expiry is recreated instead of reused
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 120
+# After a failed cache creation, use full prompts for this long before retrying
+CONTEXT_CACHE_RETRY_SECONDS = 600
+CONTEXT_CACHE_CREATE_TIMEOUT_SECONDS = 30
+
+# (model, template_id, language, version) -> {"name", "expire_time"} or {"failed_until"}
+_contexts: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+_locks: Dict[Tuple[str, str, str, str], asyncio.Lock] = {}
+
+_stats = {
+    "hits": 0,
+    "creates": 0,
+    "create_failures": 0,
+    "expired_fallbacks": 0,
+    "full_prompt_calls": 0,
+}
+
+
+def is_cache_miss_error(error: Exception) -> bool:
+    """Detect 'cachedContent not found / expired / not accessible' provider errors"""
+    error_str = str(error).lower()
+    if "cache" not in error_str:
+        return False
+    return any(marker in error_str for marker in ("not found", "not_found", "expired", "404", "403", "permission_denied"))
+
+
+def _context_key(model: str, template: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return (model, template["template_id"], template["language"], template["version"])
+
+
+def invalidate(model: str, template: Dict[str, Any]):
+    """Forget the cached context of a template (e.g. provider says it expired)"""
+    _contexts.pop(_context_key(model, template), None)
+
+
+async def get_cached_context(client, model: str, template: Dict[str, Any], request_id: str = "unknown") -> Optional[str]:
+    """
+    Return the cachedContent name for a compiled template, creating it if needed.
+    Returns None when caching is disabled or unavailable (caller sends the full prompt).
+    """
+    if not CONTEXT_CACHE_ENABLED or client is None or not hasattr(client, "caches"):
+        return None
+
+    key = _context_key(model, template)
+    now = datetime.now(timezone.utc)
+
+    entry = _contexts.get(key)
+    if entry is not None:
+        if entry.get("failed_until") and entry["failed_until"] > now:
+            return None
+        if entry.get("name") and entry["expire_time"] - now > timedelta(seconds=CONTEXT_CACHE_REFRESH_MARGIN_SECONDS):
+            _stats["hits"] += 1
+            return entry["name"]
+
+    # One creation per template at a time - concurrent requests wait for it
+    lock = _locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        entry = _contexts.get(key)
+        now = datetime.now(timezone.utc)
+        if entry is not None and entry.get("name") and entry["expire_time"] - now > timedelta(seconds=CONTEXT_CACHE_REFRESH_MARGIN_SECONDS):
+            _stats["hits"] += 1
+            return entry["name"]
+
+        try:
+            cached = await llm_executor.run_blocking(
+                client.caches.create,
+                model=model,
+                contents=[template["static_prefix"]],
+                config=genai_types.CreateCachedContentConfig(
+                    ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+                    display_name=f"igv-{template['template_id']}-{template['version']}"[:128]
+                ),
+                timeout=CONTEXT_CACHE_CREATE_TIMEOUT_SECONDS,
+                request_id=request_id
+            )
+        except Exception as e:
+            _stats["create_failures"] += 1
+            _contexts[key] = {"failed_until": now + timedelta(seconds=CONTEXT_CACHE_RETRY_SECONDS)}
+            logging.warning(f"[{request_id}] CONTEXT_CACHE_CREATE_FAILED {template['template_id']}: {str(e)} - using full prompts")
+            return None
+
+        expire_time = getattr(cached, "expire_time", None) or now + timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS)
+        _contexts[key] = {"name": cached.name, "expire_time": expire_time, "created_at": now}
+        _stats["creates"] += 1
+        logging.info(f"[{request_id}] ✅ CONTEXT_CACHE_CREATED {template['template_id']} v{template['version']} -> {cached.name}")
+        return cached.name
+
+
+async def prepare_request(
+    client,
+    model: str,
+    request,
+    language: str,
+    transform: Optional[Callable[[str], str]] = None,
+    request_id: str = "unknown"
+) -> Dict[str, Any]:
+    """
+    Build the provider call for a mini-analysis request.
+
+    Returns {"contents", "config", "template", "cached_content"}: with a cached context
+    contents only hold the form block, otherwise the full prompt (build_prompt output).
+    transform (e.g. the LANG_FAIL retry instruction) is applied to the text actually sent.
+    """
+    form_block, template = prompt_registry.render_form_block(request, language)
+    cached_content = await get_cached_context(client, model, template, request_id)
+
+    if cached_content:
+        text = form_block
+        config = genai_types.GenerateContentConfig(cached_content=cached_content)
+    else:
+        text, template = prompt_registry.render_prompt(request, language)
+        config = None
+
+    if transform is not None:
+        text = transform(text)
+
+    return {"contents": [text], "config": config, "template": template, "cached_content": cached_content}
+
+
+def _full_prompt_request(request, language: str, transform: Optional[Callable[[str], str]]) -> Dict[str, Any]:
+    text, template = prompt_registry.render_prompt(request, language)
+    if transform is not None:
+        text = transform(text)
+    return {"contents": [text], "config": None, "template": template, "cached_content": None}
+
+
+async def generate(
+    client,
+    model: str,
+    request,
+    language: str,
+    *,
+    transform: Optional[Callable[[str], str]] = None,
+    timeout: Optional[float] = None,
+    http_request: Optional[Request] = None,
+    request_id: str = "unknown"
+):
+    """generate_content using the cached static prefix when available"""
+    call = await prepare_request(client, model, request, language, transform, request_id)
+
+    if call["cached_content"]:
+        try:
+            return await llm_executor.generate_content(
+                client, model, call["contents"], config=call["config"],
+                timeout=timeout, http_request=http_request, request_id=request_id
+            )
+        except Exception as e:
+            if not is_cache_miss_error(e):
+                raise
+            _stats["expired_fallbacks"] += 1
+            invalidate(model, call["template"])
+            logging.warning(f"[{request_id}] CONTEXT_CACHE_MISS {call['cached_content']}: {str(e)} - retrying with full prompt")
+            call = _full_prompt_request(request, language, transform)
+
+    _stats["full_prompt_calls"] += 1
+    return await llm_executor.generate_content(
+        client, model, call["contents"],
+        timeout=timeout, http_request=http_request, request_id=request_id
+    )
+
+
+async def stream(
+    client,
+    model: str,
+    request,
+    language: str,
+    *,
+    transform: Optional[Callable[[str], str]] = None,
+    timeout: Optional[float] = None,
+    http_request: Optional[Request] = None,
+    request_id: str = "unknown"
+) -> AsyncIterator[Any]:
+    """generate_content_stream using the cached static prefix when available"""
+    call = await prepare_request(client, model, request, language, transform, request_id)
+
+    if call["cached_content"]:
+        started = False
+        try:
+            async for chunk in llm_executor.stream_content(
+                client, model, call["contents"], config=call["config"],
+                timeout=timeout, http_request=http_request, request_id=request_id
+            ):
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            # Only safe to fall back before any chunk reached the client
+            if started or not is_cache_miss_error(e):
+                raise
+            _stats["expired_fallbacks"] += 1
+            invalidate(model, call["template"])
+            logging.warning(f"[{request_id}] CONTEXT_CACHE_MISS (stream) {call['cached_content']}: {str(e)} - retrying with full prompt")
+            call = _full_prompt_request(request, language, transform)
+
+    _stats["full_prompt_calls"] += 1
+    async for chunk in llm_executor.stream_content(
+        client, model, call["contents"],
+        timeout=timeout, http_request=http_request, request_id=request_id
+    ):
+        yield chunk
+
+
+async def release_contexts(client):
+    """Best-effort deletion of the cached contexts we created (app shutdown)"""
+    if client is None or not hasattr(client, "caches"):
+        return
+    for key, entry in list(_contexts.items()):
+        if entry.get("name"):
+            try:
+                await llm_executor.run_blocking(client.caches.delete, name=entry["name"], timeout=10, request_id="shutdown")
+            except Exception as e:
+                logging.warning(f"CONTEXT_CACHE_DELETE_FAILED {entry['name']}: {str(e)}")
+        _contexts.pop(key, None)
+
+
+def cache_status() -> Dict[str, Any]:
+    """Cached contexts + counters for the /mini-analysis/debug endpoint"""
+    now = datetime.now(timezone.utc)
+    contexts = []
+    for (model, template_id, language, version), entry in _contexts.items():
+        contexts.append({
+            "model": model,
+            "template_id": template_id,
+            "language": language,
+            "version": version,
+            "name": entry.get("name"),
+            "expires_in_seconds": int((entry["expire_time"] - now).total_seconds()) if entry.get("name") else None,
+            "disabled_until": entry["failed_until"].isoformat() if entry.get("failed_until") else None
+        })
+    return {
+        "enabled": CONTEXT_CACHE_ENABLED,
+        "ttl_seconds": CONTEXT_CACHE_TTL_SECONDS,
+        "stats": dict(_stats),
+        "contexts": contexts
+    }
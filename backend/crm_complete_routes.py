@@ -4,14 +4,12 @@ All 5 modules: Dashboard, Leads, Pipeline, Contacts, Settings
 Uses centralized auth_middleware for authentication and RBAC
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Query, Body, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Body, status, Header
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import aiosmtplib
-import os
 import logging
 import hashlib
 import re
@@ -30,6 +28,13 @@ from auth_middleware import (
     get_db
 )
 
+import campaign_engine
+from database import get_database
+import email_outbox
+import idempotency
+import smtp_client
+import similarity_index
+
 router = APIRouter(prefix="/api/crm")
 
 
@@ -404,6 +409,25 @@ async def get_lead(lead_id: str, user: Dict = Depends(get_current_user)):
     return lead
 
 
+@router.get("/leads/{lead_id}/similar-analyses")
+async def get_similar_analyses(lead_id: str, k: int = Query(5, ge=1, le=50), include_same_brand: bool = False,
+                               user: Dict = Depends(get_current_user)):
+    """Past mini-analyses most similar to this lead's brand (TF-IDF cosine, top k)"""
+    current_db = get_db()
+    if current_db is None:
+        raise HTTPException(status_code=500, detail="Database not configured")
+    
+    try:
+        lead = await current_db.leads.find_one({"_id": ObjectId(lead_id)})
+    except:
+        raise HTTPException(status_code=400, detail="Invalid lead ID")
+    
+    if not lead:
+        raise HTTPException(status_code=404, detail="Lead not found")
+    
+    return await similarity_index.similar_to_lead(current_db, lead, k=k, include_same_brand=include_same_brand)
+
+
 @router.post("/leads", status_code=status.HTTP_201_CREATED)
 async def create_lead(lead_data: LeadCreate, user: Dict = Depends(get_current_user)):
     """Create new lead"""
@@ -1565,14 +1589,10 @@ async def send_crm_email(
     if current_db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
     
-    # OVH SMTP Configuration (contact@israelgrowthventure.com)
-    smtp_host = os.getenv('SMTP_HOST', 'ssl0.ovh.net')
-    smtp_port = int(os.getenv('SMTP_PORT', '465'))
-    smtp_user = os.getenv('SMTP_USER', 'contact@israelgrowthventure.com')
-    smtp_password = os.getenv('SMTP_PASSWORD')
-    smtp_from = os.getenv('SMTP_FROM', 'contact@israelgrowthventure.com')
+    # OVH SMTP account (contact@israelgrowthventure.com)
+    smtp_from = smtp_client.SMTP_FROM
     
-    if not smtp_user or not smtp_password:
+    if not smtp_client.is_configured():
         raise HTTPException(status_code=500, detail="SMTP credentials not configured")
     
     # Create email message
@@ -1603,44 +1623,53 @@ async def send_crm_email(
     message.attach(MIMEText(html_body, 'html'))
     
     try:
-        # OVH requires SSL/TLS (port 465) instead of STARTTLS (port 587)
-        await aiosmtplib.send(
+        outbox_id = await email_outbox.enqueue(
+            current_db,
             message,
-            hostname=smtp_host,
-            port=smtp_port,
-            username=smtp_user,
-            password=smtp_password,
-            use_tls=True  # SSL/TLS direct for OVH
+            "crm",
+            smtp_client.account(),
+            event={"contact_id": email_data.contact_id, "sent_by": user["email"]},
+            context={"contact_id": email_data.contact_id, "sent_by": user["email"]}
         )
         
-        # Log email activity
-        activity = {
-            "type": "email_sent",
-            "to_email": email_data.to_email,
-            "subject": email_data.subject,
-            "contact_id": email_data.contact_id,
-            "sent_by": user["email"],
-            "sent_at": datetime.now(timezone.utc).isoformat()
-        }
-        await current_db.crm_activities.insert_one(activity)
-        
-        # Update contact last activity if contact_id provided
-        if email_data.contact_id:
-            try:
-                await current_db.contacts.update_one(
-                    {"_id": ObjectId(email_data.contact_id)},
-                    {"$set": {"last_activity": datetime.now(timezone.utc).isoformat()}}
-                )
-            except Exception:
-                pass  # Non-critical
-        
-        return {"success": True, "message": "Email sent successfully"}
+        return {"success": True, "queued": True, "outbox_id": outbox_id, "message": "Email queued for sending"}
         
     except Exception as e:
-        logging.error(f"Error sending CRM email: {str(e)}")
+        logging.error(f"Error queueing CRM email: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
 
 
+async def record_crm_email_result(current_db, item: Dict[str, Any], sent: bool, error: Optional[str]):
+    """Email outbox result hook: CRM activity + contact last activity once the email is sent"""
+    if not sent:
+        return
+    context = item.get("context") or {}
+    
+    # Log email activity
+    activity = {
+        "type": "email_sent",
+        "to_email": item.get("to_email"),
+        "subject": item.get("subject"),
+        "contact_id": context.get("contact_id"),
+        "sent_by": context.get("sent_by"),
+        "sent_at": datetime.now(timezone.utc).isoformat()
+    }
+    await current_db.crm_activities.insert_one(activity)
+    
+    # Update contact last activity if contact_id provided
+    if context.get("contact_id"):
+        try:
+            await current_db.contacts.update_one(
+                {"_id": ObjectId(context["contact_id"])},
+                {"$set": {"last_activity": datetime.now(timezone.utc).isoformat()}}
+            )
+        except Exception:
+            pass  # Non-critical
+
+
+email_outbox.on_result("crm", record_crm_email_result)
+
+
 @router.get("/settings/pipeline-stages")
 async def get_pipeline_stages(user: Dict = Depends(get_current_user)):
     """Get pipeline stages configuration"""
@@ -1663,6 +1692,123 @@ async def get_pipeline_stages(user: Dict = Depends(get_current_user)):
     return {"stages": stages}
 
 
+# ==========================================
+# EMAIL CAMPAIGNS
+# ==========================================
+
+class CampaignAudience(BaseModel):
+    type: str  # newsletter (active subscribers with marketing consent) | leads
+    filters: Dict[str, Any] = {}  # newsletter: language, tags - leads: status, stage, sector, language...
+
+
+class CampaignCreate(BaseModel):
+    name: str
+    template_id: str
+    audience: CampaignAudience
+    language: str = "fr"  # Recipients without a language (or a template without it) get this one
+    variables: Dict[str, str] = {}  # Campaign-wide {{variables}} (link...); recipients add email, name, brand...
+    start: bool = False
+
+
+def _campaign_response(campaign: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "campaign_id": str(campaign["_id"]),
+        "name": campaign.get("name"),
+        "status": campaign.get("status"),
+        "template": {"template_id": campaign["template"].get("template_id"), "name": campaign["template"].get("name")},
+        "audience": campaign.get("audience"),
+        "language": campaign.get("language"),
+        "progress": campaign_engine.campaign_progress(campaign),
+        "last_error": campaign.get("last_error"),
+        "created_by": campaign.get("created_by"),
+        "created_at": campaign.get("created_at"),
+        "started_at": campaign.get("started_at"),
+        "completed_at": campaign.get("completed_at"),
+    }
+
+
+@router.post("/campaigns")
+async def create_campaign(data: CampaignCreate, user: Dict = Depends(get_current_user),
+                          current_db=Depends(get_database)):
+    """Create an email campaign: a template sent to newsletter subscribers or a lead segment (Admin only)"""
+    await require_role(["admin"], user)
+    
+    if data.audience.type not in campaign_engine.AUDIENCE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Audience type must be one of {', '.join(campaign_engine.AUDIENCE_TYPES)}")
+    unknown = set(data.audience.filters) - set(campaign_engine.LEAD_FILTER_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown audience filters: {', '.join(sorted(unknown))}")
+    if not ObjectId.is_valid(data.template_id):
+        raise HTTPException(status_code=400, detail="Invalid template ID")
+    
+    template = await current_db.email_templates.find_one({"_id": ObjectId(data.template_id)})
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    audience = data.audience.dict()
+    campaign = await campaign_engine.create_campaign(
+        current_db, data.name, template, audience, data.language, data.variables, user["email"]
+    )
+    if data.start:
+        campaign = await campaign_engine.set_status(current_db, str(campaign["_id"]), "running")
+    
+    return {
+        **_campaign_response(campaign),
+        "audience_estimate": await campaign_engine.count_audience(current_db, audience)
+    }
+
+
+@router.get("/campaigns")
+async def list_campaigns(user: Dict = Depends(get_current_user), limit: int = Query(50, le=200),
+                         current_db=Depends(get_database)):
+    """Campaigns with their progress (sent / failed / skipped, throughput)"""
+    
+    campaigns = await current_db.campaigns.find({}).sort("created_at", -1).limit(limit).to_list(limit)
+    return {"campaigns": [_campaign_response(campaign) for campaign in campaigns]}
+
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str, user: Dict = Depends(get_current_user), current_db=Depends(get_database)):
+    """Campaign progress, with the recipients per delivery status"""
+    if not ObjectId.is_valid(campaign_id):
+        raise HTTPException(status_code=400, detail="Invalid campaign ID")
+    
+    campaign = await current_db.campaigns.find_one({"_id": ObjectId(campaign_id)})
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    
+    recipients = await current_db.campaign_recipients.aggregate([
+        {"$match": {"campaign_id": campaign["_id"]}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    
+    return {
+        **_campaign_response(campaign),
+        "recipients": {r["_id"]: r["count"] for r in recipients},
+        "audience_estimate": await campaign_engine.count_audience(current_db, campaign["audience"])
+    }
+
+
+@router.post("/campaigns/{campaign_id}/{action}")
+async def change_campaign_status(campaign_id: str, action: str, user: Dict = Depends(get_current_user),
+                                 current_db=Depends(get_database)):
+    """start (also resumes a paused campaign), pause or cancel (Admin only)"""
+    await require_role(["admin"], user)
+    
+    statuses = {"start": "running", "pause": "paused", "cancel": "cancelled"}
+    if action not in statuses:
+        raise HTTPException(status_code=404, detail="Unknown campaign action")
+    if not ObjectId.is_valid(campaign_id):
+        raise HTTPException(status_code=400, detail="Invalid campaign ID")
+    
+    campaign = await campaign_engine.set_status(current_db, campaign_id, statuses[action])
+    if campaign is None:
+        raise HTTPException(status_code=409, detail=f"Campaign not found or cannot {action} from its current status")
+    
+    logging.info(f"CAMPAIGN_{action.upper()} {campaign_id} by {user['email']}")
+    return _campaign_response(campaign)
+
+
 # ==========================================
 # ACTIVITIES
 # ==========================================
@@ -1766,12 +1912,24 @@ async def get_activities(
 # ==========================================
 
 @router.post("/lead-from-pack")
-async def create_lead_from_pack(data: LeadFromPackRequest):
+async def create_lead_from_pack(data: LeadFromPackRequest,
+                                idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")):
     """
     Enregistre demande de rappel depuis /packs (PUBLIQUE - pas d'auth)
     Crée lead avec status=new, source=pack_rappel, assigned_to=null
     Admin redistribuera manuellement
+    Idempotent: un double-clic ne crée qu'un seul lead (Idempotency-Key ou payload)
     """
+    return await idempotency.run_once(
+        "crm-lead-from-pack",
+        idempotency_key,
+        data.dict(),
+        lambda clients: insert_lead_from_pack(data)
+    )
+
+
+async def insert_lead_from_pack(data: LeadFromPackRequest) -> dict:
+    """Insertion du lead pack (exécutée une seule fois par clé d'idempotence)"""
     current_db = get_db()
     if current_db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
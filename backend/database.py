@@ -0,0 +1,224 @@
+"""
+MongoDB Provider for Israel Growth Venture
+One AsyncIOMotorClient (one connection pool) for the whole process, instead of a client per module:
+- created by the app startup (connect) and closed at shutdown (close); get_db() also creates it
+  on first use for background tasks and scripts that run outside the app
+- pool size, idle time, timeouts and wire compression configurable (MONGO_*)
+- get_database: FastAPI dependency (500 when MongoDB is not configured)
+- pool usage (connections open / checked out, checkout waits and failures) collected by a
+  pymongo connection pool listener, exposed by pool_status() (GET /api/admin/database)
+
+Every module's get_db() is this one: `from database import get_db`.
+"""
+
+from typing import Any, Dict, List, Optional
+import logging
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+# MongoDB connection with environment variable aliases (Render compatibility)
+MONGO_URL = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
+DB_NAME = os.getenv('DB_NAME', 'igv_production')
+
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '20'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '1'))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '300000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '30000'))
+# Wait for a free pooled connection before failing (instead of queueing forever under load)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+# Preference order; compressors whose library is not installed are left out (zlib is always available)
+MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zstd,snappy,zlib')
+
+_client: Optional[AsyncIOMotorClient] = None
+_db = None
+_connected_at: Optional[float] = None
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool counters of the shared client (called by pymongo, must not block)"""
+
+    def __init__(self):
+        self.stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "pool_cleared": 0,
+        }
+        self.open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkout_wait_ms_total = 0.0
+        self.checkout_wait_ms_max = 0.0
+        self._checkout_started: Dict[int, List[float]] = {}
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.stats["pool_cleared"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.stats["connections_created"] += 1
+        self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.stats["connections_closed"] += 1
+        self.open -= 1
+
+    def connection_check_out_started(self, event):
+        # Events carry no request id: waits are matched per thread (Motor runs pymongo in its executor)
+        self._checkout_started.setdefault(threading.get_ident(), []).append(time.monotonic())
+
+    def _checkout_ended(self) -> float:
+        started = self._checkout_started.get(threading.get_ident())
+        return (time.monotonic() - started.pop()) * 1000 if started else 0.0
+
+    def connection_check_out_failed(self, event):
+        self._checkout_ended()
+        self.stats["checkout_failures"] += 1
+
+    def connection_checked_out(self, event):
+        waited_ms = self._checkout_ended()
+        self.stats["checkouts"] += 1
+        self.checked_out += 1
+        self.max_checked_out = max(self.max_checked_out, self.checked_out)
+        self.checkout_wait_ms_total += waited_ms
+        self.checkout_wait_ms_max = max(self.checkout_wait_ms_max, waited_ms)
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+
+_monitor = PoolMonitor()
+
+
+def available_compressors() -> List[str]:
+    compressors = []
+    for name in [c.strip() for c in MONGO_COMPRESSORS.split(",") if c.strip()]:
+        try:
+            if name == "zstd":
+                import zstandard  # noqa: F401
+            elif name == "snappy":
+                import snappy  # noqa: F401
+            elif name != "zlib":
+                continue
+        except ImportError:
+            continue
+        compressors.append(name)
+    return compressors
+
+
+def _create_client() -> AsyncIOMotorClient:
+    global _client, _db, _connected_at
+    _client = AsyncIOMotorClient(
+        MONGO_URL,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        compressors=available_compressors() or None,
+        event_listeners=[_monitor]
+    )
+    _db = _client[DB_NAME]
+    _connected_at = time.time()
+    return _client
+
+
+def get_client() -> Optional[AsyncIOMotorClient]:
+    if _client is None and MONGO_URL:
+        try:
+            _create_client()
+        except Exception as e:
+            logging.error(f"MongoDB connection error: {str(e)}")
+    return _client
+
+
+def get_db():
+    """Shared database (None when MongoDB is not configured)"""
+    if _db is None:
+        get_client()
+    return _db
+
+
+def is_connected() -> bool:
+    """Client created (by connect() or a first get_db())"""
+    return _client is not None
+
+
+def get_database():
+    """FastAPI dependency: the shared database, 500 when MongoDB is not configured"""
+    current_db = get_db()
+    if current_db is None:
+        raise HTTPException(status_code=500, detail="Database not configured")
+    return current_db
+
+
+async def connect():
+    """App startup: create the client and check the server answers (a failure does not block the startup)"""
+    if get_client() is None:
+        return
+    try:
+        await _db.command('ping')
+        logging.info(f"✅ MongoDB connected: {DB_NAME} (pool {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE}, "
+                     f"compression {','.join(available_compressors()) or 'off'})")
+    except Exception as e:
+        logging.error(f"❌ MongoDB ping failed at startup: {str(e)}")
+
+
+def close():
+    """App shutdown: close the pooled connections"""
+    global _client, _db
+    if _client is not None:
+        _client.close()
+        _client = None
+        _db = None
+
+
+def pool_status() -> Dict[str, Any]:
+    """Pool settings and usage of the shared client"""
+    checkouts = _monitor.stats["checkouts"]
+    return {
+        "configured": bool(MONGO_URL),
+        "connected": is_connected(),
+        "db_name": DB_NAME,
+        "uptime_seconds": round(time.time() - _connected_at) if _client is not None and _connected_at else None,
+        "settings": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "max_idle_time_ms": MONGO_MAX_IDLE_TIME_MS,
+            "server_selection_timeout_ms": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "connect_timeout_ms": MONGO_CONNECT_TIMEOUT_MS,
+            "socket_timeout_ms": MONGO_SOCKET_TIMEOUT_MS,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "compressors": available_compressors(),
+        },
+        "pool": {
+            "open": _monitor.open,
+            "checked_out": _monitor.checked_out,
+            "max_checked_out": _monitor.max_checked_out,
+            "utilization": round(_monitor.checked_out / MONGO_MAX_POOL_SIZE, 3) if MONGO_MAX_POOL_SIZE else None,
+            "checkout_wait_ms_avg": round(_monitor.checkout_wait_ms_total / checkouts, 2) if checkouts else None,
+            "checkout_wait_ms_max": round(_monitor.checkout_wait_ms_max, 2),
+        },
+        "stats": dict(_monitor.stats),
+    }
@@ -0,0 +1,363 @@
+"""
+Email Outbox for Israel Growth Venture
+Request handlers do not wait for SMTP any more: they enqueue() the composed message and return.
+A background dispatcher (started with the app) delivers email_outbox:
+- atomic lease (find_one_and_update) so a message is sent by one worker, expired leases are reclaimed
+- bounded concurrency (EMAIL_OUTBOX_CONCURRENCY sends in flight, over smtp_client's pooled sessions)
+- transient failures retried with exponential backoff (30s, 60s, 120s... up to 1h),
+  permanent ones (5xx recipient / message refusals) fail at once
+- final status (sent / failed) recorded in email_events, then the result hook of the
+  email type runs (invoice status, mini_analyses.email_status, CRM activity...)
+- EMAIL_OUTBOX_ENABLED=false: no dispatcher, enqueue() sends at once (one attempt, no retry)
+
+PDF attachments are not copied into the outbox: they are stored in the PDF store
+(sha256, deduplicated with the mini-analysis PDFs already there) and attached at send time.
+
+email_outbox schema:
+    status: pending | sending | sent | failed
+    email_type, message (RFC 822 bytes without the attachments), message_id, to_email,
+    smtp (smtp_client.account() settings, no password), attachments [{filename, sha256}],
+    event (extra email_events fields), context (result hook data),
+    attempts, next_attempt_at, lease_owner, lease_expires_at, last_error,
+    send_ms (SMTP delivery time of the successful attempt, also passed to the result hook)
+"""
+
+from datetime import datetime, timedelta, timezone
+from email import message_from_bytes
+from email.mime.application import MIMEApplication
+from email.utils import formatdate, make_msgid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from bson import Binary
+from pymongo import ReturnDocument
+
+import database
+import pdf_store
+import smtp_client
+from smtp_client import aiosmtplib
+
+EMAIL_OUTBOX_ENABLED = os.getenv('EMAIL_OUTBOX_ENABLED', 'true').lower() == 'true'
+EMAIL_OUTBOX_CONCURRENCY = int(os.getenv('EMAIL_OUTBOX_CONCURRENCY', '4'))
+EMAIL_OUTBOX_POLL_SECONDS = int(os.getenv('EMAIL_OUTBOX_POLL_SECONDS', '15'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '6'))
+EMAIL_OUTBOX_LEASE_SECONDS = 300
+# Retries: 30s, 60s, 120s... up to 1h
+RETRY_BACKOFF_BASE_SECONDS = 30
+RETRY_BACKOFF_MAX_SECONDS = 3600
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+# email_type -> coroutine(current_db, item, sent, error) run once the final status is known
+ResultHook = Callable[[Any, Dict[str, Any], bool, Optional[str]], Awaitable[None]]
+_result_hooks: Dict[str, ResultHook] = {}
+
+_task: Optional[asyncio.Task] = None
+_wakeup: Optional[asyncio.Event] = None
+_indexes_ready = False
+
+_stats = {
+    "enqueued": 0,
+    "sent": 0,
+    "retried": 0,
+    "failed": 0,
+    "last_run_at": None,
+}
+
+
+def on_result(email_type: str, hook: ResultHook):
+    """Register the coroutine run after the final status of an email type (sent or failed)"""
+    _result_hooks[email_type] = hook
+
+
+async def _ensure_indexes(current_db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        await current_db.email_outbox.create_index([("status", 1), ("next_attempt_at", 1)], background=True)
+        await current_db.email_outbox.create_index("lease_expires_at", background=True)
+    except Exception as e:
+        logging.warning(f"email_outbox index creation skipped: {e}")
+    _indexes_ready = True
+
+
+async def enqueue(current_db, message, email_type: str, smtp: Optional[Dict[str, Any]] = None,
+                  attachments: Optional[List[Tuple[str, bytes]]] = None,
+                  event: Optional[Dict[str, Any]] = None,
+                  context: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Queue a composed message (email.message.Message, attachments excluded) and return the outbox id.
+    smtp: smtp_client.account() settings (default: the SMTP_* env account)
+    attachments: [(filename, pdf_bytes)] - stored in the PDF store, attached by the dispatcher
+    event: fields copied to the email_events record (lead_id, invoice_id, language...)
+    context: data for the result hook of email_type
+    """
+    if current_db is None:
+        raise RuntimeError("Database not configured - email cannot be queued")
+    smtp = smtp or smtp_client.account()
+
+    # Set once: retries deliver the same message (receivers can deduplicate on Message-ID)
+    if not message.get('Message-ID'):
+        message['Message-ID'] = make_msgid(domain=(smtp.get("username") or "").partition("@")[2] or None)
+    if not message.get('Date'):
+        message['Date'] = formatdate(localtime=False)
+
+    stored_attachments = []
+    for filename, pdf_bytes in attachments or []:
+        reference = await pdf_store.put(current_db, pdf_bytes, {"email_type": email_type, "filename": filename})
+        stored_attachments.append({"filename": filename, "sha256": reference["sha256"]})
+
+    now = datetime.now(timezone.utc)
+    item = {
+        "status": "pending",
+        "email_type": email_type,
+        "to_email": message.get('To'),
+        "subject": str(message.get('Subject', '')),
+        "message_id": message['Message-ID'],
+        "message": Binary(message.as_bytes()),
+        "smtp": smtp,
+        "attachments": stored_attachments,
+        "event": event or {},
+        "context": context or {},
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+        "updated_at": now
+    }
+    if not EMAIL_OUTBOX_ENABLED:
+        # No dispatcher: leased by this call and sent inline (the record keeps the final status)
+        item.update(status="sending", lease_owner=WORKER_ID,
+                    lease_expires_at=now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SECONDS), last_attempt_at=now)
+    result = await current_db.email_outbox.insert_one(item)
+    _stats["enqueued"] += 1
+
+    if not EMAIL_OUTBOX_ENABLED:
+        item["_id"] = result.inserted_id
+        outcome = await _process_leased(current_db, item, max_attempts=1)
+        logging.info(f"EMAIL_SENT_INLINE {email_type} to={message.get('To')} outbox_id={result.inserted_id}: {outcome['status']}")
+        return str(result.inserted_id)
+
+    if _wakeup is not None:
+        _wakeup.set()
+    logging.info(f"EMAIL_QUEUED {email_type} to={message.get('To')} outbox_id={result.inserted_id}")
+    return str(result.inserted_id)
+
+
+async def lease_next(current_db) -> Optional[Dict[str, Any]]:
+    """Atomically claim the oldest due message - returns the leased document"""
+    now = datetime.now(timezone.utc)
+    return await current_db.email_outbox.find_one_and_update(
+        {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            # Lease of a crashed / restarted worker
+            {"status": "sending", "lease_expires_at": {"$lt": now}}
+        ]},
+        {"$set": {
+            "status": "sending",
+            "lease_owner": WORKER_ID,
+            "lease_expires_at": now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SECONDS),
+            "last_attempt_at": now,
+            "updated_at": now
+        }},
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def build_message(current_db, item: Dict[str, Any]):
+    """Stored message + its PDF attachments from the PDF store"""
+    message = message_from_bytes(bytes(item["message"]))
+    for attachment in item.get("attachments") or []:
+        pdf_bytes = await pdf_store.read(current_db, attachment["sha256"])
+        part = MIMEApplication(pdf_bytes, _subtype='pdf')
+        part.add_header('Content-Disposition', 'attachment', filename=attachment["filename"])
+        message.attach(part)
+    return message
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """5xx refusal of the recipients or the message: retrying would get the same answer"""
+    if aiosmtplib is None:
+        return False
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, aiosmtplib.SMTPAuthenticationError):
+        return False  # Credentials problem: retried once the configuration is fixed
+    return isinstance(error, aiosmtplib.SMTPResponseException) and 500 <= error.code < 600
+
+
+def retry_delay_seconds(attempts: int) -> int:
+    return min(RETRY_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), RETRY_BACKOFF_MAX_SECONDS)
+
+
+async def _record_result(current_db, item: Dict[str, Any], attempts: int, sent: bool, error: Optional[str]):
+    """email_events record + result hook of the email type"""
+    now = datetime.now(timezone.utc)
+    await current_db.email_events.insert_one({
+        **(item.get("event") or {}),
+        "email_type": item["email_type"],
+        "to_email": item.get("to_email"),
+        "subject": item.get("subject"),
+        "status": "sent" if sent else "failed",
+        "error_message": error,
+        "attempts": attempts,
+        "outbox_id": str(item["_id"]),
+        "message_id": item.get("message_id"),
+        "created_at": item.get("created_at", now),
+        "sent_at": now if sent else None
+    })
+
+    hook = _result_hooks.get(item["email_type"])
+    if hook is not None:
+        try:
+            await hook(current_db, item, sent, error)
+        except Exception as e:
+            logging.error(f"EMAIL_OUTBOX result hook {item['email_type']} failed for {item['_id']}: {str(e)}")
+
+
+async def process_item(current_db, item: Dict[str, Any], max_attempts: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Send one leased message. Returns {"outbox_id", "status", ...}
+    max_attempts: default EMAIL_OUTBOX_MAX_ATTEMPTS (1 = fail at the first error, inline sends)
+    """
+    max_attempts = max_attempts or EMAIL_OUTBOX_MAX_ATTEMPTS
+    outbox_id = str(item["_id"])
+    now = datetime.now(timezone.utc)
+    release = {"lease_owner": None, "lease_expires_at": None, "updated_at": now}
+    attempts = item.get("attempts", 0) + 1
+
+    try:
+        message = await build_message(current_db, item)
+        send_started = time.perf_counter()
+        await smtp_client.send(message, item["smtp"])
+        item["send_ms"] = round((time.perf_counter() - send_started) * 1000, 1)
+    except Exception as e:
+        error = str(e)[:500]
+        if attempts < max_attempts and not is_permanent_error(e):
+            retry_at = now + timedelta(seconds=retry_delay_seconds(attempts))
+            await current_db.email_outbox.update_one(
+                {"_id": item["_id"]},
+                {"$set": {**release, "status": "pending", "attempts": attempts, "next_attempt_at": retry_at, "last_error": error}}
+            )
+            _stats["retried"] += 1
+            logging.warning(f"EMAIL_RETRY_LATER {item['email_type']} to={item.get('to_email')} ({attempts}/{max_attempts}): {error}")
+            return {"outbox_id": outbox_id, "status": "retry_scheduled", "error": error[:100]}
+
+        await current_db.email_outbox.update_one(
+            {"_id": item["_id"]},
+            {"$set": {**release, "status": "failed", "attempts": attempts, "failed_at": now, "last_error": error}}
+        )
+        _stats["failed"] += 1
+        logging.error(f"❌ EMAIL_SEND_FAILED {item['email_type']} to={item.get('to_email')} after {attempts} attempt(s): {error}")
+        await _record_result(current_db, item, attempts, False, error)
+        return {"outbox_id": outbox_id, "status": "failed", "error": error[:100]}
+
+    await current_db.email_outbox.update_one(
+        {"_id": item["_id"]},
+        {"$set": {**release, "status": "sent", "attempts": attempts, "sent_at": datetime.now(timezone.utc),
+                  "send_ms": item["send_ms"], "last_error": None},
+         # Delivered: the body is no longer needed
+         "$unset": {"message": ""}}
+    )
+    _stats["sent"] += 1
+    logging.info(f"✅ EMAIL_SEND_OK {item['email_type']} to={item.get('to_email')} message_id={item.get('message_id')}")
+    await _record_result(current_db, item, attempts, True, None)
+    return {"outbox_id": outbox_id, "status": "sent"}
+
+
+async def _process_leased(current_db, item: Dict[str, Any], max_attempts: Optional[int] = None) -> Dict[str, Any]:
+    try:
+        return await process_item(current_db, item, max_attempts)
+    except Exception as e:
+        # Outbox bookkeeping failed (database): leave the lease to expire and be retried
+        logging.error(f"EMAIL_OUTBOX error on {item.get('_id')}: {str(e)}")
+        return {"outbox_id": str(item["_id"]), "status": "error", "error": str(e)[:100]}
+
+
+async def drain_once(limit: Optional[int] = None) -> Dict[str, Any]:
+    """Lease and send due messages with bounded concurrency until the outbox is empty or limit is reached"""
+    current_db = database.get_db()
+    if current_db is None:
+        return {"sent": 0, "not_sent": 0, "results": [], "skipped": "Database not configured"}
+
+    await _ensure_indexes(current_db)
+    _stats["last_run_at"] = datetime.now(timezone.utc)
+
+    semaphore = asyncio.Semaphore(EMAIL_OUTBOX_CONCURRENCY)
+    tasks: List[asyncio.Task] = []
+    results: List[Dict[str, Any]] = []
+
+    async def run(item):
+        try:
+            results.append(await _process_leased(current_db, item))
+        finally:
+            semaphore.release()
+
+    leased = 0
+    while limit is None or leased < limit:
+        await semaphore.acquire()
+        item = await lease_next(current_db)
+        if item is None:
+            semaphore.release()
+            break
+        leased += 1
+        tasks.append(asyncio.ensure_future(run(item)))
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    sent = len([r for r in results if r["status"] == "sent"])
+    return {"sent": sent, "not_sent": len(results) - sent, "results": results}
+
+
+async def _run_loop():
+    while True:
+        _wakeup.clear()
+        try:
+            summary = await drain_once()
+            if summary.get("results"):
+                logging.info(f"EMAIL_OUTBOX run: {summary['sent']} sent, {summary['not_sent']} not sent")
+        except Exception as e:
+            logging.error(f"EMAIL_OUTBOX loop error: {str(e)}")
+
+        # enqueue() wakes the loop up at once; the poll picks up retries and other workers' messages
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=EMAIL_OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start():
+    """Start the dispatcher loop (app startup) - disabled: enqueue() sends inline"""
+    global _task, _wakeup
+    if not EMAIL_OUTBOX_ENABLED or (_task is not None and not _task.done()):
+        return
+    _wakeup = asyncio.Event()
+    _task = asyncio.ensure_future(_run_loop())
+    logging.info(f"✅ Email outbox dispatcher started (concurrency={EMAIL_OUTBOX_CONCURRENCY}, poll={EMAIL_OUTBOX_POLL_SECONDS}s)")
+
+
+async def stop():
+    """Messages being sent keep their lease: they are reclaimed once it expires"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+
+def outbox_status() -> Dict[str, Any]:
+    return {
+        "enabled": EMAIL_OUTBOX_ENABLED,
+        "running": _task is not None and not _task.done(),
+        "worker_id": WORKER_ID,
+        "concurrency": EMAIL_OUTBOX_CONCURRENCY,
+        "poll_seconds": EMAIL_OUTBOX_POLL_SECONDS,
+        "max_attempts": EMAIL_OUTBOX_MAX_ATTEMPTS,
+        "result_hooks": sorted(_result_hooks),
+        "stats": {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in _stats.items()}
+    }
@@ -8,22 +8,27 @@ Additional Routes for Israel Growth Venture
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Response
 from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, Any
+from typing import Optional
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 import os
 import logging
 import httpx
 import base64
-import io
 import json
 
+import email_outbox
+import letterhead
+import pdf_engine
+import render_cache
+import smtp_client
+from database import get_db
+
 # Conditional imports for email (CRITICAL: don't crash if not installed)
 try:
     import aiosmtplib
     from email.mime.text import MIMEText
     from email.mime.multipart import MIMEMultipart
-    from email.mime.application import MIMEApplication
     EMAIL_LIBS_AVAILABLE = True
 except ImportError as e:
     logging.warning(f"⚠️ Email libraries not available: {str(e)}")
@@ -31,24 +36,24 @@ except ImportError as e:
     aiosmtplib = None
     MIMEText = None
     MIMEMultipart = None
-    MIMEApplication = None
 
 router = APIRouter(prefix="/api")
 
 # Environment variables
 CALENDAR_EMAIL = os.getenv('CALENDAR_EMAIL', 'israel.growth.venture@gmail.com')
 EMAIL_FROM = os.getenv('EMAIL_FROM', 'noreply@israelgrowthventure.com')
-SMTP_HOST = os.getenv('SMTP_HOST')
-SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
-SMTP_USER = os.getenv('SMTP_USER')
-SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
+SMTP_HOST = smtp_client.SMTP_HOST
+SMTP_PORT = smtp_client.SMTP_PORT
+SMTP_USER = smtp_client.SMTP_USER
+SMTP_PASSWORD = smtp_client.smtp_password()
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 GOOGLE_CALENDAR_API_KEY = os.getenv('GOOGLE_CALENDAR_API_KEY')
+SMTP_CONFIGURED = bool(SMTP_HOST and SMTP_USER and SMTP_PASSWORD)
 
 
 # MISSION: Send quota confirmation email
-async def send_quota_confirmation_email(email: str, brand_name: str, language: str, request_id: str):
-    """Send confirmation email when quota is reached"""
+async def send_quota_confirmation_email(current_db, email: str, brand_name: str, language: str, request_id: str):
+    """Queue the confirmation email when quota is reached"""
     
     if not EMAIL_LIBS_AVAILABLE:
         raise Exception("Email libraries not available")
@@ -124,18 +129,15 @@ Reference: {request_id}
     
     msg.attach(MIMEText(template["body"], 'plain', 'utf-8'))
     
-    # Send via SMTP
-    async with aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT) as smtp:
-        await smtp.starttls()
-        await smtp.login(SMTP_USER, SMTP_PASSWORD)
-        await smtp.send_message(msg)
+    await email_outbox.enqueue(current_db, msg, "quota_confirmation",
+                               event={"language": language, "request_id": request_id})
     
-    logging.info(f"[{request_id}] Quota confirmation email sent to {email}")
+    logging.info(f"[{request_id}] Quota confirmation email queued for {email}")
 
 
-async def send_analysis_email(email: str, brand_name: str, analysis_text: str, language: str = "fr", request_id: str = "unknown"):
+async def send_analysis_email(current_db, email: str, brand_name: str, analysis_text: str, language: str = "fr", request_id: str = "unknown"):
     """
-    Send mini-analysis results via email (for pending analyses retry)
+    Queue mini-analysis results email (for pending analyses retry)
     """
     if not SMTP_CONFIGURED:
         logging.warning(f"[{request_id}] EMAIL_SEND_SKIP: SMTP not configured")
@@ -186,13 +188,10 @@ The Israel Growth Venture team"""
     
     msg.attach(MIMEText(template["body"], 'plain', 'utf-8'))
     
-    # Send via SMTP
-    async with aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT) as smtp:
-        await smtp.starttls()
-        await smtp.login(SMTP_USER, SMTP_PASSWORD)
-        await smtp.send_message(msg)
+    await email_outbox.enqueue(current_db, msg, "analysis_text",
+                               event={"language": language, "request_id": request_id})
     
-    logging.info(f"[{request_id}] Analysis email sent to {email}")
+    logging.info(f"[{request_id}] Analysis email queued for {email}")
 
 
 # Models
@@ -242,7 +241,7 @@ async def check_pdf_header():
     except ImportError:
         reportlab_ok = False
     
-    header_path = Path(__file__).parent / 'assets' / 'entete_igv.pdf'
+    header_path = letterhead.LETTERHEAD_PATH
     
     result = {
         "reportlab_installed": reportlab_ok,
@@ -331,26 +330,6 @@ async def contact_expert(request: ContactExpertRequest, background_tasks: Backgr
         logging.error(f"Error in contact_expert: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Helper function to get database connection
-def get_db():
-    """Get MongoDB connection (imported from mini_analysis_routes pattern)"""
-    from motor.motor_asyncio import AsyncIOMotorClient
-    mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-    db_name = os.getenv('DB_NAME', 'igv_production')
-    
-    if not mongo_url:
-        return None
-    
-    try:
-        client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        return client[db_name]
-    except:
-        return None
-
 # PDF Generation endpoint
 @router.post("/pdf/generate")
 async def generate_pdf(request: PDFGenerateRequest, response: Response):
@@ -362,17 +341,11 @@ async def generate_pdf(request: PDFGenerateRequest, response: Response):
     try:
         # Simple implementation using reportlab
         try:
-            from reportlab.lib.pagesizes import A4
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-            from reportlab.lib.units import inch
-            from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_JUSTIFY, TA_LEFT
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            from PyPDF2 import PdfReader, PdfWriter
+            if not pdf_engine.PDF_AVAILABLE:
+                raise ImportError("reportlab")
             
             # MISSION C.2: LOAD HEADER PDF WITH ROBUST PATH
-            header_path = Path(__file__).resolve().parent / "assets" / "entete_igv.pdf"
+            header_path = letterhead.LETTERHEAD_PATH
             
             # MISSION C.3: LOG HEADER STATUS
             header_exists = header_path.exists()
@@ -403,142 +376,8 @@ async def generate_pdf(request: PDFGenerateRequest, response: Response):
                 # For now, we'll generate the PDF with RTL alignment
                 # and display a warning if Hebrew characters are present
             
-            # Create PDF in memory
-            buffer = io.BytesIO()
-            
-            # Create document
-            doc = SimpleDocTemplate(
-                buffer,
-                pagesize=A4,
-                rightMargin=72,
-                leftMargin=72,
-                topMargin=120,  # Extra space for merged header
-                bottomMargin=18
-            )
-            
-            # Container for elements
-            elements = []
-            
-            # Styles
-            styles = getSampleStyleSheet()
-            
-            # Title style (RTL for Hebrew)
-            title_alignment = TA_RIGHT if is_hebrew else TA_CENTER
-            
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=24,
-                textColor='#1e40af',
-                spaceAfter=30,
-                alignment=title_alignment
-            )
-            
-            # Brand style
-            brand_style = ParagraphStyle(
-                'BrandStyle',
-                parent=styles['Heading2'],
-                fontSize=18,
-                spaceAfter=20,
-                alignment=title_alignment
-            )
-            
-            # Body style (RTL for Hebrew)
-            body_alignment = TA_RIGHT if is_hebrew else TA_JUSTIFY
-            
-            body_style = ParagraphStyle(
-                'BodyStyle',
-                parent=styles['BodyText'],
-                fontSize=11,
-                leading=16,
-                alignment=body_alignment,
-                spaceAfter=12
-            )
-            
-            # Header (multilingual)
-            title_text = {
-                'fr': 'Mini-Analyse IGV',
-                'en': 'IGV Mini-Analysis',
-                'he': 'מיני-אנליזה IGV'
-            }.get(request.language, 'Mini-Analyse IGV')
-            
-            elements.append(Paragraph(title_text, brand_style))
-            elements.append(Spacer(1, 0.2*inch))
-            elements.append(Paragraph(f"<b>{request.brandName}</b>", brand_style))
-            elements.append(Spacer(1, 0.3*inch))
-            
-            # Date
-            date_str = datetime.now().strftime('%d/%m/%Y')
-            elements.append(Paragraph(f"Date: {date_str}", styles['Normal']))
-            elements.append(Spacer(1, 0.3*inch))
-            
-            # Analysis content
-            # Split analysis into paragraphs
-            paragraphs = request.analysis.split('\n\n')
-            for para in paragraphs:
-                if para.strip():
-                    # Escape HTML special characters
-                    para_escaped = para.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                    elements.append(Paragraph(para_escaped, body_style))
-                    elements.append(Spacer(1, 0.1*inch))
-            
-            # Footer
-            elements.append(Spacer(1, 0.5*inch))
-            footer_style = ParagraphStyle(
-                'FooterStyle',
-                parent=styles['Normal'],
-                fontSize=9,
-                textColor='#6b7280',
-                alignment=TA_CENTER
-            )
-            elements.append(Paragraph("Israel Growth Venture", footer_style))
-            elements.append(Paragraph("www.israelgrowthventure.com", footer_style))
-            elements.append(Paragraph("israel.growth.venture@gmail.com", footer_style))
-            
-            # Build PDF
-            doc.build(elements)
-            
-            # Get content PDF bytes
-            content_pdf_bytes = buffer.getvalue()
-            buffer.close()
-            
-            # MISSION C.4 & C.5: MERGE HEADER WITH CONTENT PDF (NO FALLBACK)
-            try:
-                # Read header PDF
-                header_reader = PdfReader(str(header_path))
-                header_page = header_reader.pages[0]
-                
-                # Read content PDF
-                content_reader = PdfReader(io.BytesIO(content_pdf_bytes))
-                
-                # Create writer for final PDF
-                writer = PdfWriter()
-                
-                # Merge header with each page of content
-                for page_num, content_page in enumerate(content_reader.pages):
-                    # Merge header onto content page
-                    content_page.merge_page(header_page)
-                    writer.add_page(content_page)
-                
-                # Write final PDF to buffer
-                final_buffer = io.BytesIO()
-                writer.write(final_buffer)
-                pdf_bytes = final_buffer.getvalue()
-                final_buffer.close()
-                
-                # MISSION C.4: LOG MERGE SUCCESS
-                logging.info(f"HEADER_MERGE_OK pages={len(content_reader.pages)}")
-                
-            except Exception as merge_error:
-                # MISSION C.5: EXPLICIT ERROR IF MERGE FAILS (NO FALLBACK)
-                logging.error(f"❌ HEADER_MERGE_FAILED: {str(merge_error)}")
-                logging.error(f"❌ HEADER_PATH_USED: {header_path}")
-                logging.error(f"❌ This is a CRITICAL error - PDF generation ABORTED")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"PDF header merge failed: {str(merge_error)}. Header file missing or corrupted."
-                )
-
+            # Layout + header merge in the PDF executor (off the event loop)
+            pdf_bytes = await render_cache.render("analysis_report", pdf_engine.build_analysis_report_pdf, request.brandName, request.analysis, request.language)
             
             # Encode to base64
             pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
@@ -550,12 +389,12 @@ async def generate_pdf(request: PDFGenerateRequest, response: Response):
                     igv_email = "israel.growth.venture@gmail.com"
                     await send_pdf_to_igv(
                         brand_name=request.brandName,
-                        pdf_base64=pdf_base64,
+                        pdf_bytes=pdf_bytes,
                         filename=f"{request.brandName}_IGV_Analysis.pdf",
                         language=request.language,
                         analysis_preview=request.analysis[:200]
                     )
-                    logging.info(f"✅ PDF auto-sent to {igv_email}")
+                    logging.info(f"✅ PDF auto-send queued for {igv_email}")
                 else:
                     logging.warning(f"⚠️ Email auto-send skipped: EMAIL_LIBS={EMAIL_LIBS_AVAILABLE}, SMTP_CONFIGURED={bool(SMTP_HOST and SMTP_USER and SMTP_PASSWORD)}")
             except Exception as email_error:
@@ -646,12 +485,10 @@ async def create_calendar_event_task(summary: str, description: str, email: str)
             
             message.attach(MIMEText(body, 'plain'))
             
-            async with aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT) as smtp:
-                await smtp.starttls()
-                await smtp.login(SMTP_USER, SMTP_PASSWORD)
-                await smtp.send_message(message)
+            await email_outbox.enqueue(get_db(), message, "calendar_request",
+                                       event={"contact_email": email})
             
-            logging.info(f"Calendar notification sent for: {email}")
+            logging.info(f"Calendar notification queued for: {email}")
             return {"eventId": "email_notification"}
         else:
             logging.warning("SMTP not configured, calendar event not created")
@@ -663,7 +500,7 @@ async def create_calendar_event_task(summary: str, description: str, email: str)
 
 async def send_pdf_to_igv(
     brand_name: str,
-    pdf_base64: str,
+    pdf_bytes: bytes,
     filename: str,
     language: str,
     analysis_preview: str
@@ -722,21 +559,14 @@ www.israelgrowthventure.com
         # Body
         message.attach(MIMEText(body, 'plain', 'utf-8'))
         
-        # Attach PDF
-        pdf_bytes = base64.b64decode(pdf_base64)
-        pdf_attachment = MIMEApplication(pdf_bytes, _subtype='pdf')
-        pdf_attachment.add_header('Content-Disposition', 'attachment', filename=filename)
-        message.attach(pdf_attachment)
-        
-        # Send email
-        async with aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT) as smtp:
-            await smtp.starttls()
-            await smtp.login(SMTP_USER, SMTP_PASSWORD)
-            await smtp.send_message(message)
+        # PDF attached by the email outbox (same bytes as the mini-analysis PDF: stored once)
+        outbox_id = await email_outbox.enqueue(
+            get_db(), message, "analysis_pdf_igv",
+            attachments=[(filename, pdf_bytes)],
+            event={"language": language, "brand_name": brand_name}
+        )
         
-        # MISSION B.3: LOG EMAIL_SEND_OK
-        message_id = message.get('Message-ID', 'unknown')
-        logging.info(f"EMAIL_SEND_OK to={igv_email} message_id={message_id}")
+        logging.info(f"EMAIL_QUEUED to={igv_email} outbox_id={outbox_id}")
         
     except Exception as e:
         # MISSION B.3: LOG EMAIL_SEND_ERROR
@@ -752,7 +582,7 @@ async def send_pdf_email_task(
     language: str
 ):
     """
-    Send PDF via email (background task)
+    Queue the PDF email (email outbox)
     MISSION B: Always CC israel.growth.venture@gmail.com
     """
     try:
@@ -823,22 +653,14 @@ async def send_pdf_email_task(
         body = bodies.get(language, bodies['fr'])
         message.attach(MIMEText(body, 'plain', 'utf-8'))
         
-        # Attach PDF
-        pdf_bytes = base64.b64decode(pdf_base64)
-        pdf_attachment = MIMEApplication(pdf_bytes, _subtype='pdf')
-        pdf_attachment.add_header('Content-Disposition', 'attachment', filename=filename)
-        message.attach(pdf_attachment)
-        
-        # Send email
-        async with aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT) as smtp:
-            await smtp.starttls()
-            await smtp.login(SMTP_USER, SMTP_PASSWORD)
-            send_result = await smtp.send_message(message)
+        # PDF attached by the email outbox
+        outbox_id = await email_outbox.enqueue(
+            get_db(), message, "analysis_pdf",
+            attachments=[(filename, base64.b64decode(pdf_base64))],
+            event={"cc": [igv_email], "language": language}
+        )
         
-        # MISSION B.3: LOG EMAIL_SEND_OK
-        message_id = message.get('Message-ID', 'unknown')
-        logging.info(f"EMAIL_SEND_OK to={to_email}, cc={igv_email}, message_id={message_id}")
-        logging.info(f"PDF email sent successfully to: {to_email} (CC: {igv_email})")
+        logging.info(f"EMAIL_QUEUED to={to_email}, cc={igv_email}, outbox_id={outbox_id}")
         
     except Exception as e:
         # MISSION B.3: LOG EMAIL_SEND_ERROR
@@ -846,12 +668,3 @@ async def send_pdf_email_task(
         logging.error(f"Error in send_pdf_email_task: {str(e)}")
         import traceback
         logging.error(traceback.format_exc())
-
-# Helper function to get DB
-def get_db():
-    """Get database connection (imported from main server)"""
-    try:
-        from server import db
-        return db
-    except:
-        return None
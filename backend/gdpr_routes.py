@@ -3,34 +3,16 @@ GDPR Consent & Cookie Management Routes
 Production-ready, fully compliant
 """
 
-from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi import APIRouter, HTTPException, Request, Response, Depends
 from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
-import os
 import logging
 import hashlib
 
-router = APIRouter(prefix="/api/gdpr")
-
-# MongoDB
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
+from database import get_database
 
-mongo_client = None
-db = None
-
-def get_db():
-    global mongo_client, db
-    if db is None and mongo_url:
-        mongo_client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        db = mongo_client[db_name]
-    return db
+router = APIRouter(prefix="/api/gdpr")
 
 
 # ==========================================
@@ -69,15 +51,11 @@ class VisitorTracking(BaseModel):
 # ==========================================
 
 @router.post("/consent")
-async def update_consent(consent: ConsentUpdate, request: Request):
+async def update_consent(consent: ConsentUpdate, request: Request, current_db=Depends(get_database)):
     """
     Update user consent preferences (GDPR-compliant)
     Stores consent in visitor record
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Get visitor ID (hash of IP + user agent)
     ip = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "")
@@ -120,12 +98,8 @@ async def update_consent(consent: ConsentUpdate, request: Request):
 
 
 @router.get("/consent")
-async def get_consent(request: Request):
+async def get_consent(request: Request, current_db=Depends(get_database)):
     """Get current consent preferences for this visitor"""
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Get visitor ID
     ip = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "")
@@ -153,15 +127,11 @@ async def get_consent(request: Request):
 # ==========================================
 
 @router.post("/track/visit")
-async def track_visit(tracking: VisitorTracking, request: Request):
+async def track_visit(tracking: VisitorTracking, request: Request, current_db=Depends(get_database)):
     """
     Track visitor page view (ONLY if analytics consent given)
     GDPR-compliant: no tracking without consent
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Get visitor ID
     ip = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "")
@@ -229,15 +199,11 @@ async def track_visit(tracking: VisitorTracking, request: Request):
 # ==========================================
 
 @router.post("/newsletter/subscribe")
-async def newsletter_subscribe(sub: NewsletterSubscribe, request: Request):
+async def newsletter_subscribe(sub: NewsletterSubscribe, request: Request, current_db=Depends(get_database)):
     """
     Newsletter subscription (GDPR-compliant)
     Requires EXPLICIT marketing consent
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # GDPR: Marketing consent is MANDATORY
     if not sub.consent_marketing:
         raise HTTPException(status_code=400, detail="Marketing consent required for newsletter")
@@ -305,14 +271,10 @@ async def newsletter_subscribe(sub: NewsletterSubscribe, request: Request):
 
 
 @router.post("/newsletter/unsubscribe")
-async def newsletter_unsubscribe(email: EmailStr, reason: Optional[str] = None):
+async def newsletter_unsubscribe(email: EmailStr, reason: Optional[str] = None, current_db=Depends(get_database)):
     """
     Newsletter unsubscribe (GDPR right to withdraw consent)
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     subscriber = await current_db.newsletter_subscribers.find_one({"email": email})
     
     if not subscriber:
@@ -341,14 +303,10 @@ async def newsletter_unsubscribe(email: EmailStr, reason: Optional[str] = None):
 
 
 @router.delete("/newsletter/delete-data")
-async def newsletter_delete_data(email: EmailStr):
+async def newsletter_delete_data(email: EmailStr, current_db=Depends(get_database)):
     """
     Delete all newsletter data (GDPR right to erasure)
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     result = await current_db.newsletter_subscribers.delete_one({"email": email})
     
     if result.deleted_count == 0:
@@ -364,14 +322,10 @@ async def newsletter_delete_data(email: EmailStr):
 # ==========================================
 
 @router.get("/my-data")
-async def get_my_data(email: EmailStr):
+async def get_my_data(email: EmailStr, current_db=Depends(get_database)):
     """
     Get all data stored for an email (GDPR right of access)
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     data = {}
     
     # Lead data
@@ -400,15 +354,11 @@ async def get_my_data(email: EmailStr):
 
 
 @router.delete("/delete-all-data")
-async def delete_all_data(email: EmailStr, confirmation: str):
+async def delete_all_data(email: EmailStr, confirmation: str, current_db=Depends(get_database)):
     """
     Delete ALL data for an email (GDPR right to erasure)
     Requires confirmation = email address
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Safety check
     if confirmation != email:
         raise HTTPException(status_code=400, detail="Confirmation email does not match")
@@ -0,0 +1,198 @@
+"""
+Idempotency Layer for Israel Growth Venture public POST endpoints
+- Idempotency-Key header (or a key derived from the request payload)
+- In-flight coalescing: concurrent identical requests share one execution
+- Short-lived response store: late retries replay the stored result
+
+State is per worker process (the API runs a single uvicorn worker).
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from fastapi import HTTPException, Request, Response
+
+# Replay window for client-supplied Idempotency-Key headers
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '3600'))
+# Replay window for keys derived from the payload (double-clicks / frontend retries)
+IDEMPOTENCY_DERIVED_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_DERIVED_TTL_SECONDS', '120'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '2000'))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+# key -> {"fingerprint", "result", "headers", "expires_at"}
+_responses: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# key -> {"task", "fingerprint", "clients", "headers"}
+_inflight: Dict[str, Dict[str, Any]] = {}
+
+_stats = {
+    "executed": 0,
+    "coalesced": 0,
+    "replayed": 0,
+}
+
+
+class ClientGroup:
+    """
+    The HTTP requests waiting on one shared execution.
+    Duck-types Request.is_disconnected() for llm_executor: the group only counts
+    as disconnected once every attached client is gone.
+    """
+
+    def __init__(self, http_request: Optional[Request] = None):
+        self.requests: List[Request] = [http_request] if http_request is not None else []
+
+    def attach(self, http_request: Optional[Request]):
+        if http_request is not None:
+            self.requests.append(http_request)
+
+    async def is_disconnected(self) -> bool:
+        if not self.requests:
+            return False
+        for http_request in self.requests:
+            if not await http_request.is_disconnected():
+                return False
+        return True
+
+
+def payload_fingerprint(payload: Any) -> str:
+    """Stable sha256 of a JSON-serializable payload"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _purge_expired(now: datetime):
+    for key in [k for k, entry in _responses.items() if entry["expires_at"] <= now]:
+        _responses.pop(key, None)
+
+
+def _custom_headers(response: Optional[Response]) -> Dict[str, str]:
+    """Headers the handler set on the endpoint's Response (debug headers etc.)"""
+    if response is None:
+        return {}
+    return {
+        name: value for name, value in response.headers.items()
+        if name.lower() not in ("content-length", "content-type")
+    }
+
+
+def _apply_headers(response: Optional[Response], headers: Dict[str, str], replayed: bool):
+    if response is None:
+        return
+    for name, value in headers.items():
+        response.headers[name] = value
+    if replayed:
+        response.headers[REPLAY_HEADER] = "true"
+
+
+def _store(key: str, fingerprint: str, result: Any, headers: Dict[str, str], ttl: int):
+    _responses[key] = {
+        "fingerprint": fingerprint,
+        "result": result,
+        "headers": headers,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    }
+    _responses.move_to_end(key)
+    while len(_responses) > IDEMPOTENCY_MAX_ENTRIES:
+        _responses.popitem(last=False)
+
+
+async def run_once(
+    scope: str,
+    idempotency_key: Optional[str],
+    payload: Any,
+    handler: Callable[[ClientGroup], Awaitable[Any]],
+    *,
+    response: Optional[Response] = None,
+    http_request: Optional[Request] = None
+) -> Any:
+    """
+    Execute handler at most once per idempotency key.
+
+    Args:
+        scope: Endpoint name (keys are namespaced per endpoint)
+        idempotency_key: Idempotency-Key header value; None derives the key from payload
+        payload: Request body (dict) - fingerprinted to detect key reuse
+        handler: Coroutine function receiving the ClientGroup (pass it as http_request
+                 to llm_executor so the call is only abandoned when ALL clients left)
+        response: FastAPI Response - headers set by the first execution are replayed
+        http_request: Attached to the ClientGroup for disconnect detection
+
+    Raises:
+        HTTPException 422: the same Idempotency-Key was used with a different payload
+    """
+    fingerprint = payload_fingerprint(payload)
+
+    if idempotency_key:
+        idempotency_key = idempotency_key.strip()
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key trop long")
+        key = f"{scope}:key:{idempotency_key}"
+        ttl = IDEMPOTENCY_TTL_SECONDS
+    else:
+        key = f"{scope}:derived:{fingerprint}"
+        ttl = IDEMPOTENCY_DERIVED_TTL_SECONDS
+
+    now = datetime.now(timezone.utc)
+    _purge_expired(now)
+
+    # 1. Late retry: replay the stored result
+    stored = _responses.get(key)
+    if stored is not None:
+        if stored["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key déjà utilisée avec une requête différente")
+        _stats["replayed"] += 1
+        logging.info(f"IDEMPOTENCY_REPLAY {key[:80]}")
+        _apply_headers(response, stored["headers"], replayed=True)
+        return stored["result"]
+
+    # 2. Identical request in flight: wait for it
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        if inflight["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key déjà utilisée avec une requête différente")
+        _stats["coalesced"] += 1
+        logging.info(f"IDEMPOTENCY_COALESCED {key[:80]}")
+        inflight["clients"].attach(http_request)
+        result = await asyncio.shield(inflight["task"])
+        _apply_headers(response, inflight["headers"], replayed=True)
+        return result
+
+    # 3. First request: run the handler in its own task so a client going
+    # away (e.g. the aborted first click) does not fail the coalesced ones
+    entry = {"fingerprint": fingerprint, "clients": ClientGroup(http_request), "headers": {}}
+
+    async def execute():
+        try:
+            result = await handler(entry["clients"])
+            entry["headers"] = _custom_headers(response)
+            _store(key, fingerprint, result, entry["headers"], ttl)
+            return result
+        finally:
+            _inflight.pop(key, None)
+
+    task = asyncio.ensure_future(execute())
+    # Nobody may be left to await a failure - mark it retrieved
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    entry["task"] = task
+    _inflight[key] = entry
+    _stats["executed"] += 1
+
+    return await asyncio.shield(task)
+
+
+def idempotency_status() -> Dict[str, Any]:
+    return {
+        "ttl_seconds": IDEMPOTENCY_TTL_SECONDS,
+        "derived_ttl_seconds": IDEMPOTENCY_DERIVED_TTL_SECONDS,
+        "stored_responses": len(_responses),
+        "in_flight": len(_inflight),
+        "stats": dict(_stats)
+    }
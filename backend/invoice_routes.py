@@ -6,7 +6,6 @@ Production-ready with PDF generation, email sending, VAT 18%
 from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr, Field
-from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone, timedelta
 import os
@@ -16,63 +15,31 @@ from bson import ObjectId
 import hashlib
 import base64
 
-# PDF generation
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import cm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-    PDF_AVAILABLE = True
-except ImportError:
-    logging.warning("reportlab not available - PDF generation will fail")
-    PDF_AVAILABLE = False
-
-# Email
-try:
-    import aiosmtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    from email.mime.base import MIMEBase
-    from email import encoders
-    EMAIL_AVAILABLE = True
-except ImportError:
-    logging.warning("Email libraries not available")
-    EMAIL_AVAILABLE = False
+import email_outbox
+import pdf_engine
+import smtp_client
 
+# Email (delivered by the outbox over smtp_client, which holds the optional aiosmtplib import)
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+EMAIL_AVAILABLE = smtp_client.aiosmtplib is not None
+
+import render_cache
+from database import get_db, get_database
 from models.invoice_models import Invoice, InvoiceItem, InvoiceStatus, PaymentStatus, EmailEvent
 
 router = APIRouter(prefix="/api/invoices")
 security = HTTPBearer()
 
-# MongoDB
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
-
-mongo_client = None
-db = None
-
-def get_db():
-    global mongo_client, db
-    if db is None and mongo_url:
-        mongo_client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        db = mongo_client[db_name]
-    return db
-
 # JWT
 JWT_SECRET = os.getenv('JWT_SECRET')
 JWT_ALGORITHM = 'HS256'
 
-# SMTP Config - Support both naming conventions
-SMTP_SERVER = os.getenv('SMTP_SERVER') or os.getenv('SMTP_HOST', 'smtp.gmail.com')
-SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
-SMTP_USERNAME = os.getenv('SMTP_USERNAME') or os.getenv('SMTP_USER')
-SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
+# SMTP Config - account settings from smtp_client (SMTP_SERVER/SMTP_HOST, SMTP_USERNAME/SMTP_USER)
+SMTP_SERVER = smtp_client.SMTP_HOST
+SMTP_PORT = smtp_client.SMTP_PORT
+SMTP_USERNAME = smtp_client.SMTP_USER
+SMTP_PASSWORD = smtp_client.smtp_password()
 SMTP_FROM_EMAIL = os.getenv('SMTP_FROM_EMAIL') or os.getenv('SMTP_FROM', 'israel.growth.venture@gmail.com')
 SMTP_FROM_NAME = os.getenv('SMTP_FROM_NAME', 'Israel Growth Venture')
 
@@ -160,176 +127,40 @@ async def generate_invoice_number() -> str:
 # PDF GENERATION
 # ==========================================
 
-def generate_invoice_pdf(invoice_data: Dict[str, Any], language: str = "fr") -> bytes:
-    """Generate invoice PDF with IGV header and VAT 18%"""
-    if not PDF_AVAILABLE:
-        raise HTTPException(status_code=500, detail="PDF generation not available")
-    
-    from io import BytesIO
-    buffer = BytesIO()
-    
-    # Create PDF
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1e40af'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#4b5563')
+# Invoice fields printed on the PDF (render cache key - status / timestamps are not)
+INVOICE_RENDER_FIELDS = (
+    "invoice_number", "invoice_date", "due_date", "client_name", "client_company", "client_email",
+    "items", "currency", "subtotal", "tax_amount", "total_amount", "notes",
+)
+
+
+async def render_invoice_pdf(invoice_id: str, invoice: Dict[str, Any]) -> bytes:
+    """Invoice PDF through the render cache (entries dropped by update_invoice)"""
+    language = invoice.get("language", "fr")
+    return await render_cache.render(
+        "invoice", generate_invoice_pdf, invoice, language,
+        ref=invoice_id,
+        key_data={"invoice": {field: invoice.get(field) for field in INVOICE_RENDER_FIELDS}, "language": language}
     )
-    
-    # Header: Company Info
-    story.append(Paragraph(COMPANY_NAME, title_style))
-    story.append(Paragraph(f"{COMPANY_ADDRESS} | {COMPANY_EMAIL} | {COMPANY_WEBSITE}", header_style))
-    story.append(Spacer(1, 1*cm))
-    
-    # Invoice title
-    invoice_title = {
-        "fr": "FACTURE",
-        "en": "INVOICE",
-        "he": "חשבונית"
-    }.get(language, "FACTURE")
-    
-    story.append(Paragraph(f"<b>{invoice_title} {invoice_data['invoice_number']}</b>", styles['Heading2']))
-    story.append(Spacer(1, 0.5*cm))
-    
-    # Invoice details table
-    invoice_info = [
-        [{
-            "fr": "Date:",
-            "en": "Date:",
-            "he": "תאריך:"
-        }.get(language, "Date:"), datetime.fromisoformat(invoice_data['invoice_date'].replace('Z', '+00:00')).strftime("%d/%m/%Y")],
-        [{
-            "fr": "Échéance:",
-            "en": "Due date:",
-            "he": "תאריך יעד:"
-        }.get(language, "Échéance:"), datetime.fromisoformat(invoice_data['due_date'].replace('Z', '+00:00')).strftime("%d/%m/%Y") if invoice_data.get('due_date') else "-"],
-    ]
-    
-    info_table = Table(invoice_info, colWidths=[4*cm, 6*cm])
-    info_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
-        ('FONT', (0, 0), (0, -1), 'Helvetica-Bold', 9),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-    ]))
-    story.append(info_table)
-    story.append(Spacer(1, 1*cm))
-    
-    # Client info
-    story.append(Paragraph({
-        "fr": "<b>Facturé à:</b>",
-        "en": "<b>Billed to:</b>",
-        "he": "<b>לתשומת לב:</b>"
-    }.get(language, "<b>Facturé à:</b>"), styles['Normal']))
-    story.append(Paragraph(invoice_data['client_name'], styles['Normal']))
-    if invoice_data.get('client_company'):
-        story.append(Paragraph(invoice_data['client_company'], styles['Normal']))
-    if invoice_data.get('client_email'):
-        story.append(Paragraph(invoice_data['client_email'], styles['Normal']))
-    story.append(Spacer(1, 1*cm))
-    
-    # Items table
-    items_header = {
-        "fr": ["Description", "Qté", "Prix unitaire", "Remise", "HT", "TVA (18%)", "Total TTC"],
-        "en": ["Description", "Qty", "Unit price", "Discount", "Subtotal", "VAT (18%)", "Total"],
-        "he": ["תיאור", "כמות", "מחיר יחידה", "הנחה", "סכום ביניים", "מע\"מ (18%)", "סה\"כ"]
-    }.get(language, ["Description", "Qté", "Prix unitaire", "Remise", "HT", "TVA (18%)", "Total TTC"])
-    
-    items_data = [items_header]
-    
-    for item in invoice_data['items']:
-        discount_text = f"{item.get('discount_percent', 0)}%" if item.get('discount_percent', 0) > 0 else "-"
-        items_data.append([
-            item['description'],
-            str(item['quantity']),
-            f"{item['unit_price']} {invoice_data['currency']}",
-            discount_text,
-            f"{item.get('subtotal', 0):.2f}",
-            f"{item.get('tax_amount', 0):.2f}",
-            f"{item.get('total', 0):.2f}"
-        ])
-    
-    items_table = Table(items_data, colWidths=[6*cm, 1.5*cm, 2.5*cm, 1.5*cm, 2*cm, 2*cm, 2*cm])
-    items_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-    ]))
-    story.append(items_table)
-    story.append(Spacer(1, 1*cm))
-    
-    # Totals
-    totals_label = {
-        "fr": ["Sous-total HT:", "TVA (18%):", "Total TTC:"],
-        "en": ["Subtotal:", "VAT (18%):", "Total:"],
-        "he": ["סכום ביניים:", "מע\"מ (18%):", "סה\"כ:"]
-    }.get(language, ["Sous-total HT:", "TVA (18%):", "Total TTC:"])
-    
-    totals_data = [
-        [totals_label[0], f"{invoice_data['subtotal']:.2f} {invoice_data['currency']}"],
-        [totals_label[1], f"{invoice_data['tax_amount']:.2f} {invoice_data['currency']}"],
-        [totals_label[2], f"<b>{invoice_data['total_amount']:.2f} {invoice_data['currency']}</b>"],
-    ]
-    
-    totals_table = Table(totals_data, colWidths=[12*cm, 4*cm])
-    totals_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
-        ('FONT', (0, -1), (-1, -1), 'Helvetica-Bold', 12),
-        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-    ]))
-    story.append(totals_table)
-    story.append(Spacer(1, 1*cm))
-    
-    # Notes
-    if invoice_data.get('notes'):
-        story.append(Paragraph({
-            "fr": "<b>Notes:</b>",
-            "en": "<b>Notes:</b>",
-            "he": "<b>הערות:</b>"
-        }.get(language, "<b>Notes:</b>"), styles['Normal']))
-        story.append(Paragraph(invoice_data['notes'], styles['Normal']))
-    
-    # Build PDF
-    doc.build(story)
-    
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
-    
-    return pdf_bytes
+
+
+def generate_invoice_pdf(invoice_data: Dict[str, Any], language: str = "fr") -> bytes:
+    """Generate invoice PDF with IGV header and VAT 18% (layout in pdf_engine)"""
+    return pdf_engine.build_invoice_pdf(invoice_data, language, company={
+        "name": COMPANY_NAME,
+        "address": COMPANY_ADDRESS,
+        "email": COMPANY_EMAIL,
+        "website": COMPANY_WEBSITE,
+    })
 
 
 # ==========================================
 # EMAIL SENDING
 # ==========================================
 
-async def send_invoice_email(invoice_data: Dict[str, Any], pdf_bytes: bytes, language: str = "fr") -> Dict[str, Any]:
-    """Send invoice by email with PDF attachment"""
+async def send_invoice_email(current_db, invoice_id: str, invoice_data: Dict[str, Any], pdf_bytes: bytes,
+                             language: str = "fr", user_email: Optional[str] = None) -> Dict[str, Any]:
+    """Queue the invoice email with its PDF attachment (sent by the email outbox)"""
     if not EMAIL_AVAILABLE or not SMTP_USERNAME or not SMTP_PASSWORD:
         logging.warning("Email not configured - skipping email send")
         return {"success": False, "error": "Email not configured"}
@@ -347,7 +178,7 @@ async def send_invoice_email(invoice_data: Dict[str, Any], pdf_bytes: bytes, lan
         }.get(language, f"Facture {invoice_data['invoice_number']}")
         
         # Email body
-        body_template = {
+        body_templates = {
             "fr": f"""Bonjour {invoice_data['client_name']},
 
 Veuillez trouver ci-joint votre facture {invoice_data['invoice_number']}.
@@ -390,35 +221,63 @@ Israel Growth Venture Team
 {COMPANY_EMAIL}
 {COMPANY_WEBSITE}
 """
-        }.get(language, body_template["fr"])
+        }
+        body_template = body_templates.get(language, body_templates["fr"])
         
         message.attach(MIMEText(body_template, 'plain', 'utf-8'))
         
-        # Attach PDF
-        pdf_attachment = MIMEBase('application', 'pdf')
-        pdf_attachment.set_payload(pdf_bytes)
-        encoders.encode_base64(pdf_attachment)
-        pdf_attachment.add_header(
-            'Content-Disposition',
-            f'attachment; filename=Invoice_{invoice_data["invoice_number"]}.pdf'
+        outbox_id = await email_outbox.enqueue(
+            current_db,
+            message,
+            "invoice",
+            smtp_client.account(),
+            attachments=[(f"Invoice_{invoice_data['invoice_number']}.pdf", pdf_bytes)],
+            event={"cc": [COMPANY_EMAIL], "language": language, "invoice_id": invoice_id},
+            context={"invoice_id": invoice_id, "invoice_number": invoice_data["invoice_number"], "user_email": user_email}
         )
-        message.attach(pdf_attachment)
         
-        # Send
-        async with aiosmtplib.SMTP(hostname=SMTP_SERVER, port=SMTP_PORT) as smtp:
-            await smtp.starttls()
-            await smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
-            await smtp.send_message(message)
+        logging.info(f"Invoice email queued: {invoice_data['invoice_number']} to {invoice_data['client_email']}")
         
-        logging.info(f"Invoice email sent: {invoice_data['invoice_number']} to {invoice_data['client_email']}")
-        
-        return {"success": True, "sent_at": datetime.now(timezone.utc).isoformat()}
+        return {"success": True, "queued": True, "outbox_id": outbox_id}
         
     except Exception as e:
-        logging.error(f"Failed to send invoice email: {str(e)}")
+        logging.error(f"Failed to queue invoice email: {str(e)}")
         return {"success": False, "error": str(e)}
 
 
+async def record_invoice_email_result(current_db, item: Dict[str, Any], sent: bool, error: Optional[str]):
+    """Email outbox result hook: invoice status + timeline event"""
+    context = item.get("context") or {}
+    invoice_id = context["invoice_id"]
+    now = datetime.now(timezone.utc)
+    
+    if sent:
+        update_data = {
+            "email_sent": True,
+            "email_sent_at": now,
+            "email_status": "sent",
+            "status": InvoiceStatus.SENT,
+            "sent_at": now,
+            "updated_at": now
+        }
+    else:
+        update_data = {"email_status": "failed", "email_error": error, "updated_at": now}
+    
+    await current_db.invoices.update_one({"_id": ObjectId(invoice_id)}, {"$set": update_data})
+    
+    await current_db.timeline_events.insert_one({
+        "entity_type": "invoice",
+        "entity_id": invoice_id,
+        "event_type": "email_sent" if sent else "email_failed",
+        "description": f"Invoice {context.get('invoice_number')} {'sent' if sent else 'failed to send'}",
+        "user_email": context.get("user_email"),
+        "created_at": now
+    })
+
+
+email_outbox.on_result("invoice", record_invoice_email_result)
+
+
 # ==========================================
 # PYDANTIC MODELS
 # ==========================================
@@ -459,13 +318,10 @@ async def list_invoices(
     user: Dict = Depends(get_current_user),
     status: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    current_db=Depends(get_database)
 ):
     """List all invoices"""
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     query = {}
     if status:
         query["status"] = status
@@ -488,15 +344,12 @@ async def list_invoices(
 @router.post("/")
 async def create_invoice(
     invoice_create: InvoiceCreate,
-    user: Dict = Depends(get_current_user)
+    user: Dict = Depends(get_current_user),
+    current_db=Depends(get_database)
 ):
     """Create new invoice"""
     await require_role(user, ["admin", "sales"])
     
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Generate invoice number
     invoice_number = await generate_invoice_number()
     
@@ -563,13 +416,10 @@ async def create_invoice(
 @router.get("/{invoice_id}")
 async def get_invoice(
     invoice_id: str,
-    user: Dict = Depends(get_current_user)
+    user: Dict = Depends(get_current_user),
+    current_db=Depends(get_database)
 ):
     """Get invoice by ID"""
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     try:
         invoice = await current_db.invoices.find_one({"_id": ObjectId(invoice_id)})
     except:
@@ -585,15 +435,12 @@ async def get_invoice(
 @router.post("/{invoice_id}/generate-pdf")
 async def generate_pdf_for_invoice(
     invoice_id: str,
-    user: Dict = Depends(get_current_user)
+    user: Dict = Depends(get_current_user),
+    current_db=Depends(get_database)
 ):
     """Generate PDF for invoice"""
     await require_role(user, ["admin", "sales"])
     
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     try:
         invoice = await current_db.invoices.find_one({"_id": ObjectId(invoice_id)})
     except:
@@ -602,8 +449,8 @@ async def generate_pdf_for_invoice(
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    # Generate PDF
-    pdf_bytes = generate_invoice_pdf(invoice, invoice.get("language", "fr"))
+    # Generate PDF (cached until the invoice is updated)
+    pdf_bytes = await render_invoice_pdf(invoice_id, invoice)
     
     # Store PDF (for now, return base64)
     pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
@@ -639,15 +486,12 @@ async def generate_pdf_for_invoice(
 @router.post("/{invoice_id}/send")
 async def send_invoice(
     invoice_id: str,
-    user: Dict = Depends(get_current_user)
+    user: Dict = Depends(get_current_user),
+    current_db=Depends(get_database)
 ):
     """Send invoice by email"""
     await require_role(user, ["admin", "sales"])
     
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     try:
         invoice = await current_db.invoices.find_one({"_id": ObjectId(invoice_id)})
     except:
@@ -656,11 +500,11 @@ async def send_invoice(
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    # Generate PDF
-    pdf_bytes = generate_invoice_pdf(invoice, invoice.get("language", "fr"))
+    # Generate PDF (cached until the invoice is updated)
+    pdf_bytes = await render_invoice_pdf(invoice_id, invoice)
     
-    # Send email
-    email_result = await send_invoice_email(invoice, pdf_bytes, invoice.get("language", "fr"))
+    # Queue email (invoice status SENT + EmailEvent once the outbox has sent it)
+    email_result = await send_invoice_email(current_db, invoice_id, invoice, pdf_bytes, invoice.get("language", "fr"), user["email"])
     
     # Update invoice
     update_data = {
@@ -668,11 +512,11 @@ async def send_invoice(
     }
     
     if email_result["success"]:
-        update_data["email_sent"] = True
-        update_data["email_sent_at"] = datetime.fromisoformat(email_result["sent_at"])
-        update_data["status"] = InvoiceStatus.SENT
-        update_data["sent_at"] = datetime.fromisoformat(email_result["sent_at"])
+        update_data["email_status"] = "queued"
+        update_data["email_outbox_id"] = email_result["outbox_id"]
+        update_data["email_error"] = None
     else:
+        update_data["email_status"] = "failed"
         update_data["email_error"] = email_result.get("error")
     
     await current_db.invoices.update_one(
@@ -680,33 +524,21 @@ async def send_invoice(
         {"$set": update_data}
     )
     
-    # Log email event
-    await current_db.email_events.insert_one({
-        "email_type": "invoice",
-        "to_email": invoice["client_email"],
-        "cc": [COMPANY_EMAIL],
-        "subject": f"Invoice {invoice['invoice_number']}",
-        "language": invoice.get("language", "fr"),
-        "status": "sent" if email_result["success"] else "failed",
-        "error_message": email_result.get("error"),
-        "invoice_id": invoice_id,
-        "created_at": datetime.now(timezone.utc),
-        "sent_at": datetime.fromisoformat(email_result["sent_at"]) if email_result["success"] else None
-    })
-    
     # Timeline event
     await current_db.timeline_events.insert_one({
         "entity_type": "invoice",
         "entity_id": invoice_id,
-        "event_type": "email_sent" if email_result["success"] else "email_failed",
-        "description": f"Invoice {invoice['invoice_number']} {'sent' if email_result['success'] else 'failed to send'}",
+        "event_type": "email_queued" if email_result["success"] else "email_failed",
+        "description": f"Invoice {invoice['invoice_number']} {'queued for sending' if email_result['success'] else 'failed to send'}",
         "user_email": user["email"],
         "created_at": datetime.now(timezone.utc)
     })
     
     return {
         "success": email_result["success"],
-        "message": "Invoice sent successfully" if email_result["success"] else "Failed to send invoice",
+        "queued": email_result["success"],
+        "outbox_id": email_result.get("outbox_id"),
+        "message": "Invoice queued for sending" if email_result["success"] else "Failed to send invoice",
         "error": email_result.get("error")
     }
 
@@ -715,15 +547,12 @@ async def send_invoice(
 async def update_invoice(
     invoice_id: str,
     invoice_update: InvoiceUpdate,
-    user: Dict = Depends(get_current_user)
+    user: Dict = Depends(get_current_user),
+    current_db=Depends(get_database)
 ):
     """Update invoice"""
     await require_role(user, ["admin", "sales"])
     
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     update_data = invoice_update.dict(exclude_unset=True)
     update_data["updated_at"] = datetime.now(timezone.utc)
     
@@ -742,6 +571,9 @@ async def update_invoice(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
+    # Cached PDFs of the previous version
+    await render_cache.invalidate("invoice", invoice_id)
+    
     # Timeline event
     await current_db.timeline_events.insert_one({
         "entity_type": "invoice",
@@ -758,15 +590,12 @@ async def update_invoice(
 @router.delete("/{invoice_id}")
 async def delete_invoice(
     invoice_id: str,
-    user: Dict = Depends(get_current_user)
+    user: Dict = Depends(get_current_user),
+    current_db=Depends(get_database)
 ):
     """Delete invoice (soft delete - mark as CANCELED)"""
     await require_role(user, ["admin"])
     
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     try:
         result = await current_db.invoices.update_one(
             {"_id": ObjectId(invoice_id)},
@@ -787,12 +616,8 @@ async def delete_invoice(
 
 
 @router.get("/stats/overview")
-async def get_invoice_stats(user: Dict = Depends(get_current_user)):
+async def get_invoice_stats(user: Dict = Depends(get_current_user), current_db=Depends(get_database)):
     """Get invoice statistics"""
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Aggregate stats
     pipeline = [
         {
@@ -0,0 +1,138 @@
+"""
+Local Language Detector for Israel Growth Venture mini-analyses
+Classifies the first few hundred characters of a generated analysis (fr / en / he)
+so a wrong-language answer is aborted while streaming instead of after completion.
+
+Signals: Hebrew script ratio (he vs latin), then French / English stop-word counts.
+No model, no dependency - a few microseconds per check.
+"""
+
+from typing import Dict, Optional
+import logging
+import os
+import re
+
+LANG_CHECK_ENABLED = os.getenv('LANG_CHECK_ENABLED', 'true').lower() == 'true'
+# Characters needed before a verdict, and the point where an undecided prefix is accepted
+LANG_CHECK_MIN_CHARS = int(os.getenv('LANG_CHECK_MIN_CHARS', '200'))
+LANG_CHECK_MAX_CHARS = int(os.getenv('LANG_CHECK_MAX_CHARS', '600'))
+# Hebrew letters / (Hebrew + Latin letters) above which a text is Hebrew
+HEBREW_RATIO_THRESHOLD = 0.5
+# Stop-word hits needed (and lead over the other language) to call fr vs en
+MIN_STOPWORD_HITS = 6
+STOPWORD_MARGIN = 2.0
+
+HEBREW_LETTER = re.compile(r'[א-ת]')
+LATIN_LETTER = re.compile(r'[A-Za-zÀ-ÖØ-öø-ÿ]')
+WORD = re.compile(r"[a-zà-öø-ÿ]+")
+
+# Words frequent in one language and absent (or rare) in the other - "a", "on", "en" excluded
+STOP_WORDS = {
+    "fr": frozenset((
+        "le", "la", "les", "des", "du", "une", "et", "est", "dans", "pour", "que", "qui",
+        "sur", "au", "aux", "avec", "par", "pas", "plus", "ce", "cette", "ces", "son", "sa",
+        "ses", "vous", "nous", "sont", "être", "mais", "leur", "leurs", "très", "marché", "votre",
+    )),
+    "en": frozenset((
+        "the", "and", "of", "to", "in", "is", "for", "that", "with", "are", "this", "be",
+        "by", "at", "from", "your", "their", "it", "an", "not", "which", "will", "has",
+        "have", "market", "its", "would", "should", "can", "strong",
+    )),
+}
+
+_stats = {
+    "checks": 0,
+    "matches": 0,
+    "mismatches": 0,
+    "undecided_accepted": 0,
+}
+
+
+class LanguageGuard:
+    """
+    Incremental check of a streamed answer.
+    feed() returns None while undecided, then "match" or "mismatch" (sticky).
+    """
+
+    def __init__(self, expected: str):
+        self.expected = expected
+        self.prefix = ""
+        self.verdict: Optional[str] = None if LANG_CHECK_ENABLED else "match"
+        self.detected: Optional[str] = None
+
+    def feed(self, text: str) -> Optional[str]:
+        if self.verdict is not None:
+            return self.verdict
+        self.prefix += text
+        if len(self.prefix) >= LANG_CHECK_MIN_CHARS:
+            self._decide(final=len(self.prefix) >= LANG_CHECK_MAX_CHARS)
+        return self.verdict
+
+    def finish(self) -> str:
+        """End of the answer: decide with whatever was received"""
+        if self.verdict is None:
+            self._decide(final=True)
+        return self.verdict
+
+    def _decide(self, final: bool):
+        detected = detect_language(self.prefix)
+        if detected is None:
+            if not final:
+                return
+            # Not enough signal (e.g. mostly names / numbers): do not block the answer
+            _stats["undecided_accepted"] += 1
+            self.verdict = "match"
+            return
+        _stats["checks"] += 1
+        self.detected = detected
+        self.verdict = "match" if detected == self.expected else "mismatch"
+        _stats["matches" if self.verdict == "match" else "mismatches"] += 1
+        if self.verdict == "mismatch":
+            logging.warning(f"LANG_CHECK_MISMATCH expected={self.expected} detected={detected} after {len(self.prefix)} chars")
+
+
+def language_scores(text: str) -> Dict[str, float]:
+    """{"he": Hebrew script ratio, "fr": stop-word hits, "en": stop-word hits, "letters": n}"""
+    hebrew = len(HEBREW_LETTER.findall(text))
+    latin = len(LATIN_LETTER.findall(text))
+    words = WORD.findall(text.lower())
+    return {
+        "he": hebrew / (hebrew + latin) if hebrew + latin else 0.0,
+        "fr": sum(1 for w in words if w in STOP_WORDS["fr"]),
+        "en": sum(1 for w in words if w in STOP_WORDS["en"]),
+        "letters": hebrew + latin,
+    }
+
+
+def detect_language(text: str) -> Optional[str]:
+    """Return "he" / "fr" / "en", or None when the text does not carry enough signal"""
+    scores = language_scores(text)
+    if scores["letters"] < 40:
+        return None
+    if scores["he"] >= HEBREW_RATIO_THRESHOLD:
+        return "he"
+
+    fr, en = scores["fr"], scores["en"]
+    if max(fr, en) < MIN_STOPWORD_HITS:
+        return None
+    if fr >= en * STOPWORD_MARGIN:
+        return "fr"
+    if en >= fr * STOPWORD_MARGIN:
+        return "en"
+    return None
+
+
+def is_wrong_language(text: str, expected: str) -> bool:
+    """Full-text check (non-streamed answers): True only for a confident mismatch"""
+    guard = LanguageGuard(expected)
+    guard.feed(text[:LANG_CHECK_MAX_CHARS])
+    return guard.finish() == "mismatch"
+
+
+def detector_status() -> Dict[str, object]:
+    return {
+        "enabled": LANG_CHECK_ENABLED,
+        "min_chars": LANG_CHECK_MIN_CHARS,
+        "max_chars": LANG_CHECK_MAX_CHARS,
+        "stats": dict(_stats),
+    }
@@ -0,0 +1,165 @@
+"""
+IGV Letterhead for generated PDFs
+assets/entete igv.pdf is parsed once (PyPDF2) into a reusable page template.
+Renderers draw it from their ReportLab page callbacks as a form XObject, so a
+PDF is written in a single pass - no PdfReader re-parse of the content PDF,
+no merge_page, no second PdfWriter serialization.
+
+Usage:
+    doc.build(story, onFirstPage=letterhead.draw_on_page)                    # first page only
+    doc.build(story, onFirstPage=letterhead.draw_on_page, onLaterPages=letterhead.draw_on_page)
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Optional
+from io import BytesIO
+import logging
+import threading
+
+LETTERHEAD_PATH = Path(__file__).parent / 'assets' / 'entete igv.pdf'
+
+# ReportLab name of the form XObject in every generated document
+FORM_NAME = "IGVLetterhead"
+
+_template = None
+_template_lock = threading.Lock()
+
+
+class LetterheadTemplate:
+    """
+    Letterhead page converted once into a plain tree (dicts, lists, serialized
+    PDF tokens, raw stream data) from which each document builds its own
+    ReportLab objects - font and image streams are copied as-is, never re-encoded.
+    """
+
+    def __init__(self, path: Path):
+        from PyPDF2 import PdfReader
+        from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+        self._types = (ArrayObject, DictionaryObject, IndirectObject, StreamObject)
+        self.path = path
+        page = PdfReader(str(path)).pages[0]
+        self.width = float(page.mediabox.width)
+        self.height = float(page.mediabox.height)
+        self._objects: Dict[int, Any] = {}
+        self.form = (
+            "stream",
+            {
+                "Type": b"/XObject",
+                "Subtype": b"/Form",
+                "FormType": b"1",
+                "BBox": ("array", [self._convert(v) for v in page.mediabox]),
+                "Resources": self._convert(page["/Resources"]),
+            },
+            page.get_contents().get_data(),  # decoded: compressed with the document's own filter
+            None,
+        )
+        self.size = sum(len(node[2]) for node in self._objects.values() if node[0] == "stream") + len(self.form[2])
+
+    def _convert(self, obj: Any) -> Any:
+        ArrayObject, DictionaryObject, IndirectObject, StreamObject = self._types
+        if isinstance(obj, IndirectObject):
+            key = obj.idnum
+            if key not in self._objects:
+                self._objects[key] = None  # cycles: placeholder until converted
+                self._objects[key] = self._convert_direct(obj.get_object(), key)
+            return ("ref", key)
+        return self._convert_direct(obj, None)
+
+    def _convert_direct(self, obj: Any, object_id: Optional[int]) -> Any:
+        ArrayObject, DictionaryObject, IndirectObject, StreamObject = self._types
+        if isinstance(obj, StreamObject):
+            entries = {k[1:]: self._convert(v) for k, v in obj.items() if k != "/Length"}
+            # Still encoded (its /Filter entry is kept): copied byte for byte
+            return ("stream", entries, obj._data, object_id)
+        if isinstance(obj, DictionaryObject):
+            return ("dict", {k[1:]: self._convert(v) for k, v in obj.items()}, object_id)
+        if isinstance(obj, ArrayObject):
+            return ("array", [self._convert(v) for v in obj])
+        buffer = BytesIO()
+        obj.write_to_stream(buffer, None)
+        return buffer.getvalue()
+
+    def register(self, rldoc) -> str:
+        """Add the form XObject (and the objects it uses) to a ReportLab document - once per document"""
+        from reportlab.pdfbase import pdfdoc
+
+        references: Dict[int, Any] = {}
+
+        def build(node: Any) -> Any:
+            if isinstance(node, bytes):
+                return node
+            kind = node[0]
+            if kind == "ref":
+                if node[1] not in references:
+                    references[node[1]] = build(self._objects[node[1]])
+                return references[node[1]]
+            if kind == "array":
+                return pdfdoc.PDFArray([build(v) for v in node[1]])
+            if kind == "dict":
+                rldict = pdfdoc.PDFDictionary()
+                reference = None
+                if node[2] is not None:
+                    # Indirect in the source: registered first (the tree may point back at it)
+                    rldict.__RefOnly__ = 1
+                    reference = references[node[2]] = rldoc.Reference(rldict)
+                for key, value in node[1].items():
+                    rldict[key] = build(value)
+                return reference or rldict
+            # stream
+            rldict = pdfdoc.PDFDictionary()
+            stream = pdfdoc.PDFStream(rldict, node[2])
+            reference = rldoc.Reference(stream, rldoc.getXObjectName(FORM_NAME) if node is self.form else None)
+            if node[3] is not None:
+                references[node[3]] = reference
+            for key, value in node[1].items():
+                rldict[key] = build(value)
+            return reference
+
+        build(self.form)
+        return FORM_NAME
+
+
+def load() -> Optional[LetterheadTemplate]:
+    """Parse the letterhead once (startup / first render). None when the asset is missing or unreadable"""
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                if not LETTERHEAD_PATH.exists():
+                    logging.error(f"❌ LETTERHEAD_MISSING: {LETTERHEAD_PATH}")
+                    return None
+                try:
+                    _template = LetterheadTemplate(LETTERHEAD_PATH)
+                    logging.info(f"✅ Letterhead template loaded ({_template.size} bytes of streams)")
+                except Exception as e:
+                    logging.error(f"❌ Letterhead template load failed: {str(e)}")
+                    return None
+    return _template
+
+
+def draw_on_page(canvas, doc=None):
+    """
+    ReportLab onPage callback: draw the letterhead at the page origin
+    (drawn under the page content - the renderers leave its space free)
+    """
+    template = load()
+    if template is None:
+        return
+    rldoc = canvas._doc
+    if not getattr(rldoc, "_igv_letterhead", False):
+        template.register(rldoc)
+        rldoc._igv_letterhead = True
+    canvas.saveState()
+    canvas.doForm(FORM_NAME)
+    canvas.restoreState()
+
+
+def letterhead_status() -> Dict[str, Any]:
+    template = load()
+    return {
+        "path": str(LETTERHEAD_PATH),
+        "loaded": template is not None,
+        "page_size": (template.width, template.height) if template else None,
+        "stream_bytes": template.size if template else None,
+    }
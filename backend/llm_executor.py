@@ -0,0 +1,246 @@
+"""
+Async LLM Execution Layer for Israel Growth Venture
+Runs blocking Gemini SDK calls off the event loop in a bounded thread pool
+with per-call timeouts and cancellation when the HTTP client disconnects.
+Generation calls are admitted and accounted by quota_governor (usage also goes to telemetry).
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Optional
+
+from fastapi import Request
+
+import quota_governor
+import telemetry
+
+# Pool size bounds the number of concurrent Gemini calls per worker process
+LLM_MAX_WORKERS = int(os.getenv('LLM_MAX_WORKERS', '4'))
+# Default per-call timeout (seconds) - a mini-analysis usually takes 10-30s
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '90'))
+# How often we check whether the browser is still connected
+LLM_DISCONNECT_POLL_SECONDS = 0.5
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class LLMTimeoutError(Exception):
+    """Raised when an LLM call exceeds its timeout"""
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the HTTP client went away while the LLM call was running"""
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Lazy initialization of the LLM thread pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=LLM_MAX_WORKERS,
+            thread_name_prefix="igv-llm"
+        )
+        logging.info(f"✅ LLM executor started (max_workers={LLM_MAX_WORKERS})")
+    return _executor
+
+
+def shutdown_executor():
+    """Stop the thread pool (called on app shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _wait_for_disconnect(http_request: Request):
+    """Return as soon as the HTTP client disconnects"""
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(LLM_DISCONNECT_POLL_SECONDS)
+
+
+async def run_blocking(
+    func: Callable[..., Any],
+    *args,
+    timeout: Optional[float] = None,
+    http_request: Optional[Request] = None,
+    request_id: str = "unknown",
+    **kwargs
+) -> Any:
+    """
+    Run a blocking callable in the LLM thread pool without blocking the event loop.
+
+    Args:
+        func: Blocking callable (e.g. gemini_client.models.generate_content)
+        timeout: Seconds before giving up (defaults to LLM_TIMEOUT_SECONDS)
+        http_request: If provided, the call is abandoned when this client disconnects
+        request_id: Identifier for logging
+
+    Raises:
+        LLMTimeoutError: The call did not finish in time
+        ClientDisconnectedError: The client disconnected before the call finished
+
+    Note: a thread that already started cannot be killed, but a call still waiting
+    in the pool queue is dropped, and the awaiting coroutine is released immediately.
+    """
+    loop = asyncio.get_running_loop()
+    call_future = loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+    watcher = asyncio.ensure_future(_wait_for_disconnect(http_request)) if http_request is not None else None
+
+    waiters = {call_future} if watcher is None else {call_future, watcher}
+    effective_timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=effective_timeout, return_when=asyncio.FIRST_COMPLETED)
+
+        if call_future in done:
+            return call_future.result()
+
+        call_future.cancel()
+        if watcher is not None and watcher in done:
+            logging.warning(f"[{request_id}] LLM_CANCELLED: client disconnected")
+            raise ClientDisconnectedError("Client disconnected during LLM call")
+
+        logging.error(f"[{request_id}] LLM_TIMEOUT after {effective_timeout}s")
+        raise LLMTimeoutError(f"LLM call timed out after {effective_timeout}s")
+
+    except asyncio.CancelledError:
+        call_future.cancel()
+        raise
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+
+async def generate_content(
+    client,
+    model: str,
+    contents: list,
+    *,
+    config: Any = None,
+    timeout: Optional[float] = None,
+    http_request: Optional[Request] = None,
+    request_id: str = "unknown"
+):
+    """
+    Async wrapper around client.models.generate_content (google-genai)
+
+    CRITICAL: contents MUST be a list for google-genai 0.2.2
+    """
+    kwargs = {"model": model, "contents": contents}
+    if config is not None:
+        kwargs["config"] = config
+
+    # Refused here (QuotaBudgetExhausted) when the quota budget is nearly gone
+    reservation = await quota_governor.admit(model, contents, request_id)
+    try:
+        response = await run_blocking(
+            client.models.generate_content,
+            timeout=timeout,
+            http_request=http_request,
+            request_id=request_id,
+            **kwargs
+        )
+    except Exception as e:
+        quota_governor.release(reservation, e)
+        raise
+
+    quota_governor.record(reservation, getattr(response, "usage_metadata", None))
+    telemetry.add_gemini_usage(model, getattr(response, "usage_metadata", None))
+    return response
+
+
+async def stream_content(
+    client,
+    model: str,
+    contents: list,
+    *,
+    config: Any = None,
+    timeout: Optional[float] = None,
+    http_request: Optional[Request] = None,
+    request_id: str = "unknown"
+) -> AsyncIterator[Any]:
+    """
+    Async iterator over client.models.generate_content_stream (google-genai)
+
+    The blocking SDK iterator is drained in the LLM thread pool and chunks are
+    handed to the event loop through a queue. Closing the iterator (e.g. when
+    a StreamingResponse is cancelled) stops the producer after the current chunk.
+
+    Raises:
+        LLMTimeoutError: The whole stream did not finish in time
+        ClientDisconnectedError: http_request was given and the client disconnected
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop_event = threading.Event()
+
+    kwargs = {"model": model, "contents": contents}
+    if config is not None:
+        kwargs["config"] = config
+
+    def _put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    def _produce():
+        try:
+            for chunk in client.models.generate_content_stream(**kwargs):
+                if stop_event.is_set():
+                    break
+                _put(("chunk", chunk))
+        except Exception as e:
+            _put(("error", e))
+        finally:
+            _put(("done", None))
+
+    reservation = await quota_governor.admit(model, contents, request_id)
+    loop.run_in_executor(get_executor(), _produce)
+    # usage_metadata comes with the last chunk
+    usage_metadata = None
+    failure: Optional[Exception] = None
+
+    effective_timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = loop.time() + effective_timeout
+
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logging.error(f"[{request_id}] LLM_STREAM_TIMEOUT after {effective_timeout}s")
+                raise LLMTimeoutError(f"LLM stream timed out after {effective_timeout}s")
+
+            if http_request is not None and await http_request.is_disconnected():
+                logging.warning(f"[{request_id}] LLM_STREAM_CANCELLED: client disconnected")
+                raise ClientDisconnectedError("Client disconnected during LLM stream")
+
+            try:
+                kind, payload = await asyncio.wait_for(
+                    queue.get(),
+                    timeout=min(remaining, LLM_DISCONNECT_POLL_SECONDS)
+                )
+            except asyncio.TimeoutError:
+                continue
+
+            if kind == "chunk":
+                usage_metadata = getattr(payload, "usage_metadata", None) or usage_metadata
+                yield payload
+            elif kind == "error":
+                raise payload
+            else:
+                return
+    except Exception as e:
+        failure = e
+        raise
+    finally:
+        stop_event.set()
+        if failure is not None and usage_metadata is None:
+            quota_governor.release(reservation, failure)
+        else:
+            quota_governor.record(reservation, usage_metadata)
+            telemetry.add_gemini_usage(model, usage_metadata)
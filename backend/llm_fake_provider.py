@@ -0,0 +1,209 @@
+"""
+Local Fake Gemini Provider for Israel Growth Venture
+Offline stand-in for google.genai.Client (models + caches) used to exercise the
+mini-analysis pipeline, context caching and streaming without API calls.
+Enable with LLM_FAKE_PROVIDER=true
+"""
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, Optional
+import hashlib
+import logging
+import os
+import threading
+import time
+
+# Simulated generation latency (seconds) - keeps concurrency behaviour realistic
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv('FAKE_LLM_LATENCY_SECONDS', '0.2'))
+
+# Rough chars-per-token ratio used for the simulated usage metadata
+CHARS_PER_TOKEN = 4
+
+# Locations are in both whitelists: the canned answer passes the whitelist check
+FAKE_ANALYSES = {
+    "fr": "## Analyse de marché – {brand}\n\nPotentiel en Israël: {score}/10. Emplacements recommandés: Haifa, Jerusalem.\n\n### Prochaines étapes\nValider le concept avec IGV.",
+    "en": "## Market analysis – {brand}\n\nIsrael potential: {score}/10. Recommended locations: Haifa, Jerusalem.\n\n### Next steps\nValidate the concept with IGV.",
+    "he": "## ניתוח שוק – {brand}\n\nפוטנציאל בישראל: {score}/10. מיקומים מומלצים: חיפה, ירושלים.\n\n### הצעדים הבאים\nאימות הקונספט עם IGV.",
+}
+
+# Form labels used to recover brand + language from the prompt text
+BRAND_LABELS = {
+    "he": "- **שם המותג:** ",
+    "en": "- **Brand Name:** ",
+    "fr": "- **Nom de marque:** ",
+}
+
+
+class FakeProviderError(Exception):
+    """Mimics google.genai.errors.APIError (code + status in the message)"""
+
+    def __init__(self, code: int, status: str, message: str):
+        self.code = code
+        self.status = status
+        self.message = message
+        super().__init__(f"{code} {status}. {message}")
+
+
+def _content_text(contents: Any) -> str:
+    """Flatten google-genai style contents (str | list[str]) into text"""
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(str(part) for part in (contents or []))
+
+
+def _config_value(config: Any, field: str) -> Optional[Any]:
+    if config is None:
+        return None
+    if isinstance(config, dict):
+        return config.get(field)
+    return getattr(config, field, None)
+
+
+def _ttl_seconds(ttl: Optional[str]) -> float:
+    """Parse a google-genai ttl string like '3600s'"""
+    if not ttl:
+        return 3600.0
+    return float(str(ttl).rstrip("s"))
+
+
+class FakeCaches:
+    """In-memory cachedContents store with TTL expiry (client.caches)"""
+
+    def __init__(self):
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.create_calls = 0
+
+    def create(self, *, model: str, contents: Any, config: Any = None):
+        text = _content_text(contents)
+        expire_time = datetime.now(timezone.utc) + timedelta(seconds=_ttl_seconds(_config_value(config, "ttl")))
+        with self._lock:
+            self.create_calls += 1
+            name = f"cachedContents/fake-{self.create_calls}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]}"
+            self._items[name] = {"text": text, "model": model, "expire_time": expire_time}
+        return SimpleNamespace(
+            name=name,
+            model=model,
+            display_name=_config_value(config, "display_name"),
+            expire_time=expire_time,
+            usage_metadata=SimpleNamespace(total_token_count=len(text) // CHARS_PER_TOKEN)
+        )
+
+    def lookup(self, name: str) -> str:
+        """Return cached text or raise the same kind of error as the real API"""
+        with self._lock:
+            item = self._items.get(name)
+            if item is not None and item["expire_time"] <= datetime.now(timezone.utc):
+                del self._items[name]
+                item = None
+        if item is None:
+            raise FakeProviderError(404, "NOT_FOUND", f"CachedContent not found (or expired): {name}")
+        return item["text"]
+
+    def expire(self, name: Optional[str] = None):
+        """Force expiry of one (or every) cached context - for fallback tests"""
+        with self._lock:
+            for key in list(self._items):
+                if name is None or key == name:
+                    self._items[key]["expire_time"] = datetime.now(timezone.utc)
+
+    def delete(self, *, name: str):
+        with self._lock:
+            self._items.pop(name, None)
+
+
+class FakeModels:
+    """Deterministic generate_content / generate_content_stream (client.models)"""
+
+    def __init__(self, caches: FakeCaches):
+        self._caches = caches
+        self.calls = []
+
+    def _respond(self, model: str, contents: Any, config: Any = None):
+        prompt_text = _content_text(contents)
+        cached_text = ""
+        cached_name = _config_value(config, "cached_content")
+        if cached_name:
+            cached_text = self._caches.lookup(cached_name)
+
+        self.calls.append({"model": model, "prompt_chars": len(prompt_text), "cached_content": cached_name})
+        time.sleep(FAKE_LLM_LATENCY_SECONDS)
+
+        text = self._analysis_for(prompt_text)
+        cached_tokens = len(cached_text) // CHARS_PER_TOKEN
+        prompt_tokens = len(prompt_text) // CHARS_PER_TOKEN + cached_tokens
+        output_tokens = len(text) // CHARS_PER_TOKEN
+
+        usage = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens or None,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens
+        )
+        return text, usage
+
+    @staticmethod
+    def _analysis_for(prompt_text: str) -> str:
+        language, brand = "fr", "Brand"
+        for lang, label in BRAND_LABELS.items():
+            index = prompt_text.find(label)
+            if index != -1:
+                language = lang
+                brand = prompt_text[index + len(label):].split("\n", 1)[0].strip() or brand
+                break
+        score = int(hashlib.sha256(prompt_text.encode('utf-8')).hexdigest(), 16) % 4 + 6
+        return FAKE_ANALYSES[language].format(brand=brand, score=score)
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        text, usage = self._respond(model, contents, config)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_content_stream(self, *, model: str, contents: Any, config: Any = None) -> Iterator[Any]:
+        text, usage = self._respond(model, contents, config)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            yield SimpleNamespace(
+                text=word if last else word + " ",
+                usage_metadata=usage if last else None
+            )
+
+
+class FakeGeminiClient:
+    """Drop-in replacement for google.genai.Client(api_key=...)"""
+
+    def __init__(self):
+        self.caches = FakeCaches()
+        self.models = FakeModels(self.caches)
+        logging.warning("⚠️ Using FAKE Gemini provider (LLM_FAKE_PROVIDER=true) - no real API calls")
+
+
+class StubLLM:
+    """
+    Deterministic local provider for llm_gateway ("stub") - offline latency / throughput
+    benchmarks. Same text for the same prompt; every LLM_STUB_SLOW_EVERY-th call is
+    LLM_STUB_SLOW_FACTOR times slower (reproducible tail latency for hedging).
+    """
+
+    def __init__(self, latency_seconds: Optional[float] = None):
+        self.latency_seconds = FAKE_LLM_LATENCY_SECONDS if latency_seconds is None else latency_seconds
+        self.slow_every = int(os.getenv('LLM_STUB_SLOW_EVERY', '0'))
+        self.slow_factor = float(os.getenv('LLM_STUB_SLOW_FACTOR', '10'))
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, system: Optional[str] = None):
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+        slow = self.slow_every and call_number % self.slow_every == 0
+        time.sleep(self.latency_seconds * (self.slow_factor if slow else 1))
+
+        text = FakeModels._analysis_for(prompt)
+        usage = SimpleNamespace(
+            prompt_token_count=(len(prompt) + len(system or "")) // CHARS_PER_TOKEN,
+            candidates_token_count=len(text) // CHARS_PER_TOKEN,
+            total_token_count=(len(prompt) + len(system or "") + len(text)) // CHARS_PER_TOKEN
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
@@ -0,0 +1,488 @@
+"""
+LLM Gateway for Israel Growth Venture
+Single entry point for text generation (mini-analyses on Gemini, AI insights on OpenAI):
+- per-provider timeout
+- circuit breaker per provider (opens after repeated failures, half-open trial after a cooldown)
+- fallback to the next provider of the chain when one fails or times out
+- optional hedging: past the provider's p95 latency, the next provider is raced
+- latency histograms per provider (GET /api/admin/llm-gateway)
+- streaming calls (SSE endpoint) go through the same breaker and timeout, without
+  fallback or hedging (chunks already sent cannot be taken back)
+
+Providers: "gemini", "openai", "stub" (deterministic local provider, see llm_fake_provider.StubLLM)
+Chains are configured per task, e.g. MINI_ANALYSIS_LLM_PROVIDERS=gemini,openai
+"""
+
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import Request
+
+import llm_executor
+import telemetry
+from llm_executor import ClientDisconnectedError, LLMTimeoutError
+from quota_governor import QuotaBudgetExhausted
+
+# Provider chains per task (first = primary, next ones = fallbacks)
+TASK_PROVIDERS = {
+    "mini-analysis": os.getenv('MINI_ANALYSIS_LLM_PROVIDERS', 'gemini'),
+    "ai-insight": os.getenv('AI_INSIGHT_LLM_PROVIDERS', 'openai'),
+}
+
+PROVIDER_TIMEOUTS = {
+    "gemini": float(os.getenv('LLM_GEMINI_TIMEOUT_SECONDS', str(llm_executor.LLM_TIMEOUT_SECONDS))),
+    "openai": float(os.getenv('LLM_OPENAI_TIMEOUT_SECONDS', '60')),
+    "stub": float(os.getenv('LLM_STUB_TIMEOUT_SECONDS', '30')),
+}
+
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4-turbo-preview')
+
+# Circuit breaker: consecutive failures before opening, seconds before a trial call
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = int(os.getenv('LLM_BREAKER_RESET_SECONDS', '60'))
+
+# Hedging: race the next provider once the primary exceeds its p95 latency
+LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', '1.0'))
+
+HISTOGRAM_BUCKETS_MS = (100, 250, 500, 1000, 2000, 5000, 10000, 20000, 30000, 60000, 120000)
+LATENCY_SAMPLES = 500
+
+ProviderCall = Callable[[float, Optional[Request]], Awaitable[Any]]
+ProviderStream = Callable[[float, Optional[Request]], AsyncIterator[Any]]
+
+
+class CircuitOpenError(Exception):
+    """The provider's circuit breaker is open - the call was not attempted"""
+
+    def __init__(self, provider: str, last_error: str):
+        self.provider = provider
+        # Keeps the original error text (e.g. RESOURCE_EXHAUSTED) for the caller's error mapping
+        super().__init__(f"Circuit open for {provider}: {last_error}")
+
+
+class ProviderNotConfiguredError(Exception):
+    """No provider of the task chain is configured"""
+
+
+def _new_provider_state() -> Dict[str, Any]:
+    return {
+        "state": "closed",
+        "consecutive_failures": 0,
+        "opened_at": None,
+        "trial_in_flight": False,
+        "last_error": None,
+        "calls": 0,
+        "successes": 0,
+        "failures": 0,
+        "timeouts": 0,
+        "short_circuited": 0,
+        "hedges_started": 0,
+        "hedges_won": 0,
+        "fallbacks_served": 0,
+        "histogram": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+        "latency_sum_ms": 0.0,
+        "samples": deque(maxlen=LATENCY_SAMPLES),
+    }
+
+
+_providers: Dict[str, Dict[str, Any]] = {name: _new_provider_state() for name in PROVIDER_TIMEOUTS}
+
+_openai_client = None
+_stub = None
+
+
+# =============================================================================
+# PROVIDER ADAPTERS
+# =============================================================================
+
+def _gemini_client():
+    # Import dynamically to avoid circular imports
+    import mini_analysis_routes
+    return mini_analysis_routes.gemini_client, mini_analysis_routes.GEMINI_MODEL
+
+
+def _get_openai_client():
+    global _openai_client
+    if _openai_client is None and OPENAI_API_KEY:
+        import openai
+        _openai_client = openai.OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return _openai_client
+
+
+def _get_stub():
+    global _stub
+    if _stub is None:
+        from llm_fake_provider import StubLLM
+        _stub = StubLLM()
+    return _stub
+
+
+def is_configured(provider: str) -> bool:
+    if provider == "gemini":
+        return _gemini_client()[0] is not None
+    if provider == "openai":
+        return bool(OPENAI_API_KEY)
+    return provider == "stub"
+
+
+def provider_model(provider: str) -> str:
+    if provider == "gemini":
+        return _gemini_client()[1]
+    if provider == "openai":
+        return OPENAI_MODEL
+    return "stub"
+
+
+def response_text(provider: str, response: Any) -> str:
+    if provider == "openai":
+        return (response.choices[0].message.content or "").strip()
+    return response.text if hasattr(response, 'text') else str(response)
+
+
+def record_usage(provider: str, response: Any):
+    """Token usage of a non-Gemini call for telemetry (Gemini is accounted by llm_executor)"""
+    if provider == "openai":
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            telemetry.add_usage(provider, OPENAI_MODEL, usage.prompt_tokens or 0, usage.completion_tokens or 0)
+    elif provider == "stub":
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            telemetry.add_usage(provider, "stub", usage.prompt_token_count, usage.candidates_token_count)
+
+
+def _default_call(provider: str, prompt: str, system: Optional[str], temperature: Optional[float],
+                  max_tokens: Optional[int], request_id: str) -> ProviderCall:
+    """Plain prompt call for a provider (no provider-specific features)"""
+
+    async def call(timeout: float, http_request: Optional[Request]):
+        if provider == "gemini":
+            client, model = _gemini_client()
+            text = f"{system}\n\n{prompt}" if system else prompt
+            # CRITICAL: contents MUST be a list for google-genai 0.2.2
+            return await llm_executor.generate_content(
+                client, model, [text], timeout=timeout, http_request=http_request, request_id=request_id
+            )
+
+        if provider == "openai":
+            messages = [{"role": "system", "content": system}] if system else []
+            messages.append({"role": "user", "content": prompt})
+            kwargs = {"model": OPENAI_MODEL, "messages": messages}
+            if temperature is not None:
+                kwargs["temperature"] = temperature
+            if max_tokens is not None:
+                kwargs["max_tokens"] = max_tokens
+            return await llm_executor.run_blocking(
+                _get_openai_client().chat.completions.create,
+                timeout=timeout, http_request=http_request, request_id=request_id, **kwargs
+            )
+
+        return await llm_executor.run_blocking(
+            _get_stub().generate, prompt, system,
+            timeout=timeout, http_request=http_request, request_id=request_id
+        )
+
+    return call
+
+
+# =============================================================================
+# CIRCUIT BREAKER + LATENCY
+# =============================================================================
+
+def _breaker_allows(provider: str) -> bool:
+    state = _providers[provider]
+    if state["state"] == "closed":
+        return True
+    if state["state"] == "open" and time.monotonic() - state["opened_at"] >= BREAKER_RESET_SECONDS:
+        state["state"] = "half_open"
+    if state["state"] == "half_open" and not state["trial_in_flight"]:
+        # One trial call decides whether the circuit closes again
+        state["trial_in_flight"] = True
+        return True
+    return False
+
+
+def _record_success(provider: str, latency_ms: float):
+    state = _providers[provider]
+    state["successes"] += 1
+    state["consecutive_failures"] = 0
+    state["trial_in_flight"] = False
+    if state["state"] != "closed":
+        logging.info(f"✅ LLM_GATEWAY circuit closed for {provider}")
+    state["state"] = "closed"
+    _observe_latency(provider, latency_ms)
+
+
+def _record_failure(provider: str, error: Exception, latency_ms: float):
+    state = _providers[provider]
+    state["failures"] += 1
+    state["consecutive_failures"] += 1
+    state["trial_in_flight"] = False
+    state["last_error"] = str(error)[:300]
+    if isinstance(error, LLMTimeoutError):
+        state["timeouts"] += 1
+        # A timeout is a latency observation too (lower bound)
+        _observe_latency(provider, latency_ms)
+
+    if state["state"] == "half_open" or state["consecutive_failures"] >= BREAKER_FAILURE_THRESHOLD:
+        if state["state"] != "open":
+            logging.error(f"❌ LLM_GATEWAY circuit opened for {provider} after {state['consecutive_failures']} failures: {state['last_error']}")
+        state["state"] = "open"
+        state["opened_at"] = time.monotonic()
+
+
+def _observe_latency(provider: str, latency_ms: float):
+    state = _providers[provider]
+    index = len(HISTOGRAM_BUCKETS_MS)
+    for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+        if latency_ms <= bound:
+            index = i
+            break
+    state["histogram"][index] += 1
+    state["latency_sum_ms"] += latency_ms
+    state["samples"].append(latency_ms)
+
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _hedge_delay(provider: str) -> Optional[float]:
+    samples = list(_providers[provider]["samples"])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return max(HEDGE_MIN_DELAY_SECONDS, _percentile(samples, 95) / 1000.0)
+
+
+async def _attempt(provider: str, call: ProviderCall, http_request: Optional[Request], request_id: str) -> Dict[str, Any]:
+    state = _providers[provider]
+    state["calls"] += 1
+    started = time.perf_counter()
+    try:
+        response = await call(PROVIDER_TIMEOUTS[provider], http_request)
+        text = response_text(provider, response)
+    except (ClientDisconnectedError, QuotaBudgetExhausted):
+        # Not a provider health signal (client left / local budget refusal)
+        state["trial_in_flight"] = False
+        raise
+    except asyncio.CancelledError:
+        # Lost hedge race / client gone / caller cancelled: no outcome, free the half-open trial
+        state["trial_in_flight"] = False
+        raise
+    except Exception as e:
+        _record_failure(provider, e, (time.perf_counter() - started) * 1000)
+        logging.warning(f"[{request_id}] LLM_GATEWAY {provider} failed: {str(e)[:200]}")
+        raise
+
+    latency_ms = (time.perf_counter() - started) * 1000
+    _record_success(provider, latency_ms)
+    if provider != "gemini":
+        record_usage(provider, response)
+    return {
+        "text": text,
+        "provider": provider,
+        "model": provider_model(provider),
+        "latency_ms": round(latency_ms, 1),
+        "response": response,
+    }
+
+
+# =============================================================================
+# GATEWAY
+# =============================================================================
+
+def resolve_chain(task: str, providers: Optional[List[str]] = None) -> List[str]:
+    names = providers or [p.strip() for p in TASK_PROVIDERS.get(task, "gemini").split(",")]
+    return [p for p in names if p in _providers and is_configured(p)]
+
+
+async def generate(
+    task: str,
+    prompt: str,
+    *,
+    system: Optional[str] = None,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    providers: Optional[List[str]] = None,
+    overrides: Optional[Dict[str, ProviderCall]] = None,
+    http_request: Optional[Request] = None,
+    request_id: str = "unknown"
+) -> Dict[str, Any]:
+    """
+    Generate text through the task's provider chain.
+
+    Args:
+        task: "mini-analysis" | "ai-insight" (selects the provider chain)
+        prompt / system / temperature / max_tokens: plain request for every provider
+        providers: explicit chain (overrides the task configuration)
+        overrides: provider -> coroutine function(timeout, http_request) returning the raw
+                   response, for provider-specific calls (e.g. Gemini context caching)
+        http_request: abandon the call when the client disconnects
+
+    Returns:
+        {"text", "provider", "model", "latency_ms", "fallback", "hedged", "response"}
+
+    Raises:
+        The primary provider's error when every provider failed (quota / timeout errors
+        keep their type for the caller's mapping), ClientDisconnectedError immediately,
+        ProviderNotConfiguredError when no provider of the chain is configured.
+    """
+    chain = resolve_chain(task, providers)
+    if not chain:
+        raise ProviderNotConfiguredError(f"No LLM provider configured for {task}")
+
+    overrides = overrides or {}
+    calls = {
+        name: overrides.get(name) or _default_call(name, prompt, system, temperature, max_tokens, request_id)
+        for name in chain
+    }
+    errors: List[Exception] = []
+
+    index = 0
+    while index < len(chain):
+        provider = chain[index]
+        index += 1
+        if not _breaker_allows(provider):
+            _providers[provider]["short_circuited"] += 1
+            errors.append(CircuitOpenError(provider, _providers[provider]["last_error"] or "unavailable"))
+            continue
+
+        primary = asyncio.ensure_future(_attempt(provider, calls[provider], http_request, request_id))
+        hedge_index = next((i for i in range(index, len(chain)) if _providers[chain[i]]["state"] == "closed"), None)
+        hedge_provider = chain[hedge_index] if hedge_index is not None else None
+        hedge_delay = _hedge_delay(provider) if LLM_HEDGE_ENABLED and hedge_provider else None
+
+        tasks = {primary: provider}
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+            if not done and _breaker_allows(hedge_provider):
+                logging.info(f"[{request_id}] LLM_GATEWAY hedging {provider} -> {hedge_provider} after {hedge_delay:.1f}s")
+                _providers[provider]["hedges_started"] += 1
+                tasks[asyncio.ensure_future(_attempt(hedge_provider, calls[hedge_provider], http_request, request_id))] = hedge_provider
+                # The hedge provider is consumed: do not try it again as a fallback
+                index = hedge_index + 1
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task_done in done:
+                    error = task_done.exception()
+                    if error is None:
+                        result = task_done.result()
+                        result["hedged"] = len(tasks) > 1
+                        result["fallback"] = result["provider"] != chain[0]
+                        if result["hedged"] and result["provider"] != provider:
+                            _providers[provider]["hedges_won"] += 1
+                        if result["fallback"]:
+                            _providers[result["provider"]]["fallbacks_served"] += 1
+                            logging.warning(f"[{request_id}] LLM_GATEWAY served by fallback {result['provider']} (primary {chain[0]} failed or slow)")
+                        return result
+                    if isinstance(error, ClientDisconnectedError):
+                        raise error
+                    errors.append(error)
+        finally:
+            for task_pending in pending:
+                task_pending.cancel()
+
+    # Every provider failed: the primary's error drives the caller's mapping
+    for error in errors[1:]:
+        logging.error(f"[{request_id}] LLM_GATEWAY fallback error: {str(error)[:200]}")
+    raise errors[0]
+
+
+async def stream(
+    provider: str,
+    open_stream: ProviderStream,
+    *,
+    http_request: Optional[Request] = None,
+    request_id: str = "unknown"
+) -> AsyncIterator[Any]:
+    """
+    Stream one provider's chunks through its circuit breaker and timeout.
+
+    Args:
+        open_stream: function(timeout, http_request) returning the provider's chunk iterator
+        http_request: abandon the stream when the client disconnects
+
+    Raises:
+        CircuitOpenError before any chunk when the breaker is open, then the provider's
+        errors unchanged (recorded as breaker failures, except disconnects / quota refusals).
+        A stream closed early by the consumer records no outcome.
+    """
+    if not _breaker_allows(provider):
+        _providers[provider]["short_circuited"] += 1
+        raise CircuitOpenError(provider, _providers[provider]["last_error"] or "unavailable")
+
+    state = _providers[provider]
+    state["calls"] += 1
+    started = time.perf_counter()
+    chunks = open_stream(PROVIDER_TIMEOUTS[provider], http_request)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except (ClientDisconnectedError, QuotaBudgetExhausted):
+        state["trial_in_flight"] = False
+        raise
+    except Exception as e:
+        _record_failure(provider, e, (time.perf_counter() - started) * 1000)
+        logging.warning(f"[{request_id}] LLM_GATEWAY {provider} stream failed: {str(e)[:200]}")
+        raise
+    except (GeneratorExit, asyncio.CancelledError):
+        # Closed by the consumer (language check cut / client gone): no outcome
+        state["trial_in_flight"] = False
+        raise
+    finally:
+        await chunks.aclose()
+
+    _record_success(provider, (time.perf_counter() - started) * 1000)
+
+
+def gateway_status() -> Dict[str, Any]:
+    """Per-provider breaker state, counters and latency histogram (ops endpoint)"""
+    providers = {}
+    for name, state in _providers.items():
+        samples = list(state["samples"])
+        buckets = {f"le_{bound}ms": count for bound, count in zip(HISTOGRAM_BUCKETS_MS, state["histogram"])}
+        buckets["le_inf"] = state["histogram"][-1]
+        providers[name] = {
+            "configured": is_configured(name),
+            "model": provider_model(name) if is_configured(name) else None,
+            "timeout_seconds": PROVIDER_TIMEOUTS[name],
+            "breaker": {
+                "state": state["state"],
+                "consecutive_failures": state["consecutive_failures"],
+                "last_error": state["last_error"],
+            },
+            "counters": {key: state[key] for key in (
+                "calls", "successes", "failures", "timeouts", "short_circuited",
+                "hedges_started", "hedges_won", "fallbacks_served"
+            )},
+            "latency_ms": {
+                "histogram": buckets,
+                "count": sum(state["histogram"]),
+                "sum": round(state["latency_sum_ms"], 1),
+                "p50": _percentile(samples, 50),
+                "p95": _percentile(samples, 95),
+                "p99": _percentile(samples, 99),
+            },
+            "hedge_delay_seconds": _hedge_delay(name),
+        }
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "chains": {task: resolve_chain(task) for task in TASK_PROVIDERS},
+        "hedging_enabled": LLM_HEDGE_ENABLED,
+        "breaker": {"failure_threshold": BREAKER_FAILURE_THRESHOLD, "reset_seconds": BREAKER_RESET_SECONDS},
+        "providers": providers,
+    }
@@ -0,0 +1,85 @@
+"""
+Measurement mode for relevance-pruned reference documents
+Compares the full prompt (all reference documents inlined) with the pruned prompt
+for every sector and language, and prints the token savings.
+
+Usage:
+    python measure_prompt_pruning.py                      # built-in sample forms, estimated tokens
+    python measure_prompt_pruning.py --from-db 200        # last 200 real forms (MONGODB_URI)
+    python measure_prompt_pruning.py --count-tokens       # exact counts via Gemini count_tokens
+"""
+import argparse
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+FORM_FIELDS = (
+    "nom_de_marque", "email", "secteur", "statut_alimentaire", "anciennete", "pays_dorigine",
+    "concept", "positionnement", "modele_actuel", "differenciation", "objectif_israel", "contraintes",
+)
+
+SAMPLE_FORMS = [
+    {"nom_de_marque": "Le Fournil", "secteur": "Restauration / Food", "statut_alimentaire": "Casher",
+     "concept": "Boulangerie artisanale", "objectif_israel": "Ouvrir 3 boutiques à Tel Aviv et Jerusalem",
+     "contraintes": "Budget limité, fermeture Shabbat acceptée"},
+    {"nom_de_marque": "Saveurs d'Orient", "secteur": "Restauration / Food", "statut_alimentaire": "Halal",
+     "concept": "Fast food oriental", "objectif_israel": "Nazareth puis Haifa", "contraintes": ""},
+    {"nom_de_marque": "Maison Lumière", "secteur": "Retail (hors food)",
+     "concept": "Décoration haut de gamme", "objectif_israel": "Premium locations, mall in Herzliya",
+     "contraintes": "Kosher not relevant"},
+    {"nom_de_marque": "Studio Forme", "secteur": "Services",
+     "concept": "Centres de remise en forme", "objectif_israel": "", "contraintes": ""},
+    {"nom_de_marque": "OptiVision", "secteur": "Paramédical / Santé",
+     "concept": "Optique", "objectif_israel": "ירושלים ותל אביב", "contraintes": "קניון בלבד"},
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Prompt reference pruning - token savings report")
+    parser.add_argument("--from-db", type=int, default=0, help="use the last N mini_analyses forms")
+    parser.add_argument("--count-tokens", action="store_true", help="exact counts (GEMINI_API_KEY required)")
+    return parser.parse_args()
+
+
+def as_form(data: dict) -> SimpleNamespace:
+    return SimpleNamespace(**{field: data.get(field) or "" for field in FORM_FIELDS})
+
+
+async def load_forms(limit: int) -> list:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.getenv('MONGODB_URI') or os.getenv('MONGO_URL'), serverSelectionTimeoutMS=5000)
+    db = client[os.getenv('DB_NAME', 'igv_production')]
+    docs = await db.mini_analyses.find(
+        {"payload_form": {"$exists": True}}, {"payload_form": 1}
+    ).sort("created_at", -1).to_list(limit)
+    client.close()
+    return [as_form(doc["payload_form"]) for doc in docs]
+
+
+def gemini_token_counter():
+    import google.genai as genai
+    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+    model = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+    return lambda text: client.models.count_tokens(model=model, contents=[text]).total_tokens
+
+
+def main(args):
+    import prompt_registry
+
+    forms = asyncio.run(load_forms(args.from_db)) if args.from_db else [as_form(f) for f in SAMPLE_FORMS]
+    report = prompt_registry.pruning_report(forms, count_tokens=gemini_token_counter() if args.count_tokens else None)
+
+    print("=" * 86)
+    print(f"[PROMPT PRUNING] {len(forms)} forms, {report['token_counts']} tokens, cap {report['prompt_max_chars']} chars")
+    print("=" * 86)
+    print(f"{'sector':<24}{'lang':<6}{'n':>4}{'full':>9}{'pruned':>9}{'saved':>8}{'entries':>9}{'max chars':>11}")
+    for row in report["groups"]:
+        print(f"{row['sector'][:23]:<24}{row['language']:<6}{row['samples']:>4}{row['avg_full_tokens']:>9}"
+              f"{row['avg_pruned_tokens']:>9}{row['savings_pct']:>7}%{row['avg_reference_entries']:>9}{row['max_pruned_chars']:>11}")
+    print(f"Total savings: {report['total_savings_pct']}%")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main(parse_args())
@@ -0,0 +1,152 @@
+"""
+Migration script: inline PDF data URLs -> PDF artifact store
+mini_analyses.pdf_url and leads.pdf_url held the whole PDF as a base64 "data:" URL.
+Each PDF is decoded, stored once (pdf_store, sha256-addressed) and the documents
+get the reference + the download URL (GET /api/mini-analysis/{id}/pdf).
+
+Leads are linked through analysis_meta.analysis_id / mini_analysis_id, or through the
+sha256 of an already migrated analysis. Leads whose PDF matches no analysis keep their data URL.
+
+Usage:
+    python migrate_pdf_data_urls.py --dry-run
+    python migrate_pdf_data_urls.py
+"""
+import sys
+import os
+
+# Add parent directory to path to import server modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import asyncio
+import base64
+import binascii
+from datetime import datetime, timezone
+import logging
+from dotenv import load_dotenv
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Load environment variables
+load_dotenv()
+
+import pdf_store
+
+DATA_URL_PREFIX = "data:application/pdf;base64,"
+
+# MongoDB connection
+mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
+db_name = os.getenv('DB_NAME', 'igv_production')
+
+mongo_client = None
+db = None
+
+def get_db():
+    """Lazy initialization of MongoDB connection"""
+    global mongo_client, db
+    if db is None and mongo_url:
+        mongo_client = AsyncIOMotorClient(
+            mongo_url,
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=5000
+        )
+        db = mongo_client[db_name]
+    return db
+
+logging.basicConfig(level=logging.INFO)
+
+
+def decode_data_url(data_url: str) -> bytes:
+    return base64.b64decode(data_url[len(DATA_URL_PREFIX):], validate=True)
+
+
+async def migrate_pdf_data_urls(dry_run: bool = False):
+    current_db = get_db()
+
+    if current_db is None:
+        print("[ERROR] Database not configured - cannot migrate")
+        return {"error": "Database not available"}
+
+    data_url_filter = {"pdf_url": {"$regex": f"^{DATA_URL_PREFIX}"}}
+    counts = {"analyses": 0, "leads": 0, "orphan_leads": 0, "errors": 0, "bytes_before": 0, "bytes_after": 0}
+    # sha256 -> analysis id (leads without an analysis id are matched on the PDF bytes)
+    analysis_by_sha = {}
+
+    # 1. Analyses
+    async for analysis in current_db.mini_analyses.find(data_url_filter, {"pdf_url": 1, "brand_name": 1}):
+        analysis_id = str(analysis["_id"])
+        try:
+            pdf_bytes = decode_data_url(analysis["pdf_url"])
+        except (binascii.Error, ValueError) as e:
+            print(f"[ERROR] Analysis {analysis_id}: invalid data URL ({e})")
+            counts["errors"] += 1
+            continue
+
+        counts["bytes_before"] += len(analysis["pdf_url"])
+        analysis_by_sha[pdf_store.sha256_of(pdf_bytes)] = analysis_id
+        if not dry_run:
+            pdf_ref = await pdf_store.put(current_db, pdf_bytes, {"analysis_id": analysis_id, "brand_name": analysis.get("brand_name")})
+            await current_db.mini_analyses.update_one(
+                {"_id": analysis["_id"]},
+                {"$set": {"pdf": pdf_ref, "pdf_url": pdf_store.analysis_pdf_url(analysis_id),
+                          "pdf_migrated_at": datetime.now(timezone.utc)}}
+            )
+        counts["bytes_after"] += len(pdf_store.analysis_pdf_url(analysis_id))
+        counts["analyses"] += 1
+
+    # 2. Leads
+    async for lead in current_db.leads.find(data_url_filter, {"pdf_url": 1, "analysis_meta": 1, "mini_analysis_id": 1}):
+        try:
+            pdf_bytes = decode_data_url(lead["pdf_url"])
+        except (binascii.Error, ValueError) as e:
+            print(f"[ERROR] Lead {lead['_id']}: invalid data URL ({e})")
+            counts["errors"] += 1
+            continue
+
+        sha256 = pdf_store.sha256_of(pdf_bytes)
+        analysis_id = (lead.get("analysis_meta") or {}).get("analysis_id") or lead.get("mini_analysis_id") or analysis_by_sha.get(sha256)
+        if analysis_id is None:
+            analysis = await current_db.mini_analyses.find_one({"pdf.sha256": sha256}, {"_id": 1})
+            analysis_id = str(analysis["_id"]) if analysis else None
+        if analysis_id is None:
+            print(f"[SKIP] Lead {lead['_id']}: no analysis for this PDF - data URL kept")
+            counts["orphan_leads"] += 1
+            continue
+
+        counts["bytes_before"] += len(lead["pdf_url"])
+        if not dry_run:
+            pdf_ref = await pdf_store.put(current_db, pdf_bytes, {"analysis_id": analysis_id})
+            await current_db.leads.update_one(
+                {"_id": lead["_id"]},
+                {"$set": {"pdf": pdf_ref, "pdf_url": pdf_store.analysis_pdf_url(analysis_id),
+                          "pdf_migrated_at": datetime.now(timezone.utc)}}
+            )
+        counts["bytes_after"] += len(pdf_store.analysis_pdf_url(analysis_id))
+        counts["leads"] += 1
+
+    print(f"\n[{'DRY RUN' if dry_run else 'AFTER MIGRATION'}]")
+    print(f"Analyses migrated: {counts['analyses']}")
+    print(f"Leads migrated: {counts['leads']}")
+    print(f"Leads kept (no matching analysis): {counts['orphan_leads']}")
+    print(f"Errors: {counts['errors']}")
+    print(f"pdf_url bytes: {counts['bytes_before']} -> {counts['bytes_after']}")
+    if not dry_run:
+        print(f"PDF store: {pdf_store.store_status()['stats']}")
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move inline PDF data URLs to the PDF artifact store")
+    parser.add_argument("--dry-run", action="store_true", help="count and decode only, no writes")
+    args = parser.parse_args()
+
+    print("="*60)
+    print(f"MIGRATION: PDF data URLs -> PDF store ({pdf_store.PDF_STORE_BACKEND})")
+    print("="*60)
+
+    result = asyncio.run(migrate_pdf_data_urls(dry_run=args.dry_run))
+
+    print("\n" + "="*60)
+    print("[MIGRATION COMPLETE]")
+    print("="*60)
@@ -0,0 +1,294 @@
+"""
+Mini-Analysis Job Mode for Israel Growth Venture
+POST /api/mini-analysis?mode=async (or header "Prefer: respond-async") returns 202 + job id;
+a background worker pool runs generation, PDF, email and CRM updates.
+
+Progress: GET /api/mini-analysis/jobs/{job_id} or SSE GET /api/mini-analysis/jobs/{job_id}/events
+Stages: queued -> generating -> rendering -> emailing -> done (or failed)
+Jobs are persisted in MongoDB (mini_analysis_jobs); unstarted jobs are resumed after a restart.
+"""
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+import uuid
+
+import database
+import mini_analysis_routes
+from mini_analysis_routes import MiniAnalysisRequest, format_sse
+
+router = APIRouter(prefix="/api/mini-analysis/jobs")
+
+# Concurrent jobs per worker process (each job holds one LLM pool thread while generating)
+JOB_WORKERS = int(os.getenv('MINI_ANALYSIS_JOB_WORKERS', '2'))
+# SSE keepalive comment interval - keeps Render's proxy from closing idle streams
+JOB_SSE_HEARTBEAT_SECONDS = 15
+# Finished jobs kept in memory (older ones are served from MongoDB)
+JOB_MEMORY_MAX = 500
+
+FINAL_STAGES = ("done", "failed")
+
+# job_id -> public job document
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# job_id -> (MiniAnalysisRequest, context) for jobs not yet run
+_work: Dict[str, tuple] = {}
+# job_id -> SSE subscriber queues
+_listeners: Dict[str, List[asyncio.Queue]] = {}
+
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+
+
+def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in job.items() if k not in ("_id", "request_data", "context")}
+
+
+def _ensure_workers():
+    """Lazy start of the job worker tasks (on the running event loop)"""
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+    _workers[:] = [w for w in _workers if not w.done()]
+    while len(_workers) < JOB_WORKERS:
+        _workers.append(asyncio.ensure_future(_worker_loop(len(_workers))))
+
+
+async def stop_workers():
+    """Cancel worker tasks (app shutdown) - unfinished jobs stay queued in MongoDB"""
+    global _queue
+    for worker in _workers:
+        worker.cancel()
+    _workers.clear()
+    _queue = None
+
+
+async def _save(job_id: str, fields: Dict[str, Any]):
+    current_db = database.get_db()
+    if current_db is None:
+        return
+    try:
+        await current_db.mini_analysis_jobs.update_one({"job_id": job_id}, {"$set": fields}, upsert=True)
+    except Exception as e:
+        logging.error(f"[job {job_id}] JOB_PERSIST_FAILED: {str(e)}")
+
+
+async def _set_stage(job_id: str, stage: str, data: Optional[Dict[str, Any]] = None):
+    """Record a stage transition (memory + MongoDB) and notify SSE subscribers"""
+    now = datetime.now(timezone.utc)
+    job = _jobs[job_id]
+    job["stage"] = stage
+    job["updated_at"] = now
+    job["stages"].append({"stage": stage, "at": now})
+    job.update(data or {})
+
+    # The result only references the PDF (pdf_url / pdf_sha256): stored as-is
+    await _save(job_id, {"stage": stage, "updated_at": now, "stages": job["stages"], **(data or {})})
+
+    for listener in _listeners.get(job_id, []):
+        listener.put_nowait(_public(job))
+
+    if stage in FINAL_STAGES:
+        _work.pop(job_id, None)
+        _jobs.move_to_end(job_id)
+        while len(_jobs) > JOB_MEMORY_MAX:
+            oldest_id, oldest = next(iter(_jobs.items()))
+            if oldest["stage"] not in FINAL_STAGES:
+                break
+            _jobs.pop(oldest_id)
+
+
+async def submit_job(request: MiniAnalysisRequest, response: Response, http_request: Request) -> dict:
+    """
+    Validate + create the lead now (request-bound), run the rest in the background.
+    Returns the 202 body.
+    """
+    context = await mini_analysis_routes.prepare_mini_analysis(request, response, http_request)
+
+    job_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    job = {
+        "job_id": job_id,
+        "request_id": context["request_id"],
+        "brand_name": request.nom_de_marque,
+        "language": context["language"],
+        "stage": "queued",
+        "stages": [{"stage": "queued", "at": now}],
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now
+    }
+    _jobs[job_id] = job
+    _work[job_id] = (request, context)
+
+    await _save(job_id, {**job, "request_data": request.dict(), "context": context})
+
+    _ensure_workers()
+    _queue.put_nowait(job_id)
+    logging.info(f"[{context['request_id']}] JOB_QUEUED {job_id} brand={request.nom_de_marque}")
+
+    return {
+        "success": True,
+        "job_id": job_id,
+        "request_id": context["request_id"],
+        "stage": "queued",
+        "status_url": f"/api/mini-analysis/jobs/{job_id}",
+        "events_url": f"/api/mini-analysis/jobs/{job_id}/events"
+    }
+
+
+async def _run_job(job_id: str):
+    request, context = _work[job_id]
+    request_id = context["request_id"]
+
+    async def on_stage(stage: str, data: Dict[str, Any]):
+        await _set_stage(job_id, stage, data)
+
+    try:
+        # No client is attached any more: disconnect detection is off (clients=None)
+        result = await mini_analysis_routes.execute_mini_analysis(
+            request, context, Response(), None, on_stage=on_stage
+        )
+        await _set_stage(job_id, "done", {"result": result})
+        logging.info(f"[{request_id}] ✅ JOB_DONE {job_id}")
+
+    except HTTPException as e:
+        # 429: the analysis was queued in pending_analyses (detail carries queue_id)
+        await _set_stage(job_id, "failed", {"error": {"status_code": e.status_code, "detail": e.detail}})
+        logging.error(f"[{request_id}] ❌ JOB_FAILED {job_id}: {e.status_code}")
+    except Exception as e:
+        await _set_stage(job_id, "failed", {"error": {"status_code": 500, "detail": str(e)}})
+        logging.error(f"[{request_id}] ❌ JOB_FAILED {job_id}: {str(e)}")
+
+
+async def _worker_loop(worker_index: int):
+    while True:
+        job_id = await _queue.get()
+        try:
+            if job_id in _work:
+                await _run_job(job_id)
+        except Exception as e:
+            logging.error(f"JOB_WORKER_{worker_index} error on {job_id}: {str(e)}")
+        finally:
+            _queue.task_done()
+
+
+async def resume_jobs():
+    """
+    Re-queue jobs interrupted by a restart. Jobs that had not saved their analysis yet
+    (queued/generating) are re-run; later stages are marked failed (analysis already saved).
+    """
+    current_db = database.get_db()
+    if current_db is None:
+        return
+
+    try:
+        unfinished = await current_db.mini_analysis_jobs.find(
+            {"stage": {"$in": ["queued", "generating", "rendering", "emailing"]}}
+        ).to_list(1000)
+    except Exception as e:
+        logging.warning(f"Job resume skipped: {str(e)}")
+        return
+
+    resumed = 0
+    for doc in unfinished:
+        job_id = doc["job_id"]
+        job = _public(doc)
+        _jobs[job_id] = job
+
+        if doc["stage"] not in ("queued", "generating") or not doc.get("request_data"):
+            await _set_stage(job_id, "failed", {"error": {"status_code": 500, "detail": "Interrupted by server restart"}})
+            continue
+
+        _work[job_id] = (MiniAnalysisRequest(**doc["request_data"]), doc["context"])
+        _ensure_workers()
+        _queue.put_nowait(job_id)
+        resumed += 1
+
+    if unfinished:
+        logging.info(f"✅ Mini-analysis jobs resumed: {resumed}/{len(unfinished)}")
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _jobs.get(job_id)
+    if job is not None:
+        return _public(job)
+
+    current_db = database.get_db()
+    if current_db is None:
+        return None
+    return await current_db.mini_analysis_jobs.find_one(
+        {"job_id": job_id},
+        {"_id": 0, "request_data": 0, "context": 0}
+    )
+
+
+@router.get("/{job_id}")
+async def get_mini_analysis_job(job_id: str):
+    """Job status: stage, stage history, result (when done) or error (when failed)"""
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job
+
+
+@router.get("/{job_id}/events")
+async def stream_mini_analysis_job(job_id: str):
+    """
+    SSE progress stream
+    Events: progress {job_id, stage, ...} on every transition, then done {job} or failed {job}
+    """
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+
+    async def event_stream():
+        queue: asyncio.Queue = asyncio.Queue()
+        _listeners.setdefault(job_id, []).append(queue)
+        try:
+            # Snapshot first (the job may already be finished)
+            snapshot = await get_job(job_id) or job
+            yield format_sse("progress", {"job_id": job_id, "stage": snapshot["stage"]})
+            if snapshot["stage"] in FINAL_STAGES:
+                yield format_sse(snapshot["stage"], snapshot)
+                return
+
+            while True:
+                try:
+                    update = await asyncio.wait_for(queue.get(), timeout=JOB_SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                yield format_sse("progress", {"job_id": job_id, "stage": update["stage"]})
+                if update["stage"] in FINAL_STAGES:
+                    yield format_sse(update["stage"], update)
+                    return
+        finally:
+            listeners = _listeners.get(job_id, [])
+            if queue in listeners:
+                listeners.remove(queue)
+            if not listeners:
+                _listeners.pop(job_id, None)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def jobs_status() -> Dict[str, Any]:
+    by_stage: Dict[str, int] = {}
+    for job in _jobs.values():
+        by_stage[job["stage"]] = by_stage.get(job["stage"], 0) + 1
+    return {
+        "workers": JOB_WORKERS,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "jobs_in_memory": by_stage
+    }
@@ -3,84 +3,47 @@ Mini-Analysis Routes for Israel Growth Venture
 Handles brand analysis requests with Gemini AI + IGV internal data
 """
 
-from fastapi import APIRouter, HTTPException, Response, Request
+from fastapi import APIRouter, HTTPException, Response, Request, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import json
+import base64
+import uuid
 import logging
 import re
 from datetime import datetime, timezone
-from pathlib import Path
 import google.genai as genai
+import time
 import traceback
-
-# PDF generation
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import cm
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    from io import BytesIO
-    import base64
-    from PyPDF2 import PdfReader, PdfWriter
-    
-    # BiDi support for Hebrew/Arabic RTL text
-    try:
-        from bidi.algorithm import get_display
-        import arabic_reshaper
-        BIDI_AVAILABLE = True
-        logging.info("✅ BiDi support available for RTL languages")
-    except ImportError:
-        BIDI_AVAILABLE = False
-        logging.warning("⚠️ BiDi libraries not available - Hebrew/Arabic RTL may not render correctly")
-    
-    PDF_AVAILABLE = True
-    
-    # Register Hebrew font - Use DejaVuSans (pre-installed on most Linux systems)
-    # DejaVuSans has excellent Hebrew support
-    try:
-        # Try system font paths (Render uses Debian-based container)
-        font_paths = [
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-            '/usr/share/fonts/TTF/DejaVuSans.ttf',
-            '/System/Library/Fonts/Supplemental/DejaVuSans.ttf',  # macOS
-            'C:\\Windows\\Fonts\\DejaVuSans.ttf'  # Windows (dev)
-        ]
-        
-        hebrew_font_registered = False
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('HebrewFont', font_path))
-                logging.info(f"✅ Hebrew font registered: {font_path}")
-                hebrew_font_registered = True
-                break
-        
-        if not hebrew_font_registered:
-            logging.error("❌ DejaVuSans font not found - Hebrew PDFs will show squares")
-    
-    except Exception as e:
-        logging.error(f"❌ Could not setup Hebrew font: {e}")
-        logging.error(traceback.format_exc())
-        
-except ImportError as e:
-    logging.warning(f"reportlab/PyPDF2 not available - PDF generation will fail: {e}")
-    PDF_AVAILABLE = False
-
-# Email
-try:
-    import aiosmtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    from email.mime.base import MIMEBase
-    from email import encoders
-    EMAIL_AVAILABLE = True
-except ImportError:
-    logging.warning("Email libraries not available")
-    EMAIL_AVAILABLE = False
+from types import SimpleNamespace
+
+import llm_executor
+import llm_gateway
+import language_detector
+import prompt_registry
+import telemetry
+import context_cache
+import result_cache
+import similarity_index
+import whitelist_validator
+import idempotency
+import email_outbox
+import pdf_engine
+import smtp_client
+import pdf_store
+import render_cache
+import database
+from database import get_db
+from llm_executor import LLMTimeoutError, ClientDisconnectedError
+from quota_governor import QuotaBudgetExhausted
+from prompt_registry import TYPES_FILE, WHITELIST_JEWISH, WHITELIST_ARAB, PROMPTS_DIR
+
+# Email (delivered by the outbox over smtp_client, which holds the optional aiosmtplib import)
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+EMAIL_AVAILABLE = smtp_client.aiosmtplib is not None
 
 router = APIRouter(prefix="/api")
 
@@ -89,9 +52,20 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 # PRODUCTION MODEL: gemini-2.5-flash (verified working with google-genai 0.2.2)
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
 
+# Multi-language submissions (languages=[...]): languages generated at the same time
+MINI_ANALYSIS_LANGUAGE_FANOUT = int(os.getenv('MINI_ANALYSIS_LANGUAGE_FANOUT', '3'))
+
+SUPPORTED_LANGUAGES = ("fr", "en", "he")
+
+# Offline fake provider (local testing - no API calls, see llm_fake_provider.py)
+LLM_FAKE_PROVIDER = os.getenv('LLM_FAKE_PROVIDER', 'false').lower() == 'true'
+
 gemini_client = None
 
-if GEMINI_API_KEY:
+if LLM_FAKE_PROVIDER:
+    from llm_fake_provider import FakeGeminiClient
+    gemini_client = FakeGeminiClient()
+elif GEMINI_API_KEY:
     try:
         gemini_client = genai.Client(api_key=GEMINI_API_KEY)
         key_length = len(GEMINI_API_KEY)
@@ -125,9 +99,12 @@ async def diagnose_gemini():
     
     # Quick test API call
     try:
-        response = gemini_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=['Hello']
+        response = await llm_executor.generate_content(
+            gemini_client,
+            GEMINI_MODEL,
+            ['Hello'],
+            timeout=10,
+            request_id="diag-gemini"
         )
         result_text = response.text if hasattr(response, 'text') else str(response)
         
@@ -158,15 +135,11 @@ async def diagnose_smtp():
         "ready_to_send": EMAIL_AVAILABLE and SMTP_USERNAME and SMTP_PASSWORD
     }
 
-# MongoDB connection (from server.py)
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
-
-# SMTP Config - OVH (contact@israelgrowthventure.com)
-SMTP_SERVER = os.getenv('SMTP_SERVER') or os.getenv('SMTP_HOST', 'ssl0.ovh.net')
-SMTP_PORT = int(os.getenv('SMTP_PORT', '465'))
-SMTP_USERNAME = os.getenv('SMTP_USERNAME') or os.getenv('SMTP_USER', 'contact@israelgrowthventure.com')
-SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
+# SMTP Config - OVH (contact@israelgrowthventure.com), account settings from smtp_client
+SMTP_SERVER = smtp_client.SMTP_HOST
+SMTP_PORT = smtp_client.SMTP_PORT
+SMTP_USERNAME = smtp_client.SMTP_USER
+SMTP_PASSWORD = smtp_client.smtp_password()
 SMTP_FROM_EMAIL = os.getenv('SMTP_FROM_EMAIL') or os.getenv('SMTP_FROM', 'contact@israelgrowthventure.com')
 SMTP_FROM_NAME = os.getenv('SMTP_FROM_NAME', 'Israel Growth Venture')
 
@@ -175,30 +148,7 @@ COMPANY_NAME = "Israel Growth Venture"
 COMPANY_EMAIL = "contact@israelgrowthventure.com"  # Email CRM officiel (boîte de contrôle: israel.growth.venture@gmail.com)
 COMPANY_WEBSITE = "israelgrowthventure.com"
 
-# MongoDB client et db seront initialisés à la demande
-mongo_client = None
-db = None
-
-def get_db():
-    """Lazy initialization of MongoDB connection"""
-    global mongo_client, db
-    if db is None and mongo_url:
-        mongo_client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        db = mongo_client[db_name]
-    return db
-
-# IGV internal data paths
-IGV_INTERNAL_DIR = Path(__file__).parent / 'igv_internal'
-TYPES_FILE = IGV_INTERNAL_DIR / 'IGV_Types_Emplacements_Activites.txt'
-WHITELIST_JEWISH = IGV_INTERNAL_DIR / 'Whitelist_1_Jewish_incl_Mixed.txt'
-WHITELIST_ARAB = IGV_INTERNAL_DIR / 'Whitelist_2_Arabe_incl_Mixed.txt'
-
-# Master Prompts directory
-PROMPTS_DIR = Path(__file__).parent / 'prompts'
+# IGV internal data paths + master prompts directory live in prompt_registry
 PROMPT_RESTAURATION = PROMPTS_DIR / 'MASTER_PROMPT_RESTAURATION.txt'
 PROMPT_RETAIL = PROMPTS_DIR / 'MASTER_PROMPT_RETAIL_NON_FOOD.txt'
 PROMPT_SERVICES = PROMPTS_DIR / 'MASTER_PROMPT_SERVICES_PARAMEDICAL.txt'
@@ -272,222 +222,13 @@ async def create_lead_in_crm(lead_data: dict, request_id: str) -> dict:
         return {"status": "error", "error": str(e)}
 
 
-
-def prepare_hebrew_text(text: str) -> str:
-    """
-    Prepare Hebrew text for PDF rendering with BiDi
-    
-    CRITICAL: ReportLab alignment=TA_RIGHT only aligns text, does NOT reverse letters!
-    Hebrew letters in logical order appear BACKWARDS without BiDi processing.
-    
-    SOLUTION from commit 458cc92 (WORKING):
-      1. arabic_reshaper.reshape() - contextual letter forms
-      2. get_display() - reverses letters to visual RTL order
-      3. alignment=TA_RIGHT - aligns text to right
-      4. NO wordWrap='RTL' - we don't use this parameter
-    
-    This gives correct Hebrew: letters right-to-left, words right-to-left, aligned right.
-    """
-    if not BIDI_AVAILABLE:
-        return text
-    
-    try:
-        # Reshape characters then convert to visual RTL display order
-        reshaped_text = arabic_reshaper.reshape(text)
-        bidi_text = get_display(reshaped_text)
-        return bidi_text
-    except Exception as e:
-        logging.warning(f"Hebrew BiDi conversion failed: {e}")
-        return text
-
-
-def generate_mini_analysis_pdf(brand_name: str, analysis_text: str, language: str = "fr") -> bytes:
-    """Generate mini-analysis PDF with IGV header from entete igv.pdf"""
-    if not PDF_AVAILABLE:
-        raise Exception("PDF generation not available - reportlab not installed")
-    
-    # Generate content PDF first
-    content_buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        content_buffer, 
-        pagesize=A4, 
-        topMargin=0.5*cm,
-        bottomMargin=2*cm, 
-        leftMargin=2*cm, 
-        rightMargin=2*cm
-    )
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Configure Hebrew RTL styles if language is Hebrew
-    if language == "he":
-        # Check if Hebrew font is available
-        hebrew_font_available = 'HebrewFont' in pdfmetrics.getRegisteredFontNames()
-        
-        if hebrew_font_available:
-            # Create Hebrew-specific styles with RTL support
-            hebrew_title_style = ParagraphStyle(
-                'HebrewTitle',
-                parent=styles['Heading2'],
-                fontName='HebrewFont',
-                fontSize=16,
-                leading=22,
-                alignment=TA_RIGHT
-            )
-            
-            hebrew_normal_style = ParagraphStyle(
-                'HebrewNormal',
-                parent=styles['Normal'],
-                fontName='HebrewFont',
-                fontSize=11,
-                leading=16,
-                alignment=TA_RIGHT
-            )
-            
-            hebrew_footer_style = ParagraphStyle(
-                'HebrewFooter',
-                parent=styles['Normal'],
-                fontName='HebrewFont',
-                fontSize=9,
-                leading=12,
-                textColor=colors.HexColor('#4b5563'),
-                alignment=TA_CENTER
-            )
-            
-            title_style = hebrew_title_style
-            normal_style = hebrew_normal_style
-            footer_style = hebrew_footer_style
-        else:
-            logging.warning("Hebrew font not available - PDF will show squares")
-            title_style = styles['Heading2']
-            normal_style = styles['Normal']
-            footer_style = styles['Normal']
-    else:
-        # Use default styles for FR/EN
-        title_style = styles['Heading2']
-        normal_style = styles['Normal']
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor=colors.HexColor('#4b5563'),
-            alignment=TA_CENTER
-        )
-    
-    # Leave space for header (will be merged)
-    story.append(Spacer(1, 5*cm))
-    
-    # Title
-    title_text = {
-        "fr": f"Mini-Analyse de Marché - {brand_name}",
-        "en": f"Market Mini-Analysis - {brand_name}",
-        "he": f"מיני-אנליזה שוק - {brand_name}"
-    }.get(language, f"Mini-Analyse de Marché - {brand_name}")
-    
-    # Apply BiDi for Hebrew - converts logical order to visual order for RTL display
-    if language == "he" and BIDI_AVAILABLE:
-        title_text = prepare_hebrew_text(title_text)
-    
-    story.append(Paragraph(title_text, title_style))
-    story.append(Spacer(1, 0.5*cm))
-    
-    # Date
-    date_label = {
-        "fr": "Généré le:",
-        "en": "Generated on:",
-        "he": "נוצר בתאריך:"
-    }.get(language, "Généré le:")
-    
-    # Apply BiDi for Hebrew
-    date_text = f"<i>{date_label} {datetime.now(timezone.utc).strftime('%d/%m/%Y')}</i>"
-    if language == "he" and BIDI_AVAILABLE:
-        date_text = f"<i>{prepare_hebrew_text(date_label)} {datetime.now(timezone.utc).strftime('%d/%m/%Y')}</i>"
-    
-    story.append(Paragraph(date_text, normal_style))
-    story.append(Spacer(1, 1*cm))
-    
-    # Analysis content
-    paragraphs = analysis_text.split('\n\n')
-    for para in paragraphs:
-        if para.strip():
-            # Apply BiDi for Hebrew paragraphs - converts logical to visual order
-            display_para = prepare_hebrew_text(para) if language == "he" and BIDI_AVAILABLE else para
-            
-            if para.strip().startswith('-') or para.strip().startswith('•'):
-                lines = display_para.split('\n')
-                for line in lines:
-                    if line.strip():
-                        story.append(Paragraph(line.strip(), normal_style))
-                story.append(Spacer(1, 0.3*cm))
-            else:
-                story.append(Paragraph(display_para.strip(), normal_style))
-                story.append(Spacer(1, 0.5*cm))
-    
-    # Footer
-    story.append(Spacer(1, 1*cm))
-    footer_text = {
-        "fr": "Ce document est une analyse préliminaire générée par IA. Pour un accompagnement complet, contactez-nous.",
-        "en": "This document is a preliminary AI-generated analysis. For complete support, contact us.",
-        "he": "מסמך זה הוא ניתוח ראשוני שנוצר על ידי AI. לליווי מלא, צור איתנו קשר."
-    }.get(language, "Ce document est une analyse préliminaire générée par IA.")
-    
-    # Apply BiDi for Hebrew footer
-    display_footer = prepare_hebrew_text(footer_text) if language == "he" and BIDI_AVAILABLE else footer_text
-    
-    story.append(Paragraph(f"<i>{display_footer}</i>", footer_style))
-    
-    # Build content PDF
-    doc.build(story)
-    content_bytes = content_buffer.getvalue()
-    content_buffer.close()
-    
-    # Merge with IGV header
-    header_path = os.path.join(os.path.dirname(__file__), 'assets', 'entete igv.pdf')
-    
-    if os.path.exists(header_path):
-        try:
-            header_reader = PdfReader(header_path)
-            content_reader = PdfReader(BytesIO(content_bytes))
-            writer = PdfWriter()
-            
-            if len(header_reader.pages) > 0 and len(content_reader.pages) > 0:
-                # Merge header on first page
-                first_page = content_reader.pages[0]
-                header_page = header_reader.pages[0]
-                first_page.merge_page(header_page)
-                writer.add_page(first_page)
-                
-                # Add remaining pages
-                for i in range(1, len(content_reader.pages)):
-                    writer.add_page(content_reader.pages[i])
-                
-                # Write merged PDF
-                final_buffer = BytesIO()
-                writer.write(final_buffer)
-                final_bytes = final_buffer.getvalue()
-                final_buffer.close()
-                
-                logging.info(f"✅ PDF with IGV header ({len(final_bytes)} bytes)")
-                return final_bytes
-            else:
-                logging.warning("Header/content empty, returning content only")
-                return content_bytes
-        except Exception as e:
-            logging.error(f"PDF merge failed: {e}, returning content only")
-            return content_bytes
-    else:
-        logging.warning(f"IGV header not found at {header_path}")
-        return content_bytes
-
-
-async def send_mini_analysis_email(email: str, brand_name: str, pdf_bytes: bytes, language: str = "fr") -> dict:
-    """Send mini-analysis email with PDF attachment"""
+async def send_mini_analysis_email(current_db, email: str, brand_name: str, pdf_bytes: bytes, language: str = "fr",
+                                   event: dict | None = None, context: dict | None = None) -> dict:
+    """Queue the mini-analysis email with its PDF attachment (sent by the email outbox)"""
     if not EMAIL_AVAILABLE or not SMTP_USERNAME or not SMTP_PASSWORD:
         logging.warning(f"Email not configured - EMAIL_AVAILABLE:{EMAIL_AVAILABLE}, SMTP_USERNAME:{bool(SMTP_USERNAME)}, SMTP_PASSWORD:{bool(SMTP_PASSWORD)}")
         return {"success": False, "error": "Email not configured"}
     
-    logging.info(f"Attempting email send: server={SMTP_SERVER}, port={SMTP_PORT}, from={SMTP_FROM_EMAIL}")
-    
     try:
         # Create message
         message = MIMEMultipart()
@@ -572,38 +313,22 @@ https://israelgrowthventure.com/packs
         
         message.attach(MIMEText(body_template, 'plain', 'utf-8'))
         
-        # Attach PDF
-        pdf_attachment = MIMEBase('application', 'pdf')
-        pdf_attachment.set_payload(pdf_bytes)
-        encoders.encode_base64(pdf_attachment)
         filename = f"IGV_Mini_Analysis_{brand_name.replace(' ', '_')}.pdf"
-        pdf_attachment.add_header(
-            'Content-Disposition',
-            f'attachment; filename={filename}'
-        )
-        message.attach(pdf_attachment)
-        
-        # Send email - Adapt to SMTP server type
-        # Port 465 = SSL direct (use_tls=True, no STARTTLS)
-        # Port 587 = STARTTLS (use_tls=False, then STARTTLS)
-        if SMTP_PORT == 465:
-            # SSL direct connection for port 465
-            async with aiosmtplib.SMTP(hostname=SMTP_SERVER, port=SMTP_PORT, use_tls=True) as smtp:
-                await smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
-                await smtp.send_message(message)
-        else:
-            # STARTTLS for port 587
-            async with aiosmtplib.SMTP(hostname=SMTP_SERVER, port=SMTP_PORT) as smtp:
-                await smtp.starttls()
-                await smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
-                await smtp.send_message(message)
         
-        logging.info(f"Mini-analysis email sent to {email}")
+        outbox_id = await email_outbox.enqueue(
+            current_db,
+            message,
+            "mini_analysis",
+            smtp_client.account(),
+            attachments=[(filename, pdf_bytes)],
+            event={"bcc": [COMPANY_EMAIL], "language": language, **(event or {})},
+            context=context
+        )
         
-        return {"success": True, "sent_at": datetime.now(timezone.utc).isoformat()}
+        return {"success": True, "queued": True, "outbox_id": outbox_id}
         
     except Exception as e:
-        logging.error(f"Failed to send mini-analysis email: {str(e)}")
+        logging.error(f"Failed to queue mini-analysis email: {str(e)}")
         return {"success": False, "error": str(e)}
 
 
@@ -631,6 +356,7 @@ class MiniAnalysisRequest(BaseModel):
     objectif_israel: str = ""
     contraintes: str = ""
     language: str = "fr"  # LANGUAGE SUPPORT: fr/en/he
+    languages: list[str] | None = None  # Multi-language: one linked analysis per language (e.g. ["fr", "he"])
     
     def model_post_init(self, __context):
         """Handle aliases - populate nom_de_marque from company_name or brand_name"""
@@ -666,182 +392,11 @@ def normalize_brand_slug(brand_name: str) -> str:
     return slug.strip()
 
 
-def load_igv_file(file_path: Path) -> str:
-    """Load IGV internal file with error handling"""
-    if not file_path.exists():
-        logging.error(f"MISSING_IGV_FILE:{file_path}")
-        raise HTTPException(status_code=500, detail=f"Fichier IGV manquant: {file_path.name}")
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        logging.error(f"Error reading {file_path}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erreur lecture fichier: {file_path.name}")
-
-
 def build_prompt(request: MiniAnalysisRequest, language: str = "fr") -> str:
-    """Build runtime prompt with master prompt + form data"""
-    
-    # Select master prompt based on sector AND language
-    lang_suffix = f"_{language.upper()}" if language != "fr" else ""
-    
-    if request.secteur == "Restauration / Food":
-        prompt_file = PROMPTS_DIR / f'MASTER_PROMPT_RESTAURATION{lang_suffix}.txt'
-        prompt_name = f"MASTER_PROMPT_RESTAURATION{lang_suffix}"
-    elif request.secteur == "Retail (hors food)":
-        prompt_file = PROMPTS_DIR / f'MASTER_PROMPT_RETAIL_NON_FOOD{lang_suffix}.txt'
-        prompt_name = f"MASTER_PROMPT_RETAIL_NON_FOOD{lang_suffix}"
-    else:  # Services or Paramédical / Santé
-        prompt_file = PROMPTS_DIR / f'MASTER_PROMPT_SERVICES_PARAMEDICAL{lang_suffix}.txt'
-        prompt_name = f"MASTER_PROMPT_SERVICES_PARAMEDICAL{lang_suffix}"
-    
-    logging.info(f"Using prompt: {prompt_name} for sector: {request.secteur}, language: {language}")
-    
-    # Load master prompt
-    master_prompt = load_igv_file(prompt_file)
-    
-    # Load whitelists (still needed for prompt context)
-    types_data = load_igv_file(TYPES_FILE)
-    
-    # Select whitelist based on statut_alimentaire
-    if request.statut_alimentaire.lower() == 'halal':
-        whitelist_data = load_igv_file(WHITELIST_ARAB)
-        whitelist_internal_code = "Whitelist_2_Arabe_incl_Mixed"
-    else:
-        whitelist_data = load_igv_file(WHITELIST_JEWISH)
-        whitelist_internal_code = "Whitelist_1_Jewish_incl_Mixed"
-    
-    # Map internal codes to human-readable labels (MULTI-LANGUAGE)
-    whitelist_labels = {
-        "fr": {
-            "Whitelist_1_Jewish_incl_Mixed": "Villes Juives & Mixtes",
-            "Whitelist_2_Arabe_incl_Mixed": "Villes Arabes & Mixtes"
-        },
-        "en": {
-            "Whitelist_1_Jewish_incl_Mixed": "Jewish & Mixed Cities",
-            "Whitelist_2_Arabe_incl_Mixed": "Arab & Mixed Cities"
-        },
-        "he": {
-            "Whitelist_1_Jewish_incl_Mixed": "ערים יהודיות ומעורבות",
-            "Whitelist_2_Arabe_incl_Mixed": "ערים ערביות ומעורבות"
-        }
-    }
-    
-    # Get human-readable label for current language
-    whitelist_name = whitelist_labels.get(language, {}).get(whitelist_internal_code, whitelist_internal_code)
-    
-    # Build form data section (TRANSLATED based on language)
-    if language == "en":
-        form_data_section = f"""
-
----
-
-**CLIENT FORM DATA:**
-
-- **Brand Name:** {request.nom_de_marque}
-- **Email:** {request.email}
-- **Sector:** {request.secteur}
-- **Food Status:** {request.statut_alimentaire or "Not specified"}
-- **Company Age:** {request.anciennete or "Not specified"}
-- **Country of Origin:** {request.pays_dorigine or "Not specified"}
-- **Concept:** {request.concept or "Not specified"}
-- **Positioning:** {request.positionnement or "Not specified"}
-- **Current Business Model:** {request.modele_actuel or "Not specified"}
-- **Differentiation:** {request.differenciation or "Not specified"}
-- **Israel Objective:** {request.objectif_israel or "Not specified"}
-- **Constraints:** {request.contraintes or "Not specified"}
-
----
-
-**REFERENCE DOCUMENT 1: Location Types and Activities**
-
-{types_data}
-
----
-
-**REFERENCE DOCUMENT 2: {whitelist_name} (AUTHORIZED LOCATIONS)**
-
-{whitelist_data}
-
----
-"""
-    elif language == "he":
-        form_data_section = f"""
-
----
-
-**נתוני טופס הלקוח:**
-
-- **שם המותג:** {request.nom_de_marque}
-- **אימייל:** {request.email}
-- **תחום:** {request.secteur}
-- **סטטוס מזון:** {request.statut_alimentaire or "לא צוין"}
-- **ותק החברה:** {request.anciennete or "לא צוין"}
-- **מדינת מוצא:** {request.pays_dorigine or "לא צוין"}
-- **קונספט:** {request.concept or "לא צוין"}
-- **מיצוב:** {request.positionnement or "לא צוין"}
-- **מודל עסקי נוכחי:** {request.modele_actuel or "לא צוין"}
-- **בידול:** {request.differenciation or "לא צוין"}
-- **יעד בישראל:** {request.objectif_israel or "לא צוין"}
-- **אילוצים:** {request.contraintes or "לא צוין"}
-
----
-
-**מסמך עזר 1: סוגי מיקומים ופעילויות**
-
-{types_data}
-
----
-
-**מסמך עזר 2: {whitelist_name} (מיקומים מורשים)**
-
-{whitelist_data}
-
----
-"""
-    else:  # French (default)
-        form_data_section = f"""
-
----
-
-**DONNÉES DU FORMULAIRE CLIENT:**
-
-- **Nom de marque:** {request.nom_de_marque}
-- **Email:** {request.email}
-- **Secteur:** {request.secteur}
-- **Statut alimentaire:** {request.statut_alimentaire or "Non spécifié"}
-- **Ancienneté:** {request.anciennete or "Non spécifié"}
-- **Pays d'origine:** {request.pays_dorigine or "Non spécifié"}
-- **Concept:** {request.concept or "Non spécifié"}
-- **Positionnement:** {request.positionnement or "Non spécifié"}
-- **Modèle actuel:** {request.modele_actuel or "Non spécifié"}
-- **Différenciation:** {request.differenciation or "Non spécifié"}
-- **Objectif Israël:** {request.objectif_israel or "Non spécifié"}
-- **Contraintes:** {request.contraintes or "Non spécifié"}
-
----
-
-**DOCUMENT DE RÉFÉRENCE 1: Types d'Emplacements et Activités**
-
-{types_data}
-
----
-
-**DOCUMENT DE RÉFÉRENCE 2: {whitelist_name} (EMPLACEMENTS AUTORISÉS)**
-
-{whitelist_data}
-
----
-"""
-    
-    # NO NEED for translation instructions - the master_prompt is ALREADY in the target language
-    # Gemini will naturally respond in the same language as the prompt
-    
-    # Combine: master prompt (already in target language) + form data (already in target language)
-    final_prompt = master_prompt + form_data_section
-    
-    return final_prompt
+    """Build runtime prompt with master prompt + form data (static parts come from the prompt registry)"""
+    prompt, template = prompt_registry.render_prompt(request, language)
+    logging.info(f"Using prompt: {template['prompt_name']} (v{template['version']}) for sector: {request.secteur}, language: {language}")
+    return prompt
 
 
 @router.get("/mini-analysis/debug")
@@ -872,9 +427,14 @@ async def debug_mini_analysis():
         "gemini_api_key_length": len(GEMINI_API_KEY) if GEMINI_API_KEY else 0,
         "gemini_model": GEMINI_MODEL,
         "gemini_client_initialized": gemini_client is not None,
-        "mongodb_configured": bool(mongo_url),
-        "mongodb_db_name": db_name if mongo_url else None,
-        "igv_files": igv_files_status
+        "mongodb_configured": bool(database.MONGO_URL),
+        "mongodb_db_name": database.DB_NAME if database.MONGO_URL else None,
+        "igv_files": igv_files_status,
+        "prompt_registry": prompt_registry.registry_status(),
+        "context_cache": context_cache.cache_status(),
+        "result_cache": result_cache.cache_status(),
+        "idempotency": idempotency.idempotency_status(),
+        "language_check": language_detector.detector_status()
     }
 
 
@@ -919,9 +479,11 @@ Answer ONLY in English.""",
         # Call Gemini
         logging.info(f"[{request_id}] GEMINI_TEST: model={GEMINI_MODEL}, lang={language}")
         
-        response = gemini_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=[prompt]
+        response = await llm_executor.generate_content(
+            gemini_client,
+            GEMINI_MODEL,
+            [prompt],
+            request_id=request_id
         )
         
         response_text = response.text if hasattr(response, 'text') else str(response)
@@ -972,15 +534,12 @@ Answer ONLY in English.""",
 # Second debug endpoint removed - duplicate
 
 
-@router.post("/mini-analysis")
-async def generate_mini_analysis(request: MiniAnalysisRequest, response: Response, http_request: Request):
-    """
-    Generate AI-powered mini-analysis for Israel market entry
-    Includes anti-duplicate check + MongoDB persistence + AUTOMATIC LEAD CREATION (MISSION C)
-    Adds debug headers: X-IGV-Lang-Requested, X-IGV-Lang-Used, X-IGV-Cache-Hit
-    """
-    
-    # Validate required fields
+# ============================================================================
+# MINI-ANALYSIS PIPELINE (shared by /mini-analysis and /mini-analysis/stream)
+# ============================================================================
+
+def validate_mini_analysis_request(request: MiniAnalysisRequest) -> str:
+    """Validate required fields and return the effective language (fr/en/he)"""
     if not request.email or not request.nom_de_marque or not request.secteur:
         raise HTTPException(status_code=400, detail="Email, nom_de_marque et secteur sont obligatoires")
     
@@ -994,15 +553,14 @@ async def generate_mini_analysis(request: MiniAnalysisRequest, response: Respons
         logging.warning(f"Invalid language '{language}', falling back to 'en'")
         language = "en"
     
-    # DEBUG HEADERS (LIVE VERIFICATION)
-    response.headers["X-IGV-Lang-Requested"] = language
-    response.headers["X-IGV-Lang-Used"] = language
-    
-    request_id = f"req_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
-    logging.info(f"[{request_id}] LANG_REQUESTED={language} LANG_USED={language}")
-    
-    # MISSION C: CREATE LEAD AUTOMATICALLY (BEFORE checking quota/duplicate)
-    lead_data = None
+    return language
+
+
+async def register_mini_analysis_lead(request: MiniAnalysisRequest, language: str, http_request: Request, request_id: str) -> dict | None:
+    """
+    MISSION C: CREATE LEAD AUTOMATICALLY (BEFORE checking quota/duplicate)
+    Returns lead_data (reused for later status updates) or None on failure
+    """
     try:
         # Extract client metadata
         client_ip = http_request.client.host if http_request.client else None
@@ -1030,94 +588,499 @@ async def generate_mini_analysis(request: MiniAnalysisRequest, response: Respons
         
         lead_result = await create_lead_in_crm(lead_data, request_id)
         logging.info(f"[{request_id}] Lead creation result: {lead_result}")
+        return lead_data
     except Exception as lead_error:
         # Don't fail the request if lead creation fails
         logging.error(f"[{request_id}] Lead creation error (non-blocking): {str(lead_error)}")
+        return None
+
+
+async def ensure_gemini_ready(lead_data: dict | None, request_id: str):
+    """Raise 500 (and flag the lead as ERROR) when Gemini is not configured"""
+    if GEMINI_API_KEY and gemini_client:
+        return
     
-    # Check Gemini client
-    if not GEMINI_API_KEY or not gemini_client:
-        logging.error(f"❌ Gemini not configured: API_KEY={bool(GEMINI_API_KEY)}, client={gemini_client is not None}")
-        
-        # Update lead status to ERROR
-        if lead_data:
-            try:
-                lead_data["status"] = "ERROR"
-                await create_lead_in_crm(lead_data, request_id)
-            except:
-                pass
-        
-        raise HTTPException(status_code=500, detail="GEMINI_API_KEY non configurée - contactez l'administrateur")
-    
-    # Check MongoDB connection
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Base de données non configurée")
+    logging.error(f"❌ Gemini not configured: API_KEY={bool(GEMINI_API_KEY)}, client={gemini_client is not None}")
     
-    # Normalize brand name for logging
-    brand_slug = normalize_brand_slug(request.nom_de_marque)
-    cache_key = f"{brand_slug}_{language}"
+    # Update lead status to ERROR
+    if lead_data:
+        try:
+            lead_data["status"] = "ERROR"
+            await create_lead_in_crm(lead_data, request_id)
+        except:
+            pass
     
-    # Removed duplicate check - each request generates a new mini-analysis
-    # This allows multiple analyses per brand for tracking evolution over time
-    logging.info(f"NEW_ANALYSIS brand={request.nom_de_marque} slug={brand_slug} language={language}")
-    response.headers["X-IGV-Cache-Hit"] = "false"
+    raise HTTPException(status_code=500, detail="GEMINI_API_KEY non configurée - contactez l'administrateur")
+
+
+def is_quota_error(error: Exception) -> bool:
+    """MISSION: DETECT QUOTA/RESOURCE_EXHAUSTED ERRORS"""
+    error_str = str(error).lower()
+    return "resource_exhausted" in error_str or "quota" in error_str
+
+
+def is_rate_limit_refusal(error: Exception) -> bool:
+    """Per-minute (RPM / TPM) budget refused by quota_governor: retry in seconds, nothing to queue"""
+    return isinstance(error, QuotaBudgetExhausted) and not error.budget.endswith("per_day")
+
+
+def quota_retry_after(error: Exception) -> int:
+    """Seconds until a daily quota error clears (the governor knows the reset time)"""
+    return error.retry_after_seconds if isinstance(error, QuotaBudgetExhausted) else 86400
+
+
+def rate_limit_detail(error: QuotaBudgetExhausted, request_id: str) -> dict:
+    """429 detail payload of a per-minute budget refusal"""
+    seconds = error.retry_after_seconds
+    return {
+        "error_code": "GEMINI_RATE_LIMITED",
+        "message": {
+            "fr": f"Trop de demandes en cours. Réessayez dans {seconds} secondes.",
+            "en": f"Too many requests right now. Please retry in {seconds} seconds.",
+            "he": f"יותר מדי בקשות כרגע. נסו שוב בעוד {seconds} שניות."
+        },
+        "queued": False,
+        "retry_after_seconds": seconds,
+        "request_id": request_id
+    }
+
+
+def build_lang_retry_prompt(prompt: str, language: str) -> str:
+    """Prefix the prompt with a stricter language instruction (LANG_FAIL retry)"""
+    retry_prompts = {
+        "fr": f"CRITIQUE: Répondez UNIQUEMENT en français, pas en anglais, pas en hébreu.\n\n{prompt}",
+        "en": f"CRITICAL: Answer ONLY in English, not in French, not in Hebrew.\n\n{prompt}",
+        "he": f"קריטי: ענה רק בעברית, לא בצרפתית, לא באנגלית.\n\n{prompt}"
+    }
+    return retry_prompts.get(language, prompt)
+
+
+def build_whitelist_retry_prompt(prompt: str, language: str, violations: list, allowed: set) -> str:
+    """Prefix the prompt with a corrective instruction (out-of-whitelist cities regeneration)"""
+    cited = ", ".join(violations)
+    allowed_list = ", ".join(sorted(allowed))
+    retry_prompts = {
+        "fr": f"CRITIQUE: Ne cite PAS {cited} (hors whitelist). Villes autorisées UNIQUEMENT: {allowed_list}.\n\n{prompt}",
+        "en": f"CRITICAL: Do NOT mention {cited} (not in the whitelist). Allowed cities ONLY: {allowed_list}.\n\n{prompt}",
+        "he": f"קריטי: אל תזכיר את {cited} (מחוץ לרשימה המורשית). ערים מורשות בלבד: {allowed_list}.\n\n{prompt}"
+    }
+    return retry_prompts.get(language, prompt)
+
+
+async def queue_quota_blocked_analysis(current_db, request: MiniAnalysisRequest, language: str, lead_data: dict | None, request_id: str,
+                                       languages: list | None = None, retry_after_seconds: int = 86400) -> dict:
+    """
+    Gemini quota reached: flag the lead, save to pending_analyses and send the
+    confirmation email. Returns the 429 detail payload.
+    languages: multi-language submission - one pending item for all the blocked languages
+    retry_after_seconds: time to the daily quota reset (quota_retry_after)
+    """
+    # Update lead status to QUOTA_BLOCKED
+    lead_id_for_queue = None
+    if lead_data:
+        try:
+            lead_data["status"] = "QUOTA_BLOCKED"
+            lead_result = await create_lead_in_crm(lead_data, request_id)
+            lead_id_for_queue = lead_result.get("lead_id")
+        except:
+            pass
     
-    # Build prompt with IGV data
+    # SAVE TO pending_analyses (UPDATED SCHEMA)
     try:
-        prompt = build_prompt(request, language=language)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Error building prompt: {str(e)}")
-        raise HTTPException(status_code=500, detail="Erreur lors de la construction de la requête IA")
+        pending_record = {
+            "lead_id": lead_id_for_queue or "unknown",
+            "email": request.email,
+            "brand_name": request.nom_de_marque,
+            "sector": request.secteur,
+            "language": language,
+            "languages": languages or [language],
+            "status": "pending",
+            "attempts": 0,
+            "request_data": request.dict(),
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc)
+        }
+        result = await current_db.pending_analyses.insert_one(pending_record)
+        queue_id = str(result.inserted_id)
+        logging.info(f"[{request_id}] QUEUED_OK: queue_id={queue_id}")
+    except Exception as db_error:
+        logging.error(f"[{request_id}] QUEUE_FAIL: {str(db_error)}")
+        queue_id = None
+    
+    # SEND CONFIRMATION EMAIL
+    email_sent = False
+    try:
+        from extended_routes import send_quota_confirmation_email
+        await send_quota_confirmation_email(current_db, request.email, request.nom_de_marque, language, request_id)
+        logging.info(f"[{request_id}] EMAIL_QUEUED_OK")
+        email_sent = True
+    except Exception as email_error:
+        logging.error(f"[{request_id}] EMAIL_QUEUE_FAIL: {str(email_error)}")
+    
+    # Multilingual confirmation messages (EXACT SPEC)
+    quota_messages = {
+        "fr": "Quota de mini-analyses atteint. Revenez demain.",
+        "en": "Daily mini-analysis quota reached. Please come back tomorrow.",
+        "he": "המכסה היומית למיני-אנליזה הסתיימה. נסו שוב מחר."
+    }
     
-    # Call Gemini API (new google-genai package)
-    request_id = f"req_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
+    return {
+        "error_code": "GEMINI_QUOTA_DAILY",
+        "message": quota_messages,
+        "email_sent": email_sent,
+        "queued": True,
+        "queue_id": queue_id,
+        "retry_after_seconds": retry_after_seconds,
+        "request_id": request_id
+    }
+
+
+async def persist_mini_analysis(current_db, request: MiniAnalysisRequest, language: str, brand_slug: str,
+                                analysis_text: str, lead_data: dict | None, request_id: str,
+                                cache_hit: bool = False, llm: dict | None = None) -> dict:
+    """
+    Save the analysis to mini_analyses and mark the lead as GENERATED
+    llm: {"provider", "model"} of the llm_gateway answer kept (default: Gemini)
+    Returns {"inserted_id", "analysis_id", "lead_id"}
+    """
+    analysis_record = {
+        "brand_slug": brand_slug,
+        "brand_name": request.nom_de_marque,
+        "email": request.email,
+        "phone": request.phone,  # Added phone field
+        "language": language,
+        "payload_form": request.dict(),
+        "created_at": datetime.now(timezone.utc),
+        "provider": (llm or {}).get("provider", "gemini"),
+        "model": (llm or {}).get("model", GEMINI_MODEL),
+        "response_text": analysis_text,
+        "cache_hit": cache_hit,
+        "pdf_url": None,
+        "email_sent": False,
+        "email_status": None
+    }
+    
+    if whitelist_validator.WHITELIST_CHECK_ENABLED:
+        whitelist_code = prompt_registry.resolve_whitelist_code(request.statut_alimentaire)
+        analysis_record["whitelist_check"] = {
+            **whitelist_validator.validate(analysis_text, whitelist_code),
+            "checked_at": datetime.now(timezone.utc)
+        }
+        if analysis_record["whitelist_check"]["violations"]:
+            logging.warning(f"[{request_id}] WHITELIST_VIOLATION stored: {analysis_record['whitelist_check']['violations']}")
+    
+    result = await current_db.mini_analyses.insert_one(analysis_record)
+    analysis_id = str(result.inserted_id)
+    logging.info(f"Analysis saved to MongoDB with ID: {analysis_id}")
+    
+    # MISSION C: Update lead status to GENERATED (successful generation)
+    # (lead_data is None when lead creation failed, or for queued analyses that carry a lead_id)
+    lead_id = None
+    if lead_data is not None:
+        try:
+            lead_data["status"] = "GENERATED"
+            lead_result = await create_lead_in_crm(lead_data, request_id)
+            lead_id = lead_result.get("lead_id")
+        except Exception as lead_update_error:
+            logging.error(f"[{request_id}] Lead status update error (non-blocking): {str(lead_update_error)}")
+    
+    # "Similar past analyses" index (CRM) - vectorized off the request path
+    asyncio.ensure_future(similarity_index.add_analysis(current_db, result.inserted_id, {**analysis_record, "lead_id": lead_id}))
+    
+    return {"inserted_id": result.inserted_id, "analysis_id": analysis_id, "lead_id": lead_id}
+
+
+async def attach_mini_analysis_pdf(current_db, request: MiniAnalysisRequest, language: str,
+                                   analysis_text: str, saved: dict, request_id: str) -> dict:
+    """
+    GENERATE PDF AUTOMATICALLY, store it once (pdf_store) and reference it from the analysis + lead
+    Returns {"pdf_bytes", "pdf_url", "pdf_sha256"} (values are None on failure)
+    """
+    pdf_bytes = None
+    pdf_url = None
+    pdf_sha256 = None
     try:
-        logging.info(f"[{request_id}] Calling Gemini API for brand: {request.nom_de_marque} (model: {GEMINI_MODEL})")
+        logging.info(f"[{request_id}] Generating PDF for {request.nom_de_marque}")
+        # PDF worker processes: concurrent analyses (multi-language) render their PDFs in parallel
+        with telemetry.timed("pdf"):
+            pdf_bytes = await render_cache.render("mini_analysis", pdf_engine.build_mini_analysis_pdf, request.nom_de_marque, analysis_text, language)
+        
+        # Binary, content-addressed copy - documents only hold the reference and the download URL
+        pdf_ref = await pdf_store.put(current_db, pdf_bytes, {"analysis_id": saved["analysis_id"], "brand_name": request.nom_de_marque})
+        pdf_sha256 = pdf_ref["sha256"]
+        pdf_url = pdf_store.analysis_pdf_url(saved["analysis_id"])
+        
+        # Update analysis record
+        await current_db.mini_analyses.update_one(
+            {"_id": saved["inserted_id"]},
+            {"$set": {"pdf": pdf_ref, "pdf_url": pdf_url, "pdf_generated_at": datetime.now(timezone.utc)}}
+        )
         
-        if not gemini_client:
-            logging.error(f"[{request_id}] Gemini client not initialized")
-            raise HTTPException(
-                status_code=500,
-                detail={"error": "Gemini client not configured", "request_id": request_id}
+        # Update lead with PDF reference and analysis content
+        if saved["lead_id"]:
+            from bson import ObjectId
+            await current_db.leads.update_one(
+                {"_id": ObjectId(saved["lead_id"])},
+                {"$set": {
+                    "pdf": pdf_ref,
+                    "pdf_url": pdf_url,
+                    "analysis": analysis_text,  # Store full analysis text
+                    "analysis_meta": {
+                        "language": language,
+                        "generated_at": datetime.now(timezone.utc),
+                        "analysis_id": saved["analysis_id"]
+                    }
+                }}
             )
         
-        # CRITICAL: contents MUST be a list for google-genai 0.2.2
-        # Signature: contents: list[Content | list[Part | str] | Part | str]
-        response = gemini_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=[prompt]  # Wrap prompt in a list
-        )
-        
-        # Extract text from response
-        analysis_text = response.text if hasattr(response, 'text') else str(response)
+        # Timeline event
+        await current_db.timeline_events.insert_one({
+            "entity_type": "mini_analysis",
+            "entity_id": saved["analysis_id"],
+            "lead_id": saved["lead_id"],
+            "event_type": "pdf_generated",
+            "description": f"PDF generated for {request.nom_de_marque}",
+            "created_at": datetime.now(timezone.utc)
+        })
         
-        logging.info(f"[{request_id}] ✅ Gemini response received: {len(analysis_text)} characters")
+        logging.info(f"[{request_id}] PDF generated successfully")
         
-        # LANG_FAIL DETECTION (MISSION A.5)
-        if "LANG_FAIL" in analysis_text:
-            logging.error(f"[{request_id}] ❌ LANG_FAIL detected - Gemini failed to respect language={language}")
-            logging.warning(f"[{request_id}] Retrying with stricter language instruction...")
-            
-            # Retry with stricter instruction
-            retry_prompts = {
-                "fr": f"CRITIQUE: Répondez UNIQUEMENT en français, pas en anglais, pas en hébreu.\n\n{prompt}",
-                "en": f"CRITICAL: Answer ONLY in English, not in French, not in Hebrew.\n\n{prompt}",
-                "he": f"קריטי: ענה רק בעברית, לא בצרפתית, לא באנגלית.\n\n{prompt}"
-            }
+    except Exception as pdf_error:
+        logging.error(f"[{request_id}] PDF generation failed: {str(pdf_error)}")
+    
+    return {"pdf_bytes": pdf_bytes, "pdf_url": pdf_url, "pdf_sha256": pdf_sha256}
+
+
+async def email_mini_analysis(current_db, request: MiniAnalysisRequest, language: str,
+                              pdf_bytes: bytes | None, saved: dict, request_id: str) -> dict:
+    """
+    QUEUE THE EMAIL (email outbox) - the EmailEvent + timeline are recorded once it is sent or failed
+    Returns {"email_sent", "email_queued", "email_error"}
+    """
+    email_queued = False
+    email_error = None
+    try:
+        if pdf_bytes:
+            logging.info(f"[{request_id}] Queueing email to {request.email}")
+            # Outbox insert only - the SMTP delivery time is added by the result hook
+            with telemetry.timed("email_queue"):
+                email_result = await send_mini_analysis_email(
+                    current_db, request.email, request.nom_de_marque, pdf_bytes, language,
+                    event={"lead_id": saved["lead_id"], "request_id": request_id},
+                    context={"analysis_id": saved["analysis_id"], "lead_id": saved["lead_id"]}
+                )
+            email_queued = email_result["success"]
+            email_error = email_result.get("error")
             
-            retry_prompt = retry_prompts.get(language, prompt)
-            response = gemini_client.models.generate_content(
-                model=GEMINI_MODEL,
-                contents=[retry_prompt]
+            # Update analysis record (email_sent / email_sent_at are set by the outbox result hook)
+            await current_db.mini_analyses.update_one(
+                {"_id": saved["inserted_id"]},
+                {
+                    "$set": {
+                        "email_sent": False,
+                        "email_status": "queued" if email_queued else "failed",
+                        "email_outbox_id": email_result.get("outbox_id"),
+                        "email_error": email_error
+                    }
+                }
             )
             
-            analysis_text = response.text if hasattr(response, 'text') else str(response)
-            logging.info(f"[{request_id}] Retry response: {len(analysis_text)} characters")
-            
-            if "LANG_FAIL" in analysis_text:
-                logging.error(f"[{request_id}] ❌ LANG_FAIL persists after retry")
+            logging.info(f"[{request_id}] Email {'queued' if email_queued else 'failed'}")
+        
+    except Exception as email_send_error:
+        logging.error(f"[{request_id}] Email queueing failed: {str(email_send_error)}")
+        email_error = str(email_send_error)
+    
+    return {"email_sent": False, "email_queued": email_queued, "email_error": email_error}
+
+
+async def record_mini_analysis_email_result(current_db, item: dict, sent: bool, error: str | None):
+    """Email outbox result hook: analysis email status, SMTP delivery time (telemetry) + timeline event"""
+    from bson import ObjectId
+    
+    context = item.get("context") or {}
+    analysis_id = context.get("analysis_id")
+    if not analysis_id:
+        return
+    
+    if ObjectId.is_valid(analysis_id):
+        fields = {
+            "email_sent": sent,
+            "email_status": "sent" if sent else "failed",
+            "email_sent_at": datetime.now(timezone.utc) if sent else None,
+            "email_error": error
+        }
+        if sent and item.get("send_ms") is not None:
+            fields["telemetry.timings_ms.smtp"] = item["send_ms"]
+        await current_db.mini_analyses.update_one({"_id": ObjectId(analysis_id)}, {"$set": fields})
+    
+    await current_db.timeline_events.insert_one({
+        "entity_type": "mini_analysis",
+        "entity_id": analysis_id,
+        "lead_id": context.get("lead_id"),
+        "event_type": "email_sent" if sent else "email_failed",
+        "description": f"Email {'sent to' if sent else 'failed for'} {item.get('to_email')}",
+        "created_at": datetime.now(timezone.utc)
+    })
+
+
+email_outbox.on_result("mini_analysis", record_mini_analysis_email_result)
+
+
+def is_wrong_language_answer(text: str, language: str) -> bool:
+    """Local language check (main signal) or the legacy LANG_FAIL marker"""
+    return "LANG_FAIL" in text or language_detector.is_wrong_language(text, language)
+
+
+def open_gemini_stream(request: MiniAnalysisRequest, language: str, transform, http_request, request_id: str):
+    """
+    Gemini chunk stream of the SSE endpoint, through llm_gateway (breaker gate and
+    outcome, Gemini timeout, generation stopped when the client disconnects)
+    """
+    def open_stream(timeout, http_request):
+        return context_cache.stream(
+            gemini_client,
+            GEMINI_MODEL,
+            request,
+            language,
+            transform=transform,
+            timeout=timeout,
+            http_request=http_request,
+            request_id=request_id
+        )
+
+    return llm_gateway.stream("gemini", open_stream, http_request=http_request, request_id=request_id)
+
+
+async def stream_gemini_checked(request: MiniAnalysisRequest, language: str, timeout, http_request, request_id: str,
+                                instruction=None):
+    """
+    Gemini generation streamed through the local language check: a wrong-language
+    answer is cut after its first few hundred characters and regenerated at once
+    with the stricter instruction (instead of waiting for the full answer).
+    instruction: optional prompt transform applied to both attempts (whitelist regeneration)
+    Returns an object with .text (the gateway's Gemini response shape).
+    """
+    retry = (lambda text: build_lang_retry_prompt(instruction(text), language)) if instruction else \
+        (lambda text: build_lang_retry_prompt(text, language))
+    for transform in (instruction, retry):
+        # The retry is not checked again: its answer is kept whatever the verdict
+        guard = language_detector.LanguageGuard(language) if transform is not retry else None
+        analysis_text = ""
+        stream = context_cache.stream(
+            gemini_client,
+            GEMINI_MODEL,
+            request,
+            language,
+            transform=transform,
+            timeout=timeout,
+            http_request=http_request,
+            request_id=request_id
+        )
+        try:
+            async for chunk in stream:
+                chunk_text = getattr(chunk, 'text', None) or ""
+                analysis_text += chunk_text
+                if guard is not None and guard.feed(chunk_text) == "mismatch":
+                    break
+        finally:
+            # Stops the provider stream (no more tokens generated / billed)
+            await stream.aclose()
+        
+        if guard is None or (guard.finish() == "match" and "LANG_FAIL" not in analysis_text):
+            return SimpleNamespace(text=analysis_text)
+        
+        logging.error(f"[{request_id}] ❌ Wrong language detected after {len(analysis_text)} characters "
+                      f"(expected={language}, detected={guard.detected or 'LANG_FAIL'}) - retrying with stricter instruction")
+
+
+async def call_gemini_analysis(request: MiniAnalysisRequest, language: str, http_request, request_id: str,
+                               llm_meta: dict | None = None) -> str:
+    """
+    Mini-analysis generation with wrong-language retry - raw provider errors are NOT mapped
+    (shared by the HTTP endpoints and the pending_analyses worker)
+    Goes through llm_gateway: Gemini first, fallback providers per MINI_ANALYSIS_LLM_PROVIDERS
+    llm_meta: filled with the provider / model of the answer returned
+    """
+    def keep(result):
+        if llm_meta is not None:
+            llm_meta.update(provider=result["provider"], model=result.get("model"))
+
+    logging.info(f"[{request_id}] Calling Gemini API for brand: {request.nom_de_marque} (model: {GEMINI_MODEL})")
+    
+    async def generate(transform=None):
+        prompt = build_prompt(request, language=language)
+        
+        # Gemini: streamed with the early language check (retry handled inside).
+        # Runs in the LLM thread pool so the event loop keeps serving other requests
+        # The static prefix (master prompt + reference documents) is served from the
+        # provider-side context cache when available - only the form block is sent
+        async def gemini_call(timeout, http_request):
+            return await stream_gemini_checked(request, language, timeout, http_request, request_id, instruction=transform)
+        
+        return await llm_gateway.generate(
+            "mini-analysis",
+            transform(prompt) if transform else prompt,
+            overrides={"gemini": gemini_call},
+            http_request=http_request,
+            request_id=request_id
+        )
+    
+    result = await generate()
+    analysis_text = result["text"]
+    keep(result)
+    
+    logging.info(f"[{request_id}] ✅ {result['provider']} response received: {len(analysis_text)} characters")
+    
+    # Fallback providers answer in one block: checked on the full text
+    if result["provider"] != "gemini" and is_wrong_language_answer(analysis_text, language):
+        logging.error(f"[{request_id}] ❌ Wrong language from {result['provider']} - language={language}")
+        logging.warning(f"[{request_id}] Retrying with stricter language instruction...")
+        
+        result = await generate(transform=lambda text: build_lang_retry_prompt(text, language))
+        analysis_text = result["text"]
+        keep(result)
+        logging.info(f"[{request_id}] Retry response: {len(analysis_text)} characters")
+    
+    if is_wrong_language_answer(analysis_text, language):
+        logging.error(f"[{request_id}] ❌ Wrong language persists after retry")
+    
+    # Out-of-whitelist cities: one regeneration with a corrective instruction
+    # (compliant answers - the vast majority - cost nothing more than the local scan)
+    if whitelist_validator.WHITELIST_CHECK_ENABLED and whitelist_validator.WHITELIST_REGENERATE_ENABLED:
+        whitelist_code = prompt_registry.resolve_whitelist_code(request.statut_alimentaire)
+        check = whitelist_validator.validate(analysis_text, whitelist_code)
+        if check["violations"]:
+            logging.warning(f"[{request_id}] ❌ WHITELIST_VIOLATION {check['violations']} ({whitelist_code}) - regenerating")
+            allowed = whitelist_validator.allowed_cities(whitelist_code)
+            try:
+                retry = await generate(transform=lambda text: build_whitelist_retry_prompt(text, language, check["violations"], allowed))
+            except Exception as e:
+                # The first answer is still usable: kept (and flagged on mini_analyses)
+                logging.error(f"[{request_id}] ❌ Whitelist regeneration failed, keeping first answer: {str(e)}")
+                return analysis_text
+            retry_check = whitelist_validator.validate(retry["text"], whitelist_code)
+            whitelist_validator.record_regeneration(fixed=retry_check["compliant"])
+            if (retry["text"] and len(retry_check["violations"]) < len(check["violations"])
+                    and not is_wrong_language_answer(retry["text"], language)):
+                analysis_text = retry["text"]
+                keep(retry)
+            logging.info(f"[{request_id}] Whitelist regeneration: violations {check['violations']} -> {retry_check['violations']}")
+    
+    return analysis_text
+
+
+async def generate_analysis_text(request: MiniAnalysisRequest, language: str, current_db, lead_data: dict | None,
+                                 response: Response, http_request: Request, request_id: str,
+                                 llm_meta: dict | None = None, queue_on_quota: bool = True) -> str:
+    """
+    Call Gemini for one mini-analysis (with LANG_FAIL retry)
+    Raises HTTPException: 499 disconnect, 504 timeout, 429 quota (analysis queued unless
+    queue_on_quota is False - the caller queues it), 500 otherwise
+    """
+    # Call Gemini API (new google-genai package)
+    try:
+        analysis_text = await call_gemini_analysis(request, language, http_request, request_id, llm_meta)
         
         if not analysis_text:
             raise HTTPException(
@@ -1127,11 +1090,21 @@ async def generate_mini_analysis(request: MiniAnalysisRequest, response: Respons
         
     except HTTPException:
         raise  # Re-raise HTTPException as-is
+    except ClientDisconnectedError:
+        logging.warning(f"[{request_id}] Client disconnected - Gemini generation abandoned")
+        raise HTTPException(
+            status_code=499,
+            detail={"error": "Client disconnected", "request_id": request_id}
+        )
+    except LLMTimeoutError as e:
+        logging.error(f"[{request_id}] ❌ Gemini timeout: {str(e)}")
+        raise HTTPException(
+            status_code=504,
+            detail={"error": "Délai de génération IA dépassé", "request_id": request_id}
+        )
     except AttributeError as e:
-        import traceback
         error_trace = traceback.format_exc()
         logging.error(f"[{request_id}] ❌ Gemini API structure error: {str(e)}")
-        logging.error(f"[{request_id}] Response type: {type(response) if 'response' in locals() else 'no response'}")
         logging.error(f"[{request_id}] Traceback:\n{error_trace}")
         raise HTTPException(
             status_code=500,
@@ -1142,81 +1115,22 @@ async def generate_mini_analysis(request: MiniAnalysisRequest, response: Respons
             }
         )
     except Exception as e:
-        import traceback
         error_trace = traceback.format_exc()
-        error_str = str(e).lower()
         
-        # MISSION: DETECT QUOTA/RESOURCE_EXHAUSTED ERRORS
-        if "resource_exhausted" in error_str or "quota" in error_str:
+        if is_rate_limit_refusal(e):
+            logging.warning(f"[{request_id}] GEMINI_RATE_LIMITED: {str(e)}")
+            raise HTTPException(status_code=429, detail=rate_limit_detail(e, request_id),
+                                headers={"Retry-After": str(e.retry_after_seconds)})
+        
+        if is_quota_error(e):
             logging.error(f"[{request_id}] ❌ GEMINI_QUOTA_EXCEEDED: {str(e)}")
-            
-            # Update lead status to QUOTA_BLOCKED
-            if lead_data:
-                try:
-                    lead_data["status"] = "QUOTA_BLOCKED"
-                    await create_lead_in_crm(lead_data, request_id)
-                except:
-                    pass
-            
-            # SAVE TO pending_analyses (UPDATED SCHEMA)
-            lead_id_for_queue = None
-            if lead_data:
-                try:
-                    lead_result = await create_lead_in_crm(lead_data, request_id)
-                    lead_id_for_queue = lead_result.get("lead_id")
-                except:
-                    pass
-            
-            try:
-                pending_record = {
-                    "lead_id": lead_id_for_queue or "unknown",
-                    "email": request.email,
-                    "brand_name": request.nom_de_marque,
-                    "sector": request.secteur,
-                    "language": language,
-                    "status": "pending",
-                    "attempts": 0,
-                    "request_data": request.dict(),
-                    "created_at": datetime.now(timezone.utc),
-                    "updated_at": datetime.now(timezone.utc)
-                }
-                result = await current_db.pending_analyses.insert_one(pending_record)
-                queue_id = str(result.inserted_id)
-                logging.info(f"[{request_id}] QUEUED_OK: queue_id={queue_id}")
-            except Exception as db_error:
-                logging.error(f"[{request_id}] QUEUE_FAIL: {str(db_error)}")
-                queue_id = None
-            
-            # SEND CONFIRMATION EMAIL
-            email_sent = False
-            try:
-                from extended_routes import send_quota_confirmation_email
-                await send_quota_confirmation_email(request.email, request.nom_de_marque, language, request_id)
-                logging.info(f"[{request_id}] EMAIL_SEND_OK")
-                email_sent = True
-            except Exception as email_error:
-                logging.error(f"[{request_id}] EMAIL_SEND_FAIL: {str(email_error)}")
-            
-            # Multilingual confirmation messages (EXACT SPEC)
-            quota_messages = {
-                "fr": "Quota de mini-analyses atteint. Revenez demain.",
-                "en": "Daily mini-analysis quota reached. Please come back tomorrow.",
-                "he": "המכסה היומית למיני-אנליזה הסתיימה. נסו שוב מחר."
-            }
-            
-            response.headers["Retry-After"] = "86400"
-            
-            raise HTTPException(
-                status_code=429,
-                detail={
-                    "error_code": "GEMINI_QUOTA_DAILY",
-                    "message": quota_messages,
-                    "email_sent": email_sent,
-                    "queued": True,
-                    "retry_after_seconds": 86400,
-                    "request_id": request_id
-                }
-            )
+            retry_after = quota_retry_after(e)
+            if not queue_on_quota:
+                raise HTTPException(status_code=429, detail={"error_code": "GEMINI_QUOTA_DAILY", "retry_after_seconds": retry_after,
+                                                             "request_id": request_id})
+            quota_detail = await queue_quota_blocked_analysis(current_db, request, language, lead_data, request_id,
+                                                              retry_after_seconds=retry_after)
+            raise HTTPException(status_code=429, detail=quota_detail, headers={"Retry-After": str(retry_after)})
         
         # Other errors: 500
         logging.error(f"[{request_id}] ❌ Gemini API error: {str(e)}")
@@ -1232,135 +1146,331 @@ async def generate_mini_analysis(request: MiniAnalysisRequest, response: Respons
             }
         )
     
-    # Save to MongoDB
-    try:
-        analysis_record = {
-            "brand_slug": brand_slug,
-            "brand_name": request.nom_de_marque,
-            "email": request.email,
-            "phone": request.phone,  # Added phone field
-            "language": language,
-            "payload_form": request.dict(),
-            "created_at": datetime.now(timezone.utc),
-            "provider": "gemini",
-            "model": GEMINI_MODEL,
-            "response_text": analysis_text,
-            "pdf_url": None,
-            "email_sent": False,
-            "email_status": None
-        }
-        
-        result = await current_db.mini_analyses.insert_one(analysis_record)
-        analysis_id = str(result.inserted_id)
-        logging.info(f"Analysis saved to MongoDB with ID: {analysis_id}")
-        
-        # MISSION C: Update lead status to GENERATED (successful generation)
-        lead_id = None
+    return analysis_text
+
+
+@router.post("/mini-analysis")
+async def generate_mini_analysis(request: MiniAnalysisRequest, response: Response, http_request: Request,
+                                 mode: str | None = None,
+                                 idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+                                 prefer: str | None = Header(default=None)):
+    """
+    Generate AI-powered mini-analysis for Israel market entry
+    Includes anti-duplicate check + MongoDB persistence + AUTOMATIC LEAD CREATION (MISSION C)
+    Adds debug headers: X-IGV-Lang-Requested, X-IGV-Lang-Used, X-IGV-Cache-Hit
+    
+    Idempotent: double-clicks / retries (same Idempotency-Key, or same payload when the
+    header is absent) share one Gemini call, PDF and email (Idempotent-Replayed: true)
+    
+    Job mode (?mode=async or "Prefer: respond-async"): returns 202 + job_id right after
+    validation and lead creation - see mini_analysis_jobs.py for progress endpoints
+    
+    Multi-language ("languages": ["fr", "he"]): the languages are generated concurrently
+    (PDFs too) and stored as linked mini_analyses under one lead - see run_multi_language_analysis
+    """
+    languages = resolve_requested_languages(request)
+    
+    if mode == "async" or "respond-async" in (prefer or ""):
+        if len(languages) > 1:
+            raise HTTPException(status_code=400, detail="languages (multi-language) is not supported in async mode")
+        import mini_analysis_jobs  # Imported here to avoid a circular import
+        
+        job = await idempotency.run_once(
+            "mini-analysis-job",
+            idempotency_key,
+            request.dict(),
+            lambda clients: mini_analysis_jobs.submit_job(request, response, http_request),
+            response=response,
+            http_request=http_request
+        )
+        response.status_code = 202
+        response.headers["Location"] = job["status_url"]
+        return job
+    
+    return await idempotency.run_once(
+        "mini-analysis",
+        idempotency_key,
+        request.dict(),
+        lambda clients: run_mini_analysis(request, response, http_request, clients),
+        response=response,
+        http_request=http_request
+    )
+
+
+async def run_mini_analysis(request: MiniAnalysisRequest, response: Response, http_request: Request, clients) -> dict:
+    """Mini-analysis pipeline - clients is the idempotency ClientGroup (disconnect detection)"""
+    languages = resolve_requested_languages(request)
+    if len(languages) > 1:
+        return await run_multi_language_analysis(request, languages, response, http_request, clients)
+    context = await prepare_mini_analysis(request, response, http_request)
+    return await execute_mini_analysis(request, context, response, clients)
+
+
+def resolve_requested_languages(request: MiniAnalysisRequest) -> list:
+    """Target languages of a submission: "languages" (deduplicated, in order) or [language]"""
+    if not request.languages:
+        return [request.language]
+    invalid = [language for language in request.languages if language not in SUPPORTED_LANGUAGES]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Langues non supportées: {', '.join(invalid)} (fr, en, he)")
+    return list(dict.fromkeys(request.languages))
+
+
+async def run_multi_language_analysis(request: MiniAnalysisRequest, languages: list, response: Response,
+                                      http_request: Request, clients) -> dict:
+    """
+    One submission, several languages: lead created once, then every language runs
+    execute_mini_analysis concurrently (at most MINI_ANALYSIS_LANGUAGE_FANOUT at a time).
+    The languages do not touch the lead: it is updated once after they all finished
+    (status, analyses by language, PDF of the first generated language). Languages blocked
+    by the Gemini quota share one pending_analyses item and one confirmation email.
+    The mini_analyses documents share an analysis_group_id and list each other.
+    Wall time is about the slowest language; a failed language does not fail the others.
+    """
+    base_request = MiniAnalysisRequest(**{**request.dict(), "language": languages[0], "languages": None})
+    context = await prepare_mini_analysis(base_request, response, http_request)
+    request_id = context["request_id"]
+    lead_data = context["lead_data"]
+    
+    # Fail fast if a language has no master prompt (before any generation)
+    for language in languages[1:]:
+        try:
+            prompt_registry.get_compiled_prompt(request.secteur, language, request.statut_alimentaire)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Error building prompt ({language}): {str(e)}")
+            raise HTTPException(status_code=500, detail="Erreur lors de la construction de la requête IA")
+    
+    group_id = uuid.uuid4().hex
+    semaphore = asyncio.Semaphore(max(1, MINI_ANALYSIS_LANGUAGE_FANOUT))
+    logging.info(f"[{request_id}] MULTI_LANG group={group_id} languages={languages}")
+    
+    async def run_language(language: str) -> dict:
+        async with semaphore:
+            language_request = MiniAnalysisRequest(**{**request.dict(), "language": language, "languages": None})
+            language_context = {**context, "language": language, "request_id": f"{request_id}_{language}",
+                                "lead_data": None, "queue_on_quota": False}
+            return await execute_mini_analysis(language_request, language_context, Response(), clients)
+    
+    outcomes = await asyncio.gather(*(run_language(language) for language in languages), return_exceptions=True)
+    
+    analyses = {}
+    failed = {}
+    for language, outcome in zip(languages, outcomes):
+        if isinstance(outcome, HTTPException):
+            failed[language] = {"status_code": outcome.status_code, "detail": outcome.detail}
+        elif isinstance(outcome, Exception):
+            logging.error(f"[{request_id}] MULTI_LANG {language} failed: {str(outcome)}")
+            failed[language] = {"status_code": 500, "detail": str(outcome)}
+        else:
+            analyses[language] = outcome
+    
+    current_db = get_db()
+    quota_blocked = [language for language, failure in failed.items()
+                     if isinstance(failure["detail"], dict) and failure["detail"].get("error_code") == "GEMINI_QUOTA_DAILY"]
+    quota_detail = None
+    if quota_blocked:
+        retry_after = max(failed[language]["detail"]["retry_after_seconds"] for language in quota_blocked)
+        quota_detail = await queue_quota_blocked_analysis(current_db, request, quota_blocked[0], lead_data, request_id,
+                                                          languages=quota_blocked, retry_after_seconds=retry_after)
+        for language in quota_blocked:
+            failed[language]["detail"] = quota_detail
+    
+    if not analyses:
+        # Nothing generated: same error as a single-language request
+        if quota_detail is not None:
+            raise HTTPException(status_code=429, detail=quota_detail,
+                                headers={"Retry-After": str(quota_detail["retry_after_seconds"])})
+        raise next(outcome for outcome in outcomes if isinstance(outcome, Exception))
+    
+    lead_id = None
+    if lead_data is not None:
         try:
             lead_data["status"] = "GENERATED"
-            lead_result = await create_lead_in_crm(lead_data, request_id)
-            lead_id = lead_result.get("lead_id")
+            lead_id = (await create_lead_in_crm(lead_data, request_id)).get("lead_id")
         except Exception as lead_update_error:
             logging.error(f"[{request_id}] Lead status update error (non-blocking): {str(lead_update_error)}")
-        
-        # GENERATE PDF AUTOMATICALLY
-        pdf_url = None
-        pdf_base64 = None
-        try:
-            logging.info(f"[{request_id}] Generating PDF for {request.nom_de_marque}")
-            pdf_bytes = generate_mini_analysis_pdf(request.nom_de_marque, analysis_text, language)
-            pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
-            pdf_url = f"data:application/pdf;base64,{pdf_base64}"  # Inline PDF for now
-            
-            # Update analysis record
-            await current_db.mini_analyses.update_one(
-                {"_id": result.inserted_id},
-                {"$set": {"pdf_url": pdf_url, "pdf_generated_at": datetime.now(timezone.utc)}}
+    for analysis in analyses.values():
+        analysis["lead_id"] = lead_id
+    
+    analysis_ids = {language: a["analysis_id"] for language, a in analyses.items() if a["analysis_id"]}
+    await link_language_analyses(current_db, group_id, analysis_ids, lead_id, request_id)
+    if lead_id and analysis_ids:
+        primary = next(language for language in languages if language in analysis_ids)
+        await attach_primary_analysis_to_lead(current_db, lead_id, primary, analysis_ids[primary],
+                                              analyses[primary]["analysis"], request_id)
+    
+    response.headers["X-IGV-Lang-Requested"] = ",".join(languages)
+    response.headers["X-IGV-Lang-Used"] = ",".join(analyses)
+    return {
+        "success": True,
+        "multi_language": True,
+        "analysis_group_id": group_id,
+        "brand_name": request.nom_de_marque,
+        "languages": list(analyses),
+        "lead_id": lead_id,
+        "analyses": analyses,
+        "failed": failed
+    }
+
+
+async def link_language_analyses(current_db, group_id: str, analysis_ids: dict, lead_id: str | None, request_id: str):
+    """Link the mini_analyses of one multi-language submission together and to their lead"""
+    if current_db is None or not analysis_ids:
+        return
+    try:
+        from bson import ObjectId
+        await current_db.mini_analyses.update_many(
+            {"_id": {"$in": [ObjectId(analysis_id) for analysis_id in analysis_ids.values()]}},
+            {"$set": {
+                "analysis_group_id": group_id,
+                "linked_analyses": analysis_ids,
+                "lead_id": lead_id
+            }}
+        )
+        if lead_id:
+            await current_db.leads.update_one(
+                {"_id": ObjectId(lead_id)},
+                {"$set": {"analysis_group_id": group_id, "analyses_by_language": analysis_ids}}
             )
-            
-            # Update lead with PDF URL and analysis content
-            if lead_id:
-                from bson import ObjectId
-                await current_db.leads.update_one(
-                    {"_id": ObjectId(lead_id)},
-                    {"$set": {
-                        "pdf_url": pdf_url,
-                        "analysis": analysis_text,  # Store full analysis text
-                        "analysis_meta": {
-                            "language": language,
-                            "generated_at": datetime.now(timezone.utc),
-                            "analysis_id": analysis_id
-                        }
-                    }}
-                )
-            
-            # Timeline event
-            await current_db.timeline_events.insert_one({
-                "entity_type": "mini_analysis",
-                "entity_id": analysis_id,
-                "lead_id": lead_id,
-                "event_type": "pdf_generated",
-                "description": f"PDF generated for {request.nom_de_marque}",
-                "created_at": datetime.now(timezone.utc)
-            })
-            
-            logging.info(f"[{request_id}] PDF generated successfully")
-            
-        except Exception as pdf_error:
-            logging.error(f"[{request_id}] PDF generation failed: {str(pdf_error)}")
+    except Exception as e:
+        logging.error(f"[{request_id}] MULTI_LANG link error (non-blocking): {str(e)}")
+
+
+async def attach_primary_analysis_to_lead(current_db, lead_id: str, language: str, analysis_id: str,
+                                          analysis_text: str, request_id: str):
+    """Multi-language: the lead holds the analysis and PDF of one language (the first requested one generated)"""
+    try:
+        from bson import ObjectId
+        analysis = await current_db.mini_analyses.find_one({"_id": ObjectId(analysis_id)}, {"pdf": 1, "pdf_url": 1})
+        update = {
+            "analysis": analysis_text,
+            "analysis_meta": {
+                "language": language,
+                "generated_at": datetime.now(timezone.utc),
+                "analysis_id": analysis_id
+            }
+        }
+        if analysis and analysis.get("pdf"):
+            update.update({"pdf": analysis["pdf"], "pdf_url": analysis.get("pdf_url")})
+        await current_db.leads.update_one({"_id": ObjectId(lead_id)}, {"$set": update})
+    except Exception as e:
+        logging.error(f"[{request_id}] MULTI_LANG lead update error (non-blocking): {str(e)}")
+
+
+async def prepare_mini_analysis(request: MiniAnalysisRequest, response: Response, http_request: Request) -> dict:
+    """
+    Request-bound steps: validation, lead creation, Gemini/MongoDB/prompt checks
+    Returns the (serializable) context for execute_mini_analysis:
+    {"language", "request_id", "lead_data", "brand_slug"}
+    """
+    
+    # Validate required fields + language
+    language = validate_mini_analysis_request(request)
+    
+    # DEBUG HEADERS (LIVE VERIFICATION)
+    response.headers["X-IGV-Lang-Requested"] = language
+    response.headers["X-IGV-Lang-Used"] = language
+    
+    request_id = f"req_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
+    logging.info(f"[{request_id}] LANG_REQUESTED={language} LANG_USED={language}")
+    started_at = time.time()
+    
+    # MISSION C: CREATE LEAD AUTOMATICALLY (BEFORE checking quota/duplicate)
+    lead_data = await register_mini_analysis_lead(request, language, http_request, request_id)
+    
+    # Check Gemini client
+    await ensure_gemini_ready(lead_data, request_id)
+    
+    # Check MongoDB connection
+    if get_db() is None:
+        raise HTTPException(status_code=500, detail="Base de données non configurée")
+    
+    # Normalize brand name for logging
+    brand_slug = normalize_brand_slug(request.nom_de_marque)
+    
+    # Removed duplicate check - each request generates a new mini-analysis
+    # This allows multiple analyses per brand for tracking evolution over time
+    logging.info(f"NEW_ANALYSIS brand={request.nom_de_marque} slug={brand_slug} language={language}")
+    
+    # Resolve the compiled prompt template (fails fast if an IGV file is missing)
+    try:
+        template = prompt_registry.get_compiled_prompt(request.secteur, language, request.statut_alimentaire)
+        logging.info(f"Using prompt: {template['prompt_name']} (v{template['version']}) for sector: {request.secteur}, language: {language}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error building prompt: {str(e)}")
+        raise HTTPException(status_code=500, detail="Erreur lors de la construction de la requête IA")
+    
+    return {"language": language, "request_id": request_id, "lead_data": lead_data, "brand_slug": brand_slug,
+            "started_at": started_at}
+
+
+async def execute_mini_analysis(request: MiniAnalysisRequest, context: dict, response: Response, clients,
+                                on_stage=None) -> dict:
+    """
+    Generation steps: result cache / Gemini, MongoDB, PDF, email
+    on_stage: optional async callback(stage, data) - stages "generating", "rendering", "emailing"
+    """
+    language = context["language"]
+    request_id = context["request_id"]
+    lead_data = context["lead_data"]
+    brand_slug = context["brand_slug"]
+    current_db = get_db()
+    template = prompt_registry.get_compiled_prompt(request.secteur, language, request.statut_alimentaire)
+    telemetry.start(template, request.secteur, language, context.get("started_at"))
+    response.headers["X-IGV-Cache-Hit"] = "false"
+    
+    async def stage(name: str, data: dict | None = None):
+        if on_stage is not None:
+            await on_stage(name, data or {})
+    
+    await stage("generating")
+    
+    # Result cache (opt-in): identical / near-identical forms skip Gemini entirely
+    result_key = None
+    cached_result = None
+    llm_meta = {}
+    if result_cache.RESULT_CACHE_ENABLED:
+        result_key = result_cache.build_cache_key(request, language, brand_slug, template)
+        cached_result = await result_cache.lookup(current_db, result_key, request_id)
+    
+    if cached_result is not None:
+        analysis_text = cached_result["analysis_text"]
+        response.headers["X-IGV-Cache-Hit"] = "true"
+    else:
+        with telemetry.timed("generation"):
+            analysis_text = await generate_analysis_text(request, language, current_db, lead_data, response, clients, request_id,
+                                                         llm_meta, queue_on_quota=context.get("queue_on_quota", True))
+        if result_key and "LANG_FAIL" not in analysis_text:
+            await result_cache.store(current_db, result_key, brand_slug, language, template, analysis_text, request_id)
+    
+    # Save to MongoDB, then PDF, then email
+    lead_id = None
+    analysis_id = None
+    pdf_url = None
+    pdf_sha256 = None
+    email_sent = False
+    email_error = None
+    try:
+        saved = await persist_mini_analysis(current_db, request, language, brand_slug, analysis_text, lead_data, request_id,
+                                            cache_hit=cached_result is not None, llm=llm_meta)
+        lead_id = saved["lead_id"]
+        analysis_id = saved["analysis_id"]
         
-        # SEND EMAIL AUTOMATICALLY
-        email_sent = False
-        email_error = None
-        try:
-            if pdf_bytes:
-                logging.info(f"[{request_id}] Sending email to {request.email}")
-                email_result = await send_mini_analysis_email(request.email, request.nom_de_marque, pdf_bytes, language)
-                email_sent = email_result["success"]
-                email_error = email_result.get("error")
-                
-                # Update analysis record
-                await current_db.mini_analyses.update_one(
-                    {"_id": result.inserted_id},
-                    {
-                        "$set": {
-                            "email_sent": email_sent,
-                            "email_status": "sent" if email_sent else "failed",
-                            "email_sent_at": datetime.now(timezone.utc) if email_sent else None,
-                            "email_error": email_error
-                        }
-                    }
-                )
-                
-                # Create EmailEvent
-                await current_db.email_events.insert_one({
-                    "email_type": "mini_analysis",
-                    "to_email": request.email,
-                    "bcc": [COMPANY_EMAIL],
-                    "subject": f"Mini-Analysis - {request.nom_de_marque}",
-                    "language": language,
-                    "status": "sent" if email_sent else "failed",
-                    "error_message": email_error,
-                    "lead_id": lead_id,
-                    "created_at": datetime.now(timezone.utc),
-                    "sent_at": datetime.now(timezone.utc) if email_sent else None
-                })
-                
-                # Timeline event
-                await current_db.timeline_events.insert_one({
-                    "entity_type": "mini_analysis",
-                    "entity_id": analysis_id,
-                    "lead_id": lead_id,
-                    "event_type": "email_sent" if email_sent else "email_failed",
-                    "description": f"Email {'sent to' if email_sent else 'failed for'} {request.email}",
-                    "created_at": datetime.now(timezone.utc)
-                })
-                
-                logging.info(f"[{request_id}] Email {'sent' if email_sent else 'failed'}")
-            
-        except Exception as email_send_error:
-            logging.error(f"[{request_id}] Email send failed: {str(email_send_error)}")
-            email_error = str(email_send_error)
+        await stage("rendering", {"analysis_id": analysis_id, "lead_id": lead_id})
+        pdf_result = await attach_mini_analysis_pdf(current_db, request, language, analysis_text, saved, request_id)
+        pdf_url = pdf_result["pdf_url"]
+        pdf_sha256 = pdf_result["pdf_sha256"]
+        
+        await stage("emailing", {"pdf_ready": pdf_url is not None})
+        email_result = await email_mini_analysis(current_db, request, language, pdf_result["pdf_bytes"], saved, request_id)
+        email_sent = email_result["email_sent"]
+        email_error = email_result["email_error"]
+        
+        await telemetry.save(current_db, saved["inserted_id"], cache_hit=cached_result is not None, request_id=request_id)
         
     except Exception as e:
         logging.error(f"MongoDB save error: {str(e)}")
@@ -1374,13 +1484,219 @@ async def generate_mini_analysis(request: MiniAnalysisRequest, response: Respons
         "statut_alimentaire": request.statut_alimentaire,
         "language": language,
         "pdf_url": pdf_url,
-        "pdf_base64": pdf_base64,
+        "pdf_sha256": pdf_sha256,
         "email_sent": email_sent,
         "email_status": "sent" if email_sent else "failed" if email_error else "pending",
-        "lead_id": lead_id
+        "lead_id": lead_id,
+        "analysis_id": analysis_id
     }
 
 
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/mini-analysis/stream")
+async def stream_mini_analysis(request: MiniAnalysisRequest, http_request: Request):
+    """
+    Streaming variant of /mini-analysis (Server-Sent Events)
+    
+    Events, in order:
+      - meta:              {request_id, language, cache_hit}
+      - token:             {text} - Gemini chunks as they arrive (the first few hundred
+                           characters are sent once the language check passed)
+      - reset:             {reason} - discard received tokens (LANG_FAIL or WHITELIST regeneration follows)
+      - analysis_complete: {analysis_id, lead_id, length}
+      - pdf_ready:         {analysis_id, pdf_url, pdf_sha256} - pdf_url: signed GET /api/mini-analysis/{id}/pdf link
+      - email_sent:        {email_sent, email_status}
+      - done:              {success: true}
+      - error:             {status_code, detail} - terminal
+    
+    Lead creation, mini_analyses persistence and PDF/email steps are the same as /mini-analysis.
+    """
+    language = validate_mini_analysis_request(request)
+    
+    request_id = f"req_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
+    logging.info(f"[{request_id}] STREAM LANG_REQUESTED={language} LANG_USED={language}")
+    started_at = time.time()
+    
+    lead_data = await register_mini_analysis_lead(request, language, http_request, request_id)
+    await ensure_gemini_ready(lead_data, request_id)
+    
+    current_db = get_db()
+    if current_db is None:
+        raise HTTPException(status_code=500, detail="Base de données non configurée")
+    
+    brand_slug = normalize_brand_slug(request.nom_de_marque)
+    logging.info(f"NEW_ANALYSIS (stream) brand={request.nom_de_marque} slug={brand_slug} language={language}")
+    
+    # Fail fast (before the stream starts) if an IGV file is missing
+    template = prompt_registry.get_compiled_prompt(request.secteur, language, request.statut_alimentaire)
+    
+    # Result cache (opt-in): a hit is sent as a single token event
+    result_key = None
+    cached_result = None
+    if result_cache.RESULT_CACHE_ENABLED:
+        result_key = result_cache.build_cache_key(request, language, brand_slug, template)
+        cached_result = await result_cache.lookup(current_db, result_key, request_id)
+    
+    async def event_stream():
+        telemetry.start(template, request.secteur, language, started_at)
+        yield format_sse("meta", {"request_id": request_id, "language": language, "cache_hit": cached_result is not None})
+        
+        if cached_result is not None:
+            analysis_text = cached_result["analysis_text"]
+            yield format_sse("token", {"text": analysis_text})
+        else:
+            # Gemini generation - forward chunks as they arrive
+            # (StreamingResponse cancels this generator on client disconnect)
+            analysis_text = ""
+            generation_started = time.perf_counter()
+            try:
+                for transform in (None, lambda text: build_lang_retry_prompt(text, language)):
+                    analysis_text = ""
+                    # First attempt: tokens are held back until the local language check
+                    # decides (a few hundred characters) - a wrong-language answer is cut
+                    # and regenerated before the client sees any of it
+                    guard = language_detector.LanguageGuard(language) if transform is None else None
+                    held = []
+                    stream = open_gemini_stream(request, language, transform, http_request, request_id)
+                    try:
+                        async for chunk in stream:
+                            chunk_text = getattr(chunk, 'text', None) or ""
+                            if not chunk_text:
+                                continue
+                            analysis_text += chunk_text
+                            if guard is not None and guard.verdict is None:
+                                held.append(chunk_text)
+                                verdict = guard.feed(chunk_text)
+                                if verdict == "mismatch":
+                                    break
+                                if verdict == "match":
+                                    yield format_sse("token", {"text": "".join(held)})
+                                    held = []
+                                continue
+                            yield format_sse("token", {"text": chunk_text})
+                    finally:
+                        await stream.aclose()
+                    
+                    if guard is not None and guard.finish() == "mismatch":
+                        logging.error(f"[{request_id}] ❌ Wrong language in stream after {len(analysis_text)} characters "
+                                      f"(expected={language}, detected={guard.detected}) - retrying")
+                        continue
+                    if held:
+                        yield format_sse("token", {"text": "".join(held)})
+                    
+                    if "LANG_FAIL" not in analysis_text:
+                        break
+                    
+                    logging.error(f"[{request_id}] ❌ LANG_FAIL detected in stream - language={language}")
+                    yield format_sse("reset", {"reason": "LANG_FAIL"})
+                
+                if not analysis_text:
+                    yield format_sse("error", {"status_code": 500, "detail": {"error": "Réponse IA vide", "request_id": request_id}})
+                    return
+                
+                # Out-of-whitelist cities: the client discards the answer and receives
+                # one regeneration with the corrective instruction
+                if whitelist_validator.WHITELIST_CHECK_ENABLED and whitelist_validator.WHITELIST_REGENERATE_ENABLED:
+                    whitelist_code = template["whitelist_code"]
+                    check = whitelist_validator.validate(analysis_text, whitelist_code)
+                    if check["violations"]:
+                        logging.warning(f"[{request_id}] ❌ WHITELIST_VIOLATION in stream {check['violations']} - regenerating")
+                        yield format_sse("reset", {"reason": "WHITELIST", "violations": check["violations"]})
+                        allowed = whitelist_validator.allowed_cities(whitelist_code)
+                        retry_text = ""
+                        stream = open_gemini_stream(
+                            request, language,
+                            lambda text: build_whitelist_retry_prompt(text, language, check["violations"], allowed),
+                            http_request, request_id
+                        )
+                        try:
+                            async for chunk in stream:
+                                chunk_text = getattr(chunk, 'text', None) or ""
+                                if chunk_text:
+                                    retry_text += chunk_text
+                                    yield format_sse("token", {"text": chunk_text})
+                        finally:
+                            await stream.aclose()
+                        whitelist_validator.record_regeneration(
+                            fixed=whitelist_validator.validate(retry_text, whitelist_code)["compliant"]
+                        )
+                        analysis_text = retry_text or analysis_text
+                
+            except ClientDisconnectedError:
+                logging.warning(f"[{request_id}] Client disconnected - Gemini stream abandoned")
+                return
+            except LLMTimeoutError:
+                yield format_sse("error", {"status_code": 504, "detail": {"error": "Délai de génération IA dépassé", "request_id": request_id}})
+                return
+            except Exception as e:
+                if is_rate_limit_refusal(e):
+                    logging.warning(f"[{request_id}] GEMINI_RATE_LIMITED (stream): {str(e)}")
+                    yield format_sse("error", {"status_code": 429, "detail": rate_limit_detail(e, request_id)})
+                    return
+                if is_quota_error(e):
+                    logging.error(f"[{request_id}] ❌ GEMINI_QUOTA_EXCEEDED (stream): {str(e)}")
+                    quota_detail = await queue_quota_blocked_analysis(current_db, request, language, lead_data, request_id,
+                                                                      retry_after_seconds=quota_retry_after(e))
+                    yield format_sse("error", {"status_code": 429, "detail": quota_detail})
+                    return
+                
+                logging.error(f"[{request_id}] ❌ Gemini stream error: {str(e)}")
+                yield format_sse("error", {"status_code": 500, "detail": {"error": f"Erreur API Gemini: {str(e)}", "request_id": request_id}})
+                return
+            
+            telemetry.add_timing("generation", (time.perf_counter() - generation_started) * 1000)
+            logging.info(f"[{request_id}] ✅ Gemini stream complete: {len(analysis_text)} characters")
+            if result_key and "LANG_FAIL" not in analysis_text:
+                await result_cache.store(current_db, result_key, brand_slug, language, template, analysis_text, request_id)
+        
+        # Persistence, PDF and email - one event per step
+        try:
+            saved = await persist_mini_analysis(current_db, request, language, brand_slug, analysis_text, lead_data, request_id,
+                                                cache_hit=cached_result is not None)
+        except Exception as e:
+            logging.error(f"MongoDB save error: {str(e)}")
+            yield format_sse("error", {"status_code": 500, "detail": {"error": "Erreur de sauvegarde", "request_id": request_id}})
+            return
+        
+        yield format_sse("analysis_complete", {
+            "analysis_id": saved["analysis_id"],
+            "lead_id": saved["lead_id"],
+            "length": len(analysis_text)
+        })
+        
+        pdf_result = await attach_mini_analysis_pdf(current_db, request, language, analysis_text, saved, request_id)
+        yield format_sse("pdf_ready", {
+            "analysis_id": saved["analysis_id"],
+            "pdf_url": pdf_result["pdf_url"],
+            "pdf_sha256": pdf_result["pdf_sha256"]
+        })
+        
+        email_result = await email_mini_analysis(current_db, request, language, pdf_result["pdf_bytes"], saved, request_id)
+        email_sent = email_result["email_sent"]
+        yield format_sse("email_sent", {
+            "email_sent": email_sent,
+            "email_status": "sent" if email_sent else "failed" if email_result["email_error"] else "pending"
+        })
+        
+        await telemetry.save(current_db, saved["inserted_id"], cache_hit=cached_result is not None, request_id=request_id)
+        yield format_sse("done", {"success": True, "lead_id": saved["lead_id"]})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable proxy buffering (Render/nginx)
+            "X-IGV-Lang-Requested": language,
+            "X-IGV-Lang-Used": language
+        }
+    )
+
+
 # ============================================================================
 # NEW ENDPOINTS FOR UI BUTTONS (Download PDF / Send Email)
 # ============================================================================
@@ -1402,6 +1718,42 @@ class EmailPDFRequest(BaseModel):
     language: str = "fr"
 
 
+@router.api_route("/mini-analysis/{analysis_id}/pdf", methods=["GET", "HEAD"])
+async def download_mini_analysis_pdf(analysis_id: str, request: Request, token: str | None = None):
+    """
+    Stored PDF of an analysis (pdf_store), streamed from GridFS / disk
+    Public link: requires the signed token of the stored pdf_url (404 otherwise)
+    ETag = sha256 (If-None-Match -> 304), Content-Length, single byte ranges (Range -> 206)
+    """
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    
+    if not pdf_store.verify_pdf_link_token(analysis_id, token):
+        raise HTTPException(status_code=404, detail="PDF introuvable")
+    
+    current_db = get_db()
+    if current_db is None:
+        raise HTTPException(status_code=503, detail="Database not configured")
+    
+    try:
+        object_id = ObjectId(analysis_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Analyse introuvable")
+    
+    analysis = await current_db.mini_analyses.find_one({"_id": object_id}, {"pdf": 1, "brand_slug": 1})
+    if not analysis or not analysis.get("pdf"):
+        raise HTTPException(status_code=404, detail="PDF introuvable")
+    
+    response = await pdf_store.pdf_response(
+        current_db, analysis["pdf"], request,
+        filename=f"mini-analyse-{analysis.get('brand_slug') or analysis_id}.pdf"
+    )
+    if response is None:
+        logging.error(f"PDF_STORE_MISSING analysis={analysis_id} sha256={analysis['pdf'].get('sha256')}")
+        raise HTTPException(status_code=404, detail="PDF introuvable")
+    return response
+
+
 @router.post("/pdf/generate")
 async def generate_pdf_endpoint(request: PDFGenerateRequest):
     """
@@ -1413,11 +1765,13 @@ async def generate_pdf_endpoint(request: PDFGenerateRequest):
     try:
         logging.info(f"[{request_id}] PDF generation requested for {request.brandName}")
         
-        if not PDF_AVAILABLE:
+        if not pdf_engine.PDF_AVAILABLE:
             raise HTTPException(status_code=500, detail="PDF generation not available")
         
         # Generate PDF with analysis text
-        pdf_bytes = generate_mini_analysis_pdf(
+        pdf_bytes = await render_cache.render(
+            "mini_analysis",
+            pdf_engine.build_mini_analysis_pdf,
             brand_name=request.brandName,
             analysis_text=request.analysis,
             language=request.language
@@ -1456,11 +1810,13 @@ async def send_pdf_email_endpoint(request: EmailPDFRequest):
         if not EMAIL_AVAILABLE:
             raise HTTPException(status_code=500, detail="Email service not available")
         
-        if not PDF_AVAILABLE:
+        if not pdf_engine.PDF_AVAILABLE:
             raise HTTPException(status_code=500, detail="PDF generation not available")
         
         # Generate PDF first
-        pdf_bytes = generate_mini_analysis_pdf(
+        pdf_bytes = await render_cache.render(
+            "mini_analysis",
+            pdf_engine.build_mini_analysis_pdf,
             brand_name=request.brandName,
             analysis_text=request.analysis,
             language=request.language
@@ -1469,23 +1825,26 @@ async def send_pdf_email_endpoint(request: EmailPDFRequest):
         if not pdf_bytes:
             raise HTTPException(status_code=500, detail="PDF generation failed")
         
-        # Send email with PDF
+        # Queue email with PDF (sent by the email outbox)
         email_result = await send_mini_analysis_email(
+            get_db(),
             email=request.email,
             brand_name=request.brandName,
             pdf_bytes=pdf_bytes,
-            language=request.language
+            language=request.language,
+            event={"request_id": request_id, "source": "send_pdf_button"}
         )
         
         if not email_result["success"]:
             error_msg = email_result.get("error", "Unknown error")
             raise HTTPException(status_code=500, detail=f"Email send failed: {error_msg}")
         
-        logging.info(f"[{request_id}] Email sent successfully to {request.email}")
+        logging.info(f"[{request_id}] Email queued for {request.email}")
         
         return {
             "success": True,
-            "message": "Email sent successfully"
+            "queued": True,
+            "message": "Email queued for sending"
         }
         
     except HTTPException:
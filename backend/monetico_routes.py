@@ -24,7 +24,6 @@ Production-ready with signature verification, webhooks, payment tracking
 from fastapi import APIRouter, HTTPException, Request, Depends, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional, Dict, Any
 from datetime import datetime, timezone
 import os
@@ -34,29 +33,12 @@ import hashlib
 import hmac
 from bson import ObjectId
 
+from database import get_db, get_database
 from models.invoice_models import Payment, PaymentStatus
 
 router = APIRouter(prefix="/api/monetico")
 security = HTTPBearer()
 
-# MongoDB
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
-
-mongo_client = None
-db = None
-
-def get_db():
-    global mongo_client, db
-    if db is None and mongo_url:
-        mongo_client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        db = mongo_client[db_name]
-    return db
-
 # JWT
 JWT_SECRET = os.getenv('JWT_SECRET')
 JWT_ALGORITHM = 'HS256'
@@ -209,7 +191,7 @@ async def get_monetico_config():
 
 
 @router.post("/init-payment")
-async def init_payment_public(payment_request: PaymentInitRequest):
+async def init_payment_public(payment_request: PaymentInitRequest, current_db=Depends(get_database)):
     """
     Public endpoint to initiate a Monetico payment (for pack purchases)
     No authentication required
@@ -220,10 +202,6 @@ async def init_payment_public(payment_request: PaymentInitRequest):
             detail="Le paiement Monetico n'est pas encore configuré. Contactez-nous directement à israel.growth.venture@gmail.com"
         )
     
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Generate payment reference
     payment_reference = f"{payment_request.pack_id.upper()}-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
     
@@ -292,7 +270,8 @@ async def init_payment_public(payment_request: PaymentInitRequest):
 @router.post("/init")
 async def init_payment(
     payment_request: PaymentInitRequest,
-    user: Dict = Depends(get_current_user)
+    user: Dict = Depends(get_current_user),
+    current_db=Depends(get_database)
 ):
     """
     Initiate a Monetico payment (admin authenticated)
@@ -304,12 +283,8 @@ async def init_payment(
             detail="Monetico payment not configured. Please set MONETICO_TPE and MONETICO_KEY environment variables."
         )
     
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Use the public endpoint logic
-    return await init_payment_public(payment_request)
+    return await init_payment_public(payment_request, current_db)
     
     # Timeline event
     await current_db.timeline_events.insert_one({
@@ -465,13 +440,10 @@ async def monetico_notify(request: Request):
 @router.get("/payment/{payment_id}")
 async def get_payment_status(
     payment_id: str,
-    user: Dict = Depends(get_current_user)
+    user: Dict = Depends(get_current_user),
+    current_db=Depends(get_database)
 ):
     """Get payment status"""
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     payment = await current_db.payments.find_one({"payment_id": payment_id})
     
     if not payment:
@@ -487,13 +459,10 @@ async def list_payments(
     user: Dict = Depends(get_current_user),
     status: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    current_db=Depends(get_database)
 ):
     """List payments"""
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     query = {}
     if status:
         query["status"] = status
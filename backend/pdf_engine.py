@@ -0,0 +1,608 @@
+"""
+PDF Rendering Engine for Israel Growth Venture
+Single ReportLab layer shared by every generated document (mini-analysis,
+analysis report, invoice, AI insight). Set up once per process, reused by every render:
+- Hebrew TTF (DejaVuSans) registered once as a font family - ReportLab embeds
+  only the glyphs a document uses (subset) when it is written
+- paragraph style sets for fr / en / he built once (no getSampleStyleSheet() per render)
+- BiDi shaping memoized for short repeated strings (titles, labels, footers)
+
+Builders are module-level functions returning PDF bytes, so they can run in
+the PDF executor worker processes (pdf_executor.render).
+"""
+
+from functools import lru_cache
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+import logging
+import os
+import threading
+import traceback
+
+from fastapi import HTTPException
+
+import letterhead
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.lib.units import cm, inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT, TA_JUSTIFY
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.lib.fonts import addMapping
+    PDF_AVAILABLE = True
+except ImportError as e:
+    logging.warning(f"reportlab not available - PDF generation will fail: {e}")
+    PDF_AVAILABLE = False
+
+# BiDi support for Hebrew/Arabic RTL text
+try:
+    from bidi.algorithm import get_display
+    import arabic_reshaper
+    BIDI_AVAILABLE = True
+except ImportError:
+    BIDI_AVAILABLE = False
+    logging.warning("⚠️ BiDi libraries not available - Hebrew/Arabic RTL may not render correctly")
+
+LANGUAGES = ("fr", "en", "he")
+
+# Bump when a builder's layout or styles change (part of the render cache key)
+TEMPLATE_VERSION = "2026.10.1"
+
+HEBREW_FONT = 'HebrewFont'
+HEBREW_FONT_BOLD = 'HebrewFont-Bold'
+
+# Hebrew font - DejaVuSans (pre-installed on most Linux systems, excellent Hebrew support)
+FONT_PATHS = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    '/System/Library/Fonts/Supplemental/DejaVuSans.ttf',  # macOS
+    'C:\\Windows\\Fonts\\DejaVuSans.ttf'  # Windows (dev)
+]
+
+# Shaped strings kept in memory; longer texts (analysis paragraphs) are never repeated
+HEBREW_SHAPING_CACHE_SIZE = int(os.getenv('PDF_HEBREW_SHAPING_CACHE_SIZE', '2048'))
+HEBREW_SHAPING_CACHE_MAX_CHARS = 300
+
+HEBREW_FONT_AVAILABLE = False
+HEBREW_BOLD_AVAILABLE = False
+
+_stylesheets: Dict[str, Any] = {}
+_stylesheets_lock = threading.Lock()
+
+
+def _register_fonts():
+    """Register the Hebrew TTF (regular + bold when present) once per process, as one font family"""
+    global HEBREW_FONT_AVAILABLE, HEBREW_BOLD_AVAILABLE
+    try:
+        for font_path in FONT_PATHS:
+            if os.path.exists(font_path):
+                pdfmetrics.registerFont(TTFont(HEBREW_FONT, font_path))
+                HEBREW_FONT_AVAILABLE = True
+                bold_path = font_path.replace('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf')
+                if os.path.exists(bold_path):
+                    pdfmetrics.registerFont(TTFont(HEBREW_FONT_BOLD, bold_path))
+                    HEBREW_BOLD_AVAILABLE = True
+                bold = HEBREW_FONT_BOLD if HEBREW_BOLD_AVAILABLE else HEBREW_FONT
+                # <b>/<i> markup in Hebrew paragraphs (no italic face: regular glyphs)
+                addMapping(HEBREW_FONT, 0, 0, HEBREW_FONT)
+                addMapping(HEBREW_FONT, 0, 1, HEBREW_FONT)
+                addMapping(HEBREW_FONT, 1, 0, bold)
+                addMapping(HEBREW_FONT, 1, 1, bold)
+                logging.info(f"✅ Hebrew font registered: {font_path} (bold={HEBREW_BOLD_AVAILABLE})")
+                break
+
+        if not HEBREW_FONT_AVAILABLE:
+            logging.error("❌ DejaVuSans font not found - Hebrew PDFs will show squares")
+
+    except Exception as e:
+        logging.error(f"❌ Could not setup Hebrew font: {e}")
+        logging.error(traceback.format_exc())
+
+
+if PDF_AVAILABLE:
+    _register_fonts()
+
+
+# ==========================================
+# HEBREW TEXT
+# ==========================================
+
+def _shape(text: str) -> str:
+    try:
+        # Reshape characters then convert to visual RTL display order
+        return get_display(arabic_reshaper.reshape(text))
+    except Exception as e:
+        logging.warning(f"Hebrew BiDi conversion failed: {e}")
+        return text
+
+
+_shape_cached = lru_cache(maxsize=HEBREW_SHAPING_CACHE_SIZE)(_shape)
+
+
+def prepare_hebrew_text(text: str) -> str:
+    """
+    Prepare Hebrew text for PDF rendering with BiDi
+
+    CRITICAL: ReportLab alignment=TA_RIGHT only aligns text, does NOT reverse letters!
+    Hebrew letters in logical order appear BACKWARDS without BiDi processing.
+
+    SOLUTION from commit 458cc92 (WORKING):
+      1. arabic_reshaper.reshape() - contextual letter forms
+      2. get_display() - reverses letters to visual RTL order
+      3. alignment=TA_RIGHT - aligns text to right
+      4. NO wordWrap='RTL' - we don't use this parameter
+
+    This gives correct Hebrew: letters right-to-left, words right-to-left, aligned right.
+    Short strings (titles, labels, footers) are shaped once and memoized.
+    """
+    if not BIDI_AVAILABLE:
+        return text
+    if len(text) <= HEBREW_SHAPING_CACHE_MAX_CHARS:
+        return _shape_cached(text)
+    return _shape(text)
+
+
+def display_text(text: str, language: str) -> str:
+    """Text in display order for the document language (BiDi for Hebrew only)"""
+    return prepare_hebrew_text(text) if language == "he" else text
+
+
+# ==========================================
+# STYLES
+# ==========================================
+
+def _build_stylesheet(language: str):
+    """Every paragraph style used by the builders, for one language"""
+    styles = getSampleStyleSheet()
+    hebrew = language == "he" and HEBREW_FONT_AVAILABLE
+    if language == "he" and not hebrew:
+        logging.warning("Hebrew font not available - PDF will show squares")
+
+    if hebrew:
+        # Base styles switched to the Hebrew family: every derived style inherits it
+        for name in ('Normal', 'BodyText', 'Italic', 'Heading1', 'Heading2', 'Heading3'):
+            styles[name].fontName = HEBREW_FONT_BOLD if name.startswith('Heading') and HEBREW_BOLD_AVAILABLE else HEBREW_FONT
+
+    rtl = language == "he"
+
+    # Mini-analysis (letterhead on the first page)
+    if hebrew:
+        styles.add(ParagraphStyle('MiniTitle', parent=styles['Heading2'], fontName=HEBREW_FONT,
+                                  fontSize=16, leading=22, alignment=TA_RIGHT))
+        styles.add(ParagraphStyle('MiniBody', parent=styles['Normal'], fontSize=11, leading=16,
+                                  alignment=TA_RIGHT))
+        styles.add(ParagraphStyle('MiniFooter', parent=styles['Normal'], fontSize=9, leading=12,
+                                  textColor=colors.HexColor('#4b5563'), alignment=TA_CENTER))
+    else:
+        styles.add(ParagraphStyle('MiniTitle', parent=styles['Heading2']))
+        styles.add(ParagraphStyle('MiniBody', parent=styles['Normal']))
+        styles.add(ParagraphStyle('MiniFooter', parent=styles['Normal'], fontSize=9,
+                                  textColor=colors.HexColor('#4b5563'), alignment=TA_CENTER))
+
+    # Analysis report (/pdf/generate, letterhead on every page)
+    styles.add(ParagraphStyle('ReportBrand', parent=styles['Heading2'], fontSize=18, spaceAfter=20,
+                              alignment=TA_RIGHT if rtl else TA_CENTER))
+    styles.add(ParagraphStyle('ReportBody', parent=styles['BodyText'], fontSize=11, leading=16,
+                              alignment=TA_RIGHT if rtl else TA_JUSTIFY, spaceAfter=12))
+    styles.add(ParagraphStyle('ReportMeta', parent=styles['Normal'], alignment=TA_RIGHT if rtl else TA_LEFT))
+    styles.add(ParagraphStyle('ReportFooter', parent=styles['Normal'], fontSize=9, textColor='#6b7280',
+                              alignment=TA_CENTER))
+
+    # Invoice
+    styles.add(ParagraphStyle('InvoiceTitle', parent=styles['Heading1'], fontSize=24,
+                              textColor=colors.HexColor('#1e40af'), spaceAfter=30, alignment=TA_CENTER))
+    styles.add(ParagraphStyle('InvoiceHeader', parent=styles['Normal'], fontSize=10,
+                              textColor=colors.HexColor('#4b5563')))
+    styles.add(ParagraphStyle('InvoiceText', parent=styles['Normal'], alignment=TA_RIGHT if rtl else TA_LEFT))
+
+    # AI insight (English document with the Hebrew tagline)
+    styles.add(ParagraphStyle('InsightTitle', parent=styles['Heading1'], fontSize=24, textColor='#1e40af',
+                              spaceAfter=12, alignment=TA_CENTER))
+    styles.add(ParagraphStyle('InsightSubtitle', parent=styles['Normal'], fontSize=12, textColor='#6b7280',
+                              spaceAfter=20, alignment=TA_CENTER))
+    styles.add(ParagraphStyle('InsightHebrew', parent=styles['Normal'], fontSize=10, textColor='#6b7280',
+                              spaceAfter=20, alignment=TA_CENTER,
+                              **({'fontName': HEBREW_FONT} if HEBREW_FONT_AVAILABLE else {})))
+    styles.add(ParagraphStyle('InsightBody', parent=styles['Normal'], fontSize=11, leading=16,
+                              spaceAfter=12, alignment=TA_LEFT))
+    styles.add(ParagraphStyle('InsightFooter', parent=styles['Normal'], fontSize=9, textColor='#9ca3af',
+                              alignment=TA_CENTER))
+    return styles
+
+
+def stylesheet(language: str):
+    """Style set of a language, built on first use then shared (styles are never mutated by renders)"""
+    language = language if language in LANGUAGES else "fr"
+    styles = _stylesheets.get(language)
+    if styles is None:
+        with _stylesheets_lock:
+            styles = _stylesheets.get(language)
+            if styles is None:
+                styles = _stylesheets[language] = _build_stylesheet(language)
+    return styles
+
+
+def table_fonts(language: str) -> Tuple[str, str]:
+    """(regular, bold) font names for TableStyle commands"""
+    if language == "he" and HEBREW_FONT_AVAILABLE:
+        return HEBREW_FONT, HEBREW_FONT_BOLD if HEBREW_BOLD_AVAILABLE else HEBREW_FONT
+    return 'Helvetica', 'Helvetica-Bold'
+
+
+def warm():
+    """Build every style set and parse the letterhead (PDF worker spawn / startup)"""
+    if not PDF_AVAILABLE:
+        return
+    for language in LANGUAGES:
+        stylesheet(language)
+    letterhead.load()
+
+
+def engine_status() -> Dict[str, Any]:
+    shaping = _shape_cached.cache_info()
+    return {
+        "pdf_available": PDF_AVAILABLE,
+        "bidi_available": BIDI_AVAILABLE,
+        "hebrew_font": HEBREW_FONT_AVAILABLE,
+        "hebrew_bold": HEBREW_BOLD_AVAILABLE,
+        "stylesheets": sorted(_stylesheets),
+        "shaping_cache": {
+            "hits": shaping.hits,
+            "misses": shaping.misses,
+            "size": shaping.currsize,
+            "max_size": shaping.maxsize,
+        },
+    }
+
+
+# ==========================================
+# DOCUMENT BUILDERS
+# ==========================================
+
+def build_mini_analysis_pdf(brand_name: str, analysis_text: str, language: str = "fr") -> bytes:
+    """Mini-analysis PDF with the IGV letterhead on the first page"""
+    if not PDF_AVAILABLE:
+        raise Exception("PDF generation not available - reportlab not installed")
+
+    styles = stylesheet(language)
+    title_style = styles['MiniTitle']
+    normal_style = styles['MiniBody']
+    footer_style = styles['MiniFooter']
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        topMargin=0.5*cm,
+        bottomMargin=2*cm,
+        leftMargin=2*cm,
+        rightMargin=2*cm
+    )
+    story = []
+
+    # Leave space for the letterhead (drawn by the page callback)
+    story.append(Spacer(1, 5*cm))
+
+    # Title
+    title_text = {
+        "fr": f"Mini-Analyse de Marché - {brand_name}",
+        "en": f"Market Mini-Analysis - {brand_name}",
+        "he": f"מיני-אנליזה שוק - {brand_name}"
+    }.get(language, f"Mini-Analyse de Marché - {brand_name}")
+
+    story.append(Paragraph(display_text(title_text, language), title_style))
+    story.append(Spacer(1, 0.5*cm))
+
+    # Date
+    date_label = {
+        "fr": "Généré le:",
+        "en": "Generated on:",
+        "he": "נוצר בתאריך:"
+    }.get(language, "Généré le:")
+
+    date_text = f"<i>{display_text(date_label, language)} {datetime.now(timezone.utc).strftime('%d/%m/%Y')}</i>"
+    story.append(Paragraph(date_text, normal_style))
+    story.append(Spacer(1, 1*cm))
+
+    # Analysis content
+    paragraphs = analysis_text.split('\n\n')
+    for para in paragraphs:
+        if para.strip():
+            display_para = display_text(para, language)
+
+            if para.strip().startswith('-') or para.strip().startswith('•'):
+                lines = display_para.split('\n')
+                for line in lines:
+                    if line.strip():
+                        story.append(Paragraph(line.strip(), normal_style))
+                story.append(Spacer(1, 0.3*cm))
+            else:
+                story.append(Paragraph(display_para.strip(), normal_style))
+                story.append(Spacer(1, 0.5*cm))
+
+    # Footer
+    story.append(Spacer(1, 1*cm))
+    footer_text = {
+        "fr": "Ce document est une analyse préliminaire générée par IA. Pour un accompagnement complet, contactez-nous.",
+        "en": "This document is a preliminary AI-generated analysis. For complete support, contact us.",
+        "he": "מסמך זה הוא ניתוח ראשוני שנוצר על ידי AI. לליווי מלא, צור איתנו קשר."
+    }.get(language, "Ce document est une analyse préliminaire générée par IA.")
+
+    story.append(Paragraph(f"<i>{display_text(footer_text, language)}</i>", footer_style))
+
+    # Single pass: IGV letterhead (parsed once) drawn on the first page
+    doc.build(story, onFirstPage=letterhead.draw_on_page)
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+
+    logging.info(f"✅ PDF with IGV header ({len(pdf_bytes)} bytes)")
+    return pdf_bytes
+
+
+def build_analysis_report_pdf(brand_name: str, analysis: str, language: str) -> bytes:
+    """Analysis report (/pdf/generate): IGV letterhead on every page, no fallback without it"""
+    styles = stylesheet(language)
+    brand_style = styles['ReportBrand']
+    body_style = styles['ReportBody']
+    footer_style = styles['ReportFooter']
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=120,  # Extra space for the letterhead
+        bottomMargin=18
+    )
+    elements = []
+
+    # Header (multilingual)
+    title_text = {
+        'fr': 'Mini-Analyse IGV',
+        'en': 'IGV Mini-Analysis',
+        'he': 'מיני-אנליזה IGV'
+    }.get(language, 'Mini-Analyse IGV')
+
+    elements.append(Paragraph(display_text(title_text, language), brand_style))
+    elements.append(Spacer(1, 0.2*inch))
+    elements.append(Paragraph(f"<b>{display_text(brand_name, language)}</b>", brand_style))
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Date
+    date_str = datetime.now().strftime('%d/%m/%Y')
+    elements.append(Paragraph(f"Date: {date_str}", styles['ReportMeta']))
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Analysis content
+    paragraphs = analysis.split('\n\n')
+    for para in paragraphs:
+        if para.strip():
+            # Escape HTML special characters (after BiDi reordering, so entities stay intact)
+            para_escaped = display_text(para, language).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            elements.append(Paragraph(para_escaped, body_style))
+            elements.append(Spacer(1, 0.1*inch))
+
+    # Footer
+    elements.append(Spacer(1, 0.5*inch))
+    elements.append(Paragraph("Israel Growth Venture", footer_style))
+    elements.append(Paragraph("www.israelgrowthventure.com", footer_style))
+    elements.append(Paragraph("israel.growth.venture@gmail.com", footer_style))
+
+    # MISSION C.4 & C.5: HEADER ON EVERY PAGE (NO FALLBACK)
+    if letterhead.load() is None:
+        logging.error(f"❌ HEADER_PATH_USED: {letterhead.LETTERHEAD_PATH}")
+        logging.error("❌ This is a CRITICAL error - PDF generation ABORTED")
+        raise HTTPException(status_code=500, detail="PDF header file missing or corrupted.")
+
+    # Single pass (letterhead form drawn by the page callbacks)
+    doc.build(elements, onFirstPage=letterhead.draw_on_page, onLaterPages=letterhead.draw_on_page)
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+
+    # MISSION C.4: LOG HEADER SUCCESS
+    logging.info(f"HEADER_DRAW_OK pages={doc.page}")
+
+    return pdf_bytes
+
+
+def build_invoice_pdf(invoice_data: Dict[str, Any], language: str = "fr",
+                      company: Optional[Dict[str, str]] = None) -> bytes:
+    """Invoice PDF with the company header and VAT 18% (company: name / address / email / website)"""
+    if not PDF_AVAILABLE:
+        raise HTTPException(status_code=500, detail="PDF generation not available")
+
+    company = company or {}
+    styles = stylesheet(language)
+    text_style = styles['InvoiceText']
+    regular_font, bold_font = table_fonts(language)
+
+    def label(text: str) -> str:
+        return display_text(text, language)
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm)
+    story = []
+
+    # Header: Company Info
+    story.append(Paragraph(company.get("name", ""), styles['InvoiceTitle']))
+    story.append(Paragraph(
+        f"{company.get('address', '')} | {company.get('email', '')} | {company.get('website', '')}",
+        styles['InvoiceHeader']
+    ))
+    story.append(Spacer(1, 1*cm))
+
+    # Invoice title
+    invoice_title = {
+        "fr": "FACTURE",
+        "en": "INVOICE",
+        "he": "חשבונית"
+    }.get(language, "FACTURE")
+
+    story.append(Paragraph(f"<b>{label(invoice_title)} {invoice_data['invoice_number']}</b>", styles['Heading2']))
+    story.append(Spacer(1, 0.5*cm))
+
+    # Invoice details table
+    invoice_info = [
+        [label({
+            "fr": "Date:",
+            "en": "Date:",
+            "he": "תאריך:"
+        }.get(language, "Date:")), datetime.fromisoformat(invoice_data['invoice_date'].replace('Z', '+00:00')).strftime("%d/%m/%Y")],
+        [label({
+            "fr": "Échéance:",
+            "en": "Due date:",
+            "he": "תאריך יעד:"
+        }.get(language, "Échéance:")), datetime.fromisoformat(invoice_data['due_date'].replace('Z', '+00:00')).strftime("%d/%m/%Y") if invoice_data.get('due_date') else "-"],
+    ]
+
+    info_table = Table(invoice_info, colWidths=[4*cm, 6*cm])
+    info_table.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), regular_font, 9),
+        ('FONT', (0, 0), (0, -1), bold_font, 9),
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+    ]))
+    story.append(info_table)
+    story.append(Spacer(1, 1*cm))
+
+    # Client info
+    story.append(Paragraph(f"<b>{label({'fr': 'Facturé à:', 'en': 'Billed to:', 'he': 'לתשומת לב:'}.get(language, 'Facturé à:'))}</b>",
+                           text_style))
+    story.append(Paragraph(label(invoice_data['client_name']), text_style))
+    if invoice_data.get('client_company'):
+        story.append(Paragraph(label(invoice_data['client_company']), text_style))
+    if invoice_data.get('client_email'):
+        story.append(Paragraph(invoice_data['client_email'], text_style))
+    story.append(Spacer(1, 1*cm))
+
+    # Items table
+    items_header = {
+        "fr": ["Description", "Qté", "Prix unitaire", "Remise", "HT", "TVA (18%)", "Total TTC"],
+        "en": ["Description", "Qty", "Unit price", "Discount", "Subtotal", "VAT (18%)", "Total"],
+        "he": ["תיאור", "כמות", "מחיר יחידה", "הנחה", "סכום ביניים", "מע\"מ (18%)", "סה\"כ"]
+    }.get(language, ["Description", "Qté", "Prix unitaire", "Remise", "HT", "TVA (18%)", "Total TTC"])
+
+    items_data = [[label(header) for header in items_header]]
+
+    for item in invoice_data['items']:
+        discount_text = f"{item.get('discount_percent', 0)}%" if item.get('discount_percent', 0) > 0 else "-"
+        items_data.append([
+            label(item['description']),
+            str(item['quantity']),
+            f"{item['unit_price']} {invoice_data['currency']}",
+            discount_text,
+            f"{item.get('subtotal', 0):.2f}",
+            f"{item.get('tax_amount', 0):.2f}",
+            f"{item.get('total', 0):.2f}"
+        ])
+
+    items_table = Table(items_data, colWidths=[6*cm, 1.5*cm, 2.5*cm, 1.5*cm, 2*cm, 2*cm, 2*cm])
+    items_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), bold_font),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), regular_font),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+        ('ALIGN', (0, 1), (0, -1), 'RIGHT' if language == "he" else 'LEFT'),
+    ]))
+    story.append(items_table)
+    story.append(Spacer(1, 1*cm))
+
+    # Totals
+    totals_label = {
+        "fr": ["Sous-total HT:", "TVA (18%):", "Total TTC:"],
+        "en": ["Subtotal:", "VAT (18%):", "Total:"],
+        "he": ["סכום ביניים:", "מע\"מ (18%):", "סה\"כ:"]
+    }.get(language, ["Sous-total HT:", "TVA (18%):", "Total TTC:"])
+
+    totals_data = [
+        [label(totals_label[0]), f"{invoice_data['subtotal']:.2f} {invoice_data['currency']}"],
+        [label(totals_label[1]), f"{invoice_data['tax_amount']:.2f} {invoice_data['currency']}"],
+        [label(totals_label[2]), f"{invoice_data['total_amount']:.2f} {invoice_data['currency']}"],
+    ]
+
+    totals_table = Table(totals_data, colWidths=[12*cm, 4*cm])
+    totals_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('FONT', (0, 0), (-1, -1), regular_font, 10),
+        ('FONT', (0, -1), (-1, -1), bold_font, 12),
+        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+    ]))
+    story.append(totals_table)
+    story.append(Spacer(1, 1*cm))
+
+    # Notes
+    if invoice_data.get('notes'):
+        story.append(Paragraph(f"<b>{label({'fr': 'Notes:', 'en': 'Notes:', 'he': 'הערות:'}.get(language, 'Notes:'))}</b>",
+                               text_style))
+        story.append(Paragraph(label(invoice_data['notes']), text_style))
+
+    doc.build(story)
+
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+
+    return pdf_bytes
+
+
+def build_ai_insight_pdf(email: str, sector: str, analysis: str) -> bytes:
+    """AI insight PDF with IGV branding (English)"""
+    styles = stylesheet("en")
+    body_style = styles['InsightBody']
+    footer_style = styles['InsightFooter']
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                           rightMargin=0.75*inch, leftMargin=0.75*inch,
+                           topMargin=0.75*inch, bottomMargin=0.75*inch)
+    story = []
+
+    # Header avec branding
+    story.append(Paragraph("Israel Growth Venture", styles['InsightTitle']))
+    story.append(Paragraph(prepare_hebrew_text("ייעוץ בנושא התרחבות ופיתוח פעילות בישראל"), styles['InsightHebrew']))
+    story.append(Spacer(1, 0.3*inch))
+
+    story.append(Paragraph("AI-Generated Preliminary Market Insight", styles['InsightSubtitle']))
+    story.append(Spacer(1, 0.2*inch))
+
+    # Metadata
+    story.append(Paragraph(f"<b>Sector:</b> {sector}", body_style))
+    story.append(Paragraph(f"<b>Generated for:</b> {email}", body_style))
+    story.append(Paragraph(f"<b>Date:</b> {datetime.now().strftime('%B %d, %Y')}", body_style))
+    story.append(Spacer(1, 0.3*inch))
+
+    # Analysis content
+    story.append(Paragraph("<b>Your Israel Market Insight:</b>", styles['Heading2']))
+    story.append(Spacer(1, 0.1*inch))
+
+    paragraphs = analysis.split('\n\n')
+    for para in paragraphs:
+        if para.strip():
+            story.append(Paragraph(para.strip(), body_style))
+            story.append(Spacer(1, 0.1*inch))
+
+    # Footer
+    story.append(Spacer(1, 0.5*inch))
+    story.append(Paragraph("© Israel Growth Venture", footer_style))
+    story.append(Paragraph("israelgrowthventure.com", footer_style))
+
+    doc.build(story)
+
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+
+    return pdf_bytes
@@ -0,0 +1,179 @@
+"""
+PDF Rendering Executor for Israel Growth Venture
+ReportLab layout is CPU-bound: a long Hebrew analysis holds
+the GIL for hundreds of milliseconds. Every PDF-producing route awaits render(),
+which runs the renderer in a ProcessPoolExecutor so rendering scales across
+cores instead of serializing all traffic on the event loop.
+
+- workers are warm: pdf_engine fonts registered, style sets built, letterhead parsed at spawn
+- renderers must be module-level functions (pickled by reference)
+- PDF_EXECUTOR_WORKERS=0 renders in a thread instead (dev / single-core hosts)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+PDF_EXECUTOR_WORKERS = int(os.getenv('PDF_EXECUTOR_WORKERS', str(min(2, os.cpu_count() or 1))))
+# "spawn": workers do not inherit the server's threads / sockets (Motor, SDK clients)
+PDF_EXECUTOR_START_METHOD = os.getenv('PDF_EXECUTOR_START_METHOD', 'spawn')
+# Modules imported by every worker at spawn (font registration, ReportLab caches)
+WARM_MODULES = ("pdf_engine", "invoice_routes")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_in_flight = 0
+
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "pool_restarts": 0,
+    "max_queue_depth": 0,
+    "render_ms_total": 0.0,
+    "render_ms_max": 0.0,
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+}
+
+
+class RenderError(Exception):
+    """HTTPException raised inside a worker (HTTPException itself does not pickle)"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _warm_worker():
+    """Worker initializer: import the renderers, build the style sets and parse the letterhead once, so the first job pays no setup cost"""
+    import importlib
+    for module in WARM_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logging.warning(f"PDF worker {os.getpid()}: {module} not loaded ({e})")
+    import pdf_engine
+    pdf_engine.warm()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _run(func: Callable, args: tuple, kwargs: dict):
+    """Runs in the worker: (result, render ms)"""
+    started = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    except HTTPException as e:
+        raise RenderError(e.status_code, e.detail)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def get_executor() -> Optional[ProcessPoolExecutor]:
+    """Lazy initialization of the PDF process pool (None when PDF_EXECUTOR_WORKERS=0)"""
+    global _executor
+    if _executor is None and PDF_EXECUTOR_WORKERS > 0:
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_EXECUTOR_WORKERS,
+            mp_context=multiprocessing.get_context(PDF_EXECUTOR_START_METHOD),
+            initializer=_warm_worker
+        )
+        logging.info(f"✅ PDF executor started (workers={PDF_EXECUTOR_WORKERS}, start={PDF_EXECUTOR_START_METHOD})")
+    return _executor
+
+
+async def _warm_up():
+    executor = get_executor()
+    if executor is None:
+        # Thread mode: renderers run in this process
+        await asyncio.to_thread(_warm_worker)
+        return
+    try:
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[loop.run_in_executor(executor, _ping) for _ in range(PDF_EXECUTOR_WORKERS)])
+        logging.info(f"✅ PDF workers warm: {sorted(set(pids))}")
+    except Exception as e:
+        logging.error(f"❌ PDF executor warm-up failed: {str(e)}")
+
+
+def start():
+    """Spawn every worker now (startup, in the background) instead of on the first PDF request"""
+    asyncio.ensure_future(_warm_up())
+
+
+def shutdown_executor():
+    """Stop the process pool (called on app shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def render(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a PDF renderer off the event loop and return its result.
+    HTTPExceptions raised by the renderer are re-raised as such.
+    """
+    global _in_flight, _executor
+    _stats["submitted"] += 1
+    _in_flight += 1
+    _stats["max_queue_depth"] = max(_stats["max_queue_depth"], _in_flight - max(PDF_EXECUTOR_WORKERS, 1))
+    started = time.perf_counter()
+    try:
+        executor = get_executor()
+        if executor is None:
+            result, render_ms = await asyncio.to_thread(_run, func, args, kwargs)
+        else:
+            result, render_ms = await asyncio.get_running_loop().run_in_executor(executor, _run, func, args, kwargs)
+    except RenderError as e:
+        _stats["failed"] += 1
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except BrokenProcessPool:
+        # A worker died (OOM kill...): the next render gets a fresh pool
+        _stats["failed"] += 1
+        _stats["pool_restarts"] += 1
+        logging.error("❌ PDF worker pool broken - restarting")
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        raise
+    except Exception:
+        _stats["failed"] += 1
+        raise
+    finally:
+        _in_flight -= 1
+
+    wait_ms = max(0.0, (time.perf_counter() - started) * 1000 - render_ms)
+    _stats["completed"] += 1
+    _stats["render_ms_total"] += render_ms
+    _stats["render_ms_max"] = max(_stats["render_ms_max"], render_ms)
+    _stats["wait_ms_total"] += wait_ms
+    _stats["wait_ms_max"] = max(_stats["wait_ms_max"], wait_ms)
+    return result
+
+
+def executor_status() -> Dict[str, Any]:
+    """Admin view: pool size, current queue depth, render / queue wait times"""
+    completed = _stats["completed"]
+    return {
+        "workers": PDF_EXECUTOR_WORKERS,
+        "mode": "process" if PDF_EXECUTOR_WORKERS > 0 else "thread",
+        "start_method": PDF_EXECUTOR_START_METHOD,
+        "started": _executor is not None,
+        "in_flight": _in_flight,
+        "queue_depth": max(0, _in_flight - max(PDF_EXECUTOR_WORKERS, 1)),
+        "stats": {
+            **{k: round(v, 1) if isinstance(v, float) else v for k, v in _stats.items()},
+            "render_ms_avg": round(_stats["render_ms_total"] / completed, 1) if completed else None,
+            "wait_ms_avg": round(_stats["wait_ms_total"] / completed, 1) if completed else None,
+        },
+    }
@@ -0,0 +1,263 @@
+"""
+PDF Artifact Store for Israel Growth Venture
+Generated PDFs are stored once, as binary, addressed by their sha256.
+Documents (mini_analyses, leads) only keep a reference
+    "pdf": {"sha256", "size", "store", "created_at"}
+plus the URL of the download endpoint (GET /api/mini-analysis/{id}/pdf?token=...),
+instead of a base64 data URL copied into every document. The download is public:
+the token (HMAC of the analysis id, PDF_LINK_SECRET) makes the link unguessable.
+
+Backends (PDF_STORE_BACKEND):
+- gridfs (default): GridFS bucket "pdf_artifacts" of the main database, file _id = sha256
+- disk: PDF_STORE_DIR/<2 first hex chars>/<sha256>.pdf (needs a persistent volume)
+Identical PDFs are stored once (content addressing).
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import hmac
+import os
+import re
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+PDF_STORE_BACKEND = os.getenv('PDF_STORE_BACKEND', 'gridfs').lower()
+PDF_STORE_DIR = Path(os.getenv('PDF_STORE_DIR', '/var/data/igv-pdf'))
+# Prefix of the download URLs stored on documents ('' = relative to the API host)
+PDF_PUBLIC_BASE_URL = os.getenv('PDF_PUBLIC_BASE_URL', '').rstrip('/')
+# Signs the download links (defaults to JWT_SECRET; changing it invalidates the links already sent)
+PDF_LINK_SECRET = os.getenv('PDF_LINK_SECRET') or os.getenv('JWT_SECRET') or ''
+
+PDF_STORE_BUCKET = "pdf_artifacts"
+# GridFS chunk size and streaming read size
+CHUNK_SIZE = 256 * 1024
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+_stats = {
+    "stored": 0,
+    "deduplicated": 0,
+    "bytes_stored": 0,
+    "downloads": 0,
+    "range_requests": 0,
+    "not_modified": 0,
+    "bytes_served": 0,
+    "errors": 0,
+}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def sha256_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def pdf_link_token(analysis_id: str) -> str:
+    return hmac.new(PDF_LINK_SECRET.encode(), f"mini_analysis_pdf:{analysis_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def verify_pdf_link_token(analysis_id: str, token: Optional[str]) -> bool:
+    """False without a configured secret: unsigned links are never served"""
+    if not PDF_LINK_SECRET or not token:
+        return False
+    return hmac.compare_digest(pdf_link_token(analysis_id), token)
+
+
+def analysis_pdf_url(analysis_id: str) -> str:
+    """Signed download URL stored on mini_analyses / leads"""
+    return f"{PDF_PUBLIC_BASE_URL}/api/mini-analysis/{analysis_id}/pdf?token={pdf_link_token(analysis_id)}"
+
+
+def _bucket(current_db):
+    from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+    return AsyncIOMotorGridFSBucket(current_db, bucket_name=PDF_STORE_BUCKET, chunk_size_bytes=CHUNK_SIZE)
+
+
+def _disk_path(sha256: str) -> Path:
+    return PDF_STORE_DIR / sha256[:2] / f"{sha256}.pdf"
+
+
+def _write_disk(sha256: str, data: bytes) -> bool:
+    """Atomic write (tmp + rename); False when the file already exists"""
+    path = _disk_path(sha256)
+    if path.exists():
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+async def put(current_db, pdf_bytes: bytes, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Store a PDF (no-op when the same bytes are already stored) and return its reference"""
+    sha256 = sha256_of(pdf_bytes)
+    try:
+        if PDF_STORE_BACKEND == "disk":
+            created = await asyncio.to_thread(_write_disk, sha256, pdf_bytes)
+        else:
+            from pymongo.errors import DuplicateKeyError
+            created = False
+            if await current_db[f"{PDF_STORE_BUCKET}.files"].find_one({"_id": sha256}, {"_id": 1}) is None:
+                try:
+                    await _bucket(current_db).upload_from_stream_with_id(
+                        sha256, f"{sha256}.pdf", pdf_bytes,
+                        metadata={"content_type": "application/pdf", **(metadata or {})}
+                    )
+                    created = True
+                except DuplicateKeyError:
+                    pass  # Same PDF stored concurrently
+    except Exception:
+        _stats["errors"] += 1
+        raise
+
+    if created:
+        _stats["stored"] += 1
+        _stats["bytes_stored"] += len(pdf_bytes)
+    else:
+        _stats["deduplicated"] += 1
+
+    return {
+        "sha256": sha256,
+        "size": len(pdf_bytes),
+        "store": PDF_STORE_BACKEND,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+async def size_of(current_db, sha256: str) -> Optional[int]:
+    """Stored size in bytes, None when the PDF is not in the store"""
+    if PDF_STORE_BACKEND == "disk":
+        path = _disk_path(sha256)
+        return path.stat().st_size if path.exists() else None
+    doc = await current_db[f"{PDF_STORE_BUCKET}.files"].find_one({"_id": sha256}, {"length": 1})
+    return doc["length"] if doc else None
+
+
+async def iter_range(current_db, sha256: str, start: int, end: int) -> AsyncIterator[bytes]:
+    """Bytes start..end (inclusive) of a stored PDF, in CHUNK_SIZE pieces"""
+    remaining = end - start + 1
+    if PDF_STORE_BACKEND == "disk":
+        f = await asyncio.to_thread(open, _disk_path(sha256), 'rb')
+        try:
+            await asyncio.to_thread(f.seek, start)
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+        return
+
+    grid_out = await _bucket(current_db).open_download_stream(sha256)
+    grid_out.seek(start)
+    while remaining > 0:
+        chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def read(current_db, sha256: str) -> bytes:
+    """Whole PDF in memory (email attachments, migration checks)"""
+    size = await size_of(current_db, sha256)
+    if size is None:
+        raise FileNotFoundError(sha256)
+    return b"".join([chunk async for chunk in iter_range(current_db, sha256, 0, size - 1)])
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single "bytes=" range -> (start, end) inclusive.
+    None = serve the whole file (multi-range or unknown unit); RangeNotSatisfiable when out of bounds.
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+async def pdf_response(current_db, reference: Dict[str, Any], request: Request, filename: str) -> Optional[Response]:
+    """
+    HTTP response for a stored PDF: ETag (the sha256), Content-Length,
+    conditional GET (If-None-Match -> 304), single byte ranges (206 / 416), HEAD.
+    None when the PDF is missing from the store.
+    """
+    sha256 = reference["sha256"]
+    size = await size_of(current_db, sha256)
+    if size is None:
+        return None
+
+    etag = f'"{sha256}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Content-addressed: the bytes behind this ETag never change
+        "Cache-Control": "private, max-age=86400",
+        "Content-Disposition": f'inline; filename="{filename}"',
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            _stats["range_requests"] += 1
+
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="application/pdf")
+
+    _stats["downloads"] += 1
+    _stats["bytes_served"] += end - start + 1
+    return StreamingResponse(
+        iter_range(current_db, sha256, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/pdf",
+    )
+
+
+def store_status() -> Dict[str, Any]:
+    return {
+        "backend": PDF_STORE_BACKEND,
+        "location": str(PDF_STORE_DIR) if PDF_STORE_BACKEND == "disk" else f"GridFS:{PDF_STORE_BUCKET}",
+        "public_base_url": PDF_PUBLIC_BASE_URL or None,
+        "signed_links": bool(PDF_LINK_SECRET),
+        "stats": dict(_stats),
+    }
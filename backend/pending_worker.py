@@ -0,0 +1,407 @@
+"""
+Pending Analyses Worker for Israel Growth Venture
+In-process scheduler that drains pending_analyses (mini-analyses blocked by the Gemini quota):
+- atomic lease (find_one_and_update) so an item is processed once, expired leases are reclaimed
+- bounded concurrency
+- pauses on RESOURCE_EXHAUSTED: exponential backoff for per-minute limits,
+  until the daily reset (midnight Pacific time) for daily limits - then resumes by itself
+- full pipeline: Gemini, mini_analyses, PDF, email (queued in the email outbox), lead status
+
+Unified pending_analyses schema (legacy "queued"/form_payload items are migrated):
+    status: pending | processing | processed | failed
+    request_data, lead_id, email, brand_name, sector, language,
+    languages, languages_done (multi-language submissions: one language per lease),
+    analysis_ids {language: mini_analyses id} (set once saved: a retried lease reuses it),
+    attempts, next_attempt_at, lease_owner, lease_expires_at, last_error
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+import socket
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+import database
+import prompt_registry
+import telemetry
+from quota_governor import next_quota_reset
+
+PENDING_WORKER_ENABLED = os.getenv('PENDING_WORKER_ENABLED', 'true').lower() == 'true'
+PENDING_WORKER_CONCURRENCY = int(os.getenv('PENDING_WORKER_CONCURRENCY', '2'))
+PENDING_POLL_SECONDS = int(os.getenv('PENDING_POLL_SECONDS', '60'))
+PENDING_LEASE_SECONDS = 600
+PENDING_MAX_ATTEMPTS = 5
+# Per-minute quota errors: pause 60s, 120s, 240s... up to 1h
+QUOTA_BACKOFF_BASE_SECONDS = 60
+QUOTA_BACKOFF_MAX_SECONDS = 3600
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+_task: Optional[asyncio.Task] = None
+_paused_until: Optional[datetime] = None
+_quota_strikes = 0
+_legacy_migrated = False
+
+_stats = {
+    "processed": 0,
+    "quota_deferred": 0,
+    "retried": 0,
+    "failed": 0,
+    "last_run_at": None,
+}
+
+
+def is_daily_quota_error(error: Exception) -> bool:
+    error_str = str(error).lower().replace(" ", "")
+    return "perday" in error_str or "daily" in error_str
+
+
+def is_paused() -> bool:
+    return _paused_until is not None and _paused_until > datetime.now(timezone.utc)
+
+
+def _register_quota_error(error: Exception):
+    """Pause the whole worker - the quota is global, not per item"""
+    global _paused_until, _quota_strikes
+    now = datetime.now(timezone.utc)
+    # Concurrent items failing together count as one strike
+    if not is_paused():
+        _quota_strikes += 1
+    if is_daily_quota_error(error):
+        until = next_quota_reset(now)
+    elif getattr(error, "retry_after_seconds", None):
+        # Refused by quota_governor: it knows when the budget refills
+        until = now + timedelta(seconds=error.retry_after_seconds)
+    else:
+        until = now + timedelta(seconds=min(QUOTA_BACKOFF_BASE_SECONDS * 2 ** (_quota_strikes - 1), QUOTA_BACKOFF_MAX_SECONDS))
+    _paused_until = max(_paused_until or now, until)
+    logging.warning(f"PENDING_WORKER_PAUSED until {_paused_until.isoformat()} (quota strike {_quota_strikes})")
+
+
+async def migrate_legacy_items(current_db):
+    """One-time: admin_routes schema (status queued, form_payload, retry_count...) -> unified schema"""
+    global _legacy_migrated
+    if _legacy_migrated:
+        return
+    result = await current_db.pending_analyses.update_many(
+        {"status": "queued"},
+        {
+            "$rename": {
+                "form_payload": "request_data",
+                "retry_count": "attempts",
+                "brand": "brand_name",
+                "user_email": "email"
+            },
+            "$set": {"status": "pending", "updated_at": datetime.now(timezone.utc)}
+        }
+    )
+    _legacy_migrated = True
+    if result.modified_count:
+        logging.info(f"✅ pending_analyses: {result.modified_count} legacy 'queued' items migrated")
+
+
+async def lease_next(current_db, queue_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Atomically claim the oldest due item (or a given one) - returns the leased document"""
+    now = datetime.now(timezone.utc)
+    if queue_id:
+        query = {"_id": ObjectId(queue_id), "status": "pending"}
+    else:
+        query = {"$or": [
+            {"status": "pending", "next_attempt_at": {"$not": {"$gt": now}}},
+            # Lease of a crashed / restarted worker
+            {"status": "processing", "lease_expires_at": {"$lt": now}}
+        ]}
+
+    return await current_db.pending_analyses.find_one_and_update(
+        query,
+        {"$set": {
+            "status": "processing",
+            "lease_owner": WORKER_ID,
+            "lease_expires_at": now + timedelta(seconds=PENDING_LEASE_SECONDS),
+            "last_attempt_at": now,
+            "updated_at": now
+        }},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _request_from_item(item: Dict[str, Any]):
+    """Rebuild the MiniAnalysisRequest (request_data, or the bare /api/quota/queue-analysis fields)"""
+    import mini_analysis_routes
+
+    request_data = item.get("request_data") or {
+        "email": item.get("email"),
+        "nom_de_marque": item.get("brand_name", ""),
+        "secteur": item.get("sector") or "",
+        "language": item.get("language", "fr")
+    }
+    return mini_analysis_routes.MiniAnalysisRequest(**request_data)
+
+
+async def _saved_analysis(current_db, item: Dict[str, Any], language: str) -> Optional[Dict[str, Any]]:
+    """mini_analyses document already saved for this item and language (lease expired after persistence)"""
+    analysis_id = (item.get("analysis_ids") or {}).get(language)
+    if not analysis_id or not ObjectId.is_valid(analysis_id):
+        return None
+    return await current_db.mini_analyses.find_one({"_id": ObjectId(analysis_id)})
+
+
+async def process_item(current_db, item: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one leased item through the mini-analysis pipeline. Returns {"queue_id", "status", ...}"""
+    import mini_analysis_routes
+
+    queue_id = str(item["_id"])
+    request_id = item.get("request_id") or f"pending_{queue_id}"
+    now = datetime.now(timezone.utc)
+    release = {"lease_owner": None, "lease_expires_at": None, "updated_at": now}
+    llm_meta = {}
+
+    try:
+        request = _request_from_item(item)
+        # Multi-language items: one language per lease, in order (languages_done records progress)
+        languages = item.get("languages") or [item.get("language") or request.language or "fr"]
+        remaining = [l for l in languages if l not in item.get("languages_done", [])]
+        language = remaining[0]
+        saved_doc = await _saved_analysis(current_db, item, language)
+        if saved_doc is None:
+            telemetry.start(
+                prompt_registry.get_compiled_prompt(request.secteur, language, request.statut_alimentaire),
+                request.secteur, language
+            )
+            with telemetry.timed("generation"):
+                analysis_text = await mini_analysis_routes.call_gemini_analysis(request, language, None, request_id, llm_meta)
+            if not analysis_text or mini_analysis_routes.is_wrong_language_answer(analysis_text, language):
+                raise Exception("Invalid response from Gemini")
+
+    except Exception as e:
+        if mini_analysis_routes.is_quota_error(e):
+            # Quota errors do not consume attempts - the item waits for the pause to end
+            _register_quota_error(e)
+            await current_db.pending_analyses.update_one(
+                {"_id": item["_id"]},
+                {"$set": {**release, "status": "pending", "last_error": "quota_exhausted"}}
+            )
+            _stats["quota_deferred"] += 1
+            logging.warning(f"[{request_id}] QUEUE_RETRY: Quota still exhausted")
+            return {"queue_id": queue_id, "status": "quota_exhausted"}
+
+        attempts = item.get("attempts", 0) + 1
+        if attempts < PENDING_MAX_ATTEMPTS:
+            retry_at = now + timedelta(minutes=2 ** attempts)
+            await current_db.pending_analyses.update_one(
+                {"_id": item["_id"]},
+                {"$set": {**release, "status": "pending", "attempts": attempts, "next_attempt_at": retry_at, "last_error": str(e)[:500]}}
+            )
+            _stats["retried"] += 1
+            logging.error(f"[{request_id}] QUEUE_RETRY_LATER ({attempts}/{PENDING_MAX_ATTEMPTS}): {str(e)}")
+            return {"queue_id": queue_id, "status": "retry_scheduled", "error": str(e)[:100]}
+
+        await current_db.pending_analyses.update_one(
+            {"_id": item["_id"]},
+            {"$set": {**release, "status": "failed", "attempts": attempts, "failed_at": now, "last_error": str(e)[:500]}}
+        )
+        _stats["failed"] += 1
+        logging.error(f"[{request_id}] QUEUE_FAILED: {str(e)}")
+        return {"queue_id": queue_id, "status": "failed", "error": str(e)[:100]}
+
+    if saved_doc is not None:
+        # A previous lease saved the analysis then died: finish its steps, no second generation
+        analysis_text = saved_doc.get("response_text") or ""
+        saved = {"inserted_id": saved_doc["_id"], "analysis_id": str(saved_doc["_id"]), "lead_id": saved_doc.get("lead_id")}
+        logging.warning(f"[{request_id}] QUEUE_RESUME queue_id={queue_id} language={language} analysis_id={saved['analysis_id']}")
+    else:
+        global _quota_strikes
+        _quota_strikes = 0
+
+        # Same persistence / PDF / email steps as the live endpoint
+        brand_slug = mini_analysis_routes.normalize_brand_slug(request.nom_de_marque)
+        saved = await mini_analysis_routes.persist_mini_analysis(
+            current_db, request, language, brand_slug, analysis_text, None, request_id, llm=llm_meta
+        )
+        await current_db.pending_analyses.update_one(
+            {"_id": item["_id"]},
+            {"$set": {f"analysis_ids.{language}": saved["analysis_id"], "updated_at": datetime.now(timezone.utc)}}
+        )
+    lead_id = item.get("lead_id")
+    if lead_id and ObjectId.is_valid(lead_id):
+        saved["lead_id"] = lead_id
+        await current_db.leads.update_one(
+            {"_id": ObjectId(lead_id)},
+            {"$set": {"status": "GENERATED", "updated_at": datetime.now(timezone.utc)}}
+        )
+    await current_db.mini_analyses.update_one(
+        {"_id": saved["inserted_id"]},
+        {"$set": {"from_pending": True, "pending_id": queue_id, "original_request_id": request_id, "lead_id": saved["lead_id"]}}
+    )
+
+    if saved_doc is not None and saved_doc.get("email_outbox_id"):
+        # PDF and email already done by the previous lease
+        email_result = {"email_queued": True}
+    else:
+        pdf_result = await mini_analysis_routes.attach_mini_analysis_pdf(current_db, request, language, analysis_text, saved, request_id)
+        email_result = await mini_analysis_routes.email_mini_analysis(current_db, request, language, pdf_result["pdf_bytes"], saved, request_id)
+        if saved_doc is None:
+            await telemetry.save(current_db, saved["inserted_id"], request_id=request_id)
+
+    if len(remaining) > 1:
+        # Next language on the next lease (the item stays pending)
+        await current_db.pending_analyses.update_one(
+            {"_id": item["_id"]},
+            {"$set": {**release, "status": "pending", f"analysis_ids.{language}": saved["analysis_id"], "last_error": None},
+             "$push": {"languages_done": language}}
+        )
+        logging.info(f"[{request_id}] QUEUE_LANGUAGE_DONE queue_id={queue_id} language={language} remaining={remaining[1:]}")
+        return {"queue_id": queue_id, "status": "language_processed", "language": language,
+                "analysis_id": saved["analysis_id"], "email_queued": email_result["email_queued"]}
+
+    await current_db.pending_analyses.update_one(
+        {"_id": item["_id"]},
+        {"$set": {
+            **release,
+            "status": "processed",
+            "processed_at": datetime.now(timezone.utc),
+            "analysis_id": saved["analysis_id"],
+            "email_queued": email_result["email_queued"],
+            "last_error": None
+        }}
+    )
+
+    if saved["lead_id"]:
+        try:
+            await current_db.activities.insert_one({
+                "type": "note",
+                "subject": "Queued analysis generated",
+                "description": "Mini-analysis generated after quota reset and queued for email." if email_result["email_queued"]
+                               else "Mini-analysis generated after quota reset (email not queued).",
+                "lead_id": saved["lead_id"],
+                "metadata": {"queue_id": queue_id, "analysis_id": saved["analysis_id"]},
+                "created_at": datetime.now(timezone.utc)
+            })
+        except Exception as e:
+            logging.error(f"[{request_id}] Failed to log queue activity: {e}")
+
+    _stats["processed"] += 1
+    logging.info(f"[{request_id}] ✅ QUEUE_PROCESSED queue_id={queue_id} analysis_id={saved['analysis_id']}")
+    return {"queue_id": queue_id, "status": "processed", "analysis_id": saved["analysis_id"], "email_queued": email_result["email_queued"]}
+
+
+async def _process_leased(current_db, item: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return await process_item(current_db, item)
+    except Exception as e:
+        # Unexpected pipeline error after generation: leave the lease to expire and be retried
+        # (the analysis, once saved, is reused by the next lease)
+        logging.error(f"PENDING_WORKER error on {item.get('_id')}: {str(e)}")
+        return {"queue_id": str(item["_id"]), "status": "error", "error": str(e)[:100]}
+
+
+async def drain_once(limit: Optional[int] = None, ignore_pause: bool = False) -> Dict[str, Any]:
+    """
+    Lease and process due items with bounded concurrency until the queue is empty,
+    limit is reached or a quota error pauses the worker.
+    ignore_pause: manual trigger - try even while paused (stops at the first quota error)
+    """
+    import mini_analysis_routes
+
+    current_db = database.get_db()
+    if current_db is None or mini_analysis_routes.gemini_client is None:
+        return {"processed": 0, "failed": 0, "results": [], "skipped": "Database or Gemini not configured"}
+
+    await migrate_legacy_items(current_db)
+    _stats["last_run_at"] = datetime.now(timezone.utc)
+
+    semaphore = asyncio.Semaphore(PENDING_WORKER_CONCURRENCY)
+    tasks: List[asyncio.Task] = []
+    results: List[Dict[str, Any]] = []
+    quota_hit = asyncio.Event()
+
+    async def run(item):
+        try:
+            result = await _process_leased(current_db, item)
+            if result["status"] == "quota_exhausted":
+                quota_hit.set()
+            results.append(result)
+        finally:
+            semaphore.release()
+
+    leased = 0
+    while limit is None or leased < limit:
+        await semaphore.acquire()
+        if quota_hit.is_set() or (is_paused() and not ignore_pause):
+            semaphore.release()
+            break
+        item = await lease_next(current_db)
+        if item is None:
+            semaphore.release()
+            break
+        leased += 1
+        tasks.append(asyncio.ensure_future(run(item)))
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    processed = len([r for r in results if r["status"] == "processed"])
+    return {"processed": processed, "failed": len(results) - processed, "results": results}
+
+
+async def process_queue_item(queue_id: str) -> Dict[str, Any]:
+    """Process one specific pending item now (admin trigger)"""
+    current_db = database.get_db()
+    await migrate_legacy_items(current_db)
+    item = await lease_next(current_db, queue_id=queue_id)
+    if item is None:
+        return {"queue_id": queue_id, "status": "not_pending"}
+    return await _process_leased(current_db, item)
+
+
+async def _run_loop():
+    while True:
+        try:
+            if is_paused():
+                logging.info(f"PENDING_WORKER paused until {_paused_until.isoformat()}")
+            else:
+                summary = await drain_once()
+                if summary.get("results"):
+                    logging.info(f"PENDING_WORKER run: {summary['processed']} processed, {summary['failed']} not processed")
+        except Exception as e:
+            logging.error(f"PENDING_WORKER loop error: {str(e)}")
+
+        # Wake up right after a pause ends, or at the next poll
+        delay = PENDING_POLL_SECONDS
+        if is_paused():
+            delay = max(1, min(delay * 10, (_paused_until - datetime.now(timezone.utc)).total_seconds()))
+        await asyncio.sleep(delay)
+
+
+def start():
+    """Start the scheduler loop (app startup)"""
+    global _task
+    if not PENDING_WORKER_ENABLED or (_task is not None and not _task.done()):
+        return
+    _task = asyncio.ensure_future(_run_loop())
+    logging.info(f"✅ Pending analyses worker started (concurrency={PENDING_WORKER_CONCURRENCY}, poll={PENDING_POLL_SECONDS}s)")
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+
+def worker_status() -> Dict[str, Any]:
+    return {
+        "enabled": PENDING_WORKER_ENABLED,
+        "running": _task is not None and not _task.done(),
+        "worker_id": WORKER_ID,
+        "concurrency": PENDING_WORKER_CONCURRENCY,
+        "poll_seconds": PENDING_POLL_SECONDS,
+        "paused_until": _paused_until.isoformat() if is_paused() else None,
+        "quota_strikes": _quota_strikes,
+        "stats": {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in _stats.items()}
+    }
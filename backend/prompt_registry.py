@@ -0,0 +1,461 @@
+"""
+Prompt Registry for Israel Growth Venture mini-analyses
+Loads master prompts + IGV reference documents once, pre-assembles the static
+part of every (sector, language, whitelist) prompt and reloads on file change.
+Only the client form section is formatted per request.
+
+Reference documents are parsed into entries (reference_index); with
+PROMPT_REFERENCE_PRUNING only the entries relevant to the client's sector,
+objective and constraints are sent, and the prompt never exceeds PROMPT_MAX_CHARS.
+"""
+
+from fastapi import HTTPException
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import reference_index
+
+# IGV internal data paths
+IGV_INTERNAL_DIR = Path(__file__).parent / 'igv_internal'
+TYPES_FILE = IGV_INTERNAL_DIR / 'IGV_Types_Emplacements_Activites.txt'
+WHITELIST_JEWISH = IGV_INTERNAL_DIR / 'Whitelist_1_Jewish_incl_Mixed.txt'
+WHITELIST_ARAB = IGV_INTERNAL_DIR / 'Whitelist_2_Arabe_incl_Mixed.txt'
+
+# Master Prompts directory
+PROMPTS_DIR = Path(__file__).parent / 'prompts'
+
+# Seconds between two mtime checks of the same template
+PROMPT_RELOAD_CHECK_SECONDS = float(os.getenv('PROMPT_RELOAD_CHECK_SECONDS', '5'))
+
+# Relevance-pruned reference documents + hard prompt size cap
+PROMPT_REFERENCE_PRUNING = os.getenv('PROMPT_REFERENCE_PRUNING', 'true').lower() == 'true'
+PROMPT_REFERENCE_MAX_CHARS = int(os.getenv('PROMPT_REFERENCE_MAX_CHARS', '4000'))
+# Entries kept per document when few match (main locations come first in the files)
+PROMPT_REFERENCE_MIN_ENTRIES = int(os.getenv('PROMPT_REFERENCE_MIN_ENTRIES', '4'))
+PROMPT_MAX_CHARS = int(os.getenv('PROMPT_MAX_CHARS', '24000'))
+PROMPT_FORM_FIELD_MAX_CHARS = int(os.getenv('PROMPT_FORM_FIELD_MAX_CHARS', '1500'))
+# Form fields the reference entries are selected on
+REFERENCE_QUERY_FIELDS = ("secteur", "statut_alimentaire", "objectif_israel", "contraintes")
+# Token estimate for the measurement mode (Hebrew tokenizes denser than latin text)
+CHARS_PER_TOKEN_ESTIMATE = {"fr": 4.0, "en": 4.0, "he": 2.5}
+
+LANGUAGES = ("fr", "en", "he")
+
+# Form "secteur" value -> master prompt base name
+SECTOR_PROMPTS = {
+    "Restauration / Food": "MASTER_PROMPT_RESTAURATION",
+    "Retail (hors food)": "MASTER_PROMPT_RETAIL_NON_FOOD",
+}
+DEFAULT_SECTOR_PROMPT = "MASTER_PROMPT_SERVICES_PARAMEDICAL"  # Services or Paramédical / Santé
+
+WHITELISTS = {
+    "Whitelist_1_Jewish_incl_Mixed": WHITELIST_JEWISH,
+    "Whitelist_2_Arabe_incl_Mixed": WHITELIST_ARAB,
+}
+
+# Map internal codes to human-readable labels (MULTI-LANGUAGE)
+WHITELIST_LABELS = {
+    "fr": {
+        "Whitelist_1_Jewish_incl_Mixed": "Villes Juives & Mixtes",
+        "Whitelist_2_Arabe_incl_Mixed": "Villes Arabes & Mixtes"
+    },
+    "en": {
+        "Whitelist_1_Jewish_incl_Mixed": "Jewish & Mixed Cities",
+        "Whitelist_2_Arabe_incl_Mixed": "Arab & Mixed Cities"
+    },
+    "he": {
+        "Whitelist_1_Jewish_incl_Mixed": "ערים יהודיות ומעורבות",
+        "Whitelist_2_Arabe_incl_Mixed": "ערים ערביות ומעורבות"
+    }
+}
+
+# Form data section (TRANSLATED based on language)
+# fields: (label, request attribute, use "not specified" fallback)
+FORM_SECTIONS = {
+    "fr": {
+        "title": "DONNÉES DU FORMULAIRE CLIENT",
+        "not_specified": "Non spécifié",
+        "fields": [
+            ("Nom de marque", "nom_de_marque", False),
+            ("Email", "email", False),
+            ("Secteur", "secteur", False),
+            ("Statut alimentaire", "statut_alimentaire", True),
+            ("Ancienneté", "anciennete", True),
+            ("Pays d'origine", "pays_dorigine", True),
+            ("Concept", "concept", True),
+            ("Positionnement", "positionnement", True),
+            ("Modèle actuel", "modele_actuel", True),
+            ("Différenciation", "differenciation", True),
+            ("Objectif Israël", "objectif_israel", True),
+            ("Contraintes", "contraintes", True),
+        ],
+        "reference_1": "DOCUMENT DE RÉFÉRENCE 1: Types d'Emplacements et Activités",
+        "reference_2": "DOCUMENT DE RÉFÉRENCE 2: {whitelist_name} (EMPLACEMENTS AUTORISÉS)",
+    },
+    "en": {
+        "title": "CLIENT FORM DATA",
+        "not_specified": "Not specified",
+        "fields": [
+            ("Brand Name", "nom_de_marque", False),
+            ("Email", "email", False),
+            ("Sector", "secteur", False),
+            ("Food Status", "statut_alimentaire", True),
+            ("Company Age", "anciennete", True),
+            ("Country of Origin", "pays_dorigine", True),
+            ("Concept", "concept", True),
+            ("Positioning", "positionnement", True),
+            ("Current Business Model", "modele_actuel", True),
+            ("Differentiation", "differenciation", True),
+            ("Israel Objective", "objectif_israel", True),
+            ("Constraints", "contraintes", True),
+        ],
+        "reference_1": "REFERENCE DOCUMENT 1: Location Types and Activities",
+        "reference_2": "REFERENCE DOCUMENT 2: {whitelist_name} (AUTHORIZED LOCATIONS)",
+    },
+    "he": {
+        "title": "נתוני טופס הלקוח",
+        "not_specified": "לא צוין",
+        "fields": [
+            ("שם המותג", "nom_de_marque", False),
+            ("אימייל", "email", False),
+            ("תחום", "secteur", False),
+            ("סטטוס מזון", "statut_alimentaire", True),
+            ("ותק החברה", "anciennete", True),
+            ("מדינת מוצא", "pays_dorigine", True),
+            ("קונספט", "concept", True),
+            ("מיצוב", "positionnement", True),
+            ("מודל עסקי נוכחי", "modele_actuel", True),
+            ("בידול", "differenciation", True),
+            ("יעד בישראל", "objectif_israel", True),
+            ("אילוצים", "contraintes", True),
+        ],
+        "reference_1": "מסמך עזר 1: סוגי מיקומים ופעילויות",
+        "reference_2": "מסמך עזר 2: {whitelist_name} (מיקומים מורשים)",
+    },
+}
+
+# Registry: (prompt_base, language, whitelist_code) -> compiled template dict
+_registry: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+_registry_lock = threading.Lock()
+
+_pruning_stats = {
+    "renders": 0,
+    "reference_chars_sent": 0,
+    "reference_chars_full": 0,
+}
+
+
+def load_igv_file(file_path: Path) -> str:
+    """Load IGV internal file with error handling"""
+    if not file_path.exists():
+        logging.error(f"MISSING_IGV_FILE:{file_path}")
+        raise HTTPException(status_code=500, detail=f"Fichier IGV manquant: {file_path.name}")
+
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except Exception as e:
+        logging.error(f"Error reading {file_path}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur lecture fichier: {file_path.name}")
+
+
+def resolve_prompt_name(prompt_base: str, language: str) -> str:
+    """Master prompt file name for a sector prompt base AND language"""
+    lang_suffix = f"_{language.upper()}" if language != "fr" else ""
+    return f"{prompt_base}{lang_suffix}"
+
+
+def resolve_whitelist_code(statut_alimentaire: str) -> str:
+    """Select whitelist based on statut_alimentaire"""
+    if (statut_alimentaire or "").lower() == 'halal':
+        return "Whitelist_2_Arabe_incl_Mixed"
+    return "Whitelist_1_Jewish_incl_Mixed"
+
+
+def _source_files(prompt_name: str, whitelist_code: str) -> list:
+    return [PROMPTS_DIR / f'{prompt_name}.txt', TYPES_FILE, WHITELISTS[whitelist_code]]
+
+
+def _source_mtimes(files: list) -> Dict[str, float]:
+    return {str(f): f.stat().st_mtime if f.exists() else 0.0 for f in files}
+
+
+def _reference_tail(labels: Tuple[str, str], texts: list) -> str:
+    return (
+        f"\n---\n\n**{labels[0]}**\n\n{texts[0]}\n\n---\n\n"
+        f"**{labels[1]}**\n\n{texts[1]}\n\n---\n"
+    )
+
+
+def _compile_template(prompt_name: str, language: str, whitelist_code: str) -> Dict[str, Any]:
+    """Read the source files and pre-assemble the static prompt parts"""
+    files = _source_files(prompt_name, whitelist_code)
+    mtimes = _source_mtimes(files)
+
+    master_prompt = load_igv_file(files[0])
+    types_data = load_igv_file(files[1])
+    whitelist_data = load_igv_file(files[2])
+
+    section = FORM_SECTIONS.get(language, FORM_SECTIONS["fr"])
+    whitelist_name = WHITELIST_LABELS.get(language, {}).get(whitelist_code, whitelist_code)
+    reference_2 = section["reference_2"].format(whitelist_name=whitelist_name)
+
+    # Master prompt (already in target language) + form data header
+    head = f"{master_prompt}\n\n---\n\n**{section['title']}:**\n\n"
+    # Reference documents (already in target language)
+    reference_labels = (section['reference_1'], reference_2)
+    tail = _reference_tail(reference_labels, [types_data, whitelist_data])
+
+    # Provider context caching needs one contiguous static block: master prompt
+    # followed by the reference documents, the form data is sent after it.
+    # Pruned references depend on the form: they are sent with it instead.
+    static_prefix = master_prompt if PROMPT_REFERENCE_PRUNING else f"{master_prompt}\n{tail}"
+    form_header = f"**{section['title']}:**\n\n"
+
+    version = hashlib.sha256((head + "\x00" + tail).encode('utf-8')).hexdigest()[:12]
+
+    return {
+        "template_id": f"{prompt_name}:{whitelist_code}",
+        "prompt_name": prompt_name,
+        "language": language,
+        "whitelist_code": whitelist_code,
+        "head": head,
+        "tail": tail,
+        "reference_labels": reference_labels,
+        "references": [
+            reference_index.ReferenceDocument(files[1].name, types_data),
+            reference_index.ReferenceDocument(whitelist_code, whitelist_data),
+        ],
+        "static_prefix": static_prefix,
+        "form_header": form_header,
+        "static_chars": len(head) if PROMPT_REFERENCE_PRUNING else len(head) + len(tail),
+        "version": version,
+        "source_mtimes": mtimes,
+        "compiled_at": datetime.now(timezone.utc),
+        "checked_at": time.monotonic(),
+    }
+
+
+def load_prompt_registry() -> Dict[str, Any]:
+    """
+    Compile every (sector, language, whitelist) combination.
+    Called once at startup; missing files are logged and compiled lazily later.
+    """
+    compiled = 0
+    errors = []
+    prompt_bases = list(SECTOR_PROMPTS.values()) + [DEFAULT_SECTOR_PROMPT]
+
+    for prompt_base in prompt_bases:
+        for language in LANGUAGES:
+            prompt_name = resolve_prompt_name(prompt_base, language)
+            for whitelist_code in WHITELISTS:
+                try:
+                    entry = _compile_template(prompt_name, language, whitelist_code)
+                    with _registry_lock:
+                        _registry[(prompt_base, language, whitelist_code)] = entry
+                    compiled += 1
+                except HTTPException as e:
+                    errors.append(f"{prompt_name}:{whitelist_code}: {e.detail}")
+
+    logging.info(f"✅ Prompt registry loaded: {compiled} templates, {len(errors)} errors")
+    for error in errors:
+        logging.error(f"❌ PROMPT_REGISTRY_ERROR {error}")
+
+    return {"compiled": compiled, "errors": errors}
+
+
+def get_compiled_prompt(secteur: str, language: str, statut_alimentaire: str = "") -> Dict[str, Any]:
+    """
+    Return the compiled template for a request, recompiling it if one of its
+    source files changed on disk (mtime checked at most every few seconds).
+    """
+    prompt_base = SECTOR_PROMPTS.get(secteur, DEFAULT_SECTOR_PROMPT)
+    whitelist_code = resolve_whitelist_code(statut_alimentaire)
+    key = (prompt_base, language, whitelist_code)
+
+    entry = _registry.get(key)
+    now = time.monotonic()
+
+    if entry is not None and now - entry["checked_at"] < PROMPT_RELOAD_CHECK_SECONDS:
+        return entry
+
+    with _registry_lock:
+        entry = _registry.get(key)
+        if entry is not None:
+            files = _source_files(entry["prompt_name"], whitelist_code)
+            if _source_mtimes(files) == entry["source_mtimes"]:
+                entry["checked_at"] = now
+                return entry
+            logging.info(f"PROMPT_RELOAD: {entry['template_id']} changed on disk")
+
+        entry = _compile_template(resolve_prompt_name(prompt_base, language), language, whitelist_code)
+        _registry[key] = entry
+        return entry
+
+
+def format_form_section(request, language: str) -> str:
+    """Format the per-request client form lines (the only dynamic part)"""
+    section = FORM_SECTIONS.get(language, FORM_SECTIONS["fr"])
+    lines = []
+    for label, attribute, use_fallback in section["fields"]:
+        value = (getattr(request, attribute, "") or "")[:PROMPT_FORM_FIELD_MAX_CHARS]
+        if use_fallback:
+            value = value or section["not_specified"]
+        lines.append(f"- **{label}:** {value}\n")
+    return "".join(lines)
+
+
+def _fitted_form_section(request, language: str, entry: Dict[str, Any]) -> str:
+    """Form lines, cut so that head + form + reference labels stay under PROMPT_MAX_CHARS"""
+    form_lines = format_form_section(request, language)
+    if not PROMPT_REFERENCE_PRUNING:
+        return form_lines
+    room = PROMPT_MAX_CHARS - len(entry["head"]) - len(_reference_tail(entry["reference_labels"], ["", ""]))
+    if len(form_lines) > room:
+        logging.warning(f"PROMPT_CAP: form section cut from {len(form_lines)} to {max(0, room)} chars ({entry['template_id']})")
+        form_lines = form_lines[:max(0, room - 1)] + "\n"
+    return form_lines
+
+
+def render_references(request, entry: Dict[str, Any], form_lines: str,
+                      prune: Optional[bool] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Reference documents part of the prompt: full documents, or (pruning) the entries
+    relevant to the request within what PROMPT_MAX_CHARS leaves after head + form.
+    Returns (reference text, selection stats or None)
+    """
+    if not (PROMPT_REFERENCE_PRUNING if prune is None else prune):
+        return entry["tail"], None
+
+    overhead = len(_reference_tail(entry["reference_labels"], ["", ""]))
+    budget = min(PROMPT_REFERENCE_MAX_CHARS, PROMPT_MAX_CHARS - len(entry["head"]) - len(form_lines) - overhead)
+    query = " ".join(getattr(request, field, "") or "" for field in REFERENCE_QUERY_FIELDS)
+    texts, stats = reference_index.select(entry["references"], query, max(0, budget), PROMPT_REFERENCE_MIN_ENTRIES)
+
+    _pruning_stats["renders"] += 1
+    _pruning_stats["reference_chars_sent"] += stats["chars"]
+    _pruning_stats["reference_chars_full"] += stats["chars_full"]
+    return _reference_tail(entry["reference_labels"], texts), stats
+
+
+def render_prompt(request, language: str = "fr") -> Tuple[str, Dict[str, Any]]:
+    """Build the full prompt for a request. Returns (prompt, compiled template)"""
+    entry = get_compiled_prompt(request.secteur, language, request.statut_alimentaire)
+    form_lines = _fitted_form_section(request, language, entry)
+    references, _ = render_references(request, entry, form_lines)
+    prompt = entry["head"] + form_lines + references
+    return prompt, entry
+
+
+def render_form_block(request, language: str = "fr") -> Tuple[str, Dict[str, Any]]:
+    """
+    Build only the dynamic client form block, to be sent after the template's
+    static_prefix (provider-side cached context). Returns (form block, compiled template)
+    With reference pruning the selected reference entries follow the form.
+    """
+    entry = get_compiled_prompt(request.secteur, language, request.statut_alimentaire)
+    form_lines = _fitted_form_section(request, language, entry)
+    if PROMPT_REFERENCE_PRUNING:
+        references, _ = render_references(request, entry, form_lines)
+        return entry["form_header"] + form_lines + references, entry
+    form_block = entry["form_header"] + form_lines + "\n---\n"
+    return form_block, entry
+
+
+def estimate_prompt_tokens(text: str, language: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN_ESTIMATE.get(language, 4.0))
+
+
+def pruning_report(forms: list, languages=LANGUAGES, count_tokens=None) -> Dict[str, Any]:
+    """
+    Measurement mode: full prompt (all reference documents) vs pruned prompt,
+    per sector and language, for the given client forms.
+    count_tokens(text) -> int gives exact counts (e.g. Gemini count_tokens);
+    without it tokens are estimated from characters.
+    """
+    groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for form in forms:
+        for language in languages:
+            entry = get_compiled_prompt(form.secteur, language, form.statut_alimentaire)
+            form_lines = format_form_section(form, language)
+            references, stats = render_references(form, entry, form_lines, prune=True)
+            full = entry["head"] + form_lines + entry["tail"]
+            pruned = entry["head"] + form_lines + references
+
+            if count_tokens is not None:
+                full_tokens, pruned_tokens = count_tokens(full), count_tokens(pruned)
+            else:
+                full_tokens = estimate_prompt_tokens(full, language)
+                pruned_tokens = estimate_prompt_tokens(pruned, language)
+
+            group = groups.setdefault((form.secteur, language), {
+                "sector": form.secteur,
+                "language": language,
+                "samples": 0,
+                "full_tokens": 0,
+                "pruned_tokens": 0,
+                "max_pruned_chars": 0,
+                "reference_entries": 0,
+            })
+            group["samples"] += 1
+            group["full_tokens"] += full_tokens
+            group["pruned_tokens"] += pruned_tokens
+            group["max_pruned_chars"] = max(group["max_pruned_chars"], len(pruned))
+            group["reference_entries"] += stats["entries"]
+
+    rows = []
+    for group in groups.values():
+        samples = group["samples"]
+        rows.append({
+            "sector": group["sector"],
+            "language": group["language"],
+            "samples": samples,
+            "avg_full_tokens": round(group["full_tokens"] / samples),
+            "avg_pruned_tokens": round(group["pruned_tokens"] / samples),
+            "savings_pct": round(100.0 * (1 - group["pruned_tokens"] / group["full_tokens"]), 1) if group["full_tokens"] else 0.0,
+            "avg_reference_entries": round(group["reference_entries"] / samples, 1),
+            "max_pruned_chars": group["max_pruned_chars"],
+        })
+
+    full_total = sum(g["full_tokens"] for g in groups.values())
+    pruned_total = sum(g["pruned_tokens"] for g in groups.values())
+    return {
+        "token_counts": "exact" if count_tokens is not None else "estimated",
+        "prompt_max_chars": PROMPT_MAX_CHARS,
+        "groups": sorted(rows, key=lambda r: (r["sector"], r["language"])),
+        "total_savings_pct": round(100.0 * (1 - pruned_total / full_total), 1) if full_total else 0.0,
+    }
+
+
+def registry_status() -> Dict[str, Any]:
+    """Registry contents for the /mini-analysis/debug endpoint"""
+    templates = []
+    for entry in sorted(_registry.values(), key=lambda e: (e["prompt_name"], e["whitelist_code"])):
+        templates.append({
+            "template_id": entry["template_id"],
+            "language": entry["language"],
+            "version": entry["version"],
+            "static_chars": entry["static_chars"],
+            "compiled_at": entry["compiled_at"].isoformat(),
+            "source_mtimes": {
+                Path(path).name: datetime.fromtimestamp(mtime, timezone.utc).isoformat() if mtime else None
+                for path, mtime in entry["source_mtimes"].items()
+            }
+        })
+    return {
+        "template_count": len(templates),
+        "reload_check_seconds": PROMPT_RELOAD_CHECK_SECONDS,
+        "reference_pruning": {
+            "enabled": PROMPT_REFERENCE_PRUNING,
+            "reference_max_chars": PROMPT_REFERENCE_MAX_CHARS,
+            "prompt_max_chars": PROMPT_MAX_CHARS,
+            "stats": dict(_pruning_stats),
+        },
+        "templates": templates
+    }
@@ -0,0 +1,408 @@
+"""
+Gemini Quota Governor for Israel Growth Venture
+Predicts quota exhaustion instead of discovering it through RESOURCE_EXHAUSTED:
+- every Gemini call is admitted against per-minute and per-day request/token budgets
+  (token buckets; daily budgets refill at Google's daily reset, midnight Pacific time)
+- usage_metadata (prompt / candidate tokens) of each call is recorded in memory
+  and persisted in MongoDB (gemini_usage), so budgets survive a restart
+- when a budget is nearly gone the call is refused with QuotaBudgetExhausted
+  (daily budget: the mini-analysis goes straight to pending_analyses; per-minute
+  budget: 429 with Retry-After = retry_after_seconds, nothing is queued)
+
+State is per worker process (the API runs a single uvicorn worker).
+"""
+
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+
+import database
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_RESET_TZ = ZoneInfo("America/Los_Angeles")  # Gemini daily quotas reset at midnight PT
+except Exception:
+    QUOTA_RESET_TZ = None
+
+GOVERNOR_ENABLED = os.getenv('GEMINI_QUOTA_GOVERNOR_ENABLED', 'true').lower() == 'true'
+# Project limits for GEMINI_MODEL (0 = no limit) - see Google AI Studio > Rate limits
+GEMINI_RPM_LIMIT = int(os.getenv('GEMINI_RPM_LIMIT', '10'))
+GEMINI_TPM_LIMIT = int(os.getenv('GEMINI_TPM_LIMIT', '250000'))
+GEMINI_RPD_LIMIT = int(os.getenv('GEMINI_RPD_LIMIT', '250'))
+GEMINI_TPD_LIMIT = int(os.getenv('GEMINI_TPD_LIMIT', '0'))
+# Fraction of each budget kept in reserve: below it, calls are refused ("nearly gone")
+QUOTA_RESERVE_RATIO = float(os.getenv('GEMINI_QUOTA_RESERVE_RATIO', '0.05'))
+# A call short on a per-minute budget waits up to this long instead of being refused
+QUOTA_MAX_WAIT_SECONDS = float(os.getenv('GEMINI_QUOTA_MAX_WAIT_SECONDS', '10'))
+# Token estimate for a call before any usage was recorded (prompt chars / 4 + output)
+DEFAULT_OUTPUT_TOKENS = 2048
+CHARS_PER_TOKEN = 4
+USAGE_RETENTION_DAYS = 8
+BURN_WINDOW_SECONDS = 3600
+
+
+class QuotaBudgetExhausted(Exception):
+    """Raised (instead of calling Gemini) when a quota budget is nearly gone"""
+
+    def __init__(self, budget: str, retry_after_seconds: int):
+        self.budget = budget
+        self.retry_after_seconds = retry_after_seconds
+        scope = "daily" if budget.endswith("per_day") else "per-minute"
+        super().__init__(f"RESOURCE_EXHAUSTED (quota governor): {scope} budget {budget} nearly exhausted, retry in {retry_after_seconds}s")
+
+
+def next_quota_reset(now: datetime) -> datetime:
+    """Next daily quota reset (midnight Pacific time), in UTC"""
+    if QUOTA_RESET_TZ is None:
+        return (now + timedelta(days=1)).replace(hour=8, minute=0, second=0, microsecond=0)
+    local = now.astimezone(QUOTA_RESET_TZ)
+    midnight = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    # A little slack: the reset is not instantaneous on Google's side
+    return midnight.astimezone(timezone.utc) + timedelta(minutes=5)
+
+
+def _current_day_start(now: datetime) -> datetime:
+    return next_quota_reset(now) - timedelta(days=1)
+
+
+class TokenBucket:
+    """
+    Budget of `capacity` units.
+    per_minute: refills continuously (capacity per 60s)
+    per_day: refills completely at the daily quota reset
+    """
+
+    def __init__(self, name: str, capacity: int, daily: bool = False):
+        self.name = name
+        self.capacity = capacity
+        self.daily = daily
+        self.level = float(capacity)
+        now = datetime.now(timezone.utc)
+        self.updated_at = now
+        self.resets_at = next_quota_reset(now) if daily else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def refill(self, now: datetime):
+        if self.daily:
+            if now >= self.resets_at:
+                self.level = float(self.capacity)
+                self.resets_at = next_quota_reset(now)
+        else:
+            elapsed = (now - self.updated_at).total_seconds()
+            self.level = min(float(self.capacity), self.level + elapsed * self.capacity / 60.0)
+        self.updated_at = now
+
+    def reserve_units(self) -> float:
+        return self.capacity * QUOTA_RESERVE_RATIO
+
+    def shortfall(self, amount: float, now: datetime) -> float:
+        """Seconds until `amount` can be taken without touching the reserve (0 = now)"""
+        self.refill(now)
+        missing = amount + self.reserve_units() - self.level
+        if missing <= 0:
+            return 0.0
+        if self.daily:
+            return (self.resets_at - now).total_seconds()
+        return missing * 60.0 / self.capacity
+
+    def take(self, amount: float):
+        # May go negative: actual usage can exceed the estimate
+        self.level -= amount
+
+    def give_back(self, amount: float):
+        self.level = min(float(self.capacity), self.level + amount)
+
+    def drain(self, now: datetime):
+        """Provider said this budget is gone"""
+        self.refill(now)
+        self.level = min(self.level, 0.0)
+
+    def status(self, now: datetime) -> Dict[str, Any]:
+        self.refill(now)
+        return {
+            "limit": self.capacity,
+            "remaining": max(0, int(self.level)),
+            "used": max(0, int(self.capacity - self.level)),
+            "resets_at": self.resets_at.isoformat() if self.daily else None
+        }
+
+
+_buckets: Dict[str, TokenBucket] = {
+    "requests_per_minute": TokenBucket("requests_per_minute", GEMINI_RPM_LIMIT),
+    "tokens_per_minute": TokenBucket("tokens_per_minute", GEMINI_TPM_LIMIT),
+    "requests_per_day": TokenBucket("requests_per_day", GEMINI_RPD_LIMIT, daily=True),
+    "tokens_per_day": TokenBucket("tokens_per_day", GEMINI_TPD_LIMIT, daily=True),
+}
+
+# (recorded_at, total_tokens) for the burn rate
+_recent: Deque[Tuple[datetime, int]] = deque()
+# Moving average of recorded total tokens per call (admission estimate)
+_avg_tokens: Optional[float] = None
+_indexes_ready = False
+_restored = False
+
+_stats = {
+    "admitted": 0,
+    "waited": 0,
+    "refused": 0,
+    "recorded": 0,
+    "provider_exhausted": 0,
+    "prompt_tokens": 0,
+    "candidate_tokens": 0,
+}
+
+
+def _is_provider_quota_error(error: Exception) -> bool:
+    error_str = str(error).lower()
+    return "resource_exhausted" in error_str or "quota" in error_str
+
+
+def estimate_tokens(contents: list) -> int:
+    """Expected total tokens of a call (moving average once usage was recorded)"""
+    if _avg_tokens is not None:
+        return int(_avg_tokens)
+    chars = sum(len(part) for part in contents if isinstance(part, str))
+    return chars // CHARS_PER_TOKEN + DEFAULT_OUTPUT_TOKENS
+
+
+def _costs(tokens: int) -> Dict[str, int]:
+    return {
+        "requests_per_minute": 1,
+        "tokens_per_minute": tokens,
+        "requests_per_day": 1,
+        "tokens_per_day": tokens,
+    }
+
+
+async def admit(model: str, contents: list, request_id: str = "unknown") -> Optional[Dict[str, Any]]:
+    """
+    Reserve budget for one Gemini call. Returns a reservation for record()/release()
+    (None when the governor is disabled).
+
+    Raises:
+        QuotaBudgetExhausted: a daily budget is nearly gone, or a per-minute budget
+                              would need more than QUOTA_MAX_WAIT_SECONDS to refill
+    """
+    if not GOVERNOR_ENABLED:
+        return None
+
+    tokens = estimate_tokens(contents)
+    costs = _costs(tokens)
+    waited = False
+
+    while True:
+        now = datetime.now(timezone.utc)
+        waits = {
+            name: bucket.shortfall(costs[name], now)
+            for name, bucket in _buckets.items() if bucket.enabled
+        }
+        blocking = {name: wait for name, wait in waits.items() if wait > 0}
+
+        if not blocking:
+            # No await between the check and the take: atomic on the event loop
+            for name, bucket in _buckets.items():
+                if bucket.enabled:
+                    bucket.take(costs[name])
+            _stats["admitted"] += 1
+            if waited:
+                _stats["waited"] += 1
+            return {"model": model, "request_id": request_id, "tokens": tokens, "at": now}
+
+        budget, wait = max(blocking.items(), key=lambda item: item[1])
+        if budget.endswith("per_day") or wait > QUOTA_MAX_WAIT_SECONDS:
+            _stats["refused"] += 1
+            logging.warning(f"[{request_id}] QUOTA_GOVERNOR_REFUSED {budget} (retry in {int(wait)}s)")
+            raise QuotaBudgetExhausted(budget, int(wait) + 1)
+
+        waited = True
+        await asyncio.sleep(wait)
+
+
+def record(reservation: Optional[Dict[str, Any]], usage_metadata: Any):
+    """Account the actual usage of an admitted call (corrects the estimate)"""
+    global _avg_tokens
+    if reservation is None:
+        return
+
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+    candidate_tokens = getattr(usage_metadata, "candidates_token_count", None) or 0
+    if usage_metadata is None:
+        # No usage reported (e.g. stream closed early): keep the estimate
+        total_tokens = reservation["tokens"]
+    else:
+        total_tokens = getattr(usage_metadata, "total_token_count", None) or (prompt_tokens + candidate_tokens)
+
+    delta = total_tokens - reservation["tokens"]
+    for name in ("tokens_per_minute", "tokens_per_day"):
+        if delta > 0:
+            _buckets[name].take(delta)
+        else:
+            _buckets[name].give_back(-delta)
+
+    if usage_metadata is not None:
+        _avg_tokens = total_tokens if _avg_tokens is None else 0.8 * _avg_tokens + 0.2 * total_tokens
+
+    now = datetime.now(timezone.utc)
+    _recent.append((now, total_tokens))
+    _stats["recorded"] += 1
+    _stats["prompt_tokens"] += prompt_tokens
+    _stats["candidate_tokens"] += candidate_tokens
+
+    asyncio.ensure_future(_persist({
+        "model": reservation["model"],
+        "request_id": reservation["request_id"],
+        "prompt_tokens": prompt_tokens,
+        "candidate_tokens": candidate_tokens,
+        "cached_tokens": getattr(usage_metadata, "cached_content_token_count", None) or 0,
+        "total_tokens": total_tokens,
+        "estimated_tokens": reservation["tokens"],
+        "usage_reported": usage_metadata is not None,
+        "created_at": now
+    }))
+
+
+def release(reservation: Optional[Dict[str, Any]], error: Optional[Exception] = None):
+    """
+    The call failed. Tokens are given back unless the call may still have run
+    (timeout / disconnect); a provider quota error drains the matching budgets.
+    """
+    if reservation is None:
+        return
+
+    import llm_executor
+
+    if not isinstance(error, (llm_executor.LLMTimeoutError, llm_executor.ClientDisconnectedError)):
+        for name in ("tokens_per_minute", "tokens_per_day"):
+            _buckets[name].give_back(reservation["tokens"])
+
+    if error is not None and _is_provider_quota_error(error):
+        note_provider_exhausted(error)
+
+
+def note_provider_exhausted(error: Exception):
+    """Gemini returned RESOURCE_EXHAUSTED: our budgets were too optimistic - align them"""
+    now = datetime.now(timezone.utc)
+    error_str = str(error).lower().replace(" ", "")
+    daily = "perday" in error_str or "daily" in error_str
+    names = ("requests_per_day", "tokens_per_day") if daily else ("requests_per_minute", "tokens_per_minute")
+    for name in names:
+        if _buckets[name].enabled:
+            _buckets[name].drain(now)
+    _stats["provider_exhausted"] += 1
+    logging.warning(f"QUOTA_GOVERNOR: provider quota error - {'daily' if daily else 'per-minute'} budgets drained")
+
+
+def _get_db():
+    return database.get_db()
+
+
+async def _ensure_indexes(current_db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        await current_db.gemini_usage.create_index(
+            "created_at", expireAfterSeconds=USAGE_RETENTION_DAYS * 86400, background=True
+        )
+        _indexes_ready = True
+    except Exception as e:
+        logging.warning(f"Gemini usage index creation skipped: {e}")
+
+
+async def _persist(usage: Dict[str, Any]):
+    current_db = _get_db()
+    if current_db is None:
+        return
+    try:
+        await _ensure_indexes(current_db)
+        await current_db.gemini_usage.insert_one(usage)
+    except Exception as e:
+        logging.error(f"[{usage['request_id']}] GEMINI_USAGE_PERSIST_FAILED: {str(e)}")
+
+
+async def restore_usage():
+    """Rebuild budgets from gemini_usage after a restart (app startup)"""
+    global _restored
+    current_db = _get_db()
+    if current_db is None or _restored or not GOVERNOR_ENABLED:
+        return
+
+    now = datetime.now(timezone.utc)
+    day_start = _current_day_start(now)
+    try:
+        calls = await current_db.gemini_usage.find(
+            {"created_at": {"$gte": day_start}},
+            {"_id": 0, "created_at": 1, "total_tokens": 1}
+        ).to_list(None)
+    except Exception as e:
+        logging.warning(f"Gemini usage restore skipped: {str(e)}")
+        return
+
+    for call in calls:
+        created_at = call["created_at"]
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        tokens = call.get("total_tokens", 0)
+        _buckets["requests_per_day"].take(1)
+        _buckets["tokens_per_day"].take(tokens)
+        age = (now - created_at).total_seconds()
+        if age < 60:
+            # What the continuous refill has not given back yet
+            _buckets["requests_per_minute"].take(1 - age / 60.0)
+            _buckets["tokens_per_minute"].take(tokens * (1 - age / 60.0))
+        if age < BURN_WINDOW_SECONDS:
+            _recent.append((created_at, tokens))
+
+    _restored = True
+    if calls:
+        logging.info(f"✅ Gemini quota governor restored {len(calls)} calls since {day_start.isoformat()}")
+
+
+def _burn_rate(now: datetime, window_seconds: int) -> Dict[str, float]:
+    while _recent and (now - _recent[0][0]).total_seconds() > BURN_WINDOW_SECONDS:
+        _recent.popleft()
+    calls = [tokens for at, tokens in _recent if (now - at).total_seconds() <= window_seconds]
+    minutes = window_seconds / 60.0
+    return {
+        "requests_per_minute": round(len(calls) / minutes, 2),
+        "tokens_per_minute": round(sum(calls) / minutes, 1)
+    }
+
+
+def governor_status() -> Dict[str, Any]:
+    """Remaining budgets, burn rate and projected daily exhaustion (admin endpoint)"""
+    now = datetime.now(timezone.utc)
+    budgets = {name: bucket.status(now) for name, bucket in _buckets.items() if bucket.enabled}
+    burn_hour = _burn_rate(now, BURN_WINDOW_SECONDS)
+
+    # At the last hour's pace, when does each daily budget run out?
+    exhaustion = {}
+    for name, rate_key in (("requests_per_day", "requests_per_minute"), ("tokens_per_day", "tokens_per_minute")):
+        if name not in budgets:
+            continue
+        rate = burn_hour[rate_key]
+        bucket = _buckets[name]
+        if rate <= 0:
+            exhaustion[name] = None
+            continue
+        runs_out = now + timedelta(minutes=max(0.0, bucket.level - bucket.reserve_units()) / rate)
+        exhaustion[name] = runs_out.isoformat() if runs_out < bucket.resets_at else None
+
+    return {
+        "enabled": GOVERNOR_ENABLED,
+        "reserve_ratio": QUOTA_RESERVE_RATIO,
+        "budgets": budgets,
+        "burn_rate": {
+            "last_5_minutes": _burn_rate(now, 300),
+            "last_hour": burn_hour
+        },
+        "projected_exhaustion": exhaustion,
+        "estimated_tokens_per_call": estimate_tokens([]) if _avg_tokens is not None else None,
+        "stats": dict(_stats)
+    }
@@ -5,32 +5,14 @@ Handles analysis requests when quota is exceeded
 
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
-import os
 import logging
 from bson import ObjectId
 
-router = APIRouter(prefix="/api/quota")
-
-# MongoDB
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
+from database import get_database
 
-mongo_client = None
-db = None
-
-def get_db():
-    global mongo_client, db
-    if db is None and mongo_url:
-        mongo_client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        db = mongo_client[db_name]
-    return db
+router = APIRouter(prefix="/api/quota")
 
 
 # ==========================================
@@ -50,15 +32,11 @@ class PendingAnalysisCreate(BaseModel):
 # ==========================================
 
 @router.post("/queue-analysis")
-async def queue_analysis(analysis: PendingAnalysisCreate):
+async def queue_analysis(analysis: PendingAnalysisCreate, current_db=Depends(get_database)):
     """
     Queue an analysis request when quota is exceeded
     Called automatically by mini-analysis when quota reached
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     # Check if already queued
     existing = await current_db.pending_analyses.find_one({
         "lead_id": analysis.lead_id,
@@ -144,12 +122,8 @@ async def get_queue_position(db, queue_id: str) -> int:
 
 
 @router.get("/queue-status/{queue_id}")
-async def get_queue_status(queue_id: str):
+async def get_queue_status(queue_id: str, current_db=Depends(get_database)):
     """Get status of queued analysis"""
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     try:
         queue_item = await current_db.pending_analyses.find_one({"_id": ObjectId(queue_id)})
     except:
@@ -173,16 +147,13 @@ async def get_queue_status(queue_id: str):
 async def get_pending_analyses(
     skip: int = 0,
     limit: int = 50,
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    current_db=Depends(get_database)
 ):
     """
     Get all pending analyses (admin only)
     Used to process the queue
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     filter_query = {}
     if status:
         filter_query["status"] = status
@@ -209,15 +180,11 @@ async def get_pending_analyses(
 
 
 @router.post("/admin/process-pending/{queue_id}")
-async def process_pending_analysis(queue_id: str):
+async def process_pending_analysis(queue_id: str, current_db=Depends(get_database)):
     """
     Process a single pending analysis
     Admin endpoint to manually trigger processing
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
     try:
         queue_item = await current_db.pending_analyses.find_one({"_id": ObjectId(queue_id)})
     except:
@@ -226,50 +193,39 @@ async def process_pending_analysis(queue_id: str):
     if not queue_item:
         raise HTTPException(status_code=404, detail="Queue item not found")
     
-    if queue_item["status"] != "pending":
+    if queue_item["status"] not in ("pending", "queued"):
         raise HTTPException(status_code=400, detail="Analysis not in pending status")
     
-    # Update status to processing
-    await current_db.pending_analyses.update_one(
-        {"_id": ObjectId(queue_id)},
-        {
-            "$set": {
-                "status": "processing",
-                "last_attempt_at": datetime.now(timezone.utc),
-                "updated_at": datetime.now(timezone.utc)
-            },
-            "$inc": {"attempts": 1}
-        }
-    )
+    # Import dynamically to avoid circular imports
+    import pending_worker
     
-    # Here you would trigger the actual analysis generation
-    # For now, we'll mark it as needing manual processing
+    # Leased like any worker item: if the scheduler already picked it up, nothing runs twice
+    result = await pending_worker.process_queue_item(queue_id)
+    if result["status"] == "not_pending":
+        raise HTTPException(status_code=409, detail="Analysis already being processed")
     
     return {
-        "status": "processing",
-        "message": "Analysis processing started",
-        "queue_id": queue_id,
-        "lead_id": queue_item["lead_id"],
-        "email": queue_item["email"]
+        **result,
+        "message": f"Analysis {result['status']}",
+        "lead_id": queue_item.get("lead_id"),
+        "email": queue_item.get("email")
     }
 
 
 @router.post("/admin/retry-failed")
-async def retry_failed_analyses():
+async def retry_failed_analyses(current_db=Depends(get_database)):
     """
     Retry all failed analyses
     Admin endpoint for bulk retry
     """
-    current_db = get_db()
-    if current_db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
-    # Reset failed analyses back to pending
+    # Reset failed analyses back to pending - the worker picks them up on its next run
     result = await current_db.pending_analyses.update_many(
-        {"status": "failed", "attempts": {"$lt": 3}},
+        {"status": "failed"},
         {
             "$set": {
                 "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": None,
                 "updated_at": datetime.now(timezone.utc)
             }
         }
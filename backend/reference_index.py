@@ -0,0 +1,209 @@
+"""
+Reference Document Index for Israel Growth Venture mini-analyses
+Parses the IGV reference files (location types, whitelists) into structured
+entries once, with an inverted keyword index, so a prompt only carries the
+entries relevant to the client's sector / objective / constraints.
+
+Document format (markdown-like):
+  # title lines                -> preamble (always kept)
+  ## SECTION                   -> section header (re-emitted with its entries)
+  ### Sub-section + "- " lines -> one entry
+  section text without ###     -> one entry ("RÈGLES" sections are always kept)
+"""
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+import math
+import re
+import unicodedata
+
+TOKEN = re.compile(r"[a-z0-9א-ת]+")
+MIN_TOKEN_LENGTH = 3
+
+# Sections kept whatever the request (normalized heading contains one of these)
+ALWAYS_SECTIONS = ("regles", "rules")
+
+# Tokens present in more than this share of a document's entries carry no signal
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+STOP_WORDS = frozenset((
+    "les", "des", "pour", "avec", "dans", "une", "sur", "par", "aux", "est", "pas", "plus",
+    "the", "and", "for", "with", "our", "your", "from", "that", "this", "are", "not",
+))
+
+# Form vocabulary (English / Hebrew / variants) -> reference vocabulary (French, latin city names)
+QUERY_SYNONYMS = {
+    "kosher": "casher", "kasher": "casher", "cacher": "casher", "כשר": "casher",
+    "חלאל": "halal",
+    "sabbath": "shabbat", "שבת": "shabbat",
+    "restaurant": "restauration", "restaurants": "restauration", "מסעדה": "restauration",
+    "shopping": "commercial", "קניון": "mall", "kanyon": "mall",
+    "religious": "religieux", "orthodox": "orthodoxe", "דתי": "religieux", "חרדי": "orthodoxe",
+    "arab": "arabe", "ערבי": "arabe", "mixed": "mixte", "מעורב": "mixte",
+    "tourist": "touristique", "tourists": "touristique", "luxury": "luxe",
+    "students": "etudiants", "offices": "bureaux", "north": "nord", "south": "sud",
+    "ירושלים": "jerusalem", "חיפה": "haifa", "נצרת": "nazareth", "נתניה": "netanya",
+    "הרצליה": "herzliya", "אשדוד": "ashdod", "אשקלון": "ashkelon", "מודיעין": "modiin",
+    "רחובות": "rehovot", "חולון": "holon", "כרמיאל": "karmiel", "טבריה": "tiberias",
+}
+# Multi-word synonyms (matched on the normalized query text)
+QUERY_PHRASES = {
+    "תל אביב": "tel aviv", "באר שבע": "beer sheva", "בני ברק": "bnei brak",
+    "רמת גן": "ramat gan", "פתח תקווה": "petah tikva", "ראשון לציון": "rishon lezion",
+    "אום אל פחם": "umm fahm",
+}
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accents removed (Hebrew letters kept)"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN.findall(normalize(text)) if len(t) >= MIN_TOKEN_LENGTH and t not in STOP_WORDS]
+
+
+def query_tokens(text: str) -> Set[str]:
+    """Tokens of the client form fields, mapped onto the reference vocabulary"""
+    normalized = normalize(text)
+    for phrase, replacement in QUERY_PHRASES.items():
+        normalized = normalized.replace(phrase, f" {replacement} ")
+    return {QUERY_SYNONYMS.get(t, t) for t in tokenize(normalized)}
+
+
+class ReferenceDocument:
+    """One parsed reference file: preamble, sections, entries and inverted index"""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.full_text = text
+        self.preamble = ""
+        self.sections: List[str] = []
+        self.entries: List[Dict[str, Any]] = []
+        self.index: Dict[str, Set[int]] = {}
+        self.idf: Dict[str, float] = {}
+        self._parse(text)
+        self._build_index()
+
+    def _parse(self, text: str):
+        preamble: List[str] = []
+        section: Optional[int] = None
+        current: Optional[List[str]] = None
+        heading = None
+
+        def close():
+            if current is not None and any(line.strip() for line in current):
+                body = "\n".join(current).strip()
+                keywords = tokenize(f"{self.sections[section]} {body}")
+                self.entries.append({
+                    "id": len(self.entries),
+                    "section": section,
+                    "heading": heading,
+                    "text": body,
+                    "chars": len(body),
+                    "keywords": set(keywords),
+                    "heading_keywords": set(tokenize(heading or self.sections[section])),
+                    "always": any(marker in normalize(self.sections[section]) for marker in ALWAYS_SECTIONS),
+                })
+
+        for line in text.splitlines():
+            if line.startswith("## "):
+                close()
+                self.sections.append(line[3:].strip())
+                section = len(self.sections) - 1
+                current, heading = [], None
+            elif line.startswith("### ") and section is not None:
+                close()
+                current, heading = [line], line[4:].strip()
+            elif section is None:
+                preamble.append(line)
+            else:
+                current.append(line)
+        close()
+        self.preamble = "\n".join(preamble).strip()
+
+    def _build_index(self):
+        for entry in self.entries:
+            for token in entry["keywords"]:
+                self.index.setdefault(token, set()).add(entry["id"])
+        total = len(self.entries) or 1
+        self.idf = {
+            token: math.log(total / len(ids))
+            for token, ids in self.index.items()
+            if len(ids) <= total * MAX_DOCUMENT_FREQUENCY
+        }
+
+    def score(self, tokens: Set[str]) -> Dict[int, float]:
+        """entry id -> relevance (idf of matched tokens, heading matches count double)"""
+        scores: Dict[int, float] = {}
+        for token in tokens:
+            weight = self.idf.get(token)
+            if not weight:
+                continue
+            for entry_id in self.index.get(token, ()):
+                bonus = 2.0 if token in self.entries[entry_id]["heading_keywords"] else 1.0
+                scores[entry_id] = scores.get(entry_id, 0.0) + weight * bonus
+        return scores
+
+    def render(self, entry_ids: Set[int]) -> str:
+        """Preamble + selected entries in document order, under their section headers"""
+        parts = [self.preamble] if self.preamble else []
+        for section_id, title in enumerate(self.sections):
+            texts = [e["text"] for e in self.entries if e["section"] == section_id and e["id"] in entry_ids]
+            if texts:
+                parts.append(f"## {title}\n\n" + "\n\n".join(texts))
+        return "\n\n".join(parts)
+
+
+def select(documents: List[ReferenceDocument], query: str, budget_chars: int,
+           min_entries: int) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Pick entries of every document under a total character budget:
+    always-kept sections first, then by relevance, then (up to min_entries per
+    document) the first entries of the document - the files list main locations first.
+    Returns (rendered text per document, selection stats)
+    """
+    tokens = query_tokens(query)
+    candidates = []  # (priority, -score, doc index, entry id)
+    for doc_index, document in enumerate(documents):
+        scores = document.score(tokens)
+        relevant = 0
+        for entry in document.entries:
+            if entry["always"]:
+                candidates.append((0, 0.0, doc_index, entry["id"]))
+            elif entry["id"] in scores:
+                relevant += 1
+                candidates.append((1, -scores[entry["id"]], doc_index, entry["id"]))
+        filler = [e for e in document.entries if not e["always"] and e["id"] not in scores]
+        for entry in filler[:max(0, min_entries - relevant)]:
+            candidates.append((2, float(entry["id"]), doc_index, entry["id"]))
+
+    used = sum(len(d.preamble) for d in documents)
+    selected: List[Set[int]] = [set() for _ in documents]
+    for _, _, doc_index, entry_id in sorted(candidates):
+        entry = documents[doc_index].entries[entry_id]
+        if used + entry["chars"] + 2 > budget_chars:
+            continue
+        selected[doc_index].add(entry_id)
+        used += entry["chars"] + 2
+
+    texts = [document.render(ids) for document, ids in zip(documents, selected)]
+    # Section headers may push the rendered text over the estimate: drop lowest priority entries
+    ranked = [(doc_index, entry_id) for _, _, doc_index, entry_id in sorted(candidates)
+              if entry_id in selected[doc_index]]
+    while sum(len(t) for t in texts) > budget_chars and ranked:
+        doc_index, entry_id = ranked.pop()
+        selected[doc_index].discard(entry_id)
+        texts[doc_index] = documents[doc_index].render(selected[doc_index])
+    if sum(len(t) for t in texts) > budget_chars:
+        # Budget smaller than the preambles: no reference documents at all
+        texts = ["" for _ in documents]
+
+    stats = {
+        "query_tokens": len(tokens),
+        "entries": sum(len(ids) for ids in selected),
+        "entries_total": sum(len(d.entries) for d in documents),
+        "chars": sum(len(t) for t in texts),
+        "chars_full": sum(len(d.full_text) for d in documents),
+    }
+    return texts, stats
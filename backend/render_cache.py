@@ -0,0 +1,262 @@
+"""
+PDF Render Cache for Israel Growth Venture
+Every PDF endpoint renders through render(): the results page re-renders
+(/api/pdf/generate, /api/email/send-pdf) the analysis /api/mini-analysis rendered
+moments earlier, and invoices are rebuilt on every generate-pdf / send.
+
+Key = sha256(document type, renderer arguments - language included -,
+template version, date printed on the document). Two tiers:
+- memory: LRU bounded in bytes (this worker)
+- disk: RENDER_CACHE_DIR, shared by the uvicorn workers, bounded in bytes (oldest files pruned)
+Concurrent renders of the same key share one render.
+Entries can carry a ref (e.g. the invoice id) so updates invalidate them: invalidate("invoice", invoice_id).
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+
+import letterhead
+import pdf_engine
+import pdf_executor
+
+RENDER_CACHE_ENABLED = os.getenv('RENDER_CACHE_ENABLED', 'true').lower() == 'true'
+RENDER_CACHE_MEMORY_MB = int(os.getenv('RENDER_CACHE_MEMORY_MB', '64'))
+RENDER_CACHE_DIR = Path(os.getenv('RENDER_CACHE_DIR', '/tmp/igv-render-cache'))
+RENDER_CACHE_DISK_MB = int(os.getenv('RENDER_CACHE_DISK_MB', '512'))  # 0 = memory tier only
+
+# Documents printing the render date: the key changes every day
+DATED_DOC_TYPES = ("mini_analysis", "analysis_report", "ai_insight")
+
+_memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_memory_bytes = 0
+# Disk tier size estimate (None until the directory has been scanned)
+_disk_bytes: Optional[int] = None
+_inflight: Dict[str, asyncio.Future] = {}
+
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "stores": 0,
+    "memory_evictions": 0,
+    "disk_evictions": 0,
+    "invalidated": 0,
+    "disk_errors": 0,
+}
+
+
+def template_version() -> str:
+    """Builder layout version + letterhead file: a change of either is a cache miss"""
+    try:
+        stat = letterhead.LETTERHEAD_PATH.stat()
+        letterhead_version = f"{stat.st_size}-{stat.st_mtime_ns}"
+    except OSError:
+        letterhead_version = "missing"
+    return f"{pdf_engine.TEMPLATE_VERSION}:{letterhead_version}"
+
+
+def build_key(doc_type: str, inputs: Any) -> str:
+    payload = {"doc_type": doc_type, "inputs": inputs, "template_version": template_version()}
+    if doc_type in DATED_DOC_TYPES:
+        payload["date"] = f"{datetime.now(timezone.utc):%Y-%m-%d}/{datetime.now():%Y-%m-%d}"
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _call_inputs(func: Callable, args: tuple, kwargs: dict) -> Dict[str, Any]:
+    """Renderer arguments by name (positional and keyword calls share their entries)"""
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return dict(bound.arguments)
+
+
+def _safe_ref(ref: Optional[str]) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", ref) if ref else "_"
+
+
+def _disk_path(doc_type: str, ref: Optional[str], key: str) -> Path:
+    # doc type and ref in the file name: invalidation is a glob, no index to maintain
+    return RENDER_CACHE_DIR / f"{doc_type}.{_safe_ref(ref)}.{key}.pdf"
+
+
+def _remember(key: str, doc_type: str, ref: Optional[str], pdf_bytes: bytes):
+    global _memory_bytes
+    previous = _memory.pop(key, None)
+    if previous is not None:
+        _memory_bytes -= len(previous["pdf"])
+    _memory[key] = {"doc_type": doc_type, "ref": ref, "pdf": pdf_bytes}
+    _memory_bytes += len(pdf_bytes)
+    while _memory_bytes > RENDER_CACHE_MEMORY_MB * 1024 * 1024 and len(_memory) > 1:
+        _, evicted = _memory.popitem(last=False)
+        _memory_bytes -= len(evicted["pdf"])
+        _stats["memory_evictions"] += 1
+
+
+def _disk_read(path: Path) -> Optional[bytes]:
+    try:
+        data = path.read_bytes()
+        os.utime(path)  # LRU order for pruning
+        return data
+    except FileNotFoundError:
+        return None
+
+
+def _disk_prune():
+    """Drop the least recently used files until the tier fits in RENDER_CACHE_DISK_MB"""
+    global _disk_bytes
+    files = []
+    for entry in os.scandir(RENDER_CACHE_DIR):
+        if entry.name.endswith(".pdf"):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    limit = RENDER_CACHE_DISK_MB * 1024 * 1024
+    for _, size, path in sorted(files):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            _stats["disk_evictions"] += 1
+        except FileNotFoundError:
+            pass
+    _disk_bytes = total
+
+
+def _disk_write(path: Path, pdf_bytes: bytes):
+    global _disk_bytes
+    RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_bytes(pdf_bytes)
+    os.replace(tmp_path, path)
+    if _disk_bytes is None or _disk_bytes + len(pdf_bytes) > RENDER_CACHE_DISK_MB * 1024 * 1024:
+        _disk_prune()
+    else:
+        _disk_bytes += len(pdf_bytes)
+
+
+async def render(doc_type: str, func: Callable, *args, ref: Optional[str] = None,
+                 key_data: Any = None, **kwargs) -> bytes:
+    """
+    pdf_executor.render(func, *args, **kwargs) through the cache.
+    key_data replaces the renderer arguments in the key (e.g. only the invoice fields printed on the PDF).
+    """
+    if not RENDER_CACHE_ENABLED:
+        return await pdf_executor.render(func, *args, **kwargs)
+
+    key = build_key(doc_type, key_data if key_data is not None else _call_inputs(func, args, kwargs))
+
+    entry = _memory.get(key)
+    if entry is not None:
+        _memory.move_to_end(key)
+        _stats["memory_hits"] += 1
+        return entry["pdf"]
+
+    path = _disk_path(doc_type, ref, key)
+    if RENDER_CACHE_DISK_MB > 0:
+        try:
+            pdf_bytes = await asyncio.to_thread(_disk_read, path)
+        except Exception as e:
+            _stats["disk_errors"] += 1
+            logging.warning(f"RENDER_CACHE_DISK_READ_FAILED {path.name}: {str(e)}")
+            pdf_bytes = None
+        if pdf_bytes is not None:
+            _remember(key, doc_type, ref, pdf_bytes)
+            _stats["disk_hits"] += 1
+            return pdf_bytes
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        _stats["coalesced"] += 1
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        pdf_bytes = await pdf_executor.render(func, *args, **kwargs)
+        future.set_result(pdf_bytes)
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # retrieved: no "never retrieved" warning without waiters
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+    _stats["misses"] += 1
+    _stats["stores"] += 1
+    _remember(key, doc_type, ref, pdf_bytes)
+    if RENDER_CACHE_DISK_MB > 0:
+        try:
+            await asyncio.to_thread(_disk_write, path, pdf_bytes)
+        except Exception as e:
+            _stats["disk_errors"] += 1
+            logging.warning(f"RENDER_CACHE_DISK_WRITE_FAILED {path.name}: {str(e)}")
+    return pdf_bytes
+
+
+def _disk_invalidate(doc_type: str, ref: Optional[str]) -> int:
+    global _disk_bytes
+    if not RENDER_CACHE_DIR.exists():
+        return 0
+    removed = 0
+    pattern = f"{doc_type}.{_safe_ref(ref)}.*.pdf" if ref is not None else f"{doc_type}.*.pdf"
+    for path in RENDER_CACHE_DIR.glob(pattern):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+            removed += 1
+            if _disk_bytes is not None:
+                _disk_bytes -= size
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+async def invalidate(doc_type: str, ref: Optional[str] = None) -> Dict[str, int]:
+    """Drop the cached renders of a document type, or only those of one ref (all workers: disk tier)"""
+    global _memory_bytes
+    keys = [key for key, entry in _memory.items()
+            if entry["doc_type"] == doc_type and (ref is None or entry["ref"] == ref)]
+    for key in keys:
+        _memory_bytes -= len(_memory.pop(key)["pdf"])
+
+    disk_removed = 0
+    try:
+        disk_removed = await asyncio.to_thread(_disk_invalidate, doc_type, ref)
+    except Exception as e:
+        _stats["disk_errors"] += 1
+        logging.warning(f"RENDER_CACHE_INVALIDATE_FAILED {doc_type}/{ref}: {str(e)}")
+
+    _stats["invalidated"] += len(keys) + disk_removed
+    logging.info(f"RENDER_CACHE_INVALIDATED {doc_type} ref={ref} memory={len(keys)} disk={disk_removed}")
+    return {"memory_removed": len(keys), "disk_removed": disk_removed}
+
+
+def cache_status() -> Dict[str, Any]:
+    lookups = _stats["memory_hits"] + _stats["disk_hits"] + _stats["misses"]
+    return {
+        "enabled": RENDER_CACHE_ENABLED,
+        "template_version": template_version(),
+        "memory": {
+            "entries": len(_memory),
+            "bytes": _memory_bytes,
+            "max_mb": RENDER_CACHE_MEMORY_MB,
+        },
+        "disk": {
+            "dir": str(RENDER_CACHE_DIR),
+            "bytes": _disk_bytes,
+            "max_mb": RENDER_CACHE_DISK_MB,
+        },
+        "hit_rate": round((_stats["memory_hits"] + _stats["disk_hits"]) / lookups, 3) if lookups else None,
+        "stats": dict(_stats),
+    }
@@ -0,0 +1,193 @@
+"""
+Mini-Analysis Result Cache for Israel Growth Venture
+Content-addressed cache of generated analyses: key = hash(normalized form payload,
+language, prompt template version). In-memory LRU with TTL in front of a shared
+MongoDB tier (collection mini_analysis_cache, TTL index on expires_at).
+Opt-in with MINI_ANALYSIS_RESULT_CACHE_ENABLED=true
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+
+RESULT_CACHE_ENABLED = os.getenv('MINI_ANALYSIS_RESULT_CACHE_ENABLED', 'false').lower() == 'true'
+RESULT_CACHE_TTL_SECONDS = int(os.getenv('MINI_ANALYSIS_RESULT_CACHE_TTL_SECONDS', '604800'))  # 7 days
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('MINI_ANALYSIS_RESULT_CACHE_MAX_ENTRIES', '256'))
+
+# Form fields that shape the analysis (contact fields - email, phone, names - do not)
+CACHE_KEY_FIELDS = [
+    "secteur",
+    "statut_alimentaire",
+    "anciennete",
+    "pays_dorigine",
+    "concept",
+    "positionnement",
+    "modele_actuel",
+    "differenciation",
+    "objectif_israel",
+    "contraintes",
+]
+
+_memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_indexes_ready = False
+
+_stats = {
+    "memory_hits": 0,
+    "mongo_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+}
+
+
+def normalize_value(value: Optional[str]) -> str:
+    """Case/spacing/trailing punctuation insensitive form value (tiny edits hit the cache)"""
+    value = unicodedata.normalize("NFKC", value or "").casefold()
+    value = " ".join(value.split())
+    return re.sub(r"[\s.,;:!?]+$", "", value)
+
+
+def build_cache_key(request, language: str, brand_slug: str, template: Dict[str, Any]) -> str:
+    """sha256 of normalized payload + language + template id/version"""
+    payload = {field: normalize_value(getattr(request, field, "")) for field in CACHE_KEY_FIELDS}
+    payload["brand_slug"] = brand_slug
+    payload["language"] = language
+    payload["template_id"] = template["template_id"]
+    payload["template_version"] = template["version"]
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _remember(entry: Dict[str, Any]):
+    _memory[entry["cache_key"]] = entry
+    _memory.move_to_end(entry["cache_key"])
+    while len(_memory) > RESULT_CACHE_MAX_ENTRIES:
+        _memory.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+async def _ensure_indexes(current_db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        await current_db.mini_analysis_cache.create_index("cache_key", unique=True, background=True)
+        await current_db.mini_analysis_cache.create_index("expires_at", expireAfterSeconds=0, background=True)
+        await current_db.mini_analysis_cache.create_index("brand_slug", background=True)
+        _indexes_ready = True
+    except Exception as e:
+        logging.warning(f"Result cache index creation skipped: {e}")
+
+
+async def lookup(current_db, cache_key: str, request_id: str = "unknown") -> Optional[Dict[str, Any]]:
+    """Return the cached entry (memory first, then MongoDB) or None"""
+    now = datetime.now(timezone.utc)
+
+    entry = _memory.get(cache_key)
+    if entry is not None:
+        if entry["expires_at"] > now:
+            _memory.move_to_end(cache_key)
+            _stats["memory_hits"] += 1
+            logging.info(f"[{request_id}] RESULT_CACHE_HIT memory key={cache_key[:12]}")
+            return entry
+        _memory.pop(cache_key, None)
+
+    if current_db is not None:
+        try:
+            # TTL monitor only runs every ~60s, so filter on expires_at as well
+            entry = await current_db.mini_analysis_cache.find_one(
+                {"cache_key": cache_key, "expires_at": {"$gt": now}},
+                {"_id": 0}
+            )
+        except Exception as e:
+            logging.warning(f"[{request_id}] RESULT_CACHE_LOOKUP_FAILED: {str(e)}")
+            entry = None
+
+        if entry is not None:
+            # Mongo (BSON) datetimes come back naive UTC
+            if entry["expires_at"].tzinfo is None:
+                entry["expires_at"] = entry["expires_at"].replace(tzinfo=timezone.utc)
+            _remember(entry)
+            _stats["mongo_hits"] += 1
+            logging.info(f"[{request_id}] RESULT_CACHE_HIT mongo key={cache_key[:12]}")
+            return entry
+
+    _stats["misses"] += 1
+    return None
+
+
+async def store(current_db, cache_key: str, brand_slug: str, language: str,
+                template: Dict[str, Any], analysis_text: str, request_id: str = "unknown"):
+    """Store a generated analysis in both tiers (MongoDB failures are non-blocking)"""
+    now = datetime.now(timezone.utc)
+    entry = {
+        "cache_key": cache_key,
+        "brand_slug": brand_slug,
+        "language": language,
+        "template_id": template["template_id"],
+        "template_version": template["version"],
+        "analysis_text": analysis_text,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=RESULT_CACHE_TTL_SECONDS),
+    }
+    _remember(dict(entry))
+    _stats["stores"] += 1
+
+    if current_db is None:
+        return
+    try:
+        await _ensure_indexes(current_db)
+        await current_db.mini_analysis_cache.update_one(
+            {"cache_key": cache_key},
+            {"$set": entry},
+            upsert=True
+        )
+    except Exception as e:
+        logging.warning(f"[{request_id}] RESULT_CACHE_STORE_FAILED: {str(e)}")
+
+
+async def invalidate(current_db, brand_slug: Optional[str] = None, template: Optional[str] = None) -> Dict[str, int]:
+    """
+    Drop cached analyses for a brand slug and/or a template.
+    template matches template_id prefixes, e.g. "MASTER_PROMPT_RETAIL_NON_FOOD"
+    (all languages) or "MASTER_PROMPT_RETAIL_NON_FOOD_HE:Whitelist_2_Arabe_incl_Mixed".
+    """
+    def matches(entry: Dict[str, Any]) -> bool:
+        if brand_slug is not None and entry["brand_slug"] != brand_slug:
+            return False
+        if template is not None and not entry["template_id"].startswith(template):
+            return False
+        return True
+
+    memory_keys = [key for key, entry in _memory.items() if matches(entry)]
+    for key in memory_keys:
+        _memory.pop(key, None)
+
+    mongo_removed = 0
+    if current_db is not None:
+        query: Dict[str, Any] = {}
+        if brand_slug is not None:
+            query["brand_slug"] = brand_slug
+        if template is not None:
+            query["template_id"] = {"$regex": f"^{re.escape(template)}"}
+        result = await current_db.mini_analysis_cache.delete_many(query)
+        mongo_removed = result.deleted_count
+
+    logging.info(f"RESULT_CACHE_INVALIDATED brand={brand_slug} template={template} memory={len(memory_keys)} mongo={mongo_removed}")
+    return {"memory_removed": len(memory_keys), "mongo_removed": mongo_removed}
+
+
+def cache_status() -> Dict[str, Any]:
+    return {
+        "enabled": RESULT_CACHE_ENABLED,
+        "ttl_seconds": RESULT_CACHE_TTL_SECONDS,
+        "max_entries": RESULT_CACHE_MAX_ENTRIES,
+        "memory_entries": len(_memory),
+        "stats": dict(_stats)
+    }
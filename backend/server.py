@@ -1,11 +1,10 @@
 # IGV Backend - FastAPI Server - Build 20260102-0845 - HOTFIX 3
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
 import os
 import logging
@@ -20,19 +19,31 @@ import hashlib
 import hmac
 import traceback
 
-# Conditional email imports (don't crash if not available)
-try:
-    import aiosmtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    EMAIL_LIBS_AVAILABLE = True
-except ImportError as e:
-    logging.warning(f"⚠️ Email libraries not available in server.py: {str(e)}")
-    EMAIL_LIBS_AVAILABLE = False
+# Email (sent through smtp_client, which holds the optional aiosmtplib import)
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+import smtp_client
+EMAIL_LIBS_AVAILABLE = smtp_client.aiosmtplib is not None
+
+import llm_executor
+import prompt_registry
+import idempotency
 
 # Import AI routes
 from ai_routes import router as ai_router
 from mini_analysis_routes import router as mini_analysis_router
+from mini_analysis_jobs import router as mini_analysis_jobs_router
+import mini_analysis_jobs
+import campaign_engine
+import database
+from database import get_db
+import email_outbox
+import pending_worker
+import pdf_executor
+import quota_governor
+import similarity_index
+import whitelist_validator
 from extended_routes import router as extended_router
 # from crm_routes import router as crm_router  # DISABLED - duplicate with crm_complete_routes
 from tracking_routes import router as tracking_router
@@ -79,35 +90,22 @@ ADMIN_EMAIL = os.getenv('ADMIN_EMAIL')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
 BOOTSTRAP_TOKEN = os.getenv('BOOTSTRAP_TOKEN')
 
-# MongoDB connection with environment variable aliases (Render compatibility)
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
-
-# Initialize MongoDB client (optional - will be None if not configured)
-client = None
-db = None
-mongodb_status = "not_configured"
+# MongoDB: one client (one connection pool) shared by every module, see database.py
+# The client is created by the startup hook (database.connect); handlers read it with get_db()
+mongo_url = database.MONGO_URL
+db_name = database.DB_NAME
 
 if mongo_url:
-    try:
-        # Configure MongoDB with timeout and connection pooling
-        client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,  # 5 second timeout
-            connectTimeoutMS=5000,
-            socketTimeoutMS=5000,
-            maxPoolSize=10,
-            minPoolSize=1
-        )
-        db = client[db_name]
-        mongodb_status = "configured"
-        logging.info(f"MongoDB configured for database: {db_name}")
-    except Exception as e:
-        logging.error(f"MongoDB connection error: {str(e)}")
-        mongodb_status = "error"
+    logging.info(f"MongoDB configured for database: {db_name}")
 else:
     logging.warning("MongoDB not configured (MONGODB_URI or MONGO_URL not set)")
 
+
+def mongodb_status() -> str:
+    if database.is_connected():
+        return "configured"
+    return "error" if mongo_url else "not_configured"
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -127,7 +125,7 @@ async def debug_routers():
         "gemini_api_key_length": len(os.getenv('GEMINI_API_KEY', '')),
         "mongodb_uri_set": bool(mongo_url),
         "db_name": db_name,
-        "mongodb_status": mongodb_status,
+        "mongodb_status": mongodb_status(),
         "build_timestamp": "2025-12-29T17:20:00Z"
     }
 
@@ -253,16 +251,17 @@ async def debug_headers(request: Request):
 @api_router.get("/health")
 async def health_check():
     """Health check endpoint with MongoDB status"""
+    current_db = get_db()
     health_status = {
         "status": "ok",
-        "mongodb": mongodb_status
+        "mongodb": mongodb_status()
     }
     
-    if mongodb_status == "configured" and db is not None:
+    if current_db is not None:
         try:
             # Test MongoDB connection with timeout
             import asyncio
-            await asyncio.wait_for(db.command('ping'), timeout=3.0)
+            await asyncio.wait_for(current_db.command('ping'), timeout=3.0)
             health_status["mongodb"] = "connected"
             health_status["db"] = db_name
         except asyncio.TimeoutError:
@@ -404,16 +403,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     return verify_jwt_token(token)
 
 
-# Helper function to send email via OVH SMTP (contact@israelgrowthventure.com)
+# Helper function to queue an email via OVH SMTP (contact@israelgrowthventure.com) - sent by the email outbox
 async def send_email_gmail(to_email: str, subject: str, body: str, html_body: str = None):
-    # OVH SMTP Configuration
-    smtp_host = os.getenv('SMTP_HOST', 'ssl0.ovh.net')
-    smtp_port = int(os.getenv('SMTP_PORT', '465'))
-    smtp_user = os.getenv('SMTP_USER', 'contact@israelgrowthventure.com')
-    smtp_password = os.getenv('SMTP_PASSWORD')
-    smtp_from = os.getenv('SMTP_FROM', 'contact@israelgrowthventure.com')
-    
-    if not smtp_user or not smtp_password:
+    # OVH SMTP account (smtp_client settings)
+    smtp_from = smtp_client.SMTP_FROM
+    
+    if not smtp_client.is_configured():
         raise HTTPException(status_code=500, detail="SMTP credentials not configured")
     
     message = MIMEMultipart('alternative')
@@ -430,18 +425,10 @@ async def send_email_gmail(to_email: str, subject: str, body: str, html_body: st
         message.attach(part2)
     
     try:
-        # OVH requires SSL/TLS (port 465) instead of STARTTLS (port 587)
-        await aiosmtplib.send(
-            message,
-            hostname=smtp_host,
-            port=smtp_port,
-            username=smtp_user,
-            password=smtp_password,
-            use_tls=True  # SSL/TLS direct for OVH
-        )
+        await email_outbox.enqueue(get_db(), message, "contact", smtp_client.account())
         return True
     except Exception as e:
-        logging.error(f"Error sending email: {str(e)}")
+        logging.error(f"Error queueing email: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
 
 
@@ -452,9 +439,19 @@ async def root():
 
 
 @api_router.post("/contact", response_model=ContactResponse)
-async def create_contact(contact: ContactForm):
-    """Handle contact form submission"""
-    if db is None:
+async def create_contact(contact: ContactForm, idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")):
+    """Handle contact form submission (idempotent: one record + one email per submission)"""
+    return await idempotency.run_once(
+        "contact",
+        idempotency_key,
+        contact.model_dump(),
+        lambda clients: save_contact_and_notify(contact)
+    )
+
+
+async def save_contact_and_notify(contact: ContactForm) -> ContactResponse:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
     
     contact_dict = contact.model_dump()
@@ -463,7 +460,7 @@ async def create_contact(contact: ContactForm):
     # Save to MongoDB
     doc = contact_obj.model_dump()
     doc['timestamp'] = doc['timestamp'].isoformat()
-    await db.contacts.insert_one(doc)
+    await current_db.contacts.insert_one(doc)
     
     # Send email notification
     email_subject = f"Nouveau contact IGV - {contact.name}"
@@ -523,9 +520,10 @@ async def create_contact(contact: ContactForm):
 @api_router.get("/contacts", response_model=List[ContactResponse])
 async def get_contacts():
     """Get all contacts (admin)"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
-    contacts = await db.contacts.find({}, {"_id": 0}).to_list(1000)
+    contacts = await current_db.contacts.find({}, {"_id": 0}).to_list(1000)
     for contact in contacts:
         ts = contact.get('timestamp')
         if ts is None:
@@ -544,21 +542,23 @@ async def get_contacts():
 @api_router.post("/cart", response_model=CartItem)
 async def add_to_cart(item: CartItemCreate):
     """Add item to cart"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
     cart_obj = CartItem(**item.model_dump())
     doc = cart_obj.model_dump()
     doc['timestamp'] = doc['timestamp'].isoformat()
-    await db.cart.insert_one(doc)
+    await current_db.cart.insert_one(doc)
     return cart_obj
 
 
 @api_router.get("/cart", response_model=List[CartItem])
 async def get_cart():
     """Get cart items"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
-    items = await db.cart.find({}, {"_id": 0}).to_list(1000)
+    items = await current_db.cart.find({}, {"_id": 0}).to_list(1000)
     for item in items:
         if isinstance(item['timestamp'], str):
             item['timestamp'] = datetime.fromisoformat(item['timestamp'])
@@ -654,10 +654,11 @@ async def detect_location(request: Request):
 @api_router.get("/cms/content")
 async def get_cms_content(page: str, language: str = 'fr', user: Dict = Depends(get_current_user)):
     """Get CMS content for a specific page and language (protected)"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
     
-    content = await db.cms_content.find_one(
+    content = await current_db.cms_content.find_one(
         {"page": page, "language": language},
         {"_id": 0}
     )
@@ -670,7 +671,8 @@ async def get_cms_content(page: str, language: str = 'fr', user: Dict = Depends(
 @api_router.post("/cms/content")
 async def save_cms_content(data: CMSContentCreate, user: Dict = Depends(get_current_user)):
     """Save CMS content (protected, admin/editor only)"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
     
     if user['role'] not in ['admin', 'editor']:
@@ -684,7 +686,7 @@ async def save_cms_content(data: CMSContentCreate, user: Dict = Depends(get_curr
     )
     
     # Upsert: update if exists, insert if not
-    await db.cms_content.update_one(
+    await current_db.cms_content.update_one(
         {"page": data.page, "language": data.language},
         {"$set": content_obj.model_dump()},
         upsert=True
@@ -700,7 +702,8 @@ async def save_cms_content(data: CMSContentCreate, user: Dict = Depends(get_curr
 @api_router.post("/admin/bootstrap")
 async def bootstrap_admin(token: str):
     """Bootstrap admin account (protected by BOOTSTRAP_TOKEN)"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
     
     if not BOOTSTRAP_TOKEN:
@@ -713,10 +716,10 @@ async def bootstrap_admin(token: str):
         raise HTTPException(status_code=403, detail="Invalid bootstrap token")
     
     # Check if admin already exists
-    existing_admin = await db.users.find_one({"email": ADMIN_EMAIL})
+    existing_admin = await current_db.users.find_one({"email": ADMIN_EMAIL})
     if existing_admin:
         # Update password hash if it exists (allows password reset)
-        await db.users.update_one(
+        await current_db.users.update_one(
             {"email": ADMIN_EMAIL},
             {"$set": {"password_hash": hash_password(ADMIN_PASSWORD)}}
         )
@@ -729,17 +732,18 @@ async def bootstrap_admin(token: str):
         role='admin'
     )
     
-    await db.users.insert_one(admin_user.model_dump())
+    await current_db.users.insert_one(admin_user.model_dump())
     
     return {"message": "Admin created successfully", "email": ADMIN_EMAIL}
 
 @api_router.post("/admin/login")
 async def admin_login(credentials: AdminLoginRequest):
     """Admin login - returns JWT token"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
     
-    user = await db.users.find_one({"email": credentials.email})
+    user = await current_db.users.find_one({"email": credentials.email})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -765,29 +769,31 @@ async def verify_admin_token(user: Dict = Depends(get_current_user)):
 @api_router.get("/admin/contacts")
 async def get_all_contacts(user: Dict = Depends(get_current_user)):
     """Get all contacts (admin only)"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
     
     if user['role'] not in ['admin', 'editor', 'viewer']:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
-    contacts = await db.contacts.find({}, {"_id": 0}).sort("timestamp", -1).to_list(1000)
+    contacts = await current_db.contacts.find({}, {"_id": 0}).sort("timestamp", -1).to_list(1000)
     return contacts
 
 @api_router.get("/admin/stats")
 async def get_stats(user: Dict = Depends(get_current_user)):
     """Get dashboard statistics (admin/sales/viewer)"""
-    if db is None:
+    current_db = get_db()
+    if current_db is None:
         raise HTTPException(status_code=503, detail="Database not configured")
     
     if user['role'] not in ['admin', 'sales', 'viewer']:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     try:
-        total_contacts = await db.contacts.count_documents({})
-        total_carts = await db.cart.count_documents({})
-        total_leads = await db.leads.count_documents({})
-        total_analyses = await db.mini_analyses.count_documents({})
+        total_contacts = await current_db.contacts.count_documents({})
+        total_carts = await current_db.cart.count_documents({})
+        total_leads = await current_db.leads.count_documents({})
+        total_analyses = await current_db.mini_analyses.count_documents({})
         
         # Calculate conversion rate (leads that became analyses)
         conversion_rate = round((total_analyses / total_leads * 100) if total_leads > 0 else 0, 1)
@@ -898,6 +904,7 @@ async def monetico_callback(data: Dict[str, Any]):
 app.include_router(api_router)
 app.include_router(ai_router)  # AI Insight generation
 app.include_router(mini_analysis_router)  # Mini-Analysis with Gemini
+app.include_router(mini_analysis_jobs_router)  # Mini-Analysis async jobs (202 + progress)
 app.include_router(extended_router)  # Extended features: PDF, Calendar, Contact Expert
 # app.include_router(crm_router)  # DISABLED - duplicate with crm_complete_routes
 app.include_router(crm_complete_router)  # CRM Complete (MVP) - ONLY CRM router now
@@ -934,32 +941,105 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_database():
+    """Open the shared MongoDB connection pool (the first startup hook: the others use it)"""
+    await database.connect()
+
 @app.on_event("startup")
 async def startup_db_init():
     """Create MongoDB indexes for performance on startup"""
-    if db is not None:
+    current_db = get_db()
+    if current_db is not None:
         try:
             # Leads indexes
-            await db.leads.create_index("created_at", background=True)
-            await db.leads.create_index("status", background=True)
-            await db.leads.create_index("email", background=True)
-            await db.leads.create_index("stage", background=True)
+            await current_db.leads.create_index("created_at", background=True)
+            await current_db.leads.create_index("status", background=True)
+            await current_db.leads.create_index("email", background=True)
+            await current_db.leads.create_index("stage", background=True)
             # Contacts indexes
-            await db.contacts.create_index("email", background=True)
-            await db.contacts.create_index("name", background=True)
-            await db.contacts.create_index("created_at", background=True)
+            await current_db.contacts.create_index("email", background=True)
+            await current_db.contacts.create_index("name", background=True)
+            await current_db.contacts.create_index("created_at", background=True)
             # Opportunities indexes  
-            await db.opportunities.create_index("stage", background=True)
-            await db.opportunities.create_index("contact_id", background=True)
-            await db.opportunities.create_index("created_at", background=True)
+            await current_db.opportunities.create_index("stage", background=True)
+            await current_db.opportunities.create_index("contact_id", background=True)
+            await current_db.opportunities.create_index("created_at", background=True)
             # Activities index
-            await db.activities.create_index("lead_id", background=True)
-            await db.activities.create_index("created_at", background=True)
+            await current_db.activities.create_index("lead_id", background=True)
+            await current_db.activities.create_index("created_at", background=True)
             logging.info("✓ MongoDB indexes created/verified")
         except Exception as e:
             logging.warning(f"Index creation skipped: {e}")
 
+@app.on_event("startup")
+async def startup_prompt_registry():
+    """Compile master prompts + reference documents once"""
+    prompt_registry.load_prompt_registry()
+
+@app.on_event("startup")
+async def startup_whitelist_validator():
+    """Compile the city automaton used to check generated analyses against the whitelists"""
+    whitelist_validator.build()
+
+@app.on_event("startup")
+async def startup_mini_analysis_jobs():
+    """Resume mini-analysis jobs interrupted by a restart"""
+    await mini_analysis_jobs.resume_jobs()
+
+@app.on_event("startup")
+async def startup_quota_governor():
+    """Rebuild today's Gemini budgets from recorded usage"""
+    await quota_governor.restore_usage()
+
+@app.on_event("startup")
+async def startup_similarity_index():
+    """Reload the similar-analyses vectors (and index analyses saved since)"""
+    similarity_index.start()
+
+@app.on_event("startup")
+async def startup_pdf_executor():
+    """Spawn the PDF rendering worker processes (renderer modules imported, fonts registered)"""
+    pdf_executor.start()
+
+@app.on_event("startup")
+async def startup_email_outbox():
+    """Deliver queued emails in the background (request handlers only enqueue)"""
+    email_outbox.start()
+
+@app.on_event("startup")
+async def startup_campaign_engine():
+    """Send email campaigns in the background (campaigns left running resume from their checkpoint)"""
+    campaign_engine.start()
+
+@app.on_event("startup")
+async def startup_pending_worker():
+    """Drain pending_analyses (quota-blocked mini-analyses) in the background"""
+    pending_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown_mini_analysis_jobs():
+    await mini_analysis_jobs.stop_workers()
+    await pending_worker.stop()
+    await email_outbox.stop()
+    await campaign_engine.stop()
+    await smtp_client.close_all()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    if client:
-        client.close()
+    database.close()
+
+@app.on_event("shutdown")
+async def shutdown_llm_executor():
+    """Release Gemini cached contexts, then the Gemini thread pool"""
+    try:
+        import context_cache
+        from mini_analysis_routes import gemini_client
+        await context_cache.release_contexts(gemini_client)
+    except Exception as e:
+        logging.warning(f"Context cache release skipped: {e}")
+    llm_executor.shutdown_executor()
+
+@app.on_event("shutdown")
+async def shutdown_pdf_executor():
+    pdf_executor.shutdown_executor()
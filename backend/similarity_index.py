@@ -0,0 +1,369 @@
+"""
+Similar Past Analyses Index for Israel Growth Venture
+In-process TF-IDF index over mini_analyses (client form + generated text) for
+"have we analysed a similar brand before?" lookups from the CRM.
+
+- Hashed unigram + bigram features (signed feature hashing, SIMILARITY_INDEX_DIM
+  buckets): no vocabulary, so analyses are added one by one as they are saved
+- Term frequencies live in a NumPy matrix; IDF is derived from per-bucket document
+  counts at query time -> top-k cosine over a few thousand rows in milliseconds
+- Vectors are persisted (sparse) in mini_analysis_vectors: a restart reloads them
+  and only vectorizes the analyses saved since the last one
+- At most SIMILARITY_INDEX_MAX_DOCS rows in memory: adding past the cap evicts the oldest
+"""
+
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+
+import database
+from language_detector import STOP_WORDS
+
+SIMILARITY_INDEX_ENABLED = os.getenv('SIMILARITY_INDEX_ENABLED', 'true').lower() == 'true'
+SIMILARITY_INDEX_DIM = int(os.getenv('SIMILARITY_INDEX_DIM', '4096'))
+SIMILARITY_INDEX_MAX_DOCS = int(os.getenv('SIMILARITY_INDEX_MAX_DOCS', '20000'))
+# Stored vectors with another version are recomputed (feature extraction changed)
+INDEX_VERSION = f"hash-uni-bi-v1-{SIMILARITY_INDEX_DIM}"
+
+# Form fields describing the brand (brand name and contact fields excluded on purpose)
+FORM_FIELDS = (
+    "secteur", "statut_alimentaire", "pays_dorigine", "concept", "positionnement",
+    "modele_actuel", "differenciation", "objectif_israel", "contraintes",
+)
+# The form describes the brand more densely than the generated analysis
+FORM_WEIGHT = 3.0
+INITIAL_CAPACITY = 256
+BACKFILL_BATCH = 200
+
+TOKEN = re.compile(r"[a-zà-öø-ÿא-ת0-9]+")
+ALL_STOP_WORDS = STOP_WORDS["fr"] | STOP_WORDS["en"]
+
+_lock = asyncio.Lock()
+_loaded = False
+_matrix = np.zeros((0, SIMILARITY_INDEX_DIM), dtype=np.float32)
+_size = 0
+_doc_freq = np.zeros(SIMILARITY_INDEX_DIM, dtype=np.float32)
+_ids: List[str] = []
+_meta: List[Dict[str, Any]] = []
+_positions: Dict[str, int] = {}
+# Analysis ids in insertion order (oldest first) - eviction order past SIMILARITY_INDEX_MAX_DOCS
+_order: deque = deque()
+_watermark: Optional[datetime] = None
+# TF-IDF weighted, L2-normalized rows - recomputed on the first query after an add
+_normalized: Optional[np.ndarray] = None
+_idf_cached: Optional[np.ndarray] = None
+
+_stats = {
+    "added": 0,
+    "evicted": 0,
+    "loaded": 0,
+    "backfilled": 0,
+    "queries": 0,
+    "last_query_ms": None,
+    "load_ms": None,
+}
+
+
+# =============================================================================
+# VECTORIZATION
+# =============================================================================
+
+def _features(text: str) -> List[str]:
+    tokens = [t for t in TOKEN.findall(text.lower()) if len(t) > 1 and t not in ALL_STOP_WORDS]
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _accumulate(vector: np.ndarray, text: str, weight: float):
+    counts: Dict[str, int] = {}
+    for feature in _features(text):
+        counts[feature] = counts.get(feature, 0) + 1
+    for feature, count in counts.items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        sign = 1.0 if h & 0x80000000 else -1.0
+        # Sublinear term frequency
+        vector[h % SIMILARITY_INDEX_DIM] += sign * weight * (1.0 + math.log(count))
+
+
+def vectorize(form: Dict[str, Any], response_text: str = "") -> np.ndarray:
+    """Term-frequency vector of an analysis (form fields weighted FORM_WEIGHT)"""
+    vector = np.zeros(SIMILARITY_INDEX_DIM, dtype=np.float32)
+    form_text = " ".join(str(form.get(field) or "") for field in FORM_FIELDS)
+    _accumulate(vector, form_text, FORM_WEIGHT)
+    _accumulate(vector, response_text or "", 1.0)
+    return vector
+
+
+def _metadata(doc: Dict[str, Any]) -> Dict[str, Any]:
+    form = doc.get("payload_form") or {}
+    return {
+        "brand_name": doc.get("brand_name"),
+        "brand_slug": doc.get("brand_slug"),
+        "secteur": form.get("secteur"),
+        "language": doc.get("language"),
+        "lead_id": doc.get("lead_id"),
+        "created_at": doc.get("created_at"),
+    }
+
+
+# =============================================================================
+# IN-MEMORY INDEX
+# =============================================================================
+
+def _evict_oldest():
+    """Drop the oldest row; the last row moves into its slot (rows stay contiguous)"""
+    global _size, _doc_freq
+    position = _positions.pop(_order.popleft())
+    last = _size - 1
+    _doc_freq -= _matrix[position] != 0
+    if position != last:
+        _matrix[position] = _matrix[last]
+        _ids[position] = _ids[last]
+        _meta[position] = _meta[last]
+        _positions[_ids[position]] = position
+    _matrix[last] = 0
+    _ids.pop()
+    _meta.pop()
+    _size = last
+    _stats["evicted"] += 1
+
+
+def _add_row(analysis_id: str, vector: np.ndarray, meta: Dict[str, Any]):
+    global _matrix, _size, _doc_freq, _watermark, _normalized
+    _normalized = None
+    position = _positions.get(analysis_id)
+    if position is not None:
+        _doc_freq -= _matrix[position] != 0
+    else:
+        while _size >= max(1, SIMILARITY_INDEX_MAX_DOCS):
+            _evict_oldest()
+        if _size == len(_matrix):
+            grown = np.zeros((max(INITIAL_CAPACITY, len(_matrix) * 2), SIMILARITY_INDEX_DIM), dtype=np.float32)
+            grown[:_size] = _matrix[:_size]
+            _matrix = grown
+        position = _size
+        _size += 1
+        _ids.append(analysis_id)
+        _meta.append(meta)
+        _positions[analysis_id] = position
+        _order.append(analysis_id)
+    _matrix[position] = vector
+    _meta[position] = meta
+    _doc_freq += vector != 0
+    created_at = meta.get("created_at")
+    if isinstance(created_at, datetime):
+        # MongoDB returns naive UTC datetimes
+        created_at = meta["created_at"] = created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+        if _watermark is None or created_at > _watermark:
+            _watermark = created_at
+
+
+def _weighted_matrix():
+    global _normalized, _idf_cached
+    if _normalized is None:
+        _idf_cached = np.log((1.0 + _size) / (1.0 + _doc_freq)).astype(np.float32) + 1.0
+        weighted = _matrix[:_size] * _idf_cached
+        norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+        _normalized = weighted / np.where(norms == 0, 1.0, norms)
+    return _normalized, _idf_cached
+
+
+def query_vector(vector: np.ndarray, k: int = 5, exclude_ids=(), exclude_brand_slug: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Top-k cosine matches (TF-IDF weighted) of a term-frequency vector"""
+    if _size == 0:
+        return []
+    started = time.perf_counter()
+    normalized, idf = _weighted_matrix()
+    query = vector * idf
+    scores = normalized @ (query / (np.linalg.norm(query) or 1.0))
+
+    excluded = {_positions[i] for i in exclude_ids if i in _positions}
+    if exclude_brand_slug:
+        excluded.update(p for p, meta in enumerate(_meta) if meta.get("brand_slug") == exclude_brand_slug)
+    if excluded:
+        scores[list(excluded)] = -np.inf
+
+    count = min(k, _size - len(excluded))
+    if count <= 0:
+        return []
+    top = np.argpartition(-scores, count - 1)[:count]
+    top = top[np.argsort(-scores[top])]
+
+    _stats["queries"] += 1
+    _stats["last_query_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return [
+        {"analysis_id": _ids[p], "score": round(float(scores[p]), 4), **_meta[p]}
+        for p in top if scores[p] > 0
+    ]
+
+
+# =============================================================================
+# PERSISTENCE (mini_analysis_vectors)
+# =============================================================================
+
+def _get_db():
+    return database.get_db()
+
+
+def _to_document(analysis_id, vector: np.ndarray, meta: Dict[str, Any]) -> Dict[str, Any]:
+    indices = np.flatnonzero(vector).astype(np.uint16 if SIMILARITY_INDEX_DIM <= 65536 else np.uint32)
+    return {
+        "_id": analysis_id,
+        "version": INDEX_VERSION,
+        "indices": indices.tobytes(),
+        "values": vector[indices].astype(np.float32).tobytes(),
+        **meta,
+    }
+
+
+def _from_document(doc: Dict[str, Any]) -> np.ndarray:
+    vector = np.zeros(SIMILARITY_INDEX_DIM, dtype=np.float32)
+    indices = np.frombuffer(doc["indices"], dtype=np.uint16 if SIMILARITY_INDEX_DIM <= 65536 else np.uint32)
+    vector[indices] = np.frombuffer(doc["values"], dtype=np.float32)
+    return vector
+
+
+async def _store(current_db, analysis_id, vector: np.ndarray, meta: Dict[str, Any]):
+    try:
+        await current_db.mini_analysis_vectors.replace_one(
+            {"_id": analysis_id}, _to_document(analysis_id, vector, meta), upsert=True
+        )
+    except Exception as e:
+        logging.error(f"SIMILARITY_INDEX_STORE_FAILED {analysis_id}: {str(e)}")
+
+
+async def add_analysis(current_db, inserted_id, record: Dict[str, Any]):
+    """Index a freshly saved mini_analyses document (called after insert)"""
+    if not SIMILARITY_INDEX_ENABLED or current_db is None:
+        return
+    try:
+        vector = vectorize(record.get("payload_form") or {}, record.get("response_text") or "")
+        meta = _metadata(record)
+        _add_row(str(inserted_id), vector, meta)
+        _stats["added"] += 1
+        await _store(current_db, inserted_id, vector, meta)
+    except Exception as e:
+        logging.error(f"SIMILARITY_INDEX_ADD_FAILED {inserted_id}: {str(e)}")
+
+
+async def load(current_db=None):
+    """
+    Startup: reload persisted vectors, then vectorize analyses saved after the
+    newest one (everything on the first run)
+    """
+    global _loaded
+    current_db = current_db if current_db is not None else _get_db()
+    if not SIMILARITY_INDEX_ENABLED or current_db is None:
+        return
+    async with _lock:
+        if _loaded:
+            return
+        started = time.perf_counter()
+        try:
+            # Newest SIMILARITY_INDEX_MAX_DOCS, added oldest first (eviction order)
+            docs = await current_db.mini_analysis_vectors.find(
+                {"version": INDEX_VERSION}
+            ).sort("created_at", -1).to_list(SIMILARITY_INDEX_MAX_DOCS)
+            docs.reverse()
+            for doc in docs:
+                _add_row(str(doc["_id"]), _from_document(doc), {k: doc.get(k) for k in (
+                    "brand_name", "brand_slug", "secteur", "language", "lead_id", "created_at")})
+            _stats["loaded"] = len(docs)
+
+            # Newest persisted vector (not _watermark: analyses may be added while loading)
+            newest = max((doc["created_at"] for doc in docs if isinstance(doc.get("created_at"), datetime)), default=None)
+            missing = {"created_at": {"$gt": newest}} if newest is not None else {}
+            analyses = await current_db.mini_analyses.find(
+                missing,
+                {"payload_form": 1, "response_text": 1, "brand_name": 1, "brand_slug": 1,
+                 "language": 1, "lead_id": 1, "created_at": 1}
+            ).sort("created_at", -1).to_list(SIMILARITY_INDEX_MAX_DOCS)
+            analyses.reverse()
+
+            for start in range(0, len(analyses), BACKFILL_BATCH):
+                batch = [a for a in analyses[start:start + BACKFILL_BATCH] if str(a["_id"]) not in _positions]
+                # Tokenizing hundreds of analyses: keep it off the event loop
+                vectors = await asyncio.to_thread(
+                    lambda items: [vectorize(a.get("payload_form") or {}, a.get("response_text") or "") for a in items],
+                    batch
+                )
+                for analysis, vector in zip(batch, vectors):
+                    meta = _metadata(analysis)
+                    _add_row(str(analysis["_id"]), vector, meta)
+                    await _store(current_db, analysis["_id"], vector, meta)
+                _stats["backfilled"] += len(batch)
+
+            _weighted_matrix()
+            _loaded = True
+            _stats["load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            logging.info(f"✅ Similarity index ready: {_size} analyses ({_stats['loaded']} loaded, "
+                         f"{_stats['backfilled']} vectorized) in {_stats['load_ms']}ms")
+        except Exception as e:
+            logging.error(f"❌ SIMILARITY_INDEX_LOAD_FAILED: {str(e)}")
+
+
+def start():
+    """Load in the background (app startup) - queries wait for it if needed"""
+    if SIMILARITY_INDEX_ENABLED:
+        asyncio.ensure_future(load())
+
+
+async def similar_to_lead(current_db, lead: Dict[str, Any], k: int = 5, include_same_brand: bool = False) -> Dict[str, Any]:
+    """
+    Top-k past analyses similar to a lead: uses the lead's own analysis vector when
+    indexed, otherwise the lead's sector + stored analysis text
+    """
+    await load(current_db)
+    import mini_analysis_routes  # Imported here to avoid a circular import
+    started = time.perf_counter()
+
+    analysis_ids = [v for v in (lead.get("analyses_by_language") or {}).values()]
+    meta_id = (lead.get("analysis_meta") or {}).get("analysis_id")
+    if meta_id:
+        analysis_ids.insert(0, meta_id)
+
+    indexed = next((i for i in analysis_ids if i in _positions), None)
+    if indexed is not None:
+        vector = _matrix[_positions[indexed]].copy()
+        source = "analysis"
+    else:
+        vector = vectorize({"secteur": lead.get("sector")}, lead.get("analysis") or "")
+        source = "lead"
+
+    brand_slug = mini_analysis_routes.normalize_brand_slug(lead.get("brand_name") or "")
+    results = query_vector(
+        vector, k,
+        exclude_ids=analysis_ids,
+        exclude_brand_slug=None if include_same_brand or not brand_slug else brand_slug
+    )
+    for result in results:
+        if isinstance(result.get("created_at"), datetime):
+            result["created_at"] = result["created_at"].isoformat()
+    return {
+        "lead_id": str(lead["_id"]),
+        "query_source": source,
+        "index_size": _size,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+        "results": results,
+    }
+
+
+def index_status() -> Dict[str, Any]:
+    return {
+        "enabled": SIMILARITY_INDEX_ENABLED,
+        "loaded": _loaded,
+        "version": INDEX_VERSION,
+        "size": _size,
+        "max_docs": SIMILARITY_INDEX_MAX_DOCS,
+        "matrix_mb": round(_matrix.nbytes / 1024 / 1024, 2),
+        "watermark": _watermark.isoformat() if isinstance(_watermark, datetime) else None,
+        "stats": dict(_stats),
+    }
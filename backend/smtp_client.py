@@ -0,0 +1,303 @@
+"""
+SMTP Client for Israel Growth Venture
+One place for the SMTP account settings and the port / TLS rule:
+    port 465 = implicit TLS, any other port = STARTTLS
+and a small pool of authenticated connections per account (server, port, user),
+instead of TCP + TLS + EHLO + LOGIN for every message:
+- up to SMTP_POOL_SIZE connections per account, reused for the following messages
+- NOOP health check of a connection idle for more than SMTP_HEALTHCHECK_SECONDS
+- recycled after SMTP_POOL_IDLE_SECONDS idle, SMTP_CONNECTION_MAX_AGE_SECONDS
+  or SMTP_MAX_MESSAGES_PER_CONNECTION messages (provider per-session limits)
+- a reused connection dropped by the server is replaced once, transparently
+- send_batch(): several messages over one session (campaigns)
+
+The password is read from SMTP_PASSWORD when a connection logs in: account settings
+(stored with the email outbox messages) never carry it.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+try:
+    import aiosmtplib
+    SMTP_CONNECTION_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError,
+                              asyncio.IncompleteReadError)
+except ImportError:
+    logging.warning("Email libraries not available (aiosmtplib) - emails cannot be sent")
+    aiosmtplib = None
+    SMTP_CONNECTION_ERRORS = (ConnectionError,)
+
+# Default account - OVH (contact@israelgrowthventure.com)
+SMTP_HOST = os.getenv('SMTP_SERVER') or os.getenv('SMTP_HOST', 'ssl0.ovh.net')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '465'))
+SMTP_USER = os.getenv('SMTP_USERNAME') or os.getenv('SMTP_USER', 'contact@israelgrowthventure.com')
+SMTP_FROM = os.getenv('SMTP_FROM_EMAIL') or os.getenv('SMTP_FROM', 'contact@israelgrowthventure.com')
+
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '4'))
+SMTP_POOL_IDLE_SECONDS = int(os.getenv('SMTP_POOL_IDLE_SECONDS', '120'))
+SMTP_HEALTHCHECK_SECONDS = int(os.getenv('SMTP_HEALTHCHECK_SECONDS', '15'))
+SMTP_CONNECTION_MAX_AGE_SECONDS = int(os.getenv('SMTP_CONNECTION_MAX_AGE_SECONDS', '900'))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', '100'))
+SMTP_TIMEOUT_SECONDS = 60
+
+_pools: Dict[Tuple, "SMTPPool"] = {}
+
+_stats = {
+    "connections_opened": 0,
+    "connections_reused": 0,
+    "connections_recycled": 0,
+    "connect_errors": 0,
+    "healthchecks": 0,
+    "healthcheck_failures": 0,
+    "reconnects": 0,
+    "messages_sent": 0,
+    "send_errors": 0,
+}
+
+
+def smtp_password() -> Optional[str]:
+    return os.getenv('SMTP_PASSWORD')
+
+
+def is_configured(settings: Optional[Dict[str, Any]] = None) -> bool:
+    settings = settings or account()
+    return aiosmtplib is not None and bool(settings.get("hostname") and settings.get("username") and smtp_password())
+
+
+def account(hostname: Optional[str] = None, port: Optional[int] = None, username: Optional[str] = None) -> Dict[str, Any]:
+    """SMTP account settings (default: the SMTP_* env account) with the port / TLS rule applied"""
+    port = port or SMTP_PORT
+    return {
+        "hostname": hostname or SMTP_HOST,
+        "port": port,
+        "username": username or SMTP_USER,
+        "use_tls": port == 465,
+        "start_tls": port != 465,
+    }
+
+
+class PooledConnection:
+    __slots__ = ("smtp", "created_at", "last_used", "messages", "reused")
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.created_at = self.last_used = time.monotonic()
+        self.messages = 0
+        self.reused = False
+
+
+class SMTPPool:
+    """Authenticated connections of one account (most recently used first)"""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+        self._idle: List[PooledConnection] = []
+        self._slots = asyncio.Semaphore(SMTP_POOL_SIZE)
+        self.open_connections = 0
+        self.in_use = 0
+
+    async def _connect(self) -> PooledConnection:
+        if aiosmtplib is None:
+            raise RuntimeError("Email libraries not available - install aiosmtplib")
+        password = smtp_password()
+        if not self.settings.get("username") or not password:
+            raise RuntimeError("SMTP credentials not configured")
+        smtp = aiosmtplib.SMTP(
+            hostname=self.settings["hostname"],
+            port=self.settings["port"],
+            use_tls=self.settings.get("use_tls", False),
+            start_tls=self.settings.get("start_tls", False),
+            timeout=SMTP_TIMEOUT_SECONDS
+        )
+        try:
+            await smtp.connect()
+            await smtp.login(self.settings["username"], password)
+        except Exception as e:
+            _stats["connect_errors"] += 1
+            logging.error(f"❌ SMTP_CONNECT_FAILED {self.settings['hostname']}:{self.settings['port']}: {str(e)}")
+            smtp.close()
+            raise
+        _stats["connections_opened"] += 1
+        self.open_connections += 1
+        return PooledConnection(smtp)
+
+    def _expired(self, connection: PooledConnection, now: float) -> bool:
+        return (not connection.smtp.is_connected
+                or now - connection.last_used > SMTP_POOL_IDLE_SECONDS
+                or now - connection.created_at > SMTP_CONNECTION_MAX_AGE_SECONDS
+                or connection.messages >= SMTP_MAX_MESSAGES_PER_CONNECTION)
+
+    async def _close(self, connection: PooledConnection, quit: bool = True):
+        self.open_connections -= 1
+        try:
+            if quit and connection.smtp.is_connected:
+                await asyncio.wait_for(connection.smtp.quit(), timeout=5)
+        except Exception:
+            pass
+        finally:
+            connection.smtp.close()
+
+    async def acquire(self) -> PooledConnection:
+        """Idle connection (health-checked when idle for a while) or a new one"""
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                connection = self._idle.pop()
+                now = time.monotonic()
+                if self._expired(connection, now):
+                    _stats["connections_recycled"] += 1
+                    await self._close(connection)
+                    continue
+                if now - connection.last_used > SMTP_HEALTHCHECK_SECONDS:
+                    _stats["healthchecks"] += 1
+                    try:
+                        await connection.smtp.noop()
+                    except Exception:
+                        _stats["healthcheck_failures"] += 1
+                        await self._close(connection, quit=False)
+                        continue
+                _stats["connections_reused"] += 1
+                connection.reused = True
+                self.in_use += 1
+                return connection
+            connection = await self._connect()
+            self.in_use += 1
+            return connection
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, connection: PooledConnection, reusable: bool = True):
+        self.in_use -= 1
+        try:
+            connection.last_used = time.monotonic()
+            if reusable and not self._expired(connection, connection.last_used):
+                self._idle.append(connection)
+            else:
+                if reusable:
+                    _stats["connections_recycled"] += 1
+                await self._close(connection, quit=reusable)
+        finally:
+            self._slots.release()
+
+    async def discard_idle(self):
+        """The server dropped a session: the other idle ones are most likely gone too"""
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await self._close(connection, quit=False)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await self._close(connection)
+
+
+def _pool(settings: Dict[str, Any]) -> SMTPPool:
+    key = (settings["hostname"], settings["port"], settings.get("username"),
+           settings.get("use_tls", False), settings.get("start_tls", False))
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = SMTPPool(settings)
+    return pool
+
+
+async def _send_on(pool: SMTPPool, connection: PooledConnection, message) -> Tuple[PooledConnection, Optional[Exception]]:
+    """
+    Send one message on a held connection. Returns the connection to keep using
+    (a replacement when a reused one had been dropped) and the SMTP error, if any.
+    Connection failures of a fresh connection are raised.
+    """
+    for attempt in (1, 2):
+        try:
+            await connection.smtp.send_message(message)
+        except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused) as e:
+            if getattr(e, "code", None) != 421:
+                # Refused by the server: the envelope was reset, the session is still usable
+                _stats["send_errors"] += 1
+                return connection, e
+            dropped = e  # 421: the server is closing the session
+        except SMTP_CONNECTION_ERRORS as e:
+            dropped = e
+        except BaseException:
+            # Timeout / cancellation / protocol state unknown: do not reuse this session
+            _stats["send_errors"] += 1
+            await pool.release(connection, reusable=False)
+            raise
+        else:
+            connection.messages += 1
+            _stats["messages_sent"] += 1
+            return connection, None
+
+        await pool.release(connection, reusable=False)
+        if not connection.reused or attempt == 2:
+            _stats["send_errors"] += 1
+            raise dropped
+        # Stale pooled session (server idle timeout): once more on a new connection
+        _stats["reconnects"] += 1
+        logging.warning(f"SMTP_RECONNECT {pool.settings['hostname']}:{pool.settings['port']} (pooled session dropped: {str(dropped)})")
+        await pool.discard_idle()
+        connection = await pool.acquire()
+
+
+async def send(message, settings: Optional[Dict[str, Any]] = None):
+    """Send one message through the account's pool (Bcc recipients taken from the header, not transmitted)"""
+    pool = _pool(settings or account())
+    connection = await pool.acquire()
+    connection, error = await _send_on(pool, connection, message)
+    await pool.release(connection)
+    if error is not None:
+        raise error
+
+
+async def send_batch(messages: List[Any], settings: Optional[Dict[str, Any]] = None) -> List[Optional[Exception]]:
+    """
+    Send several messages over one session (a new one after SMTP_MAX_MESSAGES_PER_CONNECTION).
+    Returns one entry per message: None when sent, the SMTP refusal otherwise.
+    Connection failures are raised (messages before the failing one were sent).
+    """
+    pool = _pool(settings or account())
+    results: List[Optional[Exception]] = []
+    connection = await pool.acquire()
+    try:
+        for message in messages:
+            if connection.messages >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+                await pool.release(connection)
+                connection = None
+                connection = await pool.acquire()
+            connection, error = await _send_on(pool, connection, message)
+            results.append(error)
+    except BaseException:
+        connection = None  # released by _send_on / acquire
+        raise
+    finally:
+        if connection is not None:
+            await pool.release(connection)
+    return results
+
+
+async def close_all():
+    """QUIT the idle connections (app shutdown)"""
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
+
+
+def pool_status() -> Dict[str, Any]:
+    return {
+        "default_account": {**account(), "password_set": bool(smtp_password())},
+        "pool_size": SMTP_POOL_SIZE,
+        "idle_seconds": SMTP_POOL_IDLE_SECONDS,
+        "healthcheck_seconds": SMTP_HEALTHCHECK_SECONDS,
+        "max_age_seconds": SMTP_CONNECTION_MAX_AGE_SECONDS,
+        "max_messages_per_connection": SMTP_MAX_MESSAGES_PER_CONNECTION,
+        "pools": [
+            {"hostname": pool.settings["hostname"], "port": pool.settings["port"],
+             "username": pool.settings.get("username"), "open": pool.open_connections,
+             "in_use": pool.in_use, "idle": len(pool._idle)}
+            for pool in _pools.values()
+        ],
+        "stats": dict(_stats),
+    }
@@ -0,0 +1,228 @@
+"""
+Mini-Analysis Telemetry for Israel Growth Venture
+Per-analysis latency, token and cost record stored on mini_analyses.telemetry:
+- prompt template id + version
+- input / output / cached tokens and an estimated cost (USD) from the providers' usage
+- stage timings: generation (LLM), pdf, email_queue (outbox insert), total wall time,
+  and smtp: the delivery itself, added by the email outbox result hook once sent
+
+The record of the running analysis lives in a ContextVar: the LLM layer
+(llm_executor, llm_gateway) adds usage to it without any plumbing.
+GET /api/admin/mini-analysis-telemetry aggregates p50/p95/p99 and token totals.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+import logging
+import time
+
+# USD per 1M tokens: (input, output, cached input) - longest model-name prefix wins
+MODEL_PRICES_PER_MTOK = {
+    "gemini-2.5-flash": (0.30, 2.50, 0.075),
+    "gemini-2.5-pro": (1.25, 10.00, 0.31),
+    "gemini-2.0-flash": (0.10, 0.40, 0.025),
+    "gpt-4-turbo": (10.00, 30.00, 10.00),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "stub": (0.0, 0.0, 0.0),
+}
+DEFAULT_PRICE = MODEL_PRICES_PER_MTOK["gemini-2.5-flash"]
+
+TIMINGS = ("generation", "pdf", "email_queue", "smtp", "total")
+AGGREGATION_MAX_DOCS = 20000
+
+_current: ContextVar[Optional[Dict[str, Any]]] = ContextVar("mini_analysis_telemetry", default=None)
+
+
+def model_price(model: Optional[str]):
+    matches = [name for name in MODEL_PRICES_PER_MTOK if model and model.startswith(name)]
+    return MODEL_PRICES_PER_MTOK[max(matches, key=len)] if matches else DEFAULT_PRICE
+
+
+def start(template: Optional[Dict[str, Any]] = None, sector: Optional[str] = None,
+          language: Optional[str] = None, started_at: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Open the record of the analysis running in this context
+    started_at: time.time() when the request was received (total includes validation / job queueing)
+    """
+    record = {
+        "template_id": template["template_id"] if template else None,
+        "template_version": template["version"] if template else None,
+        "prompt_static_chars": template["static_chars"] if template else None,
+        "sector": sector,
+        "language": language,
+        "provider": None,
+        "model": None,
+        "llm_calls": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cached_tokens": 0,
+        "cost_usd": 0.0,
+        "timings_ms": {},
+        "_started": started_at or time.time(),
+    }
+    _current.set(record)
+    return record
+
+
+def current() -> Optional[Dict[str, Any]]:
+    return _current.get()
+
+
+def add_timing(stage: str, elapsed_ms: float):
+    record = current()
+    if record is not None:
+        record["timings_ms"][stage] = round(record["timings_ms"].get(stage, 0) + elapsed_ms, 1)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Add the wall time of the block to timings_ms[stage] (no-op without a record)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(stage, (time.perf_counter() - started) * 1000)
+
+
+def add_usage(provider: str, model: Optional[str], input_tokens: int, output_tokens: int, cached_tokens: int = 0):
+    """One LLM call's usage (input_tokens includes cached_tokens, as reported by Gemini)"""
+    record = current()
+    if record is None:
+        return
+    price_in, price_out, price_cached = model_price(model)
+    record["provider"] = provider
+    record["model"] = model
+    record["llm_calls"] += 1
+    record["input_tokens"] += input_tokens
+    record["output_tokens"] += output_tokens
+    record["cached_tokens"] += cached_tokens
+    record["cost_usd"] += (
+        (input_tokens - cached_tokens) * price_in
+        + cached_tokens * price_cached
+        + output_tokens * price_out
+    ) / 1_000_000
+
+
+def add_gemini_usage(model: str, usage_metadata: Any):
+    if usage_metadata is None:
+        # Stream cut before the usage chunk (e.g. wrong language): count the call only
+        record = current()
+        if record is not None:
+            record["llm_calls"] += 1
+        return
+    add_usage(
+        "gemini",
+        model,
+        getattr(usage_metadata, "prompt_token_count", None) or 0,
+        getattr(usage_metadata, "candidates_token_count", None) or 0,
+        getattr(usage_metadata, "cached_content_token_count", None) or 0,
+    )
+
+
+def finish(cache_hit: bool = False) -> Optional[Dict[str, Any]]:
+    """Close the record: total wall time, rounded cost - returns the stored document"""
+    record = current()
+    if record is None:
+        return None
+    record["timings_ms"]["total"] = round((time.time() - record["_started"]) * 1000, 1)
+    document = {k: v for k, v in record.items() if not k.startswith("_")}
+    document["cost_usd"] = round(record["cost_usd"], 6)
+    document["cache_hit"] = cache_hit
+    return document
+
+
+async def save(current_db, inserted_id, cache_hit: bool = False, request_id: str = "unknown"):
+    """
+    Store the finished record on the mini_analyses document
+    Field by field: the smtp timing may already be there (email sent before the record is saved)
+    """
+    document = finish(cache_hit)
+    if document is None or inserted_id is None:
+        return
+    fields = {f"telemetry.{key}": value for key, value in document.items() if key != "timings_ms"}
+    fields.update({f"telemetry.timings_ms.{stage}": ms for stage, ms in document["timings_ms"].items()})
+    try:
+        await current_db.mini_analyses.update_one({"_id": inserted_id}, {"$set": fields})
+        logging.info(
+            f"[{request_id}] TELEMETRY total={document['timings_ms'].get('total')}ms "
+            f"tokens={document['input_tokens']}/{document['output_tokens']} cost=${document['cost_usd']}"
+        )
+    except Exception as e:
+        logging.error(f"[{request_id}] TELEMETRY_SAVE_FAILED: {str(e)}")
+
+
+# =============================================================================
+# AGGREGATION (admin)
+# =============================================================================
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(values)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))], 1)
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99)}
+
+
+def _summarize(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    input_tokens = sum(d.get("input_tokens", 0) for d in docs)
+    output_tokens = sum(d.get("output_tokens", 0) for d in docs)
+    generated = [d for d in docs if not d.get("cache_hit")]
+    return {
+        "count": len(docs),
+        "cache_hits": len(docs) - len(generated),
+        "latency_ms": {
+            stage: _percentiles([d["timings_ms"][stage] for d in docs if stage in d.get("timings_ms", {})])
+            for stage in TIMINGS
+        },
+        "tokens": {
+            "input": input_tokens,
+            "output": output_tokens,
+            "cached": sum(d.get("cached_tokens", 0) for d in docs),
+            "avg_input_per_analysis": round(input_tokens / len(generated)) if generated else None,
+            "avg_output_per_analysis": round(output_tokens / len(generated)) if generated else None,
+        },
+        "cost_usd": round(sum(d.get("cost_usd", 0.0) for d in docs), 4),
+    }
+
+
+async def aggregate(current_db, days: int = 7, group_by: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    p50/p95/p99 per stage + token/cost totals, grouped by any of sector, language, day
+    """
+    group_by = group_by or ["sector", "language", "day"]
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+
+    docs = await current_db.mini_analyses.find(
+        {"created_at": {"$gte": since}, "telemetry": {"$exists": True}},
+        {"_id": 0, "created_at": 1, "telemetry": 1}
+    ).sort("created_at", -1).to_list(AGGREGATION_MAX_DOCS)
+
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    by_language: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        record = doc["telemetry"]
+        keys = {
+            "sector": record.get("sector"),
+            "language": record.get("language"),
+            "day": doc["created_at"].strftime("%Y-%m-%d"),
+        }
+        groups.setdefault(tuple(keys[k] for k in group_by), []).append(record)
+        by_language.setdefault(record.get("language") or "unknown", []).append(record)
+
+    return {
+        "since": since.isoformat(),
+        "days": days,
+        "group_by": group_by,
+        "total": _summarize([doc["telemetry"] for doc in docs]),
+        # Capacity / quota planning: Hebrew prompts are about twice the French ones
+        "by_language": {language: _summarize(records) for language, records in by_language.items()},
+        "groups": [
+            {**dict(zip(group_by, key)), **_summarize(records)}
+            for key, records in sorted(groups.items(), key=lambda item: tuple(str(k) for k in item[0]))
+        ],
+    }
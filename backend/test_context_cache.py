@@ -0,0 +1,89 @@
+"""
+Tests for the Gemini context cache, driven through the offline FakeGeminiClient
+Run: python -m pytest -q test_context_cache.py
+"""
+
+import asyncio
+
+import pytest
+
+import context_cache
+import llm_fake_provider
+import quota_governor
+from llm_fake_provider import FakeGeminiClient
+from mini_analysis_routes import MiniAnalysisRequest
+
+MODEL = "gemini-test"
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setattr(llm_fake_provider, "FAKE_LLM_LATENCY_SECONDS", 0)
+    monkeypatch.setattr(quota_governor, "GOVERNOR_ENABLED", False)
+    monkeypatch.setattr(context_cache, "CONTEXT_CACHE_ENABLED", True)
+    context_cache._contexts.clear()
+    context_cache._locks.clear()
+    yield
+    context_cache._contexts.clear()
+    context_cache._locks.clear()
+
+
+def _request(language="fr"):
+    return MiniAnalysisRequest(
+        email="client@example.com", nom_de_marque="Maison Test",
+        secteur="Retail (hors food)", language=language
+    )
+
+
+def _generate(client, language="fr"):
+    return asyncio.run(context_cache.generate(client, MODEL, _request(language), language, request_id="test"))
+
+
+def test_static_prefix_is_cached_once_per_template():
+    client = FakeGeminiClient()
+
+    first = _generate(client)
+    second = _generate(client)
+
+    assert client.caches.create_calls == 1
+    assert [call["cached_content"] is not None for call in client.models.calls] == [True, True]
+    # Only the form block is sent once the prefix is cached
+    assert client.models.calls[0]["prompt_chars"] < 5000
+    assert "Maison Test" in first.text and first.text == second.text
+
+
+def test_expired_context_falls_back_to_the_full_prompt():
+    client = FakeGeminiClient()
+    _generate(client)
+    fallbacks = context_cache._stats["expired_fallbacks"]
+
+    client.caches.expire()
+    response = _generate(client)
+
+    assert "Maison Test" in response.text
+    assert context_cache._stats["expired_fallbacks"] == fallbacks + 1
+    assert client.models.calls[-1]["cached_content"] is None
+    assert client.models.calls[-1]["prompt_chars"] > client.models.calls[0]["prompt_chars"]
+
+
+def test_disabled_cache_sends_the_full_prompt(monkeypatch):
+    monkeypatch.setattr(context_cache, "CONTEXT_CACHE_ENABLED", False)
+    client = FakeGeminiClient()
+
+    _generate(client, language="he")
+
+    assert client.caches.create_calls == 0
+    assert client.models.calls[0]["cached_content"] is None
+
+
+def test_stream_uses_the_cached_prefix():
+    client = FakeGeminiClient()
+
+    async def collect():
+        return [chunk.text async for chunk in context_cache.stream(client, MODEL, _request(), "fr", request_id="test")]
+
+    chunks = asyncio.run(collect())
+
+    assert len(chunks) > 1
+    assert "Maison Test" in "".join(chunks)
+    assert client.models.calls[0]["cached_content"] is not None
@@ -0,0 +1,120 @@
+"""
+Tests for the email outbox delivery of a leased message (retry vs permanent failure)
+Run: python -m pytest -q test_email_outbox.py
+"""
+
+import asyncio
+from email.mime.text import MIMEText
+from unittest.mock import AsyncMock, MagicMock
+
+import aiosmtplib
+import pytest
+from bson import ObjectId
+
+import email_outbox
+
+
+@pytest.fixture
+def db():
+    current_db = MagicMock()
+    current_db.email_outbox.update_one = AsyncMock()
+    current_db.email_events.insert_one = AsyncMock()
+    return current_db
+
+
+@pytest.fixture
+def send(monkeypatch):
+    mock = AsyncMock()
+    monkeypatch.setattr(email_outbox.smtp_client, "send", mock)
+    return mock
+
+
+def _item(attempts=0):
+    message = MIMEText("Bonjour")
+    message["To"] = "client@example.com"
+    message["Subject"] = "Test"
+    return {
+        "_id": ObjectId(),
+        "email_type": "test",
+        "to_email": "client@example.com",
+        "message": message.as_bytes(),
+        "smtp": {"host": "smtp.example.com"},
+        "attachments": [],
+        "attempts": attempts,
+    }
+
+
+def _saved_status(db):
+    return db.email_outbox.update_one.call_args.args[1]["$set"]
+
+
+def test_sent_message_records_the_event_and_runs_the_hook(db, send, monkeypatch):
+    hook = AsyncMock()
+    monkeypatch.setitem(email_outbox._result_hooks, "test", hook)
+
+    result = asyncio.run(email_outbox.process_item(db, _item()))
+
+    assert result["status"] == "sent"
+    assert _saved_status(db)["status"] == "sent"
+    assert "send_ms" in _saved_status(db)
+    assert db.email_events.insert_one.call_args.args[0]["status"] == "sent"
+    assert hook.call_args.args[2:] == (True, None)
+
+
+@pytest.mark.parametrize("error", [
+    aiosmtplib.SMTPServerDisconnected("connection lost"),
+    aiosmtplib.SMTPResponseException(451, "try again later"),
+    aiosmtplib.SMTPAuthenticationError(535, "bad credentials"),
+])
+def test_transient_errors_are_retried_with_backoff(db, send, error):
+    send.side_effect = error
+
+    result = asyncio.run(email_outbox.process_item(db, _item(attempts=1)))
+
+    assert result["status"] == "retry_scheduled"
+    saved = _saved_status(db)
+    assert saved["status"] == "pending"
+    assert saved["attempts"] == 2
+    assert saved["lease_owner"] is None
+    db.email_events.insert_one.assert_not_called()
+
+
+@pytest.mark.parametrize("error", [
+    aiosmtplib.SMTPRecipientsRefused([aiosmtplib.SMTPRecipientRefused(550, "no such user", "client@example.com")]),
+    aiosmtplib.SMTPResponseException(554, "message refused"),
+])
+def test_permanent_errors_fail_at_once(db, send, error):
+    send.side_effect = error
+
+    result = asyncio.run(email_outbox.process_item(db, _item()))
+
+    assert result["status"] == "failed"
+    assert _saved_status(db)["status"] == "failed"
+    assert db.email_events.insert_one.call_args.args[0]["status"] == "failed"
+
+
+def test_last_attempt_fails_even_for_transient_errors(db, send):
+    send.side_effect = aiosmtplib.SMTPServerDisconnected("connection lost")
+
+    result = asyncio.run(email_outbox.process_item(db, _item(attempts=email_outbox.EMAIL_OUTBOX_MAX_ATTEMPTS - 1)))
+
+    assert result["status"] == "failed"
+
+
+def test_retry_delay_doubles_up_to_one_hour():
+    assert [email_outbox.retry_delay_seconds(n) for n in (1, 2, 3)] == [30, 60, 120]
+    assert email_outbox.retry_delay_seconds(20) == email_outbox.RETRY_BACKOFF_MAX_SECONDS
+
+
+def test_disabled_outbox_sends_inline_once(db, send, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_OUTBOX_ENABLED", False)
+    db.email_outbox.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+    send.side_effect = aiosmtplib.SMTPServerDisconnected("connection lost")
+    message = MIMEText("Bonjour")
+    message["To"] = "client@example.com"
+
+    asyncio.run(email_outbox.enqueue(db, message, "test", smtp={"host": "smtp.example.com"}))
+
+    assert db.email_outbox.insert_one.call_args.args[0]["status"] == "sending"
+    send.assert_called_once()
+    assert _saved_status(db)["status"] == "failed"
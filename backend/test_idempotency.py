@@ -0,0 +1,78 @@
+"""
+Tests for idempotency keys: in-flight coalescing, replay and key reuse
+Run: python -m pytest -q test_idempotency.py
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import idempotency
+
+
+@pytest.fixture(autouse=True)
+def empty_store():
+    idempotency._responses.clear()
+    idempotency._inflight.clear()
+    yield
+    idempotency._responses.clear()
+    idempotency._inflight.clear()
+
+
+def test_concurrent_identical_requests_share_one_execution():
+    calls = []
+
+    async def handler(clients):
+        calls.append(clients)
+        await asyncio.sleep(0.05)
+        return {"analysis_id": "a1"}
+
+    async def submit_twice():
+        return await asyncio.gather(
+            idempotency.run_once("test", None, {"email": "a@b.com"}, handler),
+            idempotency.run_once("test", None, {"email": "a@b.com"}, handler),
+        )
+
+    results = asyncio.run(submit_twice())
+
+    assert len(calls) == 1
+    assert results == [{"analysis_id": "a1"}, {"analysis_id": "a1"}]
+
+
+def test_late_retry_replays_the_stored_result():
+    calls = []
+
+    async def handler(clients):
+        calls.append(1)
+        return {"analysis_id": f"a{len(calls)}"}
+
+    first = asyncio.run(idempotency.run_once("test", "key-1", {"email": "a@b.com"}, handler))
+    again = asyncio.run(idempotency.run_once("test", "key-1", {"email": "a@b.com"}, handler))
+
+    assert first == again == {"analysis_id": "a1"}
+    assert len(calls) == 1
+
+
+def test_key_reused_with_another_payload_is_rejected():
+    async def handler(clients):
+        return {}
+
+    asyncio.run(idempotency.run_once("test", "key-2", {"email": "a@b.com"}, handler))
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(idempotency.run_once("test", "key-2", {"email": "other@b.com"}, handler))
+    assert rejected.value.status_code == 422
+
+
+def test_failed_execution_is_not_stored():
+    attempts = []
+
+    async def handler(clients):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return {"ok": True}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(idempotency.run_once("test", "key-3", {}, handler))
+    assert asyncio.run(idempotency.run_once("test", "key-3", {}, handler)) == {"ok": True}
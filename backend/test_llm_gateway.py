@@ -0,0 +1,149 @@
+"""
+Tests for the LLM gateway circuit breaker (offline, StubLLM-backed calls)
+Run: python -m pytest -q test_llm_gateway.py
+"""
+
+import asyncio
+
+import pytest
+
+import llm_gateway
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    for name in llm_gateway._providers:
+        llm_gateway._providers[name] = llm_gateway._new_provider_state()
+    yield
+
+
+def _failing_call(error):
+    async def call(timeout, http_request):
+        raise error
+    return call
+
+
+async def _ok_call(timeout, http_request):
+    return llm_gateway._get_stub().generate("prompt", None)
+
+
+def _open_circuit(provider="stub"):
+    for _ in range(llm_gateway.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(RuntimeError):
+            asyncio.run(llm_gateway.generate(
+                "mini-analysis", "prompt", providers=[provider],
+                overrides={provider: _failing_call(RuntimeError("boom"))}
+            ))
+
+
+def test_breaker_opens_after_threshold_and_short_circuits():
+    _open_circuit()
+    assert llm_gateway._providers["stub"]["state"] == "open"
+
+    with pytest.raises(llm_gateway.CircuitOpenError):
+        asyncio.run(llm_gateway.generate("mini-analysis", "prompt", providers=["stub"], overrides={"stub": _ok_call}))
+    assert llm_gateway._providers["stub"]["short_circuited"] == 1
+
+
+def test_half_open_trial_success_closes_circuit(monkeypatch):
+    _open_circuit()
+    monkeypatch.setattr(llm_gateway, "BREAKER_RESET_SECONDS", 0)
+
+    result = asyncio.run(llm_gateway.generate("mini-analysis", "prompt", providers=["stub"], overrides={"stub": _ok_call}))
+    assert result["provider"] == "stub"
+    assert llm_gateway._providers["stub"]["state"] == "closed"
+
+
+def test_half_open_trial_failure_reopens_circuit(monkeypatch):
+    _open_circuit()
+    monkeypatch.setattr(llm_gateway, "BREAKER_RESET_SECONDS", 0)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(llm_gateway.generate(
+            "mini-analysis", "prompt", providers=["stub"],
+            overrides={"stub": _failing_call(RuntimeError("still down"))}
+        ))
+    assert llm_gateway._providers["stub"]["state"] == "open"
+    assert llm_gateway._providers["stub"]["trial_in_flight"] is False
+
+
+def test_cancelled_half_open_trial_frees_the_next_trial(monkeypatch):
+    _open_circuit()
+    monkeypatch.setattr(llm_gateway, "BREAKER_RESET_SECONDS", 0)
+
+    async def slow_call(timeout, http_request):
+        await asyncio.sleep(10)
+
+    async def cancel_trial():
+        task = asyncio.ensure_future(llm_gateway.generate(
+            "mini-analysis", "prompt", providers=["stub"], overrides={"stub": slow_call}
+        ))
+        await asyncio.sleep(0.05)
+        assert llm_gateway._providers["stub"]["trial_in_flight"] is True
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    state = llm_gateway._providers["stub"]
+    assert state["trial_in_flight"] is False
+    assert state["state"] == "half_open"
+
+    result = asyncio.run(llm_gateway.generate("mini-analysis", "prompt", providers=["stub"], overrides={"stub": _ok_call}))
+    assert result["provider"] == "stub"
+    assert state["state"] == "closed"
+
+
+def test_fallback_serves_when_primary_fails(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "is_configured", lambda provider: provider in ("openai", "stub"))
+
+    result = asyncio.run(llm_gateway.generate(
+        "mini-analysis", "prompt", providers=["openai", "stub"],
+        overrides={"openai": _failing_call(RuntimeError("openai down")), "stub": _ok_call}
+    ))
+    assert result["provider"] == "stub"
+    assert result["fallback"] is True
+    assert llm_gateway._providers["openai"]["consecutive_failures"] == 1
+
+
+def _collect(provider, open_stream):
+    async def run():
+        return [chunk async for chunk in llm_gateway.stream(provider, open_stream)]
+    return asyncio.run(run())
+
+
+def test_stream_records_outcomes_and_respects_open_breaker():
+    def failing_stream(timeout, http_request):
+        async def chunks():
+            yield "partial"
+            raise RuntimeError("stream broke")
+        return chunks()
+
+    for _ in range(llm_gateway.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(RuntimeError):
+            _collect("stub", failing_stream)
+    assert llm_gateway._providers["stub"]["state"] == "open"
+
+    def ok_stream(timeout, http_request):
+        async def chunks():
+            yield "never sent"
+        return chunks()
+
+    with pytest.raises(llm_gateway.CircuitOpenError):
+        _collect("stub", ok_stream)
+
+
+def test_stream_passes_the_provider_timeout():
+    seen = {}
+
+    def ok_stream(timeout, http_request):
+        seen["timeout"] = timeout
+
+        async def chunks():
+            yield "a"
+            yield "b"
+        return chunks()
+
+    assert _collect("gemini", ok_stream) == ["a", "b"]
+    assert seen["timeout"] == llm_gateway.PROVIDER_TIMEOUTS["gemini"]
+    assert llm_gateway._providers["gemini"]["successes"] == 1
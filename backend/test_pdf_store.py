@@ -0,0 +1,58 @@
+"""
+Tests for the PDF store Range parsing and signed download links
+Run: python -m pytest -q test_pdf_store.py
+"""
+
+import pytest
+
+import pdf_store
+from pdf_store import RangeNotSatisfiable, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-200", (800, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=999-999", (999, 999)),
+    (" bytes=0-0 ", (0, 0)),
+])
+def test_single_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=0-99,200-299",
+    "items=0-99",
+    "bytes=-",
+    "bytes=abc-",
+    "",
+])
+def test_unsupported_ranges_serve_the_whole_file(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",
+    "bytes=1500-1600",
+    "bytes=500-100",
+    "bytes=-0",
+])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+def test_pdf_link_token_is_bound_to_the_analysis(monkeypatch):
+    monkeypatch.setattr(pdf_store, "PDF_LINK_SECRET", "test-secret")
+    token = pdf_store.pdf_link_token("65f0c0ffee")
+    assert pdf_store.verify_pdf_link_token("65f0c0ffee", token)
+    assert not pdf_store.verify_pdf_link_token("65f0c0ffef", token)
+    assert not pdf_store.verify_pdf_link_token("65f0c0ffee", None)
+    assert pdf_store.analysis_pdf_url("65f0c0ffee").endswith(f"?token={token}")
+
+
+def test_unsigned_links_are_refused_without_a_secret(monkeypatch):
+    monkeypatch.setattr(pdf_store, "PDF_LINK_SECRET", "")
+    assert not pdf_store.verify_pdf_link_token("65f0c0ffee", pdf_store.pdf_link_token("65f0c0ffee"))
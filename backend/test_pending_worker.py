@@ -0,0 +1,58 @@
+"""
+Tests for the pending_analyses worker quota pause and lease resume
+Run: python -m pytest -q test_pending_worker.py
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+
+import pending_worker
+from quota_governor import QuotaBudgetExhausted, next_quota_reset
+
+
+@pytest.fixture(autouse=True)
+def not_paused(monkeypatch):
+    monkeypatch.setattr(pending_worker, "_paused_until", None)
+    monkeypatch.setattr(pending_worker, "_quota_strikes", 0)
+
+
+def _paused_for_seconds():
+    return (pending_worker._paused_until - datetime.now(timezone.utc)).total_seconds()
+
+
+def test_governor_refusal_pauses_for_its_retry_delay():
+    pending_worker._register_quota_error(QuotaBudgetExhausted("tokens_per_minute", 20))
+    assert pending_worker.is_paused()
+    assert 15 < _paused_for_seconds() <= 20
+
+
+def test_daily_quota_error_pauses_until_the_reset():
+    pending_worker._register_quota_error(Exception("429 RESOURCE_EXHAUSTED: GenerateRequestsPerDay quota exceeded"))
+    expected = next_quota_reset(datetime.now(timezone.utc))
+    assert abs((pending_worker._paused_until - expected).total_seconds()) < 5
+
+
+def test_per_minute_provider_errors_back_off_exponentially():
+    pending_worker._register_quota_error(Exception("429 RESOURCE_EXHAUSTED"))
+    first = _paused_for_seconds()
+    pending_worker._paused_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+    pending_worker._register_quota_error(Exception("429 RESOURCE_EXHAUSTED"))
+
+    assert first == pytest.approx(pending_worker.QUOTA_BACKOFF_BASE_SECONDS, abs=2)
+    assert _paused_for_seconds() == pytest.approx(2 * pending_worker.QUOTA_BACKOFF_BASE_SECONDS, abs=2)
+
+
+def test_retried_lease_finds_the_analysis_saved_by_the_previous_one():
+    analysis_id = ObjectId()
+    current_db = MagicMock()
+    current_db.mini_analyses.find_one = AsyncMock(return_value={"_id": analysis_id, "response_text": "..."})
+
+    item = {"_id": ObjectId(), "analysis_ids": {"he": str(analysis_id)}}
+    saved = asyncio.run(pending_worker._saved_analysis(current_db, item, "he"))
+    assert saved["_id"] == analysis_id
+    assert asyncio.run(pending_worker._saved_analysis(current_db, item, "fr")) is None
+    current_db.mini_analyses.find_one.assert_called_once_with({"_id": analysis_id})
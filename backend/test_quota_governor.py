@@ -0,0 +1,88 @@
+"""
+Tests for the Gemini quota governor token buckets (admit / wait / refuse)
+Run: python -m pytest -q test_quota_governor.py
+"""
+
+import asyncio
+
+import pytest
+
+import quota_governor
+from quota_governor import QuotaBudgetExhausted, TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def fresh_buckets(monkeypatch):
+    monkeypatch.setattr(quota_governor, "GOVERNOR_ENABLED", True)
+    monkeypatch.setattr(quota_governor, "_avg_tokens", None)
+    monkeypatch.setattr(quota_governor, "_buckets", {
+        "requests_per_minute": TokenBucket("requests_per_minute", 10),
+        "tokens_per_minute": TokenBucket("tokens_per_minute", 100000),
+        "requests_per_day": TokenBucket("requests_per_day", 100, daily=True),
+        "tokens_per_day": TokenBucket("tokens_per_day", 0, daily=True),
+    })
+    yield quota_governor._buckets
+
+
+def _admit(prompt="x" * 400):
+    return asyncio.run(quota_governor.admit("gemini-test", [prompt], request_id="test"))
+
+
+def test_admit_takes_one_request_and_the_token_estimate():
+    reservation = _admit()
+    buckets = quota_governor._buckets
+
+    assert reservation["tokens"] == 100 + quota_governor.DEFAULT_OUTPUT_TOKENS
+    assert buckets["requests_per_minute"].level == pytest.approx(9, abs=0.01)
+    assert buckets["requests_per_day"].level == 99
+    assert buckets["tokens_per_minute"].level == pytest.approx(100000 - reservation["tokens"], abs=50)
+
+
+def test_disabled_budget_is_ignored():
+    _admit()
+    assert quota_governor._buckets["tokens_per_day"].level == 0
+
+
+def test_daily_budget_nearly_gone_is_refused_until_reset(fresh_buckets):
+    # Reserve = 5% of 100: the last 5 requests are kept back
+    fresh_buckets["requests_per_day"].level = 5.5
+
+    with pytest.raises(QuotaBudgetExhausted) as refused:
+        _admit()
+    assert refused.value.budget == "requests_per_day"
+    assert refused.value.retry_after_seconds > 60
+    assert "daily" in str(refused.value)
+
+
+def test_per_minute_shortfall_waits_when_short(fresh_buckets):
+    bucket = fresh_buckets["tokens_per_minute"]
+    bucket.level = bucket.reserve_units()
+    # Missing tokens refill in well under QUOTA_MAX_WAIT_SECONDS (100000 tokens / minute)
+    _admit(prompt="")
+    assert quota_governor._stats["waited"] >= 1
+
+
+def test_per_minute_shortfall_beyond_max_wait_is_refused(fresh_buckets, monkeypatch):
+    monkeypatch.setattr(quota_governor, "QUOTA_MAX_WAIT_SECONDS", 0)
+    fresh_buckets["requests_per_minute"].level = 0
+
+    with pytest.raises(QuotaBudgetExhausted) as refused:
+        _admit()
+    assert refused.value.budget == "requests_per_minute"
+    # 1.5 requests missing at 10 / minute
+    assert 1 <= refused.value.retry_after_seconds <= 10
+    assert "per-minute" in str(refused.value)
+
+
+def test_release_gives_tokens_back(fresh_buckets):
+    reservation = _admit()
+    before = fresh_buckets["tokens_per_minute"].level
+    quota_governor.release(reservation, RuntimeError("500 INTERNAL"))
+    assert fresh_buckets["tokens_per_minute"].level == pytest.approx(before + reservation["tokens"], abs=1)
+
+
+def test_provider_quota_error_drains_the_matching_budgets(fresh_buckets):
+    reservation = _admit()
+    quota_governor.release(reservation, RuntimeError("429 RESOURCE_EXHAUSTED: quota per day exceeded"))
+    assert fresh_buckets["requests_per_day"].level == 0
+    assert fresh_buckets["requests_per_minute"].level > 0
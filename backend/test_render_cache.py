@@ -0,0 +1,71 @@
+"""
+Tests for the PDF render cache (memory / disk tiers, coalescing, invalidation)
+Run: python -m pytest -q test_render_cache.py
+"""
+
+import asyncio
+
+import pytest
+
+import render_cache
+
+
+@pytest.fixture
+def renders(monkeypatch, tmp_path):
+    calls = []
+
+    async def fake_render(func, *args, **kwargs):
+        calls.append(args)
+        await asyncio.sleep(0.05)
+        return func(*args, **kwargs)
+
+    monkeypatch.setattr(render_cache, "RENDER_CACHE_ENABLED", True)
+    monkeypatch.setattr(render_cache, "RENDER_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(render_cache, "_disk_bytes", None)
+    monkeypatch.setattr(render_cache.pdf_executor, "render", fake_render)
+    render_cache._memory.clear()
+    render_cache._inflight.clear()
+    yield calls
+    render_cache._memory.clear()
+
+
+def build_pdf(title, language="fr"):
+    return f"%PDF {title} {language}".encode("utf-8")
+
+
+def test_concurrent_identical_renders_share_one_render(renders):
+    async def render_three():
+        return await asyncio.gather(*(render_cache.render("invoice", build_pdf, "F-1", ref="inv1") for _ in range(3)))
+
+    results = asyncio.run(render_three())
+
+    assert len(renders) == 1
+    assert results == [b"%PDF F-1 fr"] * 3
+
+
+def test_positional_and_keyword_calls_share_an_entry(renders):
+    asyncio.run(render_cache.render("invoice", build_pdf, "F-2", "he"))
+    asyncio.run(render_cache.render("invoice", build_pdf, title="F-2", language="he"))
+    asyncio.run(render_cache.render("invoice", build_pdf, "F-2", language="en"))
+
+    assert len(renders) == 2
+
+
+def test_disk_tier_serves_after_the_memory_tier_is_gone(renders):
+    asyncio.run(render_cache.render("invoice", build_pdf, "F-3", ref="inv3"))
+    render_cache._memory.clear()
+
+    assert asyncio.run(render_cache.render("invoice", build_pdf, "F-3", ref="inv3")) == b"%PDF F-3 fr"
+    assert len(renders) == 1
+
+
+def test_invalidate_drops_only_the_ref(renders):
+    asyncio.run(render_cache.render("invoice", build_pdf, "F-4", ref="inv4"))
+    asyncio.run(render_cache.render("invoice", build_pdf, "F-5", ref="inv5"))
+
+    removed = asyncio.run(render_cache.invalidate("invoice", "inv4"))
+    asyncio.run(render_cache.render("invoice", build_pdf, "F-4", ref="inv4"))
+    asyncio.run(render_cache.render("invoice", build_pdf, "F-5", ref="inv5"))
+
+    assert removed == {"memory_removed": 1, "disk_removed": 1}
+    assert [args[0] for args in renders] == ["F-4", "F-5", "F-4"]
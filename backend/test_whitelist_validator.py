@@ -0,0 +1,57 @@
+"""
+Tests for the whitelist compliance validator (allowed cities per whitelist, city matching)
+Run: python -m pytest -q test_whitelist_validator.py
+"""
+
+import whitelist_validator
+
+JEWISH = "Whitelist_1_Jewish_incl_Mixed"
+ARAB = "Whitelist_2_Arabe_incl_Mixed"
+
+
+def test_allowed_cities_come_from_entry_headings():
+    jewish = whitelist_validator.allowed_cities(JEWISH)
+    arab = whitelist_validator.allowed_cities(ARAB)
+
+    assert {"Tel Aviv", "Jerusalem", "Haifa", "Bnei Brak", "Beitar Illit"} <= jewish
+    assert {"Nazareth", "Nof HaGalil", "Tira", "Jaffa", "Akko", "Jerusalem", "Haifa"} <= arab
+    # Named in entry bodies only ("proche de Kfar Saba", Haifa Bay, Jaffa entry)
+    assert "Kfar Saba" not in arab
+    assert "Tel Aviv" not in arab
+    assert "Kiryat Motzkin" not in jewish
+    assert "Nazareth" not in jewish
+
+
+def test_every_whitelist_heading_is_mapped():
+    for code, path in whitelist_validator.prompt_registry.WHITELISTS.items():
+        headings = [line[4:].strip() for line in path.read_text(encoding="utf-8").splitlines() if line.startswith("### ")]
+        unmapped = [h for h in headings if h not in whitelist_validator.WHITELIST_HEADINGS and h not in whitelist_validator.CITY_VARIANTS]
+        assert not unmapped, f"{code}: {unmapped}"
+
+
+def test_validate_flags_out_of_whitelist_cities():
+    result = whitelist_validator.validate("Ouvrir à Tel Aviv puis à Eilat, et pourquoi pas Ra'anana.", JEWISH)
+    assert result["violations"] == ["Eilat", "Ra'anana"]
+    assert result["mentions"]["Tel Aviv"] == 1
+    assert not result["compliant"]
+
+
+def test_longest_match_and_hebrew_prefixes():
+    result = whitelist_validator.validate("Modiin Illit, puis בתל אביב et לחיפה.", JEWISH)
+    assert result["cities"] == ["Haifa", "Modiin Illit", "Tel Aviv"]
+    assert result["compliant"]
+
+
+def test_tira_only_matches_in_qualified_form():
+    assert whitelist_validator.validate("Il tira la conclusion.", ARAB)["cities"] == []
+    result = whitelist_validator.validate("Deux points de vente: Tira (Triangle) et la ville de Tira.", ARAB)
+    assert result["mentions"] == {"Tira": 2}
+    assert result["compliant"]
+
+
+def test_stub_answers_are_whitelist_clean():
+    from llm_fake_provider import FAKE_ANALYSES
+    for template in FAKE_ANALYSES.values():
+        text = template.format(brand="Brand", score=7)
+        for code in (JEWISH, ARAB):
+            assert whitelist_validator.validate(text, code)["compliant"], (code, text)
@@ -5,32 +5,13 @@ MISSION D: Cookie banner + visit database
 
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
-import os
 import logging
 
-router = APIRouter(prefix="/api/track")
-
-# MongoDB connection
-mongo_url = os.getenv('MONGODB_URI') or os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'igv_production')
+from database import get_db
 
-mongo_client = None
-db = None
-
-def get_db():
-    """Lazy initialization of MongoDB connection"""
-    global mongo_client, db
-    if db is None and mongo_url:
-        mongo_client = AsyncIOMotorClient(
-            mongo_url,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
-        )
-        db = mongo_client[db_name]
-    return db
+router = APIRouter(prefix="/api/track")
 
 
 class VisitTrack(BaseModel):
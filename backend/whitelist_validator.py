@@ -0,0 +1,343 @@
+"""
+Whitelist Compliance Validator for Israel Growth Venture mini-analyses
+The master prompts require every location to come from the whitelist of the
+request (Whitelist_1 Jewish incl. mixed / Whitelist_2 Arab incl. mixed).
+Generated answers are checked locally, without an extra LLM call:
+
+- one Aho-Corasick automaton over every Israeli city name and its fr / en / he
+  variants, compiled once at startup - a response is scanned in linear time
+- allowed cities per whitelist = the "### " entry headings of the file, mapped to
+  canonical cities by WHITELIST_HEADINGS (reloaded when the file changes)
+- result stored on mini_analyses.whitelist_check; an answer citing
+  out-of-whitelist cities is regenerated once with a corrective instruction
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+import logging
+import os
+import re
+import threading
+import time
+
+import prompt_registry
+from reference_index import normalize
+
+WHITELIST_CHECK_ENABLED = os.getenv('WHITELIST_CHECK_ENABLED', 'true').lower() == 'true'
+# One regeneration (corrective instruction) when the answer cites out-of-whitelist cities
+WHITELIST_REGENERATE_ENABLED = os.getenv('WHITELIST_REGENERATE_ENABLED', 'true').lower() == 'true'
+
+# Canonical city -> name variants (French, English, Hebrew). Whitelisted cities
+# and the other main cities a model tends to cite. Ambiguous names are left out
+# ("Acre", "Cana", Hebrew words that are common nouns) or only matched in a qualified
+# form (bare "Tira" - "il tira"): matching is case-insensitive.
+CITY_VARIANTS = {
+    # Whitelist 1
+    "Tel Aviv": ["Tel Aviv", "Tel-Aviv", "Tel Aviv-Yafo", "Tel Aviv Jaffa", "תל אביב", "תל-אביב"],
+    "Ramat HaSharon": ["Ramat HaSharon", "Ramat Hasharon", "רמת השרון"],
+    "Ramat Gan": ["Ramat Gan", "Ramat-Gan", "רמת גן"],
+    "Rishon LeZion": ["Rishon LeZion", "Rishon Lezion", "Rishon LeTsiyon", "Rishon", "ראשון לציון"],
+    "Holon": ["Holon", "Kholon", "חולון"],
+    "Bat Yam": ["Bat Yam", "Bat-Yam", "בת ים"],
+    "Jerusalem": ["Jerusalem", "Jérusalem", "Yerushalayim", "Al-Quds", "ירושלים"],
+    "Modiin": ["Modiin", "Modi'in", "Modiin-Maccabim-Reut", "מודיעין"],
+    "Rehovot": ["Rehovot", "Rehovoth", "רחובות"],
+    "Petah Tikva": ["Petah Tikva", "Petah Tikvah", "Petach Tikva", "Petach Tikvah", "Petah-Tikva", "פתח תקווה", "פתח תקוה"],
+    "Herzliya": ["Herzliya", "Herzlia", "Herzliyya", "הרצליה"],
+    "Haifa": ["Haifa", "Haïfa", "Hefa", "חיפה"],
+    "Kiryat Motzkin": ["Kiryat Motzkin", "Qiryat Motzkin", "קריית מוצקין"],
+    "Netanya": ["Netanya", "Natanya", "Netania", "נתניה"],
+    "Karmiel": ["Karmiel", "Carmiel", "כרמיאל"],
+    "Tiberias": ["Tiberias", "Tibériade", "Tveria", "Tiberiade", "טבריה"],
+    "Beer Sheva": ["Beer Sheva", "Be'er Sheva", "Beersheba", "Beer Sheba", "Beersheva", "Beer-Sheva", "Béer-Sheva", "באר שבע"],
+    "Ashdod": ["Ashdod", "אשדוד"],
+    "Ashkelon": ["Ashkelon", "Ashqelon", "Ascalon", "אשקלון"],
+    "Bnei Brak": ["Bnei Brak", "Bnei-Brak", "Bné Brak", "Bne Brak", "בני ברק"],
+    "Modiin Illit": ["Modiin Illit", "Modi'in Illit", "Modiin-Illit", "מודיעין עילית"],
+    "Beitar Illit": ["Beitar Illit", "Betar Illit", "Beitar-Illit", "ביתר עילית"],
+    # Whitelist 2
+    "Nazareth": ["Nazareth", "Nazaret", "Natzrat", "נצרת"],
+    "Nof HaGalil": ["Nof HaGalil", "Nof Hagalil", "Nazareth Illit", "Natzrat Illit", "נוף הגליל", "נצרת עילית"],
+    "Umm al-Fahm": ["Umm al-Fahm", "Umm el-Fahm", "Oum el-Fahm", "Um al-Fahm", "אום אל-פחם", "אום אל פחם"],
+    "Sakhnin": ["Sakhnin", "Sakhnine", "סח'נין", "סכנין"],
+    "Shefa-Amr": ["Shefa-Amr", "Shefa Amr", "Shfaram", "Shefar'am", "Chefa-Amr", "שפרעם"],
+    "Tamra": ["Tamra", "טמרה"],
+    "Majd al-Krum": ["Majd al-Krum", "Majd el-Krum", "Majd al-Kurum", "מג'ד אל-כרום"],
+    "Arraba": ["Arraba", "Arrabe", "Arabe Batuf", "עראבה"],
+    "Taybeh": ["Taybeh", "Tayibe", "Tayibeh", "Taibe", "Taïbe", "טייבה"],
+    "Tira": ["Tireh", "at-Tira", "al-Tira", "Tira (Triangle)", "ville de Tira", "city of Tira", "town of Tira", "העיר טירה"],
+    "Qalansawe": ["Qalansawe", "Qalansuwa", "Kalansua", "קלנסווה"],
+    "Baqa al-Gharbiyye": ["Baqa al-Gharbiyye", "Baqa al-Gharbiyya", "Baka al-Gharbiyye", "Baqa el-Gharbiyye", "באקה אל-גרבייה"],
+    "Jaljulia": ["Jaljulia", "Jaljulye", "ג'לג'וליה"],
+    "Akko": ["Akko", "Akka", "Saint-Jean-d'Acre", "Acco", "עכו"],
+    "Lod": ["Lod", "Lydda", "לוד"],
+    "Ramle": ["Ramle", "Ramla", "Ramleh", "רמלה"],
+    "Jaffa": ["Jaffa", "Yafo", "Jaffo", "Jaffa-Yafo", "יפו"],
+    "Rahat": ["Rahat", "רהט"],
+    "Tel Sheva": ["Tel Sheva", "Tel as-Sabi", "תל שבע"],
+    "Segev Shalom": ["Segev Shalom", "Shaqib al-Salam", "שגב שלום"],
+    # Neither whitelist
+    "Eilat": ["Eilat", "Elat", "Eilath", "אילת"],
+    "Kfar Saba": ["Kfar Saba", "Kfar-Saba", "Kfar Sava", "כפר סבא"],
+    "Ra'anana": ["Ra'anana", "Raanana", "Ranana", "רעננה"],
+    "Hod HaSharon": ["Hod HaSharon", "Hod Hasharon", "הוד השרון"],
+    "Rosh HaAyin": ["Rosh HaAyin", "Rosh Ha'Ayin", "ראש העין"],
+    "Givatayim": ["Givatayim", "Guivatayim", "גבעתיים"],
+    "Or Yehuda": ["Or Yehuda", "אור יהודה"],
+    "Ness Ziona": ["Ness Ziona", "Nes Ziona", "Nes Tziona", "נס ציונה"],
+    "Yavne": ["Yavne", "Yavneh", "יבנה"],
+    "Kiryat Gat": ["Kiryat Gat", "Qiryat Gat", "קריית גת"],
+    "Kiryat Malakhi": ["Kiryat Malakhi", "Kiryat Malachi", "קריית מלאכי"],
+    "Kiryat Shmona": ["Kiryat Shmona", "Qiryat Shmona", "קריית שמונה"],
+    "Kiryat Ata": ["Kiryat Ata", "Qiryat Ata", "קריית אתא"],
+    "Kiryat Bialik": ["Kiryat Bialik", "Qiryat Bialik", "קריית ביאליק"],
+    "Kiryat Yam": ["Kiryat Yam", "Qiryat Yam", "קריית ים"],
+    "Tirat Carmel": ["Tirat Carmel", "Tirat HaCarmel", "טירת כרמל"],
+    "Hadera": ["Hadera", "Hadéra", "חדרה"],
+    "Zichron Yaakov": ["Zichron Yaakov", "Zikhron Ya'akov", "Zikhron Yaakov", "זכרון יעקב"],
+    "Caesarea": ["Caesarea", "Césarée", "Cesaree", "Keisaria", "קיסריה"],
+    "Or Akiva": ["Or Akiva", "אור עקיבא"],
+    "Afula": ["Afula", "Afoula", "עפולה"],
+    "Migdal HaEmek": ["Migdal HaEmek", "Migdal Haemek", "מגדל העמק"],
+    "Beit She'an": ["Beit She'an", "Beit Shean", "Bet Shean", "בית שאן"],
+    "Yokneam": ["Yokneam", "Yokneam Illit", "Yoqneam", "יקנעם"],
+    "Nahariya": ["Nahariya", "Naharia", "Nahariyya", "נהריה"],
+    "Safed": ["Safed", "Tzfat", "Zefat", "Safad", "צפת"],
+    "Beit Shemesh": ["Beit Shemesh", "Bet Shemesh", "בית שמש"],
+    "Ma'ale Adumim": ["Ma'ale Adumim", "Maale Adumim", "Maaleh Adumim", "מעלה אדומים"],
+    "Dimona": ["Dimona", "דימונה"],
+    "Sderot": ["Sderot", "Sdérot", "שדרות"],
+    "Ofakim": ["Ofakim", "Ofaqim", "אופקים"],
+    "Netivot": ["Netivot", "נתיבות"],
+    "Arad": ["Arad"],
+    "Kafr Qasim": ["Kafr Qasim", "Kafr Kassem", "Kfar Kassem", "Kafr Qassem", "כפר קאסם"],
+    "Kafr Kanna": ["Kafr Kanna", "Kafr Kana", "כפר כנא"],
+    "Daliyat al-Karmel": ["Daliyat al-Karmel", "Daliat el-Carmel", "Daliyat el-Carmel", "דלית אל-כרמל"],
+}
+
+# "### " entry heading of a whitelist file -> canonical cities it allows. Headings that
+# are a canonical city name ("### Holon") need no entry; entry bodies are not scanned
+# (they name neighbouring cities: "proche de Kfar Saba").
+WHITELIST_HEADINGS = {
+    "Tel Aviv Centre": ["Tel Aviv"],
+    "Ramat Aviv": ["Tel Aviv"],
+    "Jerusalem Ouest (laïc/mixte)": ["Jerusalem"],
+    "Jerusalem Religieux": ["Jerusalem"],
+    "Haifa Centre": ["Haifa"],
+    "Haifa Bay": ["Haifa"],
+    "Nazareth (Capitale arabe d'Israël)": ["Nazareth"],
+    "Nazareth Illit / Nof HaGalil": ["Nof HaGalil"],
+    "Shefa-Amr (Shfaram)": ["Shefa-Amr"],
+    "Taybeh (Tayibe)": ["Taybeh"],
+    "Akko (Acre)": ["Akko"],
+    "Jaffa (Yafo)": ["Jaffa"],
+    "Quartiers arabes de Jerusalem": ["Jerusalem"],
+}
+
+# Hebrew one-letter prefixes (in / to / from / the / and / that / as) glued to a city name
+HEBREW_PREFIXES = frozenset("בלמהוכש")
+HEBREW_LETTER = re.compile(r"[א-ת]")
+NON_WORD = re.compile(r"[^\w]+")
+
+_stats = {
+    "scans": 0,
+    "scans_with_violations": 0,
+    "regenerations": 0,
+    "regenerations_fixed": 0,
+    "scan_ms_total": 0.0,
+    "scan_ms_max": 0.0,
+}
+
+_automaton = None
+_automaton_lock = threading.Lock()
+# whitelist code -> (file mtime, allowed canonical cities)
+_allowed: Dict[str, Tuple[float, Set[str]]] = {}
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, accents removed, every run of punctuation / spaces -> one space"""
+    return NON_WORD.sub(" ", normalize(text or "")).replace("_", " ")
+
+
+class CityMatcher:
+    """Aho-Corasick automaton over the normalized city variants (leftmost-longest, word-bounded matches)"""
+
+    def __init__(self, variants: Dict[str, List[str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # node -> [(pattern length, canonical city, hebrew pattern)]
+        self.output: List[List[Tuple[int, str, bool]]] = [[]]
+        self.patterns = 0
+
+        for canonical, names in variants.items():
+            for name in {normalize_text(n).strip() for n in names}:
+                if name:
+                    self._add(name, canonical)
+        self._link()
+
+    def _add(self, pattern: str, canonical: str):
+        node = 0
+        for char in pattern:
+            nxt = self.goto[node].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        self.output[node].append((len(pattern), canonical, bool(HEBREW_LETTER.search(pattern))))
+        self.patterns += 1
+
+    def _link(self):
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                fallback = self.goto[state].get(char, 0)
+                self.fail[child] = fallback if fallback != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    @staticmethod
+    def _bounded(text: str, start: int, end: int, hebrew: bool) -> bool:
+        if end < len(text) and text[end].isalnum():
+            return False
+        if start == 0 or not text[start - 1].isalnum():
+            return True
+        # "בתל אביב", "לחיפה": one prefix letter, itself at a word start
+        return hebrew and text[start - 1] in HEBREW_PREFIXES and (start == 1 or not text[start - 2].isalnum())
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """(start, end, canonical city) of every city mention in normalized text"""
+        goto, fail, output = self.goto, self.fail, self.output
+        matches = []
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, canonical, hebrew in output[node]:
+                start = index + 1 - length
+                if self._bounded(text, start, index + 1, hebrew):
+                    matches.append((start, index + 1, canonical))
+
+        # "Modiin Illit" is one mention, not Modiin + Modiin Illit
+        selected = []
+        last_end = -1
+        for start, end, canonical in sorted(matches, key=lambda m: (m[0], m[0] - m[1])):
+            if start >= last_end:
+                selected.append((start, end, canonical))
+                last_end = end
+        return selected
+
+
+def _matcher() -> CityMatcher:
+    global _automaton
+    if _automaton is None:
+        with _automaton_lock:
+            if _automaton is None:
+                started = time.perf_counter()
+                matcher = CityMatcher(CITY_VARIANTS)
+                _automaton = matcher
+                logging.info(f"✅ Whitelist validator built: {len(CITY_VARIANTS)} cities, {matcher.patterns} patterns, "
+                             f"{len(matcher.goto)} states in {(time.perf_counter() - started) * 1000:.1f}ms")
+    return _automaton
+
+
+def build() -> CityMatcher:
+    """Compile the city automaton (once) and the allowed cities of every whitelist - startup"""
+    matcher = _matcher()
+    for code in prompt_registry.WHITELISTS:
+        allowed_cities(code)
+    return matcher
+
+
+def _heading_cities(text: str, whitelist_code: str) -> Set[str]:
+    """Canonical cities of the "### " entry headings (bodies and other sections name other cities)"""
+    cities = set()
+    for line in text.splitlines():
+        if not line.startswith("### "):
+            continue
+        heading = line[4:].strip()
+        canonicals = WHITELIST_HEADINGS.get(heading) or ([heading] if heading in CITY_VARIANTS else None)
+        if canonicals is None:
+            logging.warning(f"⚠️ WHITELIST_HEADING_UNMAPPED {whitelist_code}: '{heading}' (add it to WHITELIST_HEADINGS)")
+            continue
+        cities.update(canonicals)
+    return cities
+
+
+def allowed_cities(whitelist_code: str) -> Set[str]:
+    """Canonical cities of a whitelist (re-read when the file changed on disk)"""
+    path: Optional[Path] = prompt_registry.WHITELISTS.get(whitelist_code)
+    if path is None:
+        return set()
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        logging.error(f"❌ WHITELIST_FILE_MISSING {path}")
+        return _allowed.get(whitelist_code, (0.0, set()))[1]
+
+    cached = _allowed.get(whitelist_code)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    text = path.read_text(encoding='utf-8')
+    cities = _heading_cities(text, whitelist_code)
+    _allowed[whitelist_code] = (mtime, cities)
+    logging.info(f"Whitelist {whitelist_code}: {len(cities)} allowed cities")
+    return cities
+
+
+def validate(text: str, whitelist_code: str) -> Dict[str, Any]:
+    """
+    Cities cited in a generated answer vs the whitelist of the request
+    Returns {"whitelist", "compliant", "cities", "violations", "mentions", "scan_ms"}
+    """
+    started = time.perf_counter()
+    allowed = allowed_cities(whitelist_code)
+    mentions: Dict[str, int] = {}
+    for _, _, canonical in _matcher().find(normalize_text(text)):
+        mentions[canonical] = mentions.get(canonical, 0) + 1
+    violations = sorted(city for city in mentions if city not in allowed)
+    scan_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    _stats["scans"] += 1
+    _stats["scans_with_violations"] += 1 if violations else 0
+    _stats["scan_ms_total"] += scan_ms
+    _stats["scan_ms_max"] = max(_stats["scan_ms_max"], scan_ms)
+
+    return {
+        "whitelist": whitelist_code,
+        "compliant": not violations,
+        "cities": sorted(mentions),
+        "violations": violations,
+        "mentions": mentions,
+        "scan_ms": scan_ms,
+    }
+
+
+def record_regeneration(fixed: bool):
+    _stats["regenerations"] += 1
+    _stats["regenerations_fixed"] += 1 if fixed else 0
+
+
+def validator_status() -> Dict[str, Any]:
+    """Admin view: automaton size, allowed cities per whitelist, scan / regeneration counters (this worker)"""
+    matcher = _matcher()
+    return {
+        "enabled": WHITELIST_CHECK_ENABLED,
+        "regenerate_enabled": WHITELIST_REGENERATE_ENABLED,
+        "cities": len(CITY_VARIANTS),
+        "patterns": matcher.patterns,
+        "states": len(matcher.goto),
+        "whitelists": {code: sorted(allowed_cities(code)) for code in prompt_registry.WHITELISTS},
+        "stats": {
+            **_stats,
+            "scan_ms_total": round(_stats["scan_ms_total"], 2),
+            "scan_ms_avg": round(_stats["scan_ms_total"] / _stats["scans"], 3) if _stats["scans"] else None,
+        },
+    }